@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark listing installed packages from a large dpkg status file.
+
+Compares the streaming status reader behind AppUpgrader.list_items with
+the previous path, which forked `dpkg --get-selections` and split its
+output. A synthetic status file is written to a temporary admin
+directory so dpkg can be pointed at it with ``--admindir``.
+
+Usage:
+    python benchmarks/bench_dpkg_status.py [--entries 20000] [--repeat 5]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from harness import compare
+
+from upgradeapp.upgraders.packages.dpkg import iter_dpkg_status
+
+
+STANZA = """Package: pkg{i:05d}
+Status: {status}
+Priority: optional
+Section: libs
+Installed-Size: 1024
+Maintainer: Example Maintainer <maint@example.org>
+Architecture: amd64
+Multi-Arch: same
+Version: 1.{i}.0-1
+Depends: libc6 (>= 2.34)
+Description: synthetic package {i}
+ A longer description that spans
+ more than one line, as most real entries do.
+
+"""
+
+
+def write_status(admindir: str, entries: int) -> str:
+    """
+    Write a synthetic dpkg status file.
+
+    Args:
+        admindir: Directory to write ``status`` into
+        entries: Number of package entries
+
+    Returns:
+        Path to the status file
+    """
+    os.makedirs(os.path.join(admindir, 'info'), exist_ok=True)
+    path = os.path.join(admindir, 'status')
+    with open(path, 'w') as f:
+        for i in range(entries):
+            status = 'deinstall ok config-files' if i % 50 == 0 else 'install ok installed'
+            f.write(STANZA.format(i=i, status=status))
+    return path
+
+
+def list_streaming(status_file: str) -> list:
+    return list(dict.fromkeys(package.name for package in iter_dpkg_status(status_file)))
+
+
+def list_subprocess(admindir: str) -> list:
+    result = subprocess.run(
+        ['dpkg', '--admindir', admindir, '--get-selections'],
+        capture_output=True,
+        text=True,
+        timeout=30
+    )
+    return [line.split()[0] for line in result.stdout.strip().split('\n')
+            if line and 'install' in line]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--entries', type=int, default=20000, help='Number of status entries')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    args = parser.parse_args()
+
+    admindir = tempfile.mkdtemp(prefix='dpkg-bench-')
+    try:
+        status_file = write_status(admindir, args.entries)
+        print(f"Status file: {args.entries} entries, {os.path.getsize(status_file) / 1e6:.1f} MB")
+
+        compare(
+            lambda: list_streaming(status_file), 'streaming reader',
+            (lambda: list_subprocess(admindir)) if shutil.which('dpkg') else None, 'dpkg --get-selections',
+            args.repeat,
+        )
+    finally:
+        shutil.rmtree(admindir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Benchmark the native rpm and pacman backends of AppUpgrader.
+
+By default synthetic databases are generated: an rpmdb.sqlite plus cached
+primary.xml metadata, and a pacman local/sync database pair. pacman can
+read the synthetic databases, so `pacman -Q` / `pacman -Qu` are measured as
+the baseline when it is installed. The synthetic rpm headers carry only
+the tags the reader needs and are not accepted by rpm itself; use
+``--system`` on an rpm host to compare against `rpm -qa` and
+`dnf check-update` on the real databases.
+
+Usage:
+    python benchmarks/bench_package_backends.py [--packages 20000] [--repeat 5] [--system]
+"""
+
+import argparse
+import gzip
+import io
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+from harness import compare
+
+from upgradeapp.upgraders.packages.pacman import PacmanIndex, iter_pacman_local
+from upgradeapp.upgraders.packages.rpm import RpmRepoIndex, find_rpmdb, iter_rpmdb
+
+
+def _rpm_header(name: str, version: str, release: str, arch: str) -> bytes:
+    entries = []
+    data = b''
+    for tag, value in ((1000, name), (1001, version), (1002, release), (1022, arch)):
+        entries.append(struct.pack('>iiii', tag, 6, len(data), 1))
+        data += value.encode() + b'\0'
+    return struct.pack('>II', len(entries), len(data)) + b''.join(entries) + data
+
+
+def write_rpm(root: str, packages: int) -> RpmRepoIndex:
+    """
+    Write a synthetic rpmdb and one cached repository.
+
+    Args:
+        root: Directory to write into
+        packages: Number of installed packages; the repository lists
+            twice as many, with every fourth installed package updated
+
+    Returns:
+        Index over the synthetic data
+    """
+    os.makedirs(root)
+    rpmdb = os.path.join(root, 'rpmdb.sqlite')
+    connection = sqlite3.connect(rpmdb)
+    connection.execute('CREATE TABLE Packages (hnum INTEGER PRIMARY KEY AUTOINCREMENT, blob BLOB NOT NULL)')
+    connection.executemany(
+        'INSERT INTO Packages (blob) VALUES (?)',
+        ((_rpm_header(f'pkg{i:05d}', f'1.{i}', '1.fc39', 'x86_64'),) for i in range(packages))
+    )
+    connection.commit()
+    connection.close()
+
+    repodata = os.path.join(root, 'cache', 'fedora-0000', 'repodata')
+    os.makedirs(repodata)
+    with gzip.open(os.path.join(repodata, 'primary.xml.gz'), 'wt') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<metadata xmlns="http://linux.duke.edu/metadata/common">\n')
+        for i in range(packages * 2):
+            release = '2.fc39' if i % 4 == 0 else '1.fc39'
+            f.write(f'<package type="rpm"><name>pkg{i:05d}</name><arch>x86_64</arch>'
+                    f'<version epoch="0" ver="1.{i}" rel="{release}"/>'
+                    f'<summary>synthetic package {i}</summary></package>\n')
+        f.write('</metadata>\n')
+    return RpmRepoIndex([os.path.join(root, 'cache')], rpmdb)
+
+
+def write_pacman(root: str, packages: int) -> PacmanIndex:
+    """
+    Write a synthetic pacman database root and configuration.
+
+    Args:
+        root: Directory to write into
+        packages: Number of installed packages; the sync database lists
+            twice as many, with every fourth installed package updated
+
+    Returns:
+        Index over the synthetic data
+    """
+    os.makedirs(os.path.join(root, 'local'))
+    for i in range(packages):
+        entry = os.path.join(root, 'local', f'pkg{i:05d}-1.{i}-1')
+        os.makedirs(entry)
+        with open(os.path.join(entry, 'desc'), 'w') as f:
+            f.write(f'%NAME%\npkg{i:05d}\n\n%VERSION%\n1.{i}-1\n\n%ARCH%\nx86_64\n\n')
+    with open(os.path.join(root, 'local', 'ALPM_DB_VERSION'), 'w') as f:
+        f.write('9\n')
+
+    os.makedirs(os.path.join(root, 'sync'))
+    with tarfile.open(os.path.join(root, 'sync', 'core.db'), 'w:gz') as archive:
+        for i in range(packages * 2):
+            entry = f'pkg{i:05d}-1.{i}-{2 if i % 4 == 0 else 1}'
+            desc = (f'%FILENAME%\n{entry}-x86_64.pkg.tar.zst\n\n%NAME%\npkg{i:05d}\n\n'
+                    f'%VERSION%\n{entry.split("-", 1)[1]}\n\n%ARCH%\nx86_64\n\n').encode()
+            info = tarfile.TarInfo(f'{entry}/desc')
+            info.size = len(desc)
+            archive.addfile(info, io.BytesIO(desc))
+
+    config = os.path.join(root, 'pacman.conf')
+    with open(config, 'w') as f:
+        f.write(f'[options]\nDBPath = {root}\n\n[core]\nServer = file:///nonexistent\n')
+    return PacmanIndex(root, config)
+
+
+def run_lines(cmd: list) -> list:
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+    return result.stdout.splitlines()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--packages', type=int, default=20000, help='Installed packages per backend')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    parser.add_argument('--system', action='store_true', help="Use this host's databases instead")
+    args = parser.parse_args()
+
+    if args.system:
+        rpmdb = find_rpmdb()
+        if rpmdb and shutil.which('rpm'):
+            print(f"rpm: {rpmdb}")
+            compare(lambda: list(iter_rpmdb(rpmdb)), 'rpmdb reader',
+                    lambda: run_lines(['rpm', '-qa']), 'rpm -qa', args.repeat)
+            manager = shutil.which('dnf') or shutil.which('yum')
+            index = RpmRepoIndex(rpmdb_path=rpmdb)
+            if manager and index.available():
+                compare(index.upgradable, 'repo metadata index',
+                        lambda: run_lines([manager, '--quiet', '--cacheonly', 'check-update']),
+                        'check-update --cacheonly', args.repeat)
+        if shutil.which('pacman'):
+            index = PacmanIndex()
+            print("pacman: /var/lib/pacman")
+            compare(lambda: list(iter_pacman_local()), 'local database reader',
+                    lambda: run_lines(['pacman', '-Q']), 'pacman -Q', args.repeat)
+            compare(index.upgradable, 'sync database index',
+                    lambda: run_lines(['pacman', '-Qu']), 'pacman -Qu', args.repeat)
+        return 0
+
+    root = tempfile.mkdtemp(prefix='pkg-bench-')
+    try:
+        print(f"rpm: {args.packages} installed, {args.packages * 2} in repository metadata")
+        rpm_index = write_rpm(os.path.join(root, 'rpm'), args.packages)
+        compare(lambda: list(iter_rpmdb(rpm_index.rpmdb_path)), 'rpmdb reader',
+                None, 'rpm -qa', args.repeat)
+        compare(rpm_index.upgradable, 'repo metadata index', None, 'dnf check-update', args.repeat)
+
+        print(f"pacman: {args.packages} installed, {args.packages * 2} in sync database")
+        pacman_root = os.path.join(root, 'pacman')
+        pacman_index = write_pacman(pacman_root, args.packages)
+        has_pacman = shutil.which('pacman') is not None
+        compare(lambda: list(iter_pacman_local(pacman_root)), 'local database reader',
+                (lambda: run_lines(['pacman', '-Q', '--dbpath', pacman_root])) if has_pacman else None,
+                'pacman -Q', args.repeat)
+        compare(pacman_index.upgradable, 'sync database index',
+                (lambda: run_lines(['pacman', '-Qu', '--dbpath', pacman_root,
+                                    '--config', pacman_index.config_path])) if has_pacman else None,
+                'pacman -Qu', args.repeat)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark CLI startup: what importing main.py and loading a backend cost.
+
+Each scenario runs in fresh interpreters under ``-X importtime``. The
+report shows the median wall time of the whole process, the median time
+spent importing modules for the scenario itself (interpreter startup
+excluded), how many upgradeapp modules were imported and, with --top,
+the slowest modules.
+
+A scenario regresses if it imports a backend it does not need (importing
+main.py must not import any upgrader implementation, loading one type
+must not import the others), if ``import main`` takes longer than
+--budget-ms to import, or, with --baseline, if its wall or import time
+grew by more than the tolerance. Any regression makes the script exit
+with status 1.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 10] [--top 0] [--budget-ms 250]
+        [--save-baseline FILE] [--baseline FILE] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import harness  # noqa: F401  (puts the checkout on sys.path)
+
+from upgradeapp.plugins import BUILTIN_UPGRADERS
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Written to stderr before the scenario, so interpreter startup is not counted
+MARKER = '--scenario--'
+
+# Module of each built-in type's upgrader
+BACKENDS = {name: target.partition(':')[0] for name, target in BUILTIN_UPGRADERS.items()}
+
+# Scenario -> (code, type whose backend it may import)
+SCENARIOS: Dict[str, Tuple[str, Optional[str]]] = {
+    'import main': ('import main', None),
+    'main --help': ("import main, sys\nsys.argv = ['main.py', '--help']\n"
+                    "try:\n    main.main()\nexcept SystemExit:\n    pass", None),
+}
+SCENARIOS.update({
+    f"load {name}": (f"import main\nmain.plugins.load({name!r})", name) for name in BACKENDS
+})
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, int]]:
+    """
+    Parse ``-X importtime`` output after the scenario marker.
+
+    Returns:
+        Tuple of (import time in seconds, self time in microseconds by module)
+    """
+    lines = stderr.split(MARKER, 1)[-1].splitlines()
+    total = 0
+    modules: Dict[str, int] = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        # Top-level imports are indented by one space; nested ones by two more per level
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(cumulative)
+        modules[name.strip()] = int(self_us)
+    return total / 1e6, modules
+
+
+def run_scenario(code: str, repeat: int) -> Dict[str, Any]:
+    """
+    Run one scenario in fresh interpreters.
+
+    Returns:
+        Median wall and import times in seconds, and the modules imported
+        by the last run with their self times
+    """
+    walls, imports = [], []
+    modules: Dict[str, int] = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f"import sys\nsys.stderr.write({MARKER!r} + '\\n')\n{code}"],
+            cwd=ROOT, capture_output=True, text=True, timeout=60
+        )
+        walls.append(time.perf_counter() - start)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Scenario failed:\n{completed.stderr[-2000:]}")
+        seconds, modules = parse_importtime(completed.stderr)
+        imports.append(seconds)
+    return {
+        'wall': statistics.median(walls),
+        'import': statistics.median(imports),
+        'modules': sorted(name for name in modules if name.startswith('upgradeapp')),
+        'self_us': modules,
+    }
+
+
+def find_regressions(name: str, result: Dict[str, Any], allowed: Optional[str], budget: Optional[float],
+                     baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Check one scenario against the lazy-loading rules, the budget and the baseline.
+
+    Returns:
+        Descriptions of the regressions, empty if there are none
+    """
+    regressions = [f"imports {module}" for backend, module in BACKENDS.items()
+                   if backend != allowed and module in result['modules']]
+    if name == 'import main' and budget is not None and result['import'] * 1000 > budget:
+        regressions.append(f"import {result['import'] * 1000:.1f} ms over the {budget:g} ms budget")
+    previous = baseline.get(name)
+    if previous:
+        for metric in ('wall', 'import'):
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{metric} {previous[metric] * 1000:.1f} -> {result[metric] * 1000:.1f} ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=10, help='Interpreters per scenario (default 10)')
+    parser.add_argument('--top', type=int, default=0, help='Show the N slowest modules of each scenario')
+    parser.add_argument('--budget-ms', type=float, default=250,
+                        help='Import time allowed for `import main`, in ms (default 250; 0 disables)')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Write the results as a baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown over the baseline (default 0.25)')
+    args = parser.parse_args()
+
+    baseline: Dict[str, Any] = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    print(f"Python {sys.version.split()[0]}, median of {args.repeat} interpreters")
+    print(f"  {'scenario':<20}{'wall':>12}{'imports':>12}{'modules':>10}")
+    results: Dict[str, Dict[str, Any]] = {}
+    regressed = False
+    for name, (code, allowed) in SCENARIOS.items():
+        result = run_scenario(code, args.repeat)
+        results[name] = {key: result[key] for key in ('wall', 'import', 'modules')}
+        regressions = find_regressions(name, result, allowed, args.budget_ms or None, baseline, args.tolerance)
+        regressed = regressed or bool(regressions)
+        flag = '  REGRESSION: ' + '; '.join(regressions) if regressions else ''
+        print(f"  {name:<20}{result['wall'] * 1000:9.1f} ms{result['import'] * 1000:9.1f} ms"
+              f"{len(result['modules']):10d}{flag}")
+        slowest = sorted(result['self_us'].items(), key=lambda entry: entry[1], reverse=True)[:args.top]
+        for module, self_us in slowest:
+            print(f"      {module:<40}{self_us / 1000:8.1f} ms")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
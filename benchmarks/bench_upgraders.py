@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Benchmark upgrader methods against simulated runtimes at scale.
+
+The docker, podman, apt, dpkg and sudo executables are replaced by the
+simulator in this directory (see simulator.py), so list, check and
+upgrade run their real code paths, subprocesses included, against a host
+with thousands of containers or tens of thousands of packages. Each
+method runs in a fresh child process and is reported with its wall time,
+subprocess count, peak RSS and throughput.
+
+Results can be saved as a baseline and later runs compared against it;
+a run that is slower or larger than the baseline by more than the
+tolerance, or that forks more subprocesses, is flagged as a regression
+and makes the script exit with status 1.
+
+Usage:
+    python benchmarks/bench_upgraders.py [--containers 1000] [--images 200] [--packages 20000]
+        [--types docker,podman,app] [--methods list_items,check_updates,upgrade]
+        [--latency 0] [--pull-latency 0] [--output-lines 20] [--failure-rate 0] [--update-rate 0.1]
+        [--save-baseline FILE] [--baseline FILE] [--tolerance 0.25]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import harness  # noqa: F401  (puts the checkout on sys.path)
+
+import simulator
+from bench_dpkg_status import write_status
+
+
+TYPES = ('docker', 'podman', 'app', 'app-cli')
+
+METHODS = ('list_items', 'check_updates', 'upgrade', 'async_check_updates', 'async_upgrade')
+
+# Config keys that make two runs comparable
+SCALE_KEYS = ('containers', 'images', 'packages', 'latency', 'pull_latency',
+              'output_lines', 'failure_rate', 'update_rate')
+
+
+def write_apt_lists(lists_dir: str, packages: int, host: simulator.Host) -> None:
+    """
+    Write a Packages list matching the synthetic dpkg status file.
+
+    Packages the simulator marks as updated get a newer candidate version,
+    so the native apt backend and `apt list --upgradable` agree.
+
+    Args:
+        lists_dir: Directory to write the list into
+        packages: Number of packages in the status file
+        host: Simulated host deciding which packages have updates
+    """
+    os.makedirs(lists_dir, exist_ok=True)
+    path = os.path.join(lists_dir, 'deb.example.org_debian_dists_stable_main_binary-amd64_Packages')
+    with open(path, 'w') as f:
+        for i in range(packages):
+            name = f"pkg{i:05d}"
+            minor = 1 if host.updated(name) else 0
+            f.write(f"Package: {name}\nVersion: 1.{i}.{minor}-1\nArchitecture: amd64\n\n")
+
+
+def upgrader_config(upgrade_type: str, workdir: str) -> Dict[str, Any]:
+    """
+    Build the upgrader configuration for a simulated run.
+
+    Args:
+        upgrade_type: One of TYPES
+        workdir: Directory holding the synthetic package databases
+
+    Returns:
+        Configuration dictionary
+    """
+    app = {
+        'dpkg_status': os.path.join(workdir, 'dpkg', 'status'),
+        'apt_lists_dir': os.path.join(workdir, 'lists'),
+        'apt_lists_max_age': 10 ** 9,
+    }
+    if upgrade_type == 'app-cli':
+        app['apt_backend'] = 'cli'
+    return {
+        'probe_cache': False,
+        'check_workers': 8,
+        'docker_upgrader': {'backend': 'cli'},
+        'podman_upgrader': {},
+        'app_upgrader': app,
+    }
+
+
+def scale_items(upgrade_type: str, method: str, config: Dict[str, Any]) -> int:
+    """Number of units a method processes, for throughput."""
+    if upgrade_type.startswith('app'):
+        return config['packages']
+    if method.endswith('check_updates'):
+        return config['images']
+    return config['containers']
+
+
+def run_child(upgrade_type: str, method: str) -> Dict[str, Any]:
+    """
+    Run one method in this process and measure it.
+
+    Returns:
+        Wall time in seconds, peak RSS in kB and the result size
+    """
+    from upgradeapp.upgraders import AppUpgrader, DockerUpgrader, PodmanUpgrader
+
+    classes = {'docker': DockerUpgrader, 'podman': PodmanUpgrader, 'app': AppUpgrader, 'app-cli': AppUpgrader}
+    upgrader = classes[upgrade_type](upgrader_config(upgrade_type, os.environ['UPGRADEAPP_BENCH_DIR']))
+    call = getattr(upgrader, method)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = asyncio.run(call()) if method.startswith('async_') else call()
+        wall = time.perf_counter() - start
+
+    return {
+        'wall': wall,
+        'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': len(result) if hasattr(result, '__len__') else int(bool(result)),
+    }
+
+
+def run_method(upgrade_type: str, method: str, sim_config: Dict[str, Any], env: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Run one method in a child process against the simulator.
+
+    Returns:
+        Measurements including the subprocess count and throughput
+    """
+    open(sim_config['log'], 'w').close()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', upgrade_type, method],
+        capture_output=True, text=True, env=env, timeout=3600
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{upgrade_type}.{method} failed:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    with open(sim_config['log']) as f:
+        result['subprocesses'] = sum(1 for _ in f)
+    result['throughput'] = scale_items(upgrade_type, method, sim_config) / result['wall'] if result['wall'] else 0.0
+    return result
+
+
+def compare_baseline(key: str, result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compare one result with its baseline.
+
+    Returns:
+        Descriptions of the regressions, empty if there are none
+    """
+    previous = baseline.get(key)
+    if previous is None:
+        return []
+    regressions = []
+    for metric in ('wall', 'rss_kb'):
+        if result[metric] > previous[metric] * (1 + tolerance):
+            regressions.append(f"{metric} {previous[metric]:.4g} -> {result[metric]:.4g}")
+    if result['subprocesses'] > previous['subprocesses']:
+        regressions.append(f"subprocesses {previous['subprocesses']} -> {result['subprocesses']}")
+    return regressions
+
+
+def print_row(key: str, result: Dict[str, Any], regressions: Optional[List[str]], previous: Optional[Dict]) -> None:
+    delta = ''
+    if previous:
+        delta = f" {(result['wall'] / previous['wall'] - 1) * 100:+6.1f}%" if previous['wall'] else ''
+    flag = '  REGRESSION: ' + '; '.join(regressions) if regressions else ''
+    print(f"  {key:<30}{result['wall'] * 1000:10.1f} ms{delta:>8}{result['subprocesses']:8d} procs"
+          f"{result['rss_kb'] / 1024:8.1f} MB{result['throughput']:12.1f}/s{flag}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--child', nargs=2, metavar=('TYPE', 'METHOD'), help=argparse.SUPPRESS)
+    parser.add_argument('--containers', type=int, default=1000, help='Simulated containers')
+    parser.add_argument('--images', type=int, default=200, help='Distinct images the containers use')
+    parser.add_argument('--packages', type=int, default=20000, help='Installed packages')
+    parser.add_argument('--types', default='docker,podman,app', help=f"Comma-separated, from {', '.join(TYPES)}")
+    parser.add_argument('--methods', default='list_items,check_updates,upgrade',
+                        help=f"Comma-separated, from {', '.join(METHODS)}")
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each simulated command takes')
+    parser.add_argument('--pull-latency', type=float, default=0.0, help='Extra seconds each pull takes')
+    parser.add_argument('--output-lines', type=int, default=20, help='Progress lines per pull or upgrade')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of commands that fail')
+    parser.add_argument('--update-rate', type=float, default=0.1, help='Share of items with an update')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Write the results as a baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown or RSS growth over the baseline (default 0.25)')
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(*args.child)))
+        return 0
+
+    types = [t for t in args.types.split(',') if t]
+    methods = [m for m in args.methods.split(',') if m]
+    unknown = [t for t in types if t not in TYPES] + [m for m in methods if m not in METHODS]
+    if unknown:
+        parser.error(f"Unknown types or methods: {', '.join(unknown)}")
+
+    baseline: Dict[str, Any] = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved['results']
+
+    workdir = tempfile.mkdtemp(prefix='upgrader-bench-')
+    try:
+        sim_config = {
+            'containers': args.containers, 'images': args.images, 'packages': args.packages,
+            'latency': args.latency, 'pull_latency': args.pull_latency, 'output_lines': args.output_lines,
+            'failure_rate': args.failure_rate, 'update_rate': args.update_rate,
+            'log': os.path.join(workdir, 'invocations.log'),
+        }
+        if args.baseline and {k: saved['config'].get(k) for k in SCALE_KEYS} != {k: sim_config[k] for k in SCALE_KEYS}:
+            print("Warning: the baseline was recorded with different settings")
+
+        config_path = os.path.join(workdir, 'simulator.json')
+        with open(config_path, 'w') as f:
+            json.dump(sim_config, f)
+        bin_dir = os.path.join(workdir, 'bin')
+        os.makedirs(bin_dir)
+        simulator.install(bin_dir)
+        if any(t.startswith('app') for t in types):
+            write_status(os.path.join(workdir, 'dpkg'), args.packages)
+            write_apt_lists(os.path.join(workdir, 'lists'), args.packages, simulator.Host(sim_config))
+
+        env = dict(os.environ)
+        env.update({
+            'PATH': bin_dir + os.pathsep + env.get('PATH', ''),
+            simulator.CONFIG_ENV: config_path,
+            'UPGRADEAPP_BENCH_DIR': workdir,
+            'UPGRADEAPP_CACHE_DIR': os.path.join(workdir, 'cache'),
+        })
+
+        print(f"Simulated host: {args.containers} containers on {args.images} images, "
+              f"{args.packages} packages; latency {args.latency * 1000:g} ms, "
+              f"failure rate {args.failure_rate:g}, {args.output_lines} output lines")
+        print(f"  {'method':<30}{'wall':>13}{'':>8}{'':>14}{'peak RSS':>11}{'throughput':>14}")
+
+        results: Dict[str, Dict[str, Any]] = {}
+        regressed = False
+        for upgrade_type in types:
+            for method in methods:
+                key = f"{upgrade_type}.{method}"
+                results[key] = run_method(upgrade_type, method, sim_config, env)
+                regressions = compare_baseline(key, results[key], baseline, args.tolerance)
+                regressed = regressed or bool(regressions)
+                print_row(key, results[key], regressions, baseline.get(key))
+
+        if args.save_baseline:
+            with open(args.save_baseline, 'w') as f:
+                json.dump({'config': {k: sim_config[k] for k in SCALE_KEYS}, 'results': results}, f, indent=2)
+            print(f"Baseline written to {args.save_baseline}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
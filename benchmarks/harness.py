@@ -0,0 +1,71 @@
+"""
+Shared timing helpers for the scripts in this directory.
+"""
+
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Optional
+
+# Make the upgradeapp package importable when scripts run from a checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(func: Callable[[], Any], repeat: int = 5) -> float:
+    """
+    Time a function.
+
+    Args:
+        func: Function to call
+        repeat: Number of calls
+
+    Returns:
+        Median wall time in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def report(label: str, seconds: float, detail: str = '') -> None:
+    """
+    Print one result row.
+
+    Args:
+        label: What was measured
+        seconds: Median wall time
+        detail: Optional note such as a result count
+    """
+    suffix = f" ({detail})" if detail else ''
+    print(f"  {label:<28}{seconds * 1000:9.1f} ms{suffix}")
+
+
+def compare(
+    native: Callable[[], Any],
+    native_label: str,
+    baseline: Optional[Callable[[], Any]],
+    baseline_label: str,
+    repeat: int = 5
+) -> None:
+    """
+    Measure a native reader against the CLI path it replaces.
+
+    Args:
+        native: In-process implementation; its result must support len()
+        native_label: Row label for the native implementation
+        baseline: Subprocess implementation, or None if the tool is missing
+        baseline_label: Row label for the baseline
+        repeat: Calls per measurement
+    """
+    native_time = measure(native, repeat)
+    report(native_label, native_time, f"{len(native())} results")
+    if baseline is None:
+        print(f"  {baseline_label:<28}   skipped (tool not installed)")
+        return
+    baseline_time = measure(baseline, repeat)
+    report(baseline_label, baseline_time, f"{len(baseline())} results")
+    print(f"  {'speedup':<28}{baseline_time / native_time:9.1f}x")
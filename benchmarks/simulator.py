@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Simulated docker, podman, dpkg, apt and sudo executables for benchmarks.
+
+install() writes one shim per tool into a directory that is put first on
+PATH; each shim execs this script with the tool name. The simulated host
+is derived from a JSON config named by ``UPGRADEAPP_SIM_CONFIG``, so every
+invocation sees the same containers, images and packages without shared
+state. Every invocation is appended to the config's ``log`` file, one line
+per process, which is how the benchmark counts subprocesses.
+
+Config keys:
+    containers, images, packages: Scale of the simulated host
+    update_rate: Share of images and packages with a newer version
+    failure_rate: Share of invocations that fail, chosen deterministically
+        from the arguments so reruns fail the same calls
+    latency: Seconds every invocation sleeps before answering
+    pull_latency: Extra seconds every pull sleeps
+    output_lines: Progress lines printed by pulls, updates and upgrades
+    log: Path of the invocation log
+"""
+
+import hashlib
+import json
+import os
+import stat
+import sys
+import time
+import zlib
+
+
+TOOLS = ('docker', 'podman', 'dpkg', 'apt', 'sudo')
+
+CONFIG_ENV = 'UPGRADEAPP_SIM_CONFIG'
+
+
+def install(bin_dir: str, python: str = sys.executable) -> None:
+    """
+    Write the tool shims.
+
+    Args:
+        bin_dir: Directory to write the shims into
+        python: Interpreter that runs this script
+    """
+    script = os.path.abspath(__file__)
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{python}" -S "{script}" {tool} "$@"\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def _fraction(key: str) -> float:
+    return zlib.crc32(key.encode()) / 0xFFFFFFFF
+
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class Host:
+    """The simulated host described by a config."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.update_rate = float(config.get('update_rate', 0.1))
+        self._by_id = None
+
+    def updated(self, key: str) -> bool:
+        return _fraction('update:' + key) < self.update_rate
+
+    def failed(self, argv: list) -> bool:
+        return _fraction('fail:' + ' '.join(argv)) < float(self.config.get('failure_rate', 0.0))
+
+    def progress(self, label: str) -> list:
+        return [f"{label}: {i:04d} [{'=' * 20}>] {i * 512}kB/{self.config.get('output_lines', 20) * 512}kB"
+                for i in range(int(self.config.get('output_lines', 20)))]
+
+    # Containers and images
+
+    def image_tag(self, index: int) -> str:
+        return f"registry.example.com/team/app{index:04d}:latest"
+
+    def image_index(self, reference: str) -> int:
+        for prefix in ('registry.example.com/team/app',):
+            if reference.startswith(prefix):
+                return int(reference[len(prefix):len(prefix) + 4])
+        return -1
+
+    def image_ids(self, index: int) -> tuple:
+        old = _digest(f"old{index}")
+        new = _digest(f"new{index}") if self.updated(self.image_tag(index)) else old
+        return old, new
+
+    def container_name(self, index: int) -> str:
+        return f"svc{index:05d}"
+
+    def container(self, name: str):
+        if not name.startswith('svc') or not name[3:8].isdigit():
+            return None
+        index = int(name[3:8])
+        if index >= int(self.config['containers']):
+            return None
+        return index
+
+    def container_doc(self, index: int, prefix: str) -> dict:
+        name = self.container_name(index)
+        image = index % int(self.config['images'])
+        return {
+            'Id': _digest(name),
+            'Name': '/' + name,
+            'Image': prefix + self.image_ids(image)[0],
+            'Config': {'Image': self.image_tag(image), 'Hostname': _digest(name)[:12],
+                       'Env': ['PATH=/usr/bin', f'SERVICE={name}'], 'Labels': {'tier': 'bench'}},
+            'HostConfig': {'NetworkMode': 'bridge', 'RestartPolicy': {'Name': 'unless-stopped'}},
+            'Mounts': [{'Type': 'volume', 'Name': f'{name}-data', 'Destination': '/data', 'RW': True}],
+            'NetworkSettings': {'Networks': {'bridge': {'Aliases': None}}},
+            'State': {'Running': True, 'Status': 'running'},
+        }
+
+    def image_doc(self, index: int, image_id: str, prefix: str) -> dict:
+        tag = self.image_tag(index)
+        current = image_id == self.image_ids(index)[1]
+        return {
+            'Id': prefix + image_id,
+            'RepoTags': [tag] if current else [],
+            'RepoDigests': [f"{tag.rsplit(':', 1)[0]}@sha256:{_digest('manifest' + image_id)}"],
+            'Size': 50_000_000 + index * 1000,
+            'Parent': '',
+            'RootFS': {'Layers': [f"sha256:{_digest('base')}", f"sha256:{_digest('layer' + image_id)}"]},
+            'Config': {'Env': ['PATH=/usr/bin'], 'Labels': {}},
+        }
+
+    def find_image(self, reference: str, prefix: str):
+        reference = reference[len('sha256:'):] if reference.startswith('sha256:') else reference
+        index = self.image_index(reference)
+        if index >= 0:
+            return self.image_doc(index, self.image_ids(index)[1], prefix)
+        if self._by_id is None:
+            self._by_id = {
+                image_id: index for index in range(int(self.config['images'])) for image_id in self.image_ids(index)
+            }
+        index = self._by_id.get(reference)
+        return self.image_doc(index, reference, prefix) if index is not None else None
+
+
+def run_container_cli(host: Host, tool: str, args: list) -> int:
+    # Docker prefixes IDs with sha256:, Podman does not
+    prefix = 'sha256:' if tool == 'docker' else ''
+    out = sys.stdout.write
+    command = args[0] if args else ''
+
+    if command == '--version':
+        out(f"{tool} version 99.0.0-sim\n")
+    elif command == 'ps':
+        for index in range(int(host.config['containers'])):
+            doc = host.container_doc(index, prefix)
+            names = doc['Name'][1:] if tool == 'docker' else [doc['Name'][1:]]
+            out(json.dumps({'ID': doc['Id'], 'Names': names, 'Image': doc['Config']['Image'],
+                            'State': 'running', 'Labels': 'tier=bench', 'Mounts': ''}) + '\n')
+    elif command == 'inspect':
+        if args[1] == '--format':
+            index = host.container(args[3])
+            if index is None:
+                return 1
+            out(host.container_doc(index, prefix)['Config']['Image'] + '\n')
+            return 0
+        docs = []
+        by_id = {}
+        for name in args[1:]:
+            index = host.container(name)
+            if index is None:
+                if not by_id:
+                    by_id = {_digest(host.container_name(i)): i for i in range(int(host.config['containers']))}
+                index = by_id.get(name)
+            if index is not None:
+                docs.append(host.container_doc(index, prefix))
+        out(json.dumps(docs) + '\n')
+        return 0 if docs else 1
+    elif command == 'image' and args[1] == 'inspect':
+        if args[2] == '--format':
+            doc = host.find_image(args[4], prefix)
+            if doc is None:
+                return 1
+            out(json.dumps(doc['RepoDigests']) + '\n')
+            return 0
+        docs = [doc for doc in (host.find_image(ref, prefix) for ref in args[2:]) if doc is not None]
+        out(json.dumps(docs) + '\n')
+        return 0 if docs else 1
+    elif command == 'images':
+        for index in range(int(host.config['images'])):
+            old, new = host.image_ids(index)
+            if '-q' in args:
+                out(''.join(f"{prefix}{image_id}\n" for image_id in dict.fromkeys((new, old))))
+            else:
+                out(host.image_tag(index) + '\n')
+                if old != new:
+                    out('<none>:<none>\n')
+    elif command == 'pull':
+        time.sleep(float(host.config.get('pull_latency', 0)))
+        reference = args[1]
+        index = host.image_index(reference)
+        if index < 0:
+            sys.stderr.write(f"Error: pull access denied for {reference}\n")
+            return 1
+        out('\n'.join(host.progress('Downloading')) + '\n')
+        if host.updated(host.image_tag(index)):
+            out(f"Status: Downloaded newer image for {reference}\n")
+        else:
+            out(f"Status: Image is up to date for {reference}\n")
+    elif command == 'create':
+        out(_digest(' '.join(args)) + '\n')
+    elif command == 'rmi':
+        for reference in args[1:]:
+            out(f"Deleted: {prefix}{reference}\n")
+    elif command not in ('rename', 'start', 'stop', 'rm', 'network'):
+        sys.stderr.write(f"{tool}: unknown command {command}\n")
+        return 125
+    return 0
+
+
+def run_apt(host: Host, args: list) -> int:
+    out = sys.stdout.write
+    packages = int(host.config['packages'])
+    if '--version' in args:
+        out("apt 9.9.9 (amd64)\n")
+    elif 'update' in args:
+        out('\n'.join(f"Get:{i} http://deb.example.org/debian stable InRelease" for i in
+                      range(int(host.config.get('output_lines', 20)))) + '\n')
+    elif 'list' in args:
+        out("Listing... Done\n")
+        for i in range(packages):
+            name = f"pkg{i:05d}"
+            if i % 50 and host.updated(name):
+                out(f"{name}/stable 1.{i}.1-1 amd64 [upgradable from: 1.{i}.0-1]\n")
+    elif 'upgrade' in args:
+        out('\n'.join(host.progress('Unpacking')) + '\n')
+    else:
+        sys.stderr.write(f"apt: unknown arguments {' '.join(args)}\n")
+        return 100
+    return 0
+
+
+def run_dpkg(host: Host, args: list) -> int:
+    if '--version' in args:
+        sys.stdout.write("Debian 'dpkg' package management program version 9.9.9 (amd64).\n")
+    elif '--get-selections' in args:
+        sys.stdout.write(''.join(f"pkg{i:05d}\t\t\t\tinstall\n" for i in range(int(host.config['packages']))
+                                 if i % 50))
+    else:
+        return 2
+    return 0
+
+
+def main(argv: list) -> int:
+    tool, args = argv[0], argv[1:]
+    if tool == 'sudo':
+        tool, args = args[0], args[1:]
+
+    with open(os.environ[CONFIG_ENV]) as f:
+        config = json.load(f)
+    host = Host(config)
+    with open(config['log'], 'a') as log:
+        log.write(' '.join([tool] + args)[:200] + '\n')
+
+    time.sleep(float(config.get('latency', 0)))
+    if args and args[0] != '--version' and host.failed([tool] + args):
+        sys.stderr.write(f"Error: simulated {tool} failure\n")
+        return 1
+    if tool in ('docker', 'podman'):
+        return run_container_cli(host, tool, args)
+    if tool == 'apt':
+        return run_apt(host, args)
+    return run_dpkg(host, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -4,35 +4,83 @@ Main entry point for the UpgradeApp application.
 """
 
 import argparse
+import asyncio
+import contextlib
+import itertools
+import json
 import sys
-from typing import Optional
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO
 
-from upgradeapp.upgraders import AppUpgrader, DockerUpgrader, PodmanUpgrader
-from upgradeapp.utils import Config, setup_logger
+from upgradeapp.agent import Agent, AgentClient, AgentError, AgentUnavailable, UpgraderUnavailable, serve
+from upgradeapp.agent import default_address as default_agent_address
+from upgradeapp import plugins
+from upgradeapp.fleet import FleetCoordinator, HostResult, load_inventory
+from upgradeapp.utils import Config, metrics, setup_logger, shutdown_logger, tracing
+from upgradeapp.utils.aio import gather_with_timeouts, run_blocking
+
+
+DEFAULT_TRACE_FILE = 'upgradeapp-trace.json'
 
 
 def get_upgrader(upgrade_type: str, config: Optional[Config] = None):
     """
     Get the appropriate upgrader based on type.
 
+    Only the module of the requested type is imported, see plugins.
+
     Args:
-        upgrade_type: Type of upgrade (app, docker, podman)
+        upgrade_type: Type of upgrade (app, docker, podman or a plugin type)
         config: Optional configuration object
 
     Returns:
         Upgrader instance
+
+    Raises:
+        ValueError: If the type is unknown
+    """
+    upgrader_class = plugins.load(upgrade_type.lower())
+    return upgrader_class(config.to_dict() if config else None)
+
+
+class ResultWriter:
     """
-    upgraders = {
-        'app': AppUpgrader,
-        'docker': DockerUpgrader,
-        'podman': PodmanUpgrader,
-    }
+    Writes results in the selected output format as they arrive.
 
-    upgrader_class = upgraders.get(upgrade_type.lower())
-    if not upgrader_class:
-        raise ValueError(f"Unknown upgrade type: {upgrade_type}")
+    ``text`` prints one line per result, ``ndjson`` one JSON object per
+    line, flushed immediately so consumers see partial results of long
+    runs, and ``json`` a single array once the run has finished.
+    """
 
-    return upgrader_class(config.to_dict() if config else None)
+    def __init__(self, output_format: str, stream: TextIO):
+        self.output_format = output_format
+        self.stream = stream
+        self.count = 0
+        self._records: List[Dict[str, Any]] = []
+
+    def write(self, record: Dict[str, Any], text: str) -> None:
+        """
+        Write one result.
+
+        Args:
+            record: Result for the structured formats
+            text: Line to print in text format
+        """
+        self.count += 1
+        if self.output_format == 'ndjson':
+            self.stream.write(json.dumps(record) + '\n')
+            self.stream.flush()
+        elif self.output_format == 'json':
+            self._records.append(record)
+        else:
+            print(text, file=self.stream, flush=True)
+
+    def close(self) -> None:
+        """Write anything held back until the end of the run."""
+        if self.output_format == 'json':
+            json.dump(self._records, self.stream, indent=2)
+            self.stream.write('\n')
+            self.stream.flush()
 
 
 def main():
@@ -42,11 +90,12 @@ def main():
     )
     parser.add_argument(
         'type',
-        choices=['app', 'docker', 'podman'],
-        help='Type of upgrade to perform'
+        help=f"Type of upgrade to perform: {', '.join(plugins.BUILTIN_UPGRADERS)} or an installed plugin type; "
+             'all runs every available type side by side, serve starts the agent'
     )
     parser.add_argument(
         'action',
+        nargs='?',
         choices=['list', 'check', 'upgrade'],
         help='Action to perform'
     )
@@ -63,71 +112,474 @@ def main():
         '--config',
         help='Path to configuration file'
     )
+    parser.add_argument(
+        '--changes-only',
+        action='store_true',
+        help='With check, only report updates that are new since the previous --changes-only run'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='Number of items to check concurrently'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        help='With type all, seconds each upgrader may run before it is cancelled; '
+             'with --fleet, seconds to wait for a host'
+    )
+    parser.add_argument(
+        '--format',
+        default='text',
+        choices=['text', 'json', 'ndjson'],
+        help='Output format for results; json and ndjson send logs to stderr'
+    )
+    parser.add_argument(
+        '--listen',
+        help='With serve, address to listen on: unix:/path or 127.0.0.1:port'
+    )
+    parser.add_argument(
+        '--agent',
+        metavar='ADDRESS',
+        help='Address of the agent to send requests to'
+    )
+    parser.add_argument(
+        '--no-agent',
+        action='store_true',
+        help='Run locally even if an agent is running'
+    )
+    parser.add_argument(
+        '--token',
+        help='Token the agent requires from clients'
+    )
+    parser.add_argument(
+        '--fleet',
+        metavar='INVENTORY',
+        help='Run the action on the agents listed in an inventory file instead of this host'
+    )
+    parser.add_argument(
+        '--max-unavailable',
+        help='With --fleet upgrade, hosts upgraded at once, as a count or a percentage such as 10%%'
+    )
+    parser.add_argument(
+        '--max-failures',
+        help='With --fleet upgrade, failed hosts tolerated before the rollout stops, as a count or percentage'
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const=DEFAULT_TRACE_FILE,
+        metavar='TRACE_FILE',
+        help='Trace upgrader phases and external commands, write a Chrome trace (Perfetto) to '
+             f'TRACE_FILE (default {DEFAULT_TRACE_FILE}) and print a summary table; runs locally'
+    )
     parser.add_argument(
         '--log-level',
         default='INFO',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
         help='Logging level'
     )
+    parser.add_argument(
+        '--log-format',
+        choices=['text', 'json'],
+        help='Log record format; json writes one object per line with item, phase and duration fields'
+    )
+    parser.add_argument(
+        '--log-file',
+        help='Also write logs to this file, rotated by size'
+    )
 
     args = parser.parse_args()
-
-    # Setup logger
-    logger = setup_logger(level=args.log_level)
+    if args.type != 'serve' and not args.action:
+        parser.error('the following arguments are required: action')
+    if args.fleet and args.type in ('all', 'serve'):
+        parser.error(f'--fleet cannot be used with {args.type}')
+    # Fleet hosts may have plugins this host lacks; their agents check the type
+    if args.type not in ('all', 'serve') and not args.fleet and not plugins.is_known(args.type.lower()):
+        parser.error(f"argument type: invalid choice: {args.type!r} "
+                     f"(choose from {', '.join(plugins.upgrade_types() + ['all', 'serve'])})")
 
     # Load configuration
     config = Config(args.config) if args.config else Config()
     if args.dry_run:
         config.set('dry_run', True)
+    if args.workers:
+        config.set('check_workers', args.workers)
+
+    # Structured output owns stdout; logs and progress messages go to stderr
+    structured = args.format != 'text'
+    writer = ResultWriter(args.format, sys.stdout)
+    log_settings = config.get('logging', {})
+    logger = setup_logger(
+        level=args.log_level,
+        log_file=args.log_file or log_settings.get('file'),
+        stream=sys.stderr if structured else None,
+        log_format=args.log_format or log_settings.get('format', 'text'),
+        max_bytes=log_settings.get('max_bytes', 10 * 1024 * 1024),
+        backup_count=log_settings.get('backup_count', 5),
+        background=True
+    )
+    try:
+        return dispatch(args, config, writer, logger)
+    finally:
+        shutdown_logger()
+
+
+def dispatch(args: argparse.Namespace, config: Config, writer: ResultWriter, logger) -> int:
+    """
+    Run the parsed command.
+
+    Args:
+        args: Parsed command-line arguments
+        config: Configuration object
+        writer: Destination for results
+        logger: Application logger
+
+    Returns:
+        Process exit code
+    """
+    structured = args.format != 'text'
+    if args.type == 'serve':
+        return run_agent(args, config, logger)
 
     logger.info(f"UpgradeApp - Starting {args.type} {args.action}")
 
+    if args.profile:
+        tracing.enable()
+    textfile = config.get('metrics', {}).get('textfile')
+    if textfile:
+        metrics.enable()
+    start = time.monotonic()
+    code = 1
     try:
-        # Get the appropriate upgrader
-        upgrader = get_upgrader(args.type, config)
+        # Plugin upgraders may still print their progress
+        with contextlib.redirect_stdout(sys.stderr) if structured else contextlib.nullcontext(), \
+                tracing.span(f"{args.type} {args.action}"):
+            if args.type == 'all':
+                code = asyncio.run(run_all(args, config, writer, logger))
+            elif args.fleet:
+                code = run_fleet(args, config, writer, logger)
+            else:
+                code = run_action(args, config, writer, logger)
+    except KeyboardInterrupt:
+        logger.error("Interrupted")
+        code = 130
+    except Exception as e:
+        logger.error(f"Error: {e}", exc_info=True)
+        code = 1
+    finally:
+        writer.close()
+        if args.profile:
+            write_profile(tracing.disable(), args.profile, logger)
+        if textfile:
+            write_metrics(metrics.disable(), textfile, args, code, time.monotonic() - start, logger)
+    return code
 
-        # Check if upgrader is available
-        if not upgrader.check_available():
-            logger.error(f"{args.type.capitalize()} is not available on this system")
-            return 1
 
-        # Perform the requested action
-        if args.action == 'list':
-            items = upgrader.list_items()
-            if items:
-                logger.info(f"Found {len(items)} items:")
-                for item in items:
-                    print(f"  - {item}")
-            else:
-                logger.info("No items found")
+def write_profile(tracer: tracing.Tracer, path: str, logger) -> None:
+    """
+    Write the trace of a --profile run and print its summary to stderr.
+
+    Args:
+        tracer: Tracer that recorded the run
+        path: Destination of the Chrome trace
+        logger: Application logger
+    """
+    print(tracer.format_summary(), file=sys.stderr)
+    try:
+        tracer.write(path)
+    except OSError as e:
+        logger.error(f"Could not write trace: {e}")
+        return
+    logger.info(f"Trace of {len(tracer.spans)} spans written to {path}; open it in https://ui.perfetto.dev")
+
+
+def write_metrics(registry: metrics.MetricsRegistry, path: str, args: argparse.Namespace,
+                  code: int, duration: float, logger) -> None:
+    """
+    Add the metrics of a run to the node-exporter textfile.
+
+    Args:
+        registry: Registry that collected the run
+        path: Textfile to merge the metrics into
+        args: Parsed command line arguments
+        code: Exit status of the run
+        duration: Duration of the run in seconds
+        logger: Application logger
+    """
+    registry.record_run(args.type, args.action, code == 0, duration)
+    try:
+        registry.write_textfile(path)
+    except OSError as e:
+        logger.error(f"Could not write metrics: {e}")
+        return
+    logger.debug(f"Metrics written to {path}")
+
 
+async def run_all(args: argparse.Namespace, config: Config, writer: ResultWriter, logger) -> int:
+    """
+    Run the requested action for every upgrader type on one event loop.
+
+    Each type runs as its own task under the ``--timeout`` limit; a type
+    that is unavailable is skipped, and one that fails or times out does
+    not stop the others. Interrupting the run cancels every task, which
+    stops the package manager and container CLI processes it started.
+
+    Args:
+        args: Parsed command-line arguments
+        config: Configuration object
+        writer: Destination for results
+        logger: Application logger
+
+    Returns:
+        Process exit code
+    """
+    async def run(upgrade_type: str) -> bool:
+        upgrader = get_upgrader(upgrade_type, config)
+        if not await upgrader.async_check_available():
+            logger.info(f"{upgrade_type.capitalize()} is not available on this system, skipping")
+            return True
+
+        if args.action == 'list':
+            for item in await upgrader.async_list_items():
+                writer.write({'type': upgrade_type, 'item': item}, f"  - [{upgrade_type}] {item}")
         elif args.action == 'check':
-            logger.info("Checking for updates...")
-            updates = upgrader.check_updates(args.item)
-            if updates:
-                logger.info(f"Found {len(updates)} updates available:")
-                for item, version in updates.items():
-                    print(f"  - {item}: {version}")
+            if args.changes_only:
+                updates = await run_blocking(upgrader.check_changes, args.item)
             else:
-                logger.info("No updates available")
-
+                updates = await upgrader.async_check_updates(args.item)
+            for item, version in updates.items():
+                writer.write({'type': upgrade_type, 'item': item, 'version': version},
+                             f"  - [{upgrade_type}] {item}: {version}")
         elif args.action == 'upgrade':
-            if args.dry_run:
-                logger.info("Performing dry run...")
-            logger.info("Starting upgrade...")
-            success = upgrader.upgrade(args.item, dry_run=args.dry_run)
-            if success:
-                logger.info("Upgrade completed successfully")
-                return 0
-            else:
-                logger.error("Upgrade failed")
-                return 1
+            success = await upgrader.async_upgrade(args.item, dry_run=args.dry_run)
+            record = {'type': upgrade_type, 'item': args.item, 'dry_run': args.dry_run, 'success': success}
+            if getattr(upgrader, 'downtimes', None) and not args.dry_run:
+                record['downtime'] = dict(upgrader.downtimes)
+            if getattr(upgrader, 'skipped', None):
+                record['skipped'] = {name: decision.reason for name, decision in upgrader.skipped.items()}
+            writer.write(record, f"  - [{upgrade_type}] upgrade {'succeeded' if success else 'failed'}")
+            return success
+        return True
+
+    def finished(upgrade_type: str, result) -> None:
+        if isinstance(result, BaseException):
+            logger.error(f"{upgrade_type.capitalize()} {args.action} failed: {result}")
+
+    results = await gather_with_timeouts(
+        {upgrade_type: run(upgrade_type) for upgrade_type in plugins.upgrade_types()}, args.timeout, finished
+    )
+    logger.info(f"Found {writer.count} results")
+    return 0 if all(result is True for result in results.values()) else 1
+
+
+def agent_settings(args: argparse.Namespace, config: Config) -> Dict[str, Any]:
+    """
+    Get the agent settings, with command-line options taking precedence.
+
+    Args:
+        args: Parsed command-line arguments
+        config: Configuration object
+
+    Returns:
+        The ``agent`` configuration section with enabled, address, token
+        and inventory_ttl filled in
+    """
+    settings = {'enabled': True, 'address': None, 'token': None, 'inventory_ttl': 60}
+    settings.update(config.get('agent', {}))
+    if args.agent:
+        settings['address'] = args.agent
+    if args.listen:
+        settings['address'] = args.listen
+    if args.token:
+        settings['token'] = args.token
+    if args.no_agent or args.profile:
+        # A profile traces this process, so the work must not move to the agent
+        settings['enabled'] = False
+    return settings
+
+
+def run_agent(args: argparse.Namespace, config: Config, logger) -> int:
+    """
+    Run the agent until it is stopped.
+
+    Args:
+        args: Parsed command-line arguments
+        config: Configuration object
+        logger: Application logger
+
+    Returns:
+        Process exit code
+    """
+    settings = agent_settings(args, config)
+    agent = Agent(get_upgrader, config, inventory_ttl=settings['inventory_ttl'])
+    try:
+        serve(agent, settings['address'] or default_agent_address(), settings['token'], warm=plugins.upgrade_types())
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not start agent: {e}")
+        return 1
+    return 0
+
+
+def run_fleet(args: argparse.Namespace, config: Config, writer: ResultWriter, logger) -> int:
+    """
+    Run the requested action on every agent in the fleet inventory.
+
+    Args:
+        args: Parsed command-line arguments
+        config: Configuration object
+        writer: Destination for per-host results
+        logger: Application logger
 
+    Returns:
+        Process exit code; non-zero if any host failed or the rollout halted
+    """
+    settings = {'concurrency': 32, 'max_unavailable': 1, 'max_failures': 0}
+    settings.update(config.get('fleet', {}))
+    if args.max_unavailable:
+        settings['max_unavailable'] = args.max_unavailable
+    if args.max_failures:
+        settings['max_failures'] = args.max_failures
+
+    hosts = load_inventory(args.fleet)
+    coordinator = FleetCoordinator(
+        hosts,
+        args.type,
+        token=agent_settings(args, config)['token'],
+        concurrency=settings['concurrency'],
+        timeout=args.timeout,
+    )
+
+    def write(result: HostResult) -> None:
+        lines = [f"  [{result.host}] {result.status}" + (f": {result.error}" if result.error else '')]
+        for record in result.records:
+            if args.action == 'check':
+                lines.append(f"    - {record['item']}: {record['version']}")
+            elif args.action == 'list':
+                lines.append(f"    - {record['item']}")
+        writer.write({'type': args.type, 'action': args.action, **result.to_dict()}, '\n'.join(lines))
+
+    logger.info(f"Running {args.type} {args.action} on {len(hosts)} hosts")
+    if args.action == 'upgrade':
+        report = coordinator.upgrade(
+            args.item,
+            dry_run=args.dry_run,
+            max_unavailable=settings['max_unavailable'],
+            max_failures=settings['max_failures'],
+            on_result=write,
+        )
+    else:
+        report = coordinator.run(args.action, args.item, changes_only=args.changes_only, on_result=write)
+
+    if report.success:
+        logger.info(report.summary())
         return 0
+    logger.error(report.summary())
+    return 1
 
-    except Exception as e:
-        logger.error(f"Error: {e}", exc_info=True)
+
+def action_records(args: argparse.Namespace, config: Config, logger) -> Iterator[Dict[str, Any]]:
+    """
+    Run the requested action on the agent, or locally if none is running.
+
+    Args:
+        args: Parsed command-line arguments
+        config: Configuration object
+        logger: Application logger
+
+    Returns:
+        Iterator over the action's result records
+
+    Raises:
+        UpgraderUnavailable: If the upgrade type is not available
+    """
+    options = {'item': args.item, 'dry_run': args.dry_run, 'changes_only': args.changes_only}
+    settings = agent_settings(args, config)
+    if settings['enabled']:
+        client = AgentClient(settings['address'], settings['token'])
+        try:
+            records = client.run(args.type, args.action, **options)
+        except AgentUnavailable as e:
+            # Only raised before the request was sent, so the action cannot run twice
+            logger.debug(f"{e}, running locally")
+        else:
+            ignored = [option for option, value in (('--config', args.config), ('--workers', args.workers)) if value]
+            message = f"Using agent at {client.address} with the agent's own configuration"
+            if ignored:
+                message += f"; {' and '.join(ignored)} {'does' if len(ignored) == 1 else 'do'} not apply"
+            logger.info(message)
+            return _started(records)
+
+    agent = Agent(get_upgrader, config)
+    return _started(agent.run(args.type, args.action, **options))
+
+
+def _started(records: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    # Run up to the first record so unavailability surfaces before any output
+    first = next(records, None)
+    return itertools.chain([first] if first is not None else [], records)
+
+
+def run_action(args: argparse.Namespace, config: Config, writer: ResultWriter, logger) -> int:
+    """
+    Run the requested action, streaming its results to the writer.
+
+    Args:
+        args: Parsed command-line arguments
+        config: Configuration object
+        writer: Destination for results
+        logger: Application logger
+
+    Returns:
+        Process exit code
+    """
+    if args.action == 'check':
+        logger.info("Checking for updates...")
+    elif args.action == 'upgrade':
+        if args.dry_run:
+            logger.info("Performing dry run...")
+        logger.info("Starting upgrade...")
+
+    try:
+        records = action_records(args, config, logger)
+    except UpgraderUnavailable as e:
+        logger.error(str(e))
         return 1
+    except AgentError as e:
+        logger.error(f"Agent error: {e}")
+        return 1
+
+    # Perform the requested action
+    if args.action == 'list':
+        for record in records:
+            writer.write({'type': args.type, **record}, f"  - {record['item']}")
+        if writer.count:
+            logger.info(f"Found {writer.count} items")
+        else:
+            logger.info("No items found")
+
+    elif args.action == 'check':
+        for record in records:
+            writer.write({'type': args.type, **record}, f"  - {record['item']}: {record['version']}")
+        if writer.count:
+            logger.info(f"Found {writer.count} {'new ' if args.changes_only else ''}updates available")
+        else:
+            logger.info("No new updates" if args.changes_only else "No updates available")
+
+    elif args.action == 'upgrade':
+        results = list(records)
+        success = all(record['success'] for record in results)
+        if args.format != 'text':
+            for record in results:
+                writer.write({'type': args.type, **record}, '')
+        if success:
+            logger.info("Upgrade completed successfully")
+            return 0
+        else:
+            logger.error("Upgrade failed")
+            return 1
+
+    return 0
 
 
 if __name__ == '__main__':
@@ -0,0 +1,293 @@
+"""
+Tests for the long-running agent and its client.
+"""
+
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import main
+from upgradeapp.agent import (
+    Agent,
+    AgentClient,
+    AgentError,
+    AgentUnavailable,
+    UpgraderUnavailable,
+    make_server,
+    parse_address,
+)
+from upgradeapp.upgraders.base import BaseUpgrader
+
+
+class FakeUpgrader(BaseUpgrader):
+    """Upgrader counting how often it is created and queried."""
+
+    created = 0
+
+    def __init__(self, config=None, available=True):
+        super().__init__(config)
+        FakeUpgrader.created += 1
+        self.available = available
+        self.listed = 0
+        self.stamp = 1
+        self.inventory_refreshes = 0
+
+    def check_available(self):
+        return self.available
+
+    def list_items(self):
+        self.listed += 1
+        return ['web', 'db']
+
+    def check_updates(self, item=None):
+        updates = {'web': 'v2.0', 'db': 'v3.1'}
+        return {item: updates[item]} if item else updates
+
+    def upgrade(self, item=None, dry_run=False):
+        return dry_run
+
+    def package_db_stamp(self):
+        return self.stamp
+
+    def inventory(self, refresh=False):
+        self.inventory_refreshes += refresh
+
+
+def factory(upgrade_type, config=None):
+    if upgrade_type not in ('app', 'docker'):
+        raise ValueError(f"Unknown upgrade type: {upgrade_type}")
+    return FakeUpgrader(config, available=upgrade_type == 'app')
+
+
+class TestAgent(unittest.TestCase):
+    """Test cases for Agent."""
+
+    def setUp(self):
+        FakeUpgrader.created = 0
+        self.agent = Agent(factory, inventory_ttl=60)
+
+    def test_upgrader_reused(self):
+        """Test one upgrader instance serves every request."""
+        list(self.agent.run('app', 'list'))
+        list(self.agent.run('app', 'check'))
+        self.assertEqual(FakeUpgrader.created, 1)
+        self.assertEqual(self.agent.upgrader('app').inventory_refreshes, 1)
+
+    def test_listing_cached_until_database_changes(self):
+        """Test the package listing is reused until the stamp changes."""
+        upgrader = self.agent.upgrader('app')
+        self.assertEqual(list(self.agent.run('app', 'list')), [{'item': 'web'}, {'item': 'db'}])
+        list(self.agent.run('app', 'list'))
+        self.assertEqual(upgrader.listed, 1)
+        upgrader.stamp = 2
+        list(self.agent.run('app', 'list'))
+        self.assertEqual(upgrader.listed, 2)
+
+    def test_upgrade_invalidates_caches(self):
+        """Test an upgrade drops the listing and inventory."""
+        upgrader = self.agent.upgrader('app')
+        list(self.agent.run('app', 'list'))
+        self.assertEqual(list(self.agent.run('app', 'upgrade', dry_run=True)),
+                         [{'item': None, 'dry_run': True, 'success': True}])
+        list(self.agent.run('app', 'list'))
+        self.assertEqual((upgrader.listed, upgrader.inventory_refreshes), (2, 2))
+
+    def test_unavailable(self):
+        """Test an unavailable type raises UpgraderUnavailable."""
+        with self.assertRaises(UpgraderUnavailable):
+            list(self.agent.run('docker', 'check'))
+
+    def test_parse_address(self):
+        """Test Unix socket and TCP addresses are recognized."""
+        self.assertEqual(parse_address('unix:/run/a.sock'), ('unix', '/run/a.sock'))
+        self.assertEqual(parse_address('/run/a.sock'), ('unix', '/run/a.sock'))
+        self.assertEqual(parse_address('http://127.0.0.1:8765/'), ('tcp', ('127.0.0.1', 8765)))
+        with self.assertRaises(ValueError):
+            parse_address('localhost')
+
+
+class AgentServerMixin:
+    """Starts an agent server for the duration of a test."""
+
+    address = None
+    token = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.agent = Agent(factory)
+        self.server = make_server(self.agent, self.make_address(), self.token)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.client = AgentClient(self.client_address(), self.token, timeout=10)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+
+class TestUnixAgent(AgentServerMixin, unittest.TestCase):
+    """Test cases for an agent on a Unix socket."""
+
+    def make_address(self):
+        return 'unix:' + os.path.join(self.tmpdir.name, 'agent.sock')
+
+    def client_address(self):
+        return self.make_address()
+
+    def test_socket_private(self):
+        """Test the socket is only accessible by its owner."""
+        mode = os.stat(os.path.join(self.tmpdir.name, 'agent.sock')).st_mode & 0o777
+        self.assertEqual(mode, 0o600)
+
+    def test_health(self):
+        """Test the health endpoint."""
+        self.assertEqual(self.client.health()['status'], 'ok')
+
+    def test_check(self):
+        """Test check results are streamed back."""
+        self.assertEqual(list(self.client.run('app', 'check', item='db')), [{'item': 'db', 'version': 'v3.1'}])
+
+    def test_unavailable_type(self):
+        """Test an unavailable type is reported as such."""
+        with self.assertRaises(UpgraderUnavailable):
+            self.client.run('docker', 'list')
+
+    def test_unavailable_upgrade_reported_in_stream(self):
+        """Test an upgrade's unavailability arrives as a status record after the response started."""
+        records = self.client.run('docker', 'upgrade')
+        with self.assertRaises(UpgraderUnavailable):
+            list(records)
+
+    def test_timeout_after_sending_is_not_unavailable(self):
+        """Test a client giving up on a running upgrade gets a hard error and main does not rerun it."""
+        def slow_upgrade(item=None, dry_run=False):
+            time.sleep(1)
+            return True
+        self.agent.upgrader('app').upgrade = slow_upgrade
+        client = AgentClient(self.client_address(), timeout=0.2)
+        with self.assertRaises(AgentError) as raised:
+            list(client.run('app', 'upgrade'))
+        self.assertNotIsInstance(raised.exception, AgentUnavailable)
+
+        argv = ['main.py', 'app', 'upgrade', '--agent', self.client_address()]
+        with mock.patch.object(AgentClient, 'run', side_effect=AgentError('timed out')), \
+                mock.patch.object(main, 'get_upgrader', side_effect=AssertionError('ran locally')), \
+                mock.patch('sys.argv', argv), mock.patch('sys.stdout', io.StringIO()), \
+                mock.patch('sys.stderr', io.StringIO()):
+            self.assertEqual(main.main(), 1)
+
+    def test_unknown_action(self):
+        """Test an unknown action is rejected."""
+        with self.assertRaises(AgentError):
+            self.client.run('app', 'remove')
+
+    def test_stale_socket_replaced(self):
+        """Test a socket left by a dead agent does not block a new one."""
+        self.server.shutdown()
+        self.server.socket.close()
+        path = os.path.join(self.tmpdir.name, 'agent.sock')
+        self.assertTrue(os.path.exists(path))
+        server = make_server(self.agent, 'unix:' + path)
+        server.server_close()
+
+    def test_main_uses_agent(self):
+        """Test main.py sends the request to the running agent."""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        argv = ['main.py', 'app', 'check', '--format', 'ndjson', '--agent', self.client_address()]
+        with mock.patch.object(main, 'get_upgrader', side_effect=AssertionError('ran locally')), \
+                mock.patch('sys.argv', argv), mock.patch('sys.stdout', stdout), mock.patch('sys.stderr', stderr):
+            code = main.main()
+        self.assertEqual(code, 0)
+        self.assertEqual([json.loads(line) for line in stdout.getvalue().splitlines()],
+                         [{'type': 'app', 'item': 'web', 'version': 'v2.0'},
+                          {'type': 'app', 'item': 'db', 'version': 'v3.1'}])
+
+    def test_main_reports_ignored_options(self):
+        """Test main.py says at info level that the agent's configuration replaces --workers."""
+        stderr = io.StringIO()
+        argv = ['main.py', 'app', 'list', '--format', 'ndjson', '--workers', '8', '--agent', self.client_address()]
+        with mock.patch('sys.argv', argv), mock.patch('sys.stdout', io.StringIO()), mock.patch('sys.stderr', stderr):
+            self.assertEqual(main.main(), 0)
+        self.assertIn("INFO - Using agent at", stderr.getvalue())
+        self.assertIn("with the agent's own configuration; --workers does not apply", stderr.getvalue())
+
+
+class TestTCPAgent(AgentServerMixin, unittest.TestCase):
+    """Test cases for an agent on a loopback port with a token."""
+
+    token = 'secret'
+
+    def make_address(self):
+        return '127.0.0.1:0'
+
+    def client_address(self):
+        return '127.0.0.1:%d' % self.server.server_address[1]
+
+    def test_list(self):
+        """Test list results are streamed back."""
+        self.assertEqual(list(self.client.run('app', 'list')), [{'item': 'web'}, {'item': 'db'}])
+
+    def test_token_required(self):
+        """Test requests without the token are rejected."""
+        with self.assertRaises(AgentError):
+            AgentClient(self.client_address()).run('app', 'list')
+
+
+class TestListenAddress(unittest.TestCase):
+    """Test cases for the addresses an agent may listen on."""
+
+    def test_remote_listen_requires_token(self):
+        """Test an agent reachable from other hosts refuses to start without a token."""
+        for address in ('0.0.0.0:0', '10.0.0.5:0', 'agent.example.com:0'):
+            with self.assertRaises(ValueError):
+                make_server(Agent(factory), address)
+        server = make_server(Agent(factory), '0.0.0.0:0', 'secret')
+        server.server_close()
+        for address in ('127.0.0.1:0', 'localhost:0', '[::1]:0'):
+            try:
+                server = make_server(Agent(factory), address)
+            except OSError:
+                # No IPv6 loopback on this host
+                continue
+            server.server_close()
+
+
+class TestFallback(unittest.TestCase):
+    """Test cases for running without an agent."""
+
+    def test_client_unavailable(self):
+        """Test connecting to a missing agent raises AgentUnavailable."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(AgentUnavailable):
+                AgentClient('unix:' + os.path.join(tmpdir, 'none.sock')).run('app', 'list')
+
+    def test_main_runs_locally(self):
+        """Test main.py runs the action itself when no agent answers."""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            argv = ['main.py', 'app', 'list', '--format', 'ndjson',
+                    '--agent', 'unix:' + os.path.join(tmpdir, 'none.sock')]
+            with mock.patch.object(main, 'get_upgrader', side_effect=factory), \
+                    mock.patch('sys.argv', argv), mock.patch('sys.stdout', stdout), mock.patch('sys.stderr', stderr):
+                code = main.main()
+        self.assertEqual(code, 0)
+        self.assertEqual(len(stdout.getvalue().splitlines()), 2)
+
+    def test_main_unavailable_locally(self):
+        """Test an unavailable type fails with an error when run locally."""
+        stderr = io.StringIO()
+        with mock.patch.object(main, 'get_upgrader', side_effect=factory), \
+                mock.patch('sys.argv', ['main.py', 'docker', 'list', '--no-agent']), \
+                mock.patch('sys.stdout', io.StringIO()), mock.patch('sys.stderr', stderr):
+            code = main.main()
+        self.assertEqual(code, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+Tests for the native apt index reader.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import AppUpgrader
+from upgradeapp.upgraders.packages.apt import AptIndex
+from upgradeapp.upgraders.packages.deb822 import iter_stanzas
+from upgradeapp.upgraders.packages.versions import compare_deb_versions
+from upgradeapp.utils.runner import CommandResult, CommandRunner
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'apt')
+
+
+class TestDebVersions(unittest.TestCase):
+    """Test cases for dpkg version comparison."""
+
+    def test_ordering(self):
+        """Test versions order the way dpkg --compare-versions does."""
+        ascending = [
+            '1.0~rc1', '1.0', '1.0-1', '1.0-1ubuntu1', '1.0+dfsg-1', '1.0.1',
+            '1.2', '1.10', '2.0~beta', '2.0', '1:0.1',
+        ]
+        for lower, higher in zip(ascending, ascending[1:]):
+            self.assertLess(compare_deb_versions(lower, higher), 0, f'{lower} < {higher}')
+            self.assertGreater(compare_deb_versions(higher, lower), 0, f'{higher} > {lower}')
+
+    def test_equal(self):
+        """Test leading zeros and an explicit zero epoch compare equal."""
+        self.assertEqual(compare_deb_versions('1.01', '1.1'), 0)
+        self.assertEqual(compare_deb_versions('0:2.3-1', '2.3-1'), 0)
+
+
+class TestDeb822(unittest.TestCase):
+    """Test cases for the streaming deb822 reader."""
+
+    def test_selected_fields_only(self):
+        """Test only requested fields are returned and continuations skipped."""
+        stanzas = list(iter_stanzas(os.path.join(FIXTURES, 'status'), ('Package', 'Version')))
+        self.assertEqual(stanzas[0], {'Package': 'curl', 'Version': '7.88.1-10'})
+        self.assertEqual(len(stanzas), 7)
+
+    def test_compressed_list(self):
+        """Test gzip-compressed lists are read as a stream."""
+        path = os.path.join(FIXTURES, 'lists', 'deb.debian.org_debian_dists_bookworm_main_binary-i386_Packages.gz')
+        self.assertEqual(list(iter_stanzas(path))[0]['Architecture'], 'i386')
+
+
+class TestAptIndex(unittest.TestCase):
+    """Test cases for AptIndex."""
+
+    def setUp(self):
+        self.index = AptIndex(os.path.join(FIXTURES, 'lists'), os.path.join(FIXTURES, 'status'))
+
+    def test_upgradable(self):
+        """Test the newest candidate across lists is chosen per installed package."""
+        self.assertEqual(self.index.upgradable(), {
+            'curl': '7.88.1-10+deb12u7',
+            'libc6': '2.36-9+deb12u4',
+            'tzdata': '2024b-0+deb12u1',
+        })
+
+    def test_architectures_tracked_separately(self):
+        """Test each installed architecture gets its own candidate."""
+        candidates = self.index.candidates()
+        self.assertIn(('libc6', 'amd64'), candidates)
+        self.assertIn(('libc6', 'i386'), candidates)
+        self.assertEqual(candidates[('curl', 'amd64')].source,
+                         'deb.debian.org_debian-security_dists_bookworm-security_main_binary-amd64_Packages')
+
+    def test_item_filter(self):
+        """Test a single package can be requested."""
+        self.assertEqual(self.index.upgradable('tzdata'), {'tzdata': '2024b-0+deb12u1'})
+        self.assertEqual(self.index.upgradable('vim'), {})
+
+    def test_not_automatic_archives(self):
+        """Test NotAutomatic archives only upgrade packages installed from ButAutomaticUpgrades ones."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        lists_dir = os.path.join(tmpdir, 'lists')
+        shutil.copytree(os.path.join(FIXTURES, 'lists'), lists_dir)
+        archives = {
+            'deb.debian.org_debian_dists_bookworm-backports': (
+                '_InRelease',
+                '-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA512\n\n'
+                'Suite: bookworm-backports\nNotAutomatic: yes\nButAutomaticUpgrades: yes\n'
+                '-----BEGIN PGP SIGNATURE-----\n\niQIzBAEBCgAdFiEE\n-----END PGP SIGNATURE-----\n',
+                [('curl', '8.11.1-1~bpo12+1'), ('installer-tools', '3.0-1'), ('installer-tools', '3.1-1~bpo12+1')],
+            ),
+            'deb.debian.org_debian_dists_experimental': (
+                '_Release',
+                'Suite: experimental\nNotAutomatic: yes\n',
+                [('vim', '2:9.1.0016-1'), ('vim', '2:9.0.1378-2')],
+            ),
+        }
+        for prefix, (suffix, release, packages) in archives.items():
+            with open(os.path.join(lists_dir, prefix + suffix), 'w') as f:
+                f.write(release)
+            with open(os.path.join(lists_dir, prefix + '_main_binary-amd64_Packages'), 'w') as f:
+                f.write('\n'.join(f'Package: {name}\nVersion: {version}\nArchitecture: amd64\n'
+                                  for name, version in packages))
+        index = AptIndex(lists_dir, os.path.join(FIXTURES, 'status'))
+        self.assertEqual(index.not_automatic_archives(), {
+            'deb.debian.org_debian_dists_bookworm-backports': True,
+            'deb.debian.org_debian_dists_experimental': False,
+        })
+        updates = index.upgradable()
+        self.assertEqual(updates['curl'], '7.88.1-10+deb12u7')
+        self.assertEqual(updates['installer-tools'], '3.1-1~bpo12+1')
+        self.assertNotIn('vim', updates)
+
+    def test_age_ignores_list_mtimes(self):
+        """Test freshness comes from the update stamps and the lists directory, not the lists."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        lists_dir = os.path.join(tmpdir, 'lists')
+        shutil.copytree(os.path.join(FIXTURES, 'lists'), lists_dir)
+        stamp = os.path.join(tmpdir, 'update-success-stamp')
+        old = time.time() - 7200
+        os.utime(lists_dir, (old, old))
+        index = AptIndex(lists_dir, os.path.join(FIXTURES, 'status'), [stamp])
+        self.assertGreater(index.age(), 7000)
+        open(stamp, 'w').close()
+        self.assertLess(index.age(), 60)
+
+
+class TestAppUpgraderNativeApt(unittest.TestCase):
+    """Test cases for AppUpgrader with the native apt backend."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.lists_dir = os.path.join(self.tmpdir, 'lists')
+        shutil.copytree(os.path.join(FIXTURES, 'lists'), self.lists_dir)
+        # copytree keeps the fixtures' mtimes; the lists must start out fresh
+        os.utime(self.lists_dir)
+        self.upgrader = AppUpgrader({'state_store': False, 'app_upgrader': {
+            'apt_lists_dir': self.lists_dir,
+            'apt_update_stamps': [],
+            'dpkg_status': os.path.join(FIXTURES, 'status'),
+            'apt_lists_max_age': 3600,
+        }})
+        self.upgrader.package_manager = 'apt'
+
+    def test_fresh_lists_need_no_subprocess(self):
+        """Test fresh lists are read without running apt."""
+        with mock.patch.object(CommandRunner, 'run') as run:
+            updates = self.upgrader.check_updates()
+        run.assert_not_called()
+        self.assertEqual(updates['curl'], '7.88.1-10+deb12u7')
+
+    def test_stale_lists_refreshed(self):
+        """Test lists older than the threshold trigger apt update once, even if it changes nothing."""
+        old = time.time() - 7200
+        os.utime(self.lists_dir, (old, old))
+        with mock.patch.object(CommandRunner, 'run', return_value=CommandResult([], 0)) as run:
+            self.upgrader.check_updates()
+            self.upgrader.check_updates()
+        self.assertEqual(run.call_args_list[0][0][0], ['sudo', 'apt', 'update'])
+        self.assertEqual(run.call_count, 1)
+
+    def test_classify_updates(self):
+        """Test updates are classified and security archives flagged."""
+        with mock.patch.object(CommandRunner, 'run') as run:
+            updates = self.upgrader.classify_updates()
+        run.assert_not_called()
+        self.assertEqual(updates['curl'].installed, '7.88.1-10')
+        self.assertEqual((updates['curl'].kind, updates['curl'].security), ('revision', True))
+        self.assertEqual((updates['tzdata'].kind, updates['tzdata'].security), ('patch', True))
+        self.assertEqual((updates['libc6'].kind, updates['libc6'].security), ('revision', False))
+
+
+if __name__ == '__main__':
+    unittest.main()
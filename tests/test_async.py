@@ -0,0 +1,182 @@
+"""
+Tests for the asyncio upgrader core.
+"""
+
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import main
+from upgradeapp.upgraders import AppUpgrader, PodmanUpgrader
+from upgradeapp.upgraders.base import BaseUpgrader
+from upgradeapp.utils.aio import gather_with_timeouts, run_process
+from upgradeapp.utils.concurrency import AsyncKeyedLimiter
+from upgradeapp.utils.runner import CommandResult, CommandRunner
+from upgradeapp.utils.state_store import StateStore
+
+
+class SyncOnlyUpgrader(BaseUpgrader):
+    """Upgrader implementing only the blocking interface."""
+
+    def check_available(self):
+        return True
+
+    def list_items(self):
+        return ['item1']
+
+    def check_updates(self, item=None):
+        return {'item1': 'v2.0'}
+
+    def upgrade(self, item=None, dry_run=False):
+        return dry_run
+
+
+class TestRunProcess(unittest.IsolatedAsyncioTestCase):
+    """Test cases for run_process."""
+
+    async def test_captures_output(self):
+        """Test output and exit code are returned like subprocess.run."""
+        result = await run_process([sys.executable, '-c', 'import sys; print("hi"); sys.exit(3)'])
+        self.assertEqual((result.returncode, result.stdout), (3, 'hi\n'))
+
+    async def test_timeout_kills_process(self):
+        """Test a timed out process is stopped and TimeoutExpired raised."""
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            await run_process([sys.executable, '-c', 'import time; time.sleep(30)'], timeout=0.2)
+        self.assertLess(time.monotonic() - started, 10)
+
+    async def test_cancellation_kills_process(self):
+        """Test cancelling the awaiting task terminates the child process."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pidfile = os.path.join(tmpdir, 'pid')
+            code = f'import os, time; open({pidfile!r}, "w").write(str(os.getpid())); time.sleep(30)'
+            task = asyncio.ensure_future(run_process([sys.executable, '-c', code]))
+            while not os.path.exists(pidfile) or not open(pidfile).read():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            pid = int(open(pidfile).read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+class TestGatherWithTimeouts(unittest.IsolatedAsyncioTestCase):
+    """Test cases for gather_with_timeouts."""
+
+    async def test_timeout_isolated_per_task(self):
+        """Test a slow task times out without affecting the others."""
+        finished = []
+        results = await gather_with_timeouts(
+            {'slow': asyncio.sleep(5, 'late'), 'fast': asyncio.sleep(0, 'ok')},
+            timeout=0.1,
+            on_result=lambda name, result: finished.append(name),
+        )
+        self.assertEqual(results['fast'], 'ok')
+        self.assertIsInstance(results['slow'], asyncio.TimeoutError)
+        self.assertEqual(finished, ['fast', 'slow'])
+
+    async def test_keyed_limiter(self):
+        """Test concurrency is capped per key."""
+        limiter = AsyncKeyedLimiter({'quay.io': {'concurrency': 2}})
+        running, peak = 0, 0
+
+        async def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(limiter.run('quay.io', work) for _ in range(6)))
+        self.assertEqual(peak, 2)
+
+
+class TestAsyncUpgraders(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the async upgrader methods."""
+
+    async def test_default_wraps_blocking_methods(self):
+        """Test upgraders without async overrides still work on the loop."""
+        upgrader = SyncOnlyUpgrader()
+        self.assertTrue(await upgrader.async_check_available())
+        self.assertEqual(await upgrader.async_list_items(), ['item1'])
+        self.assertEqual(await upgrader.async_check_updates(), {'item1': 'v2.0'})
+        self.assertTrue(await upgrader.async_upgrade(dry_run=True))
+
+    async def test_app_cli_check(self):
+        """Test the CLI backend runs check-update as an asyncio subprocess."""
+        upgrader = AppUpgrader({'app_upgrader': {'rpm_backend': 'cli'}})
+        upgrader.package_manager = 'dnf'
+        result = CommandResult([], 100, 'bash.x86_64  5.2.26-3.fc39  updates\n', '')
+        with mock.patch.object(CommandRunner, 'run_async', return_value=result) as run, \
+                mock.patch.object(CommandRunner, 'run') as blocking:
+            self.assertEqual(await upgrader.async_check_updates(), {'bash': '5.2.26-3.fc39'})
+        run.assert_called_once_with(['dnf', '--quiet', 'check-update'], 120, keep_all=True, idempotent=True, item=None)
+        blocking.assert_not_called()
+
+    async def test_app_upgrade(self):
+        """Test upgrades run the same command as the blocking path."""
+        upgrader = AppUpgrader({})
+        upgrader.package_manager = 'zypper'
+        result = CommandResult([], 0, '', '')
+        with mock.patch.object(CommandRunner, 'run_async', return_value=result) as run, \
+                self.assertLogs('upgradeapp'):
+            self.assertTrue(await upgrader.async_upgrade('curl'))
+        run.assert_called_once_with(['sudo', 'zypper', '--non-interactive', 'update', 'curl'], 300, item='curl')
+
+    async def test_container_pull_checks(self):
+        """Test pull-mode checks run concurrently and keep listing order."""
+        images = ['slow:1', 'fast:1', 'current:1']
+
+        async def pull(image):
+            await asyncio.sleep(0.05 if image == 'slow:1' else 0)
+            return 'Status: Image is up to date' if image == 'current:1' else 'Downloaded newer image'
+
+        upgrader = PodmanUpgrader({})
+        with mock.patch.object(PodmanUpgrader, 'check_available', return_value=True), \
+                mock.patch.object(PodmanUpgrader, 'list_images', return_value=images), \
+                mock.patch.object(PodmanUpgrader, 'state_store', return_value=StateStore(persist=False)), \
+                mock.patch.object(PodmanUpgrader, '_async_pull_image', side_effect=pull), \
+                self.assertLogs('upgradeapp'):
+            updates = await upgrader.async_check_updates()
+        self.assertEqual(updates, {'slow:1': 'latest', 'fast:1': 'latest'})
+
+
+class TestRunAll(unittest.TestCase):
+    """Test cases for `main.py all`."""
+
+    def test_timeout_does_not_block_other_types(self):
+        """Test a hung upgrader is cancelled while the others report results."""
+        def make(upgrade_type, config=None):
+            upgrader = mock.Mock()
+            upgrader.async_check_available = mock.AsyncMock(return_value=upgrade_type != 'podman')
+
+            async def check(item=None):
+                if upgrade_type == 'docker':
+                    await asyncio.sleep(30)
+                return {f'{upgrade_type}-item': '2.0'}
+
+            upgrader.async_check_updates = check
+            return upgrader
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch.object(main, 'get_upgrader', side_effect=make), \
+                mock.patch('sys.argv', ['main.py', 'all', 'check', '--format', 'ndjson', '--timeout', '0.2']), \
+                mock.patch('sys.stdout', stdout), mock.patch('sys.stderr', stderr):
+            code = main.main()
+        self.assertEqual(code, 1)
+        self.assertEqual([json.loads(line) for line in stdout.getvalue().splitlines()],
+                         [{'type': 'app', 'item': 'app-item', 'version': '2.0'}])
+        self.assertIn('Docker check failed', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
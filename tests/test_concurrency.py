@@ -0,0 +1,163 @@
+"""
+Tests for the concurrent check engine.
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import PodmanUpgrader
+from upgradeapp.utils.concurrency import CheckEngine, KeyedLimiter, RateLimiter, check_many
+
+
+class ConcurrencyTracker:
+    """Records the peak number of concurrent calls per key."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def call(self, key, delay=0.05):
+        with self.lock:
+            self.active[key] = self.active.get(key, 0) + 1
+            self.peak[key] = max(self.peak.get(key, 0), self.active[key])
+        time.sleep(delay)
+        with self.lock:
+            self.active[key] -= 1
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for RateLimiter."""
+
+    def test_rate_is_enforced(self):
+        """Test operations beyond the burst are spaced by the rate."""
+        limiter = RateLimiter(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class TestKeyedLimiter(unittest.TestCase):
+    """Test cases for KeyedLimiter."""
+
+    def test_per_key_concurrency(self):
+        """Test each key is capped independently, with a default entry."""
+        limiter = KeyedLimiter({'slow.io': {'concurrency': 1}, 'default': {'concurrency': 3}})
+        tracker = ConcurrencyTracker()
+        threads = [
+            threading.Thread(target=limiter.run, args=(key, lambda key=key: tracker.call(key)))
+            for key in ['slow.io'] * 4 + ['other.io'] * 6
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(tracker.peak['slow.io'], 1)
+        self.assertLessEqual(tracker.peak['other.io'], 3)
+
+    def test_returns_value(self):
+        """Test run returns the wrapped function's value."""
+        self.assertEqual(KeyedLimiter().run('any', lambda: 42), 42)
+
+
+class TestCheckEngine(unittest.TestCase):
+    """Test cases for CheckEngine."""
+
+    def test_wall_time_is_max_not_sum(self):
+        """Test checks overlap instead of running back to back."""
+        engine = CheckEngine(workers=20)
+
+        def check(item):
+            time.sleep(0.1)
+            return 'v2'
+
+        start = time.monotonic()
+        result = engine.run([f'image{i}' for i in range(20)], check)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(len(result), 20)
+
+    def test_merges_in_input_order_and_skips_failures(self):
+        """Test results keep input order and failing items are dropped."""
+        def check(item):
+            if item == 'bad':
+                raise RuntimeError('boom')
+            return None if item == 'current' else f'{item}-new'
+
+        with self.assertLogs('upgradeapp', level='ERROR'):
+            result = CheckEngine(workers=4).run(['b', 'bad', 'current', 'a'], check)
+        self.assertEqual(list(result.items()), [('b', 'b-new'), ('a', 'a-new')])
+
+    def test_saturated_key_does_not_hold_workers(self):
+        """Test items for a capped key wait outside the pool while other keys keep running."""
+        engine = CheckEngine(workers=2, limits={'slow.io': {'concurrency': 1}})
+        tracker = ConcurrencyTracker()
+        finished = {}
+        start = time.monotonic()
+
+        def check(item):
+            tracker.call(item.split('/')[0], 0.3 if item.startswith('slow.io') else 0.01)
+            finished[item] = time.monotonic() - start
+            return 'v2'
+
+        items = ['slow.io/a', 'slow.io/b', 'slow.io/c'] + [f'fast.io/{i}' for i in range(10)]
+        result = engine.run(items, check, key=lambda item: item.split('/')[0])
+        self.assertEqual(list(result), items)
+        self.assertEqual(tracker.peak['slow.io'], 1)
+        self.assertLess(max(finished[item] for item in items if item.startswith('fast.io')), 0.3)
+
+    def test_rate_limited_key_does_not_hold_workers(self):
+        """Test a rate-limited key is retried later instead of sleeping in a worker."""
+        engine = CheckEngine(workers=2, limits={'slow.io': {'rate': 5, 'burst': 1}})
+        finished = {}
+        start = time.monotonic()
+
+        def check(item):
+            finished[item] = time.monotonic() - start
+            return 'v2'
+
+        items = ['slow.io/a', 'slow.io/b', 'slow.io/c'] + [f'fast.io/{i}' for i in range(4)]
+        updates = list(engine.iter_run(items, check, key=lambda item: item.split('/')[0]))
+        self.assertEqual(len(updates), 7)
+        self.assertGreaterEqual(finished['slow.io/c'], 0.35)
+        self.assertLess(max(finished[item] for item in items if item.startswith('fast.io')), 0.15)
+
+    def test_check_many(self):
+        """Test several upgraders are checked concurrently."""
+        upgraders = {name: mock.Mock() for name in ('app', 'docker')}
+        upgraders['app'].check_updates.return_value = {'curl': '8.0'}
+        upgraders['docker'].check_updates.return_value = {}
+        self.assertEqual(check_many(upgraders, 'x'), {'app': {'curl': '8.0'}, 'docker': {}})
+        upgraders['app'].check_updates.assert_called_once_with('x')
+
+
+class TestContainerCheckConcurrency(unittest.TestCase):
+    """Test cases for concurrent container checks."""
+
+    def test_registry_limits_applied(self):
+        """Test check_updates caps concurrency per registry host."""
+        upgrader = PodmanUpgrader({
+            'check_workers': 8,
+            'podman_upgrader': {'registry_limits': {'quay.io': {'concurrency': 2}}},
+        })
+        tracker = ConcurrencyTracker()
+        images = [f'quay.io/org/app{i}' for i in range(6)] + [f'ghcr.io/org/tool{i}' for i in range(6)]
+
+        def check(image):
+            tracker.call(image.split('/')[0])
+            return 'latest'
+
+        with mock.patch.object(PodmanUpgrader, 'check_available', return_value=True), \
+                mock.patch.object(PodmanUpgrader, 'list_images', return_value=images), \
+                mock.patch.object(PodmanUpgrader, '_check_image', side_effect=check):
+            updates = upgrader.check_updates()
+
+        self.assertEqual(list(updates), images)
+        self.assertEqual(tracker.peak['quay.io'], 2)
+        self.assertGreater(tracker.peak['ghcr.io'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Tests for the phased container upgrade.
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import PodmanUpgrader
+from upgradeapp.upgraders.inventory import ContainerInventory
+
+
+class TestPipelinedUpgrade(unittest.TestCase):
+    """Test cases for ContainerUpgrader.upgrade phases."""
+
+    def setUp(self):
+        self.upgrader = PodmanUpgrader({'podman_upgrader': {'pull_concurrency': 4}})
+        self.images = {'web': 'nginx:latest', 'api': 'app:2', 'worker': 'app:2', 'db': 'postgres:16'}
+        self.events = []
+        self.lock = threading.Lock()
+        self.failed_pulls = set()
+        self.failed_starts = set()
+        patches = [
+            mock.patch.object(PodmanUpgrader, 'check_available', return_value=True),
+            mock.patch.object(PodmanUpgrader, 'list_items', return_value=list(self.images)),
+            mock.patch.object(PodmanUpgrader, 'inventory', return_value=ContainerInventory([])),
+            mock.patch.object(PodmanUpgrader, '_container_image', side_effect=self.images.get),
+            mock.patch.object(PodmanUpgrader, '_pull_image', side_effect=self._pull),
+            mock.patch.object(PodmanUpgrader, '_inspect_container', side_effect=self._inspect),
+            mock.patch.object(PodmanUpgrader, '_inspect_image', return_value={'Id': 'sha256:new'}),
+            mock.patch.object(PodmanUpgrader, '_create_container', side_effect=self._create),
+            mock.patch.object(PodmanUpgrader, '_rename_container', side_effect=self._rename),
+            mock.patch.object(PodmanUpgrader, '_start_container', side_effect=self._start),
+            mock.patch.object(PodmanUpgrader, '_stop_container', side_effect=self._record('stop')),
+            mock.patch.object(PodmanUpgrader, '_remove_container', side_effect=self._record('rm')),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _pull(self, image, quiet=False):
+        time.sleep(0.1)
+        with self.lock:
+            self.events.append(('pull', image))
+        return None if image in self.failed_pulls else ''
+
+    def _inspect(self, container):
+        return {
+            'Id': container * 8,
+            'Name': '/' + container,
+            'Image': 'sha256:old',
+            'Config': {'Image': self.images[container], 'Env': ['ROLE=' + container]},
+            'State': {'Running': True},
+        }
+
+    def _create(self, spec, name):
+        with self.lock:
+            self.events.append(('create', name, spec.image, tuple(spec.env)))
+        return True
+
+    def _rename(self, container, new_name):
+        with self.lock:
+            self.events.append(('rename', container, new_name))
+        return True
+
+    def _start(self, container):
+        with self.lock:
+            self.events.append(('start', container))
+        time.sleep(0.01)
+        return container.split('-')[0] not in self.failed_starts or container.endswith('-old')
+
+    def _record(self, action):
+        def record(container):
+            with self.lock:
+                self.events.append((action, container))
+            return True
+        return record
+
+    def test_all_pulls_precede_restarts(self):
+        """Test no container is stopped before every image is pulled."""
+        self.assertTrue(self.upgrader.upgrade())
+        actions = [event[0] for event in self.events]
+        last_pull = max(i for i, action in enumerate(actions) if action == 'pull')
+        first_stop = actions.index('stop')
+        self.assertLess(last_pull, first_stop)
+
+    def test_shared_images_pulled_once_in_parallel(self):
+        """Test distinct images are pulled once each, concurrently."""
+        start = time.monotonic()
+        self.upgrader.upgrade()
+        self.assertLess(time.monotonic() - start, 0.25)
+        pulls = sorted(event[1] for event in self.events if event[0] == 'pull')
+        self.assertEqual(pulls, ['app:2', 'nginx:latest', 'postgres:16'])
+
+    def test_failed_pull_skips_only_its_containers(self):
+        """Test containers whose image failed to pull keep running."""
+        self.failed_pulls.add('app:2')
+        self.assertFalse(self.upgrader.upgrade())
+        stopped = [event[1] for event in self.events if event[0] == 'stop']
+        self.assertEqual(stopped, ['web-upgradeapp-old', 'db-upgradeapp-old'])
+
+    def test_replacement_created_before_stop(self):
+        """Test the swap order and that the container's config is carried over."""
+        self.assertTrue(self.upgrader.upgrade('web'))
+        swap = [event for event in self.events if event[0] != 'pull']
+        self.assertEqual(swap, [
+            ('create', 'web-upgradeapp-new', 'nginx:latest', ('ROLE=web',)),
+            ('rename', 'web', 'web-upgradeapp-old'),
+            ('rename', 'web-upgradeapp-new', 'web'),
+            ('stop', 'web-upgradeapp-old'),
+            ('start', 'web'),
+            ('rm', 'web-upgradeapp-old'),
+        ])
+        self.assertGreater(self.upgrader.downtimes['web'], 0)
+
+    def test_failed_start_restores_old_container(self):
+        """Test the old container is put back when its replacement fails to start."""
+        self.failed_starts.add('web')
+        self.assertFalse(self.upgrader.upgrade('web'))
+        self.assertEqual(self.events[-4:], [
+            ('start', 'web'),
+            ('rm', 'web'),
+            ('rename', 'web-upgradeapp-old', 'web'),
+            ('start', 'web'),
+        ])
+        self.assertNotIn('web', self.upgrader.downtimes)
+
+    def test_unchanged_image_not_recreated(self):
+        """Test a container already on the pulled image is left running."""
+        with mock.patch.object(PodmanUpgrader, '_inspect_image', return_value={'Id': 'sha256:old'}):
+            self.assertTrue(self.upgrader.upgrade('web'))
+        self.assertEqual([event[0] for event in self.events], ['pull'])
+        self.assertEqual(self.upgrader.downtimes, {'web': 0.0})
+
+    def test_dry_run_touches_nothing(self):
+        """Test a dry run neither pulls nor stops anything."""
+        self.assertTrue(self.upgrader.upgrade(dry_run=True))
+        self.assertEqual(self.events, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,370 @@
+"""
+Tests for the Docker Engine API backend.
+"""
+
+import base64
+import json
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest import mock
+
+from upgradeapp.upgraders import ContainerUpgrader, DockerUpgrader
+from upgradeapp.upgraders.docker_api import (
+    DockerAPIError, DockerEngineClient, registry_auth_header, split_image_reference
+)
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    """Request handler emulating a subset of the Docker Engine API."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload=None, content_type='application/json'):
+        if payload is None:
+            body = b''
+        elif isinstance(payload, bytes):
+            body = payload
+        else:
+            body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.server.state
+        path = self.path.split('?', 1)[0]
+        self.server.requests.append(('GET', self.path))
+        if path == '/_ping':
+            self._send(200, b'OK', 'text/plain')
+        elif path == '/containers/json':
+            self._send(200, [
+                {'Id': c['Id'], 'Names': ['/' + name], 'Image': c['Config']['Image'],
+                 'ImageID': c.get('Image', ''), 'Labels': c['Config'].get('Labels', {}),
+                 'Mounts': c.get('Mounts', []), 'State': 'running'}
+                for name, c in state['containers'].items()
+            ])
+        elif path == '/images/json':
+            self._send(200, state['images'])
+        elif path.startswith('/images/') and path.endswith('/json'):
+            name = path[len('/images/'):-len('/json')]
+            image = next((i for i in state['images'] if name in (i.get('RepoTags') or [])), None)
+            if image is None:
+                self._send(404, {'message': f'No such image: {name}'})
+            else:
+                self._send(200, image)
+        elif path.startswith('/containers/') and path.endswith('/json'):
+            name = path[len('/containers/'):-len('/json')]
+            container = state['containers'].get(name)
+            if container is None:
+                self._send(404, {'message': f'No such container: {name}'})
+            else:
+                self._send(200, container)
+        else:
+            self._send(404, {'message': 'page not found'})
+
+    def do_POST(self):
+        state = self.server.state
+        path = self.path.split('?', 1)[0]
+        self.server.requests.append(('POST', self.path))
+        if path == '/images/create':
+            self.server.pull_headers.append(self.headers.get('X-Registry-Auth'))
+            if state.get('pull_denied'):
+                self._send(404, {'message': 'pull access denied for private/app'})
+                return
+            lines = [{'status': 'Pulling from library/nginx'}, {'status': state['pull_status']}]
+            self._send(200, b'\r\n'.join(json.dumps(line).encode() for line in lines))
+        elif path == '/containers/create':
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            name = self.path.split('name=', 1)[1]
+            state['created'] = state.get('created', 0) + 1
+            container_id = f"new{state['created']}"
+            state['containers'][name] = {'Id': container_id, 'Config': {'Image': body['Image'], 'Env': body['Env']},
+                                         'HostConfig': body['HostConfig'], 'State': {'Running': False}}
+            self._send(201, {'Id': container_id})
+        elif path.startswith('/containers/') and path.endswith('/rename'):
+            name = path[len('/containers/'):-len('/rename')]
+            state['containers'][self.path.split('name=', 1)[1]] = state['containers'].pop(name)
+            self._send(204)
+        elif path.startswith('/containers/') and path.endswith(('/start', '/stop')):
+            name, _, action = path[len('/containers/'):].rpartition('/')
+            state['containers'][name].setdefault('State', {})['Running'] = action == 'start'
+            self._send(204)
+        else:
+            self._send(404, {'message': 'page not found'})
+
+    def do_DELETE(self):
+        self.server.requests.append(('DELETE', self.path))
+        if self.path.startswith('/images/'):
+            name = self.path[len('/images/'):]
+            images = self.server.state['images']
+            # Like the daemon, accept IDs with or without the sha256: prefix
+            image = next((i for i in images if name in (i['Id'], i['Id'][len('sha256:'):])
+                          or name in (i.get('RepoTags') or [])), None)
+            if image is None:
+                self._send(404, {'message': f'No such image: {name}'})
+            else:
+                images.remove(image)
+                self._send(200, [{'Deleted': image['Id']}])
+            return
+        name = self.path[len('/containers/'):]
+        if self.server.state['containers'].pop(name, None) is None:
+            self._send(404, {'message': f'No such container: {name}'})
+        else:
+            self._send(204)
+
+
+class FakeDockerDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server backed by FakeDockerHandler."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, state):
+        super().__init__(socket_path, FakeDockerHandler)
+        self.state = state
+        self.connections = 0
+        self.requests = []
+        self.pull_headers = []
+
+
+def default_state():
+    return {
+        'containers': {
+            'web': {'Id': 'abc123', 'Image': 'sha256:0', 'Config': {'Image': 'nginx:latest', 'Env': ['A=1']},
+                    'HostConfig': {'RestartPolicy': {'Name': 'always'}}, 'State': {'Running': True}},
+            'db': {'Id': 'def456', 'Image': 'sha256:0', 'Config': {'Image': 'postgres:16'},
+                   'State': {'Running': True}},
+        },
+        'images': [
+            {'Id': 'sha256:1', 'RepoTags': ['nginx:latest']},
+            {'Id': 'sha256:2', 'RepoTags': ['postgres:16']},
+            {'Id': 'sha256:3', 'RepoTags': ['<none>:<none>']},
+        ],
+        'pull_status': 'Status: Downloaded newer image for nginx:latest',
+    }
+
+
+class FakeDockerTestCase(unittest.TestCase):
+    """Base test case running a fake Docker daemon on a temporary socket."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, 'docker.sock')
+        self.state = default_state()
+        self.daemon = FakeDockerDaemon(self.socket_path, self.state)
+        self.thread = threading.Thread(
+            target=self.daemon.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True
+        )
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.daemon.server_close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+class TestDockerEngineClient(FakeDockerTestCase):
+    """Test cases for DockerEngineClient."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = DockerEngineClient(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        super().tearDown()
+
+    def test_ping(self):
+        """Test ping against a live socket."""
+        self.assertTrue(self.client.ping())
+        self.assertFalse(DockerEngineClient(os.path.join(self.tmpdir, 'missing.sock')).ping())
+
+    def test_connection_reused(self):
+        """Test sequential requests share one keep-alive connection."""
+        self.client.ping()
+        self.client.list_containers()
+        self.client.list_images()
+        self.client.inspect_container('web')
+        self.assertEqual(self.daemon.connections, 1)
+
+    def test_pull_image_reports_status(self):
+        """Test pull returns the final status line and passes the tag."""
+        status = self.client.pull_image('nginx')
+        self.assertIn('Downloaded newer image', status)
+        self.assertIn(('POST', '/images/create?fromImage=nginx&tag=latest'), self.daemon.requests)
+
+    def test_error_response(self):
+        """Test API errors surface as DockerAPIError."""
+        with self.assertRaises(DockerAPIError) as ctx:
+            self.client.inspect_container('missing')
+        self.assertEqual(ctx.exception.status, 404)
+
+    def test_split_image_reference(self):
+        """Test image references are split into repository and tag."""
+        self.assertEqual(split_image_reference('nginx'), ('nginx', 'latest'))
+        self.assertEqual(split_image_reference('nginx:1.25'), ('nginx', '1.25'))
+        self.assertEqual(split_image_reference('reg:5000/team/app'), ('reg:5000/team/app', 'latest'))
+        self.assertEqual(split_image_reference('app@sha256:ff'), ('app', 'sha256:ff'))
+
+    def test_ping_non_http_socket(self):
+        """Test ping returns False when the socket does not speak HTTP."""
+        path = os.path.join(self.tmpdir, 'garbage.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+
+        def answer():
+            conn, _ = listener.accept()
+            conn.recv(1024)
+            conn.sendall(b'not http at all\r\n')
+            conn.close()
+
+        thread = threading.Thread(target=answer, daemon=True)
+        thread.start()
+        try:
+            self.assertFalse(DockerEngineClient(path).ping())
+        finally:
+            thread.join(1)
+            listener.close()
+
+    def test_pull_sends_registry_auth(self):
+        """Test stored docker CLI credentials are forwarded on pull."""
+        config_dir = os.path.join(self.tmpdir, 'docker-config')
+        os.mkdir(config_dir)
+        with open(os.path.join(config_dir, 'config.json'), 'w') as f:
+            json.dump({'auths': {'registry.example.com': {'auth': base64.b64encode(b'bob:pw').decode()}}}, f)
+
+        with mock.patch.dict(os.environ, {'DOCKER_CONFIG': config_dir}):
+            self.client.pull_image('registry.example.com/team/app:1.0')
+            self.client.pull_image('nginx')
+
+        sent = json.loads(base64.urlsafe_b64decode(self.daemon.pull_headers[0]))
+        self.assertEqual((sent['username'], sent['password']), ('bob', 'pw'))
+        self.assertIsNone(self.daemon.pull_headers[1])
+        self.assertIsNone(registry_auth_header('nginx', config_dir=self.tmpdir))
+
+
+class TestDockerUpgraderAPIBackend(FakeDockerTestCase):
+    """Test cases for DockerUpgrader using the API backend."""
+
+    def setUp(self):
+        super().setUp()
+        self.upgrader = DockerUpgrader({
+            'docker_upgrader': {'backend': 'api', 'socket': self.socket_path}
+        })
+
+    def test_check_available(self):
+        """Test the daemon is detected through the socket."""
+        self.assertTrue(self.upgrader.check_available())
+
+    def test_list_items(self):
+        """Test containers are listed by name."""
+        self.assertEqual(sorted(self.upgrader.list_items()), ['db', 'web'])
+
+    def test_list_images(self):
+        """Test untagged images are filtered out."""
+        self.assertEqual(self.upgrader.list_images(), ['nginx:latest', 'postgres:16'])
+
+    def test_check_updates(self):
+        """Test images with newer downloads are reported."""
+        self.state['pull_status'] = 'Status: Image is up to date for nginx:latest'
+        self.assertEqual(self.upgrader.check_updates('nginx:latest'), {})
+        self.state['pull_status'] = 'Status: Downloaded newer image for nginx:latest'
+        self.assertEqual(self.upgrader.check_updates('nginx:latest'), {'nginx:latest': 'latest'})
+
+    def test_upgrade(self):
+        """Test upgrade recreates the container through the API."""
+        self.assertTrue(self.upgrader.upgrade('web'))
+        web = self.state['containers']['web']
+        self.assertEqual((web['Id'], web['Config']['Image'], web['State']['Running']), ('new1', 'nginx:latest', True))
+        self.assertEqual(web['Config']['Env'], ['A=1'])
+        self.assertEqual(web['HostConfig']['RestartPolicy'], {'Name': 'always'})
+        self.assertEqual(sorted(self.state['containers']), ['db', 'web'])
+        swap = [request for request in self.daemon.requests if request[0] != 'GET']
+        self.assertEqual(swap[1:], [
+            ('POST', '/containers/create?name=web-upgradeapp-new'),
+            ('POST', '/containers/web/rename?name=web-upgradeapp-old'),
+            ('POST', '/containers/web-upgradeapp-new/rename?name=web'),
+            ('POST', '/containers/web-upgradeapp-old/stop'),
+            ('POST', '/containers/web/start'),
+            ('DELETE', '/containers/web-upgradeapp-old'),
+        ])
+        # The image comes from the container list; only the swap inspects the container
+        self.assertEqual(self.daemon.requests.count(('GET', '/containers/web/json')), 1)
+
+    def test_image_gc(self):
+        """Test GC removes the untagged image no container uses through the API."""
+        self.state['images'][2]['Size'] = 1000
+        with self.assertLogs('upgradeapp'):
+            report = self.upgrader.collect_garbage()
+        self.assertEqual((report.removed, report.reclaimed_bytes, report.referenced), (['3'], 1000, 2))
+        self.assertIn(('GET', '/images/json?all=1&shared-size=1'), self.daemon.requests)
+        self.assertIn(('DELETE', '/images/3'), self.daemon.requests)
+        self.assertEqual([image['Id'] for image in self.state['images']], ['sha256:1', 'sha256:2'])
+
+    def test_digest_check_reads_repo_digests(self):
+        """Test digest mode reads local repo digests through the API."""
+        self.state['images'][0]['RepoDigests'] = ['nginx@sha256:old']
+        upgrader = DockerUpgrader({
+            'docker_upgrader': {'backend': 'api', 'socket': self.socket_path, 'check_mode': 'digest'}
+        })
+        with mock.patch('upgradeapp.upgraders.registry.RegistryClient.manifest_digest',
+                        return_value='sha256:new') as remote:
+            self.assertEqual(upgrader.check_updates('nginx:latest'), {'nginx:latest': 'sha256:new'})
+            remote.return_value = 'sha256:old'
+            self.assertEqual(upgrader.check_updates('nginx:latest'), {})
+        self.assertIn(('GET', '/images/nginx:latest/json'), self.daemon.requests)
+        self.assertFalse(any(path.startswith('/images/create') for _, path in self.daemon.requests))
+
+    def test_pull_denied_falls_back_to_cli(self):
+        """Test an auth failure on the API is retried with the docker CLI."""
+        self.state['pull_denied'] = True
+        upgrader = DockerUpgrader({'docker_upgrader': {'socket': self.socket_path}})
+        with mock.patch.object(ContainerUpgrader, '_pull_image', return_value='') as cli_pull:
+            self.assertEqual(upgrader._pull_image('private/app'), '')
+        cli_pull.assert_called_once_with('private/app', False)
+
+    def test_socket_error_skips_container(self):
+        """Test a socket error on one container does not abort the others."""
+        def pull(image, timeout=300):
+            if image == 'nginx:latest':
+                raise ConnectionResetError('reset')
+            return 'Status: Downloaded'
+
+        with mock.patch.object(DockerEngineClient, 'pull_image', side_effect=pull):
+            self.assertFalse(self.upgrader.upgrade())
+        self.assertEqual(self.state['containers']['web']['Id'], 'abc123')
+        self.assertEqual(self.state['containers']['db']['Id'], 'new1')
+
+    def test_api_backend_without_socket(self):
+        """Test backend 'api' reports Docker unavailable instead of using the CLI."""
+        upgrader = DockerUpgrader({
+            'docker_upgrader': {'backend': 'api', 'socket': os.path.join(self.tmpdir, 'missing.sock')}
+        })
+        with mock.patch.object(ContainerUpgrader, 'check_available', return_value=True) as cli_check:
+            self.assertFalse(upgrader.check_available())
+        cli_check.assert_not_called()
+
+    def test_cli_backend_skips_socket(self):
+        """Test the CLI backend never touches the socket."""
+        upgrader = DockerUpgrader({'docker_upgrader': {'backend': 'cli', 'socket': self.socket_path}})
+        self.assertIsNone(upgrader._get_api())
+        self.assertEqual(self.daemon.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Tests for the streaming dpkg status reader.
+"""
+
+import itertools
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import AppUpgrader
+from upgradeapp.upgraders.packages.dpkg import DpkgPackage, iter_dpkg_status
+from upgradeapp.utils.runner import CommandRunner
+
+
+STATUS_FILE = os.path.join(os.path.dirname(__file__), 'fixtures', 'apt', 'status')
+
+
+class TestIterDpkgStatus(unittest.TestCase):
+    """Test cases for iter_dpkg_status."""
+
+    def test_installed_entries(self):
+        """Test installed packages are yielded with their fields."""
+        packages = list(iter_dpkg_status(STATUS_FILE))
+        self.assertEqual(packages[0], DpkgPackage('curl', '7.88.1-10', 'amd64', 'install ok installed'))
+        self.assertNotIn('removed-pkg', [package.name for package in packages])
+        self.assertEqual(len(packages), 6)
+
+    def test_all_entries(self):
+        """Test removed packages are included on request."""
+        packages = list(iter_dpkg_status(STATUS_FILE, installed_only=False))
+        removed = [package for package in packages if package.name == 'removed-pkg']
+        self.assertEqual(len(removed), 1)
+        self.assertFalse(removed[0].installed)
+
+    def test_match_stays_within_paragraph(self):
+        """Test an incomplete entry does not borrow fields from the next one."""
+        with tempfile.NamedTemporaryFile('w', suffix='status', delete=False) as f:
+            f.write('Package: broken\nStatus: install ok installed\n\n'
+                    'Package: ok\nStatus: install ok installed\nArchitecture: all\nVersion: 1.0\n')
+        self.addCleanup(os.unlink, f.name)
+        self.assertEqual([package.name for package in iter_dpkg_status(f.name)], ['ok'])
+
+    def test_partial_consumption(self):
+        """Test a caller can stop after the first few entries."""
+        first = list(itertools.islice(iter_dpkg_status(STATUS_FILE), 2))
+        self.assertEqual([package.name for package in first], ['curl', 'libc6'])
+
+
+class TestAppUpgraderListItems(unittest.TestCase):
+    """Test cases for AppUpgrader.list_items on apt systems."""
+
+    def setUp(self):
+        self.upgrader = AppUpgrader({'app_upgrader': {'dpkg_status': STATUS_FILE}})
+        self.upgrader.package_manager = 'apt'
+
+    def test_list_items_without_subprocess(self):
+        """Test packages are listed from the status file, once per name."""
+        with mock.patch.object(CommandRunner, 'run') as run:
+            items = self.upgrader.list_items()
+        run.assert_not_called()
+        self.assertEqual(items, ['curl', 'libc6', 'tzdata', 'vim', 'installer-tools'])
+
+    def test_names_containing_install_not_special(self):
+        """Test package names are not matched against the selection state."""
+        items = self.upgrader.list_items()
+        self.assertIn('installer-tools', items)
+        self.assertNotIn('removed-pkg', items)
+
+    def test_iter_packages(self):
+        """Test the generator yields full package entries."""
+        packages = {(package.name, package.architecture): package.version
+                    for package in self.upgrader.iter_packages()}
+        self.assertEqual(packages[('libc6', 'i386')], '2.36-9')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""
+Tests for the fleet coordinator, driving several agents on localhost ports.
+"""
+
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import main
+from upgradeapp.agent import Agent, make_server
+from upgradeapp.fleet import FleetCoordinator, Host, load_inventory, resolve_limit
+from upgradeapp.upgraders import AppUpgrader
+from upgradeapp.upgraders.base import BaseUpgrader
+
+
+class NodeUpgrader(BaseUpgrader):
+    """Upgrader whose upgrade outcome is set per node."""
+
+    def __init__(self, config=None, succeed=True, log=None):
+        super().__init__(config)
+        self.succeed = succeed
+        self.log = log
+
+    def check_available(self):
+        return True
+
+    def list_items(self):
+        return ['web']
+
+    def check_updates(self, item=None):
+        return {'web': 'v2.0'}
+
+    def upgrade(self, item=None, dry_run=False):
+        self.log.append(self.config['node'])
+        return self.succeed
+
+
+class FleetTestCase(unittest.TestCase):
+    """Starts one agent per node on a loopback port."""
+
+    def start_agents(self, agents):
+        hosts = []
+        for name, agent in agents:
+            server = make_server(agent, '127.0.0.1:0')
+            threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+            hosts.append(Host(name, '127.0.0.1:%d' % server.server_address[1]))
+        return hosts
+
+    def node_agents(self, count, failing=()):
+        self.upgraded = []
+
+        def agent(index):
+            name = f'node{index}'
+            return name, Agent(lambda upgrade_type, config: NodeUpgrader(
+                {'node': name}, succeed=name not in failing, log=self.upgraded))
+
+        return self.start_agents([agent(index) for index in range(count)])
+
+
+class TestFleetCoordinator(FleetTestCase):
+    """Test cases for FleetCoordinator."""
+
+    def test_check_uses_get_upgrader_on_each_node(self):
+        """Test check fans out to agents dispatching through get_upgrader."""
+        hosts = self.start_agents([(f'node{index}', Agent(main.get_upgrader)) for index in range(3)])
+        updates = [('bash', '5.2-1')]
+        with mock.patch.object(AppUpgrader, 'check_available', return_value=True), \
+                mock.patch.object(AppUpgrader, 'iter_updates', side_effect=lambda item=None: iter(updates)):
+            report = FleetCoordinator(hosts, 'app', concurrency=8).run('check')
+        self.assertTrue(report.success)
+        self.assertEqual(list(report.results), ['node0', 'node1', 'node2'])
+        self.assertEqual(report.results['node1'].records, [{'item': 'bash', 'version': '5.2-1'}])
+
+    def test_unreachable_host(self):
+        """Test a host without an agent is reported, not raised."""
+        hosts = self.node_agents(2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            hosts.append(Host('gone', 'unix:' + os.path.join(tmpdir, 'none.sock')))
+            report = FleetCoordinator(hosts, 'app').run('list')
+        self.assertEqual(report.counts(), {'ok': 2, 'unreachable': 1})
+        self.assertFalse(report.success)
+
+    def test_rolling_upgrade(self):
+        """Test every node is upgraded in batches of max_unavailable."""
+        hosts = self.node_agents(5)
+        coordinator = FleetCoordinator(hosts, 'app')
+        with mock.patch.object(coordinator, '_fan_out', wraps=coordinator._fan_out) as fan_out:
+            report = coordinator.upgrade(max_unavailable=2)
+        self.assertTrue(report.success)
+        self.assertEqual([len(call.args[0]) for call in fan_out.call_args_list], [2, 2, 1])
+        self.assertEqual(sorted(self.upgraded), [f'node{index}' for index in range(5)])
+
+    def test_failure_threshold_halts_rollout(self):
+        """Test no batch starts once more hosts failed than tolerated."""
+        hosts = self.node_agents(6, failing={'node0', 'node2'})
+        report = FleetCoordinator(hosts, 'app').upgrade(max_unavailable=2, max_failures=1)
+        self.assertTrue(report.halted)
+        self.assertEqual(report.counts(), {'failed': 2, 'ok': 2, 'skipped': 2})
+        self.assertEqual([name for name, result in report.results.items() if result.status == 'skipped'],
+                         ['node4', 'node5'])
+        self.assertNotIn('node4', self.upgraded)
+
+    def test_resolve_limit(self):
+        """Test counts and percentages of the fleet."""
+        self.assertEqual(resolve_limit(3, 100), 3)
+        self.assertEqual(resolve_limit('3', 100), 3)
+        self.assertEqual(resolve_limit('25%', 10), 2)
+
+
+class TestInventory(unittest.TestCase):
+    """Test cases for load_inventory."""
+
+    def _load(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.inventory', delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        return load_inventory(f.name)
+
+    def test_text(self):
+        """Test one host per line with optional names and comments."""
+        hosts = self._load('# fleet\nweb1 10.0.0.1:8765\n10.0.0.2:8765\n\n')
+        self.assertEqual(hosts, [Host('web1', '10.0.0.1:8765'), Host('10.0.0.2:8765', '10.0.0.2:8765')])
+
+    def test_json(self):
+        """Test JSON inventories with per-host tokens."""
+        hosts = self._load(json.dumps({'hosts': [{'name': 'db', 'address': 'db:8765', 'token': 't'}, 'web:8765']}))
+        self.assertEqual(hosts, [Host('db', 'db:8765', 't'), Host('web:8765', 'web:8765')])
+
+    def test_duplicates_rejected(self):
+        """Test a host listed twice is an error."""
+        with self.assertRaises(ValueError):
+            self._load('a 10.0.0.1:1\na 10.0.0.2:1\n')
+
+
+class TestFleetCommand(FleetTestCase):
+    """Test cases for main.py --fleet."""
+
+    def test_upgrade_report(self):
+        """Test the rollout writes one record per host and fails on a halt."""
+        hosts = self.node_agents(3, failing={'node0'})
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write(''.join(f'{host.name} {host.address}\n' for host in hosts))
+        self.addCleanup(os.unlink, f.name)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        argv = ['main.py', 'app', 'upgrade', '--fleet', f.name, '--format', 'json']
+        with mock.patch('sys.argv', argv), mock.patch('sys.stdout', stdout), mock.patch('sys.stderr', stderr):
+            code = main.main()
+        self.assertEqual(code, 1)
+        report = {record['host']: record['status'] for record in json.loads(stdout.getvalue())}
+        self.assertEqual(report, {'node0': 'failed', 'node1': 'skipped', 'node2': 'skipped'})
+        self.assertIn('rollout halted', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
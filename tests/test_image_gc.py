@@ -0,0 +1,127 @@
+"""
+Tests for post-upgrade image garbage collection.
+"""
+
+import json
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import PodmanUpgrader
+from upgradeapp.upgraders.image_gc import GCReport, ImageRecord, ImageReferenceIndex, image_from_inspect
+from upgradeapp.upgraders.inventory import ContainerInventory, ContainerRecord
+from upgradeapp.utils.runner import CommandResult, CommandRunner
+
+
+MB = 1000 * 1000
+
+IMAGES = [
+    {'Id': 'aaa', 'RepoTags': ['example/web:2'], 'Size': 100 * MB, 'RootFS': {'Layers': ['base', 'web2']}},
+    {'Id': 'bbb', 'RepoTags': [], 'RepoDigests': ['example/web@sha256:old'], 'Size': 100 * MB,
+     'RootFS': {'Layers': ['base', 'web1']}},
+    {'Id': 'ccc', 'RepoTags': ['postgres:15'], 'Size': 300 * MB, 'RootFS': {'Layers': ['pg15']}},
+    {'Id': 'ddd', 'RepoTags': ['tools:latest'], 'Size': 50 * MB, 'RootFS': {'Layers': ['tools']}},
+    {'Id': 'eee', 'RepoTags': None, 'Size': 10 * MB, 'Parent': 'sha256:fff'},
+    {'Id': 'fff', 'RepoTags': None, 'Size': 10 * MB},
+    {'Id': 'ggg', 'RepoTags': None, 'Size': 20 * MB, 'RootFS': {'Layers': ['orphan']}},
+]
+
+CONTAINERS = [
+    ContainerRecord('web', 'c1', 'example/web:2', image_id='sha256:aaa'),
+    ContainerRecord('tools', 'c2', 'tools', state='exited'),
+]
+
+
+def records():
+    return [image_from_inspect(data) for data in IMAGES]
+
+
+class TestImageReferenceIndex(unittest.TestCase):
+    """Test cases for ImageReferenceIndex."""
+
+    def setUp(self):
+        self.index = ImageReferenceIndex(records(), CONTAINERS, retain=['postgres:*'])
+
+    def test_references(self):
+        """Test containers, retain patterns and parents all keep images."""
+        self.assertEqual(self.index.references['aaa'], ['container web'])
+        self.assertEqual(self.index.references['ddd'], ['container tools'])
+        self.assertEqual(self.index.references['ccc'], ['retained by postgres:*'])
+        self.assertEqual(self.index.references['fff'], ['parent of eee'])
+        self.assertTrue(self.index.referenced('sha256:aaa'))
+
+    def test_scopes(self):
+        """Test the dangling scope leaves unreferenced tagged images alone."""
+        self.assertEqual([image.id for image in self.index.unreferenced()], ['bbb', 'eee', 'ggg'])
+        index = ImageReferenceIndex(records(), CONTAINERS[:1])
+        self.assertEqual([image.id for image in index.unreferenced('unused')], ['bbb', 'ccc', 'ddd', 'eee', 'ggg'])
+        with self.assertRaises(ValueError):
+            index.unreferenced('everything')
+
+    def test_reclaimable_bytes(self):
+        """Test layers shared with kept images are not counted as reclaimable."""
+        candidates = self.index.unreferenced()
+        # Half of bbb's layers are shared with example/web:2; eee has no layer data
+        self.assertEqual(self.index.reclaimable_bytes(candidates), 50 * MB + 10 * MB + 20 * MB)
+        shared = ImageRecord('hhh', size=40 * MB, shared_size=30 * MB)
+        self.assertEqual(self.index.reclaimable_bytes([shared]), 10 * MB)
+
+
+class TestCollectGarbage(unittest.TestCase):
+    """Test cases for ContainerUpgrader.collect_garbage over the CLI."""
+
+    def setUp(self):
+        self.upgrader = PodmanUpgrader({'podman_upgrader': {'gc_batch_size': 2, 'gc_retain': ['postgres:*']}})
+        self.upgrader._inventory = ContainerInventory(CONTAINERS)
+        self.calls = []
+
+    def _run(self, args, *_, **kwargs):
+        self.calls.append(args)
+        if args[1:3] == ['images', '-a']:
+            stdout = '\n'.join(data['Id'] for data in IMAGES) + '\n'
+        elif args[1:3] == ['image', 'inspect']:
+            stdout = json.dumps([data for data in IMAGES if data['Id'] in args[3:]])
+        elif args[1] == 'rmi':
+            # The orphaned layer's image cannot be removed
+            stdout = ''.join(f'{ref}\n' for ref in args[2:] if ref != 'ggg')
+            return CommandResult(args, 1 if 'ggg' in args else 0, stdout,
+                                 'Error: image ggg is in use' if 'ggg' in args else '')
+        return CommandResult(args, 0, stdout, '')
+
+    def test_batched_removal(self):
+        """Test unreferenced images are removed in batched rmi calls."""
+        with mock.patch.object(CommandRunner, 'run', side_effect=self._run), self.assertLogs('upgradeapp') as logs:
+            report = self.upgrader.collect_garbage()
+        self.assertEqual([call[2:] for call in self.calls if call[1] == 'rmi'], [['bbb', 'eee'], ['ggg']])
+        self.assertEqual(report.removed, ['bbb', 'eee'])
+        self.assertEqual([image.id for image in report.failed], ['ggg'])
+        self.assertEqual(report.reclaimed_bytes, 60 * MB)
+        self.assertEqual(report.referenced, 4)
+        self.assertIn(('WARNING', 'Error: image ggg is in use'),
+                      [(record.levelname, record.getMessage()) for record in logs.records])
+
+    def test_dry_run_report(self):
+        """Test a dry run lists candidates and reclaimable bytes without removing anything."""
+        with mock.patch.object(CommandRunner, 'run', side_effect=self._run), self.assertLogs('upgradeapp') as logs:
+            report = self.upgrader.collect_garbage(dry_run=True)
+        self.assertFalse([call for call in self.calls if call[1] == 'rmi'])
+        self.assertEqual(report.reclaimable_bytes, 80 * MB)
+        self.assertEqual(logs.records[-1].getMessage(),
+                         'Image GC: would remove 3 unreferenced image(s), reclaiming about 80.0 MB; '
+                         '4 referenced image(s) kept')
+
+    def test_runs_after_successful_upgrade_only(self):
+        """Test an enabled GC runs once the upgrade succeeded, never after a failure."""
+        upgrader = PodmanUpgrader({'podman_upgrader': {'image_gc': True}})
+        for success in (True, False):
+            with mock.patch.object(PodmanUpgrader, 'check_available', return_value=True), \
+                    mock.patch.object(PodmanUpgrader, '_resolve_targets', return_value={'web': 'example/web:2'}), \
+                    mock.patch.object(PodmanUpgrader, '_prepull_images', return_value={'example/web:2': True}), \
+                    mock.patch.object(PodmanUpgrader, '_restart_pulled', return_value=success), \
+                    mock.patch.object(PodmanUpgrader, 'collect_garbage', return_value=GCReport()) as gc, \
+                    self.assertLogs('upgradeapp'):
+                self.assertEqual(upgrader.upgrade('web'), success)
+            self.assertEqual(gc.called, success)
+
+
+if __name__ == '__main__':
+    unittest.main()
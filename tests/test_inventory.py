@@ -0,0 +1,107 @@
+"""
+Tests for the batched container inventory.
+"""
+
+import json
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import PodmanUpgrader
+from upgradeapp.upgraders.inventory import ContainerInventory, record_from_summary
+from upgradeapp.utils.runner import CommandResult, CommandRunner
+
+
+def make_containers(count):
+    return [
+        {
+            'Id': f'{i:064x}',
+            'Name': f'/app{i}',
+            'Image': f'sha256:{i:064x}',
+            'Config': {'Image': f'registry.example.com/app{i % 3}:latest', 'Labels': {'tier': 'web'}},
+            'Mounts': [{'Type': 'volume', 'Name': f'data{i}', 'Destination': '/data'}],
+            'State': {'Status': 'running'},
+        }
+        for i in range(count)
+    ]
+
+
+class FakeCLI:
+    """Replacement for CommandRunner.run answering ps and inspect."""
+
+    def __init__(self, containers):
+        self.containers = containers
+        self.calls = []
+
+    def __call__(self, cmd, *args, **kwargs):
+        self.calls.append(cmd)
+        if cmd[1] == 'ps':
+            stdout = '\n'.join(
+                json.dumps({'ID': c['Id'], 'Names': c['Name'].lstrip('/'), 'Image': c['Config']['Image']})
+                for c in self.containers
+            )
+        elif cmd[1] == 'inspect':
+            wanted = set(cmd[2:])
+            stdout = json.dumps([c for c in self.containers if c['Id'] in wanted])
+        else:
+            raise AssertionError(f'unexpected command {cmd}')
+        return CommandResult(cmd, 0, stdout, '')
+
+
+class TestContainerInventory(unittest.TestCase):
+    """Test cases for ContainerInventory."""
+
+    def test_from_cli_uses_two_calls(self):
+        """Test the inventory needs one ps and one inspect call."""
+        cli = FakeCLI(make_containers(50))
+        with mock.patch.object(CommandRunner, 'run', side_effect=cli):
+            inventory = ContainerInventory.from_cli('podman')
+
+        self.assertEqual([cmd[1] for cmd in cli.calls], ['ps', 'inspect'])
+        self.assertEqual(len(inventory), 50)
+        record = inventory.get('app7')
+        self.assertEqual(record.image, 'registry.example.com/app1:latest')
+        self.assertEqual(record.image_id, f'sha256:{7:064x}')
+        self.assertEqual(record.labels, {'tier': 'web'})
+        self.assertEqual(record.mounts[0]['Name'], 'data7')
+        self.assertEqual(record.state, 'running')
+
+    def test_inspect_is_batched(self):
+        """Test huge inventories split inspect into bounded batches."""
+        cli = FakeCLI(make_containers(5))
+        with mock.patch('upgradeapp.upgraders.inventory.INSPECT_BATCH_SIZE', 2), \
+                mock.patch.object(CommandRunner, 'run', side_effect=cli):
+            inventory = ContainerInventory.from_cli('docker')
+        self.assertEqual([cmd[1] for cmd in cli.calls], ['ps', 'inspect', 'inspect', 'inspect'])
+        self.assertEqual(len(inventory), 5)
+
+    def test_lookup_by_id_and_images(self):
+        """Test lookups by full ID, ID prefix and the distinct image list."""
+        inventory = ContainerInventory([record_from_summary(s) for s in [
+            {'Id': 'a' * 64, 'Names': ['/web'], 'Image': 'nginx', 'Labels': 'a=1,b=2'},
+            {'Id': 'b' * 64, 'Names': ['/web2'], 'Image': 'nginx'},
+        ]])
+        self.assertEqual(inventory.get('a' * 64).name, 'web')
+        self.assertEqual(inventory.get('b' * 12).name, 'web2')
+        self.assertEqual(inventory.get('web').labels, {'a': '1', 'b': '2'})
+        self.assertEqual(inventory.images(), ['nginx'])
+        self.assertIsNone(inventory.get('missing'))
+
+    def test_upgrader_reads_from_index(self):
+        """Test list_items and upgrade take container details from the index."""
+        cli = FakeCLI(make_containers(20))
+        upgrader = PodmanUpgrader()
+        with mock.patch.object(CommandRunner, 'run', side_effect=cli), \
+                mock.patch.object(PodmanUpgrader, 'check_available', return_value=True), \
+                mock.patch.object(PodmanUpgrader, '_pull_image', return_value=''), \
+                mock.patch.object(PodmanUpgrader, '_inspect_image', return_value=None), \
+                mock.patch.object(PodmanUpgrader, '_create_container', return_value=False) as create, \
+                mock.patch.object(PodmanUpgrader, '_remove_container', return_value=True), \
+                self.assertLogs('upgradeapp', level='WARNING'):
+            self.assertEqual(len(upgrader.list_items()), 20)
+            upgrader.upgrade()
+        self.assertEqual([cmd[1] for cmd in cli.calls], ['ps', 'inspect'])
+        self.assertEqual(create.call_args_list[0].args[0].mounts[0]['Name'], 'data0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Tests for the logging pipeline.
+"""
+
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import main
+from upgradeapp.utils.logger import setup_logger, shutdown_logger
+
+
+class SlowStream(io.StringIO):
+    """Stream whose writes block until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait(5)
+        return super().write(text)
+
+
+class TestSetupLogger(unittest.TestCase):
+    """Test cases for setup_logger."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.addCleanup(shutdown_logger, 'upgradeapp.test')
+
+    def test_json_records(self):
+        """Test JSON lines carry the item, phase and duration fields and tracebacks."""
+        stream = io.StringIO()
+        logger = setup_logger('upgradeapp.test', stream=stream, log_format='json')
+        logger.info("Pulled %s", 'nginx:latest', extra={'item': 'nginx:latest', 'phase': 'pull', 'duration': 1.25})
+        try:
+            raise OSError('gone')
+        except OSError:
+            logger.error('Pull failed', exc_info=True)
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual({key: first[key] for key in ('level', 'logger', 'message', 'item', 'phase', 'duration')},
+                         {'level': 'INFO', 'logger': 'upgradeapp.test', 'message': 'Pulled nginx:latest',
+                          'item': 'nginx:latest', 'phase': 'pull', 'duration': 1.25})
+        self.assertRegex(first['time'], r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z$')
+        self.assertNotIn('item', second)
+        self.assertIn('OSError: gone', second['exception'])
+
+    def test_background_writer_does_not_block(self):
+        """Test logging returns while the writer thread is stuck on a slow stream."""
+        stream = SlowStream()
+        logger = setup_logger('upgradeapp.test', stream=stream, background=True)
+        args = ['value']
+        for index in range(100):
+            logger.info('Record %d %s', index, args)
+        # Arguments are rendered when logged, not when written
+        args.append('changed')
+        self.assertEqual(stream.getvalue(), '')
+        stream.release.set()
+        shutdown_logger('upgradeapp.test')
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 100)
+        self.assertTrue(lines[-1].endswith("Record 99 ['value']"))
+
+    def test_rotation(self):
+        """Test the log file is rotated by size, keeping backup_count files."""
+        log_file = os.path.join(self.tmpdir, 'upgradeapp.log')
+        logger = setup_logger('upgradeapp.test', log_file=log_file, stream=io.StringIO(), log_format='json',
+                              max_bytes=1000, backup_count=2, background=True)
+        for index in range(100):
+            logger.info(f"Record {index}", extra={'item': f"item-{index}"})
+        shutdown_logger('upgradeapp.test')
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['upgradeapp.log', 'upgradeapp.log.1', 'upgradeapp.log.2'])
+        for name in os.listdir(self.tmpdir):
+            with open(os.path.join(self.tmpdir, name)) as f:
+                self.assertLessEqual(len(f.read()), 1000)
+        with open(log_file) as f:
+            self.assertEqual(json.loads(f.read().splitlines()[-1])['item'], 'item-99')
+
+    def test_upgrader_output_reaches_log(self):
+        """Test upgrader messages go through the application logger, flushed before main returns."""
+        stderr = io.StringIO()
+        argv = ['main.py', 'app', 'upgrade', '--item', 'curl', '--dry-run', '--no-agent',
+                '--format', 'ndjson', '--log-format', 'json']
+        with mock.patch('sys.argv', argv), mock.patch('sys.stdout', io.StringIO()), mock.patch('sys.stderr', stderr), \
+                mock.patch('upgradeapp.upgraders.app_upgrader.AppUpgrader._detect_package_manager', return_value='apt'):
+            self.assertEqual(main.main(), 0)
+        records = [json.loads(line) for line in stderr.getvalue().splitlines()]
+        self.assertIn({'item': 'curl', 'phase': 'upgrade', 'logger': 'upgradeapp.upgraders.app_upgrader'},
+                      [{key: record.get(key) for key in ('item', 'phase', 'logger')} for record in records])
+        self.assertFalse(logging.getLogger('upgradeapp').handlers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+"""
+Tests for the Prometheus/OpenMetrics exporter.
+"""
+
+import asyncio
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import main
+from upgradeapp.agent import Agent, make_server
+from upgradeapp.upgraders.base import BaseUpgrader
+from upgradeapp.utils import metrics, tracing
+from upgradeapp.utils.metrics import MetricsRegistry
+
+
+class MeteredUpgrader(BaseUpgrader):
+    """Upgrader with two updates and a failing upgrade."""
+
+    def check_available(self):
+        return True
+
+    def list_items(self):
+        return ['curl', 'vim']
+
+    def check_updates(self, item=None):
+        tracing.traced_run([sys.executable, '-c', 'pass'])
+        return {'curl': '8.0', 'vim': '9.1'}
+
+    async def async_check_updates(self, item=None):
+        return await super().async_check_updates(item)
+
+    def upgrade(self, item=None, dry_run=False):
+        return False
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Test cases for collecting and rendering metrics."""
+
+    def setUp(self):
+        self.registry = metrics.enable()
+        self.addCleanup(metrics.disable)
+
+    def test_operations_from_spans(self):
+        """Test operations, their outcomes and updates found are counted once per call."""
+        upgrader = MeteredUpgrader()
+        upgrader.check_updates()
+        asyncio.run(upgrader.async_check_updates())
+        upgrader.upgrade()
+        registry = self.registry
+        self.assertEqual(registry.value('upgradeapp_operations', type='metered', operation='check_updates',
+                                        outcome='success'), 2)
+        self.assertEqual(registry.value('upgradeapp_operations', type='metered', operation='upgrade',
+                                        outcome='failure'), 1)
+        self.assertEqual(registry.value('upgradeapp_updates_found', type='metered'), 4)
+        command = tracing.command_name([sys.executable, '-c', 'pass'])
+        self.assertEqual(registry.value('upgradeapp_commands', command=command, outcome='success'), 2)
+        self.assertEqual(registry.histogram('upgradeapp_phase_duration_seconds', type='metered',
+                                            phase='async_check_updates')[0], 1)
+
+    def test_timeouts_and_pulls(self):
+        """Test timeouts are labelled with their limit and pulls with their registry."""
+        with self.assertRaises(subprocess.TimeoutExpired):
+            tracing.traced_run([sys.executable, '-c', 'import time; time.sleep(5)'], timeout=0.2)
+        with tracing.span('DockerUpgrader.pull', item='nginx'):
+            tracing.annotate(registry='registry-1.docker.io', pull_bytes=1024)
+        with tracing.span('registry GET ghcr.io', 'http', registry='ghcr.io'):
+            pass
+        registry = self.registry
+        command = tracing.command_name([sys.executable, '-c', 'import time; time.sleep(5)'])
+        self.assertEqual(registry.value('upgradeapp_command_timeouts', command=command, timeout='0.2'), 1)
+        self.assertEqual(registry.value('upgradeapp_commands', command=command, outcome='timeout'), 1)
+        self.assertEqual(registry.value('upgradeapp_pull_bytes', type='docker', registry='registry-1.docker.io'),
+                         1024)
+        self.assertEqual(registry.histogram('upgradeapp_pull_duration_seconds', type='docker',
+                                            registry='registry-1.docker.io')[0], 1)
+        self.assertEqual(registry.histogram('upgradeapp_registry_request_duration_seconds',
+                                            registry='ghcr.io')[0], 1)
+
+    def test_disabled(self):
+        """Test nothing is collected once metrics are disabled."""
+        metrics.disable()
+        self.assertIsNone(metrics.active())
+        with tracing.span('DockerUpgrader.pull'):
+            pass
+        self.assertEqual(self.registry.histogram('upgradeapp_pull_duration_seconds', type='docker')[0], 0)
+
+    def test_render_and_parse(self):
+        """Test both exposition formats and that rendered text parses back to the same samples."""
+        registry = MetricsRegistry(buckets=(1, 10))
+        registry.inc('upgradeapp_operations', type='app', operation='upgrade', outcome='success')
+        registry.observe('upgradeapp_command_duration_seconds', 0.5, command='apt "upgrade"')
+        registry.observe('upgradeapp_command_duration_seconds', 20, command='apt "upgrade"')
+        registry.record_run('app', 'upgrade', True, 12.5)
+
+        text = registry.render()
+        self.assertIn('# TYPE upgradeapp_operations_total counter', text)
+        self.assertIn('upgradeapp_operations_total{type="app",operation="upgrade",outcome="success"} 1', text)
+        self.assertIn('upgradeapp_command_duration_seconds_bucket{command="apt \\"upgrade\\"",le="1.0"} 1', text)
+        self.assertIn('upgradeapp_command_duration_seconds_bucket{command="apt \\"upgrade\\"",le="+Inf"} 2', text)
+        self.assertIn('upgradeapp_command_duration_seconds_sum{command="apt \\"upgrade\\""} 20.5', text)
+        self.assertFalse(text.rstrip().endswith('# EOF'))
+        self.assertTrue(registry.render(openmetrics=True).endswith('# EOF\n'))
+        self.assertIn('# TYPE upgradeapp_operations counter', registry.render(openmetrics=True))
+
+        parsed = MetricsRegistry.parse(text, buckets=(1, 10))
+        self.assertEqual(parsed.render(), text)
+
+
+class TestTextfile(unittest.TestCase):
+    """Test cases for the node-exporter textfile."""
+
+    def test_runs_accumulate(self):
+        """Test counters add up across main.py runs while last-run gauges are replaced."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'upgradeapp.prom')
+            config_path = os.path.join(tmp, 'config.json')
+            with open(config_path, 'w') as f:
+                f.write('{"metrics": {"textfile": "%s"}, "agent": {"enabled": false}}' % path)
+            for _ in range(2):
+                argv = ['main.py', 'app', 'upgrade', '--config', config_path, '--format', 'json']
+                with mock.patch.object(sys, 'argv', argv), \
+                        mock.patch.object(main, 'get_upgrader', return_value=MeteredUpgrader()), \
+                        mock.patch('sys.stdout'), mock.patch('sys.stderr'):
+                    self.assertEqual(main.main(), 1)
+            with open(path) as f:
+                registry = MetricsRegistry.parse(f.read())
+            # No temporary files are left behind
+            self.assertEqual(sorted(name for name in os.listdir(tmp) if not name.endswith('.lock')),
+                             ['config.json', 'upgradeapp.prom'])
+        self.assertIsNone(metrics.active())
+        self.assertEqual(registry.value('upgradeapp_operations', type='metered', operation='upgrade',
+                                        outcome='failure'), 2)
+        self.assertEqual(registry.value('upgradeapp_last_run_success', type='app', action='upgrade'), 0)
+        self.assertGreater(registry.value('upgradeapp_last_run_timestamp_seconds', type='app', action='upgrade'), 0)
+
+    def test_unwritable_textfile(self):
+        """Test a textfile that cannot be written does not fail the run."""
+        registry = MetricsRegistry()
+        logger = mock.Mock()
+        args = mock.Mock(type='app', action='list')
+        main.write_metrics(registry, '/nonexistent/dir/upgradeapp.prom', args, 0, 1.0, logger)
+        logger.error.assert_called_once()
+
+
+class TestAgentMetrics(unittest.TestCase):
+    """Test cases for the agent's /metrics endpoint."""
+
+    def setUp(self):
+        self.agent = Agent(lambda upgrade_type, config=None: MeteredUpgrader(config))
+        self.server = make_server(self.agent, '127.0.0.1:0', 'secret')
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def get(self, headers):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=10)
+        connection.request('GET', '/metrics', headers=headers)
+        response = connection.getresponse()
+        return response.status, response.getheader('Content-Type'), response.read().decode()
+
+    def test_metrics_endpoint(self):
+        """Test the live registry is served in the format the scraper accepts, behind the token."""
+        self.assertEqual(self.get({'Authorization': 'Bearer secret'})[0], 404)
+        metrics.enable()
+        self.addCleanup(metrics.disable)
+        list(self.agent.run('app', 'check'))
+
+        self.assertEqual(self.get({})[0], 401)
+        status, content_type, body = self.get({'Authorization': 'Bearer secret'})
+        self.assertEqual(status, 200)
+        self.assertEqual(content_type, metrics.PROMETHEUS_CONTENT_TYPE)
+        self.assertIn('upgradeapp_updates_found_total{type="metered"} 2', body)
+        _, content_type, body = self.get({'Authorization': 'Bearer secret',
+                                          'Accept': 'application/openmetrics-text; version=1.0.0'})
+        self.assertEqual(content_type, metrics.OPENMETRICS_CONTENT_TYPE)
+        self.assertTrue(body.endswith('# EOF\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+"""
+Tests for the native pacman database readers.
+"""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import AppUpgrader
+from upgradeapp.upgraders.packages.pacman import PacmanIndex, iter_pacman_local, parse_query_upgrades
+from upgradeapp.upgraders.packages.versions import compare_pacman_versions
+from upgradeapp.utils.runner import CommandResult, CommandRunner
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'pacman')
+
+SYNC_DBS = {
+    'core': ['bash-5.2.026-3', 'openssl-3.2.1-1', 'linux-firmware-20240220.97b693d2-1'],
+    'extra': ['python-3.12.3-1', 'bash-5.2.032-1'],
+    'aaa-local': ['zstd-1.5.6-2'],
+    'stale-removed-repo': ['openssl-3.3.0-1'],
+}
+
+
+def make_sync_db(path, entries):
+    """Write a gzip-compressed sync database with one desc file per entry."""
+    with tarfile.open(path, 'w:gz') as archive:
+        for entry in entries:
+            directory = tarfile.TarInfo(entry)
+            directory.type = tarfile.DIRTYPE
+            archive.addfile(directory)
+            desc = f'%FILENAME%\n{entry}-x86_64.pkg.tar.zst\n'.encode()
+            info = tarfile.TarInfo(f'{entry}/desc')
+            info.size = len(desc)
+            archive.addfile(info, io.BytesIO(desc))
+
+
+class PacmanTestCase(unittest.TestCase):
+    """Base class providing a pacman database root."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        shutil.copytree(os.path.join(FIXTURES, 'local'), os.path.join(self.tmpdir, 'local'))
+        os.mkdir(os.path.join(self.tmpdir, 'sync'))
+        for repo, entries in SYNC_DBS.items():
+            make_sync_db(os.path.join(self.tmpdir, 'sync', f'{repo}.db'), entries)
+        self.config = os.path.join(FIXTURES, 'pacman.conf')
+
+
+class TestPacmanVersions(unittest.TestCase):
+    """Test cases for pacman version comparison."""
+
+    def test_vercmp(self):
+        """Test ordering matches pacman's vercmp, which differs from rpm on suffixes."""
+        ascending = ['1.0a', '1.0', '1.0.1', '1.1', '1:0.5-1']
+        for lower, higher in zip(ascending, ascending[1:]):
+            self.assertLess(compare_pacman_versions(lower, higher), 0, f'{lower} < {higher}')
+            self.assertGreater(compare_pacman_versions(higher, lower), 0, f'{higher} > {lower}')
+        self.assertEqual(compare_pacman_versions('5.2.026-2', '5.2.26-2'), 0)
+
+
+class TestPacmanIndex(PacmanTestCase):
+    """Test cases for PacmanIndex."""
+
+    def test_local_packages(self):
+        """Test installed packages carry the architecture from their desc file."""
+        packages = list(iter_pacman_local(self.tmpdir))
+        self.assertEqual([package.name for package in packages],
+                         ['bash', 'linux-firmware', 'openssl', 'python', 'zstd'])
+        self.assertEqual(packages[1].architecture, 'any')
+        self.assertEqual(packages[1].version, '20240312.3b128b60-1')
+
+    def test_repository_order(self):
+        """Test pacman.conf order is followed and unconfigured databases ignored."""
+        names = [os.path.basename(path) for path in PacmanIndex(self.tmpdir, self.config).sync_dbs()]
+        self.assertEqual(names, ['core.db', 'extra.db', 'aaa-local.db'])
+
+    def test_upgradable(self):
+        """Test the first repository carrying a package decides its candidate."""
+        self.assertEqual(PacmanIndex(self.tmpdir, self.config).upgradable(), {
+            'bash': '5.2.026-3',
+            'python': '3.12.3-1',
+            'zstd': '1.5.6-2',
+        })
+
+    def test_sync_db_formats(self):
+        """Test xz-compressed databases and long member names are read."""
+        long_entry = 'a-package-with-a-name-well-beyond-the-one-hundred-byte-limit-of-plain-tar-headers-ok-1.0-1'
+        path = os.path.join(self.tmpdir, 'sync', 'extra.db')
+        os.unlink(path)
+        with tarfile.open(path, 'w:xz', format=tarfile.GNU_FORMAT) as archive:
+            info = tarfile.TarInfo(f'{long_entry}/desc')
+            archive.addfile(info, io.BytesIO(b''))
+        versions = PacmanIndex(self.tmpdir, self.config).repo_versions(path)
+        self.assertEqual(versions, {long_entry[:-6]: '1.0-1'})
+
+    def test_item_filter(self):
+        """Test a single package can be requested."""
+        index = PacmanIndex(self.tmpdir, self.config)
+        self.assertEqual(index.upgradable('python'), {'python': '3.12.3-1'})
+        self.assertEqual(index.upgradable('openssl'), {})
+
+    def test_age_ignores_database_mtimes(self):
+        """Test freshness comes from the sync directory, not the mirror-dated databases."""
+        old = time.time() - 7200
+        for name in os.listdir(os.path.join(self.tmpdir, 'sync')):
+            os.utime(os.path.join(self.tmpdir, 'sync', name), (old, old))
+        index = PacmanIndex(self.tmpdir, self.config)
+        self.assertFalse(index.is_stale(3600))
+        os.utime(os.path.join(self.tmpdir, 'sync'), (old, old))
+        self.assertTrue(index.is_stale(3600))
+
+    def test_query_upgrades_parser(self):
+        """Test `pacman -Qu` lines are parsed, ignoring held packages' markers."""
+        output = 'bash 5.2.026-2 -> 5.2.026-3\nlinux 6.8.1-1 -> 6.8.2-1 [ignored]\n'
+        self.assertEqual(parse_query_upgrades(output), {'bash': '5.2.026-3', 'linux': '6.8.2-1'})
+
+
+class TestAppUpgraderPacman(PacmanTestCase):
+    """Test cases for AppUpgrader on pacman hosts."""
+
+    def setUp(self):
+        super().setUp()
+        self.sync_path = os.path.join(self.tmpdir, 'checkup-db')
+        self.upgrader = AppUpgrader({'state_store': False, 'app_upgrader': {
+            'pacman_db_path': self.tmpdir,
+            'pacman_sync_path': self.sync_path,
+            'pacman_config': self.config,
+            'metadata_max_age': float('inf'),
+        }})
+        self.upgrader.package_manager = 'pacman'
+
+    def test_check_and_list_need_no_subprocess(self):
+        """Test checks and listings read the databases directly."""
+        with mock.patch.object(CommandRunner, 'run') as run:
+            updates = self.upgrader.check_updates()
+            items = self.upgrader.list_items()
+        run.assert_not_called()
+        self.assertEqual(updates['bash'], '5.2.026-3')
+        self.assertIn('linux-firmware', items)
+
+    def test_unreadable_sync_db_falls_back(self):
+        """Test an unsupported sync database compression falls back to pacman -Qu."""
+        with open(os.path.join(self.tmpdir, 'sync', 'core.db'), 'wb') as f:
+            f.write(b'\x28\xb5\x2f\xfd not a tarball')
+        result = CommandResult(['pacman', '-Qu'], 0, 'bash 5.2.026-2 -> 5.2.026-3\n', '')
+        with mock.patch.object(CommandRunner, 'run', return_value=result) as run:
+            updates = self.upgrader.check_updates()
+        self.assertEqual(run.call_args[0][0], ['pacman', '-Qu', '--dbpath', self.sync_path])
+        self.assertEqual(updates, {'bash': '5.2.026-3'})
+
+    def test_refresh_syncs_private_copy(self):
+        """Test stale databases are synced into a private copy, leaving the system's alone."""
+        self.upgrader.settings['metadata_max_age'] = 3600
+        system_sync = os.path.join(self.tmpdir, 'sync')
+        old = time.time() - 7200
+        os.utime(system_sync, (old, old))
+        with mock.patch.object(CommandRunner, 'run', return_value=CommandResult([], 0)) as run:
+            updates = self.upgrader.check_updates()
+            self.upgrader.check_updates()
+        run.assert_called_once()
+        cmd = run.call_args[0][0]
+        start = cmd.index('pacman')
+        self.assertNotIn('sudo', cmd)
+        self.assertEqual(cmd[start:start + 4], ['pacman', '-Sy', '--dbpath', self.sync_path])
+        self.assertEqual(os.readlink(os.path.join(self.sync_path, 'local')), os.path.join(self.tmpdir, 'local'))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.sync_path, 'sync'))), sorted(os.listdir(system_sync)))
+        self.assertEqual(updates['bash'], '5.2.026-3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Tests for the upgrader plugin registry.
+"""
+
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import main
+from upgradeapp import plugins
+from upgradeapp.upgraders.base import BaseUpgrader
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FlatpakUpgrader(BaseUpgrader):
+    """Stand-in for a third-party backend."""
+
+    def check_available(self):
+        return True
+
+    def list_items(self):
+        return ['org.example.App']
+
+    def check_updates(self, item=None):
+        return {}
+
+    def upgrade(self, item=None, dry_run=False):
+        return True
+
+
+class FakeEntryPoint:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+def imported_modules(code):
+    """Modules a fresh interpreter has imported after running code."""
+    completed = subprocess.run(
+        [sys.executable, '-c', f"import json, sys\n{code}\nprint(json.dumps(sorted(sys.modules)))"],
+        cwd=ROOT, capture_output=True, text=True, check=True, timeout=60
+    )
+    return set(json.loads(completed.stdout.splitlines()[-1]))
+
+
+class TestPlugins(unittest.TestCase):
+    """Test cases for looking up upgrade types."""
+
+    def setUp(self):
+        patcher = mock.patch.multiple(plugins, _registered={}, _installed=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def installed(self, *entry_points):
+        found = mock.Mock(spec=['select'])
+        found.select.return_value = list(entry_points)
+        return mock.patch('importlib.metadata.entry_points', return_value=found)
+
+    def test_builtin_types_without_metadata(self):
+        """Test built-in types load without reading installed package metadata."""
+        with mock.patch('importlib.metadata.entry_points', side_effect=AssertionError('scanned')):
+            self.assertEqual(plugins.load('app').__name__, 'AppUpgrader')
+            self.assertTrue(plugins.is_known('podman'))
+
+    def test_entry_point_plugin(self):
+        """Test an installed entry point adds a type, after the built-in ones."""
+        with self.installed(FakeEntryPoint('flatpak', f'{__name__}:FlatpakUpgrader'),
+                            FakeEntryPoint('docker', 'elsewhere:DockerUpgrader')):
+            self.assertIs(plugins.load('flatpak'), FlatpakUpgrader)
+            self.assertEqual(plugins.upgrade_types(), ['app', 'docker', 'podman', 'flatpak'])
+            # A plugin cannot shadow a built-in type
+            self.assertEqual(plugins.load('docker').__name__, 'DockerUpgrader')
+
+    def test_broken_and_unknown_types(self):
+        """Test unknown types and plugins that do not load are reported as ValueError."""
+        with self.installed(FakeEntryPoint('gone', 'no_such_module:Upgrader'),
+                            FakeEntryPoint('wrong', 'json:loads')):
+            for name in ('missing', 'gone', 'wrong'):
+                with self.assertRaises(ValueError):
+                    plugins.load(name)
+
+    def test_register(self):
+        """Test types registered at runtime are used by main.py."""
+        plugins.register('flatpak', FlatpakUpgrader)
+        with self.assertRaises(ValueError):
+            plugins.register('app', FlatpakUpgrader)
+        with self.installed():
+            self.assertIsInstance(main.get_upgrader('flatpak'), FlatpakUpgrader)
+            stderr = io.StringIO()
+            with mock.patch.object(sys, 'argv', ['main.py', 'snap', 'list']), mock.patch('sys.stderr', stderr):
+                with self.assertRaises(SystemExit):
+                    main.main()
+        self.assertIn('choose from app, docker, podman, flatpak, all, serve', stderr.getvalue())
+
+
+class TestLazyImports(unittest.TestCase):
+    """Test cases for importing only the backend in use."""
+
+    def test_main_imports_no_backend(self):
+        """Test importing main.py, or one backend, leaves the other backends unimported."""
+        backends = {'upgradeapp.upgraders.app_upgrader', 'upgradeapp.upgraders.container',
+                    'upgradeapp.upgraders.docker_upgrader', 'upgradeapp.upgraders.podman_upgrader'}
+        self.assertEqual(imported_modules('import main') & backends, set())
+        self.assertEqual(imported_modules("import main\nmain.plugins.load('app')") & backends,
+                         {'upgradeapp.upgraders.app_upgrader'})
+        self.assertEqual(imported_modules('from upgradeapp.upgraders import PodmanUpgrader') & backends,
+                         {'upgradeapp.upgraders.container', 'upgradeapp.upgraders.podman_upgrader'})
+
+
+if __name__ == '__main__':
+    unittest.main()
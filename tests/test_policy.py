@@ -0,0 +1,165 @@
+"""
+Tests for include/exclude policies.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import AppUpgrader, PodmanUpgrader
+from upgradeapp.upgraders.inventory import ContainerInventory, ContainerRecord
+from upgradeapp.upgraders.policy import Policy
+from upgradeapp.utils.runner import CommandResult, CommandRunner
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'apt')
+
+
+class TestPolicy(unittest.TestCase):
+    """Test cases for compiling and applying rules."""
+
+    def test_rule_kinds(self):
+        """Test exact names, globs, regexes, labels and images."""
+        policy = Policy(exclude=['vim', 'linux-image-*', 're:^python3\\.\\d+-dev$', 'label:upgrade=false',
+                                 'label:pinned', 'image:postgres:*', 'image:re:/internal/'], items='containers')
+        self.assertTrue(policy.allows('curl'))
+        self.assertFalse(policy.allows('vim'))
+        self.assertTrue(policy.allows('vim-tiny'))
+        self.assertFalse(policy.allows('linux-image-6.1.0-18-amd64'))
+        self.assertFalse(policy.allows('python3.11-dev'))
+        self.assertTrue(policy.allows('python3.11'))
+        self.assertFalse(policy.decide('web', {'upgrade': 'false'}).allowed)
+        self.assertTrue(policy.decide('web', {'upgrade': 'true'}).allowed)
+        self.assertFalse(policy.decide('web', {'pinned': ''}).allowed)
+        self.assertFalse(policy.decide('db', image='postgres:16').allowed)
+        self.assertFalse(policy.decide(None, image='registry.example.com/internal/api:1').allowed)
+        self.assertTrue(policy.decide('web', {'tier': 'web'}, 'nginx:latest').allowed)
+
+    def test_decision_reports_first_rule(self):
+        """Test the earliest matching rule in the configuration is reported."""
+        policy = Policy(exclude=['lib*', 'libc6', 're:c6$'])
+        decision = policy.decide('libc6')
+        self.assertEqual((decision.allowed, decision.setting, decision.rule), (False, 'exclude_packages', 'lib*'))
+        self.assertEqual(decision.reason, "excluded by exclude_packages rule 'lib*'")
+        self.assertEqual(Policy(exclude=['re:c6$', 'libc6']).decide('libc6').rule, 're:c6$')
+
+    def test_include_rules(self):
+        """Test include rules restrict items and exclude rules win over them."""
+        policy = Policy(include=['web-*', 'label:tier=frontend'], exclude=['web-legacy'], items='containers')
+        self.assertEqual(policy.decide('web-1').rule, 'web-*')
+        self.assertTrue(policy.decide('cdn', {'tier': 'frontend'}).allowed)
+        self.assertFalse(policy.decide('web-legacy').allowed)
+        unmatched = policy.decide('db')
+        self.assertFalse(unmatched.allowed)
+        self.assertEqual(unmatched.reason, 'not matched by any include_containers rule')
+
+    def test_uncombinable_and_invalid_regexes(self):
+        """Test regexes with backreferences still work and invalid ones are rejected."""
+        policy = Policy(exclude=['re:^(a+)-\\1$', 'x*'])
+        self.assertFalse(policy.allows('aa-aa'))
+        self.assertTrue(policy.allows('aa-a'))
+        self.assertFalse(policy.allows('xyz'))
+        with self.assertRaises(ValueError):
+            Policy(exclude=['re:(unclosed'])
+
+    def test_many_rules(self):
+        """Test thousands of rules and items give the same answers as matching rule by rule."""
+        rules = [f"pkg{i:05d}" for i in range(0, 20000, 7)] + [f"lib{i}*" for i in range(300)] + ['re:-dbg$']
+        policy = Policy(exclude=rules)
+        names = [f"pkg{i:05d}" for i in range(20000)] + [f"lib{i}x" for i in range(600)] + ['foo-dbg']
+        exact = set(rules)
+        prefixes = tuple(f"lib{i}" for i in range(300))
+        expected = [name for name in names
+                    if name not in exact and not name.startswith(prefixes) and not name.endswith('-dbg')]
+        self.assertEqual(policy.filter(names), expected)
+        self.assertFalse(Policy())
+        self.assertEqual(Policy().filter(names), names)
+
+
+class TestAppUpgraderPolicy(unittest.TestCase):
+    """Test cases for package rules in AppUpgrader."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        lists_dir = os.path.join(self.tmpdir, 'lists')
+        shutil.copytree(os.path.join(FIXTURES, 'lists'), lists_dir)
+        os.utime(lists_dir)
+        self.upgrader = AppUpgrader({'app_upgrader': {
+            'apt_lists_dir': lists_dir,
+            'dpkg_status': os.path.join(FIXTURES, 'status'),
+            'apt_lists_max_age': 3600,
+            'exclude_packages': ['libc*', 're:^tz'],
+        }})
+        self.upgrader.package_manager = 'apt'
+
+    def test_list_and_check(self):
+        """Test excluded packages are neither listed nor reported as updates."""
+        self.assertNotIn('libc6', self.upgrader.list_items())
+        self.assertIn('curl', self.upgrader.list_items())
+        self.assertEqual(list(self.upgrader.check_updates()), ['curl'])
+
+    def test_upgrade_names_allowed_packages(self):
+        """Test a full upgrade names the allowed updates and records the skipped ones."""
+        with mock.patch.object(CommandRunner, 'run', return_value=CommandResult([], 0)) as run, \
+                self.assertLogs('upgradeapp'):
+            self.assertTrue(self.upgrader.upgrade())
+            self.assertTrue(self.upgrader.upgrade('tzdata'))
+        run.assert_called_once()
+        self.assertEqual(run.call_args[0][0], ['sudo', 'apt', 'upgrade', 'curl', '-y'])
+        self.assertEqual(self.upgrader.skipped['tzdata'].rule, 're:^tz')
+
+    def test_pacman_ignores_excluded(self):
+        """Test pacman keeps upgrading the whole system and ignores excluded packages."""
+        self.upgrader.package_manager = 'pacman'
+        self.assertEqual(self.upgrader._upgrade_command(None, False, (['curl'], ['libc6', 'tzdata'])),
+                         ['sudo', 'pacman', '--noconfirm', '-Syu', '--ignore', 'libc6,tzdata'])
+
+
+class TestContainerPolicy(unittest.TestCase):
+    """Test cases for container rules in ContainerUpgrader."""
+
+    def setUp(self):
+        self.upgrader = PodmanUpgrader({'podman_upgrader': {
+            'exclude_containers': ['label:com.example.upgrade=false', 'db-*'],
+        }})
+        inventory = ContainerInventory([
+            ContainerRecord('web', '1' * 64, 'nginx', labels={'tier': 'web'}),
+            ContainerRecord('db-main', '2' * 64, 'postgres:16'),
+            ContainerRecord('cache', '3' * 64, 'redis:7', labels={'com.example.upgrade': 'false'}),
+            ContainerRecord('worker', '4' * 64, 'redis:7'),
+        ])
+        for patcher in (
+            mock.patch.object(PodmanUpgrader, 'check_available', return_value=True),
+            mock.patch.object(PodmanUpgrader, 'inventory', return_value=inventory),
+            mock.patch.object(PodmanUpgrader, '_list_image_tags',
+                              return_value=['nginx:latest', 'postgres:16', 'redis:7', 'alpine:3']),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_list_and_check_targets(self):
+        """Test excluded containers are not listed and images only they use are not checked."""
+        self.assertEqual(self.upgrader.list_items(), ['web', 'worker'])
+        # redis is still used by worker; alpine has no container and no rule excludes it
+        self.assertEqual(self.upgrader._check_targets(None), ['nginx:latest', 'redis:7', 'alpine:3'])
+        self.assertEqual(self.upgrader._check_targets('db-main'), [])
+
+    def test_upgrade_skips_excluded(self):
+        """Test an upgrade leaves excluded containers alone and reports why."""
+        with self.assertLogs('upgradeapp'):
+            self.assertTrue(self.upgrader.upgrade(dry_run=True))
+        self.assertEqual({name: decision.rule for name, decision in self.upgrader.skipped.items()},
+                         {'db-main': 'db-*', 'cache': 'label:com.example.upgrade=false'})
+        with self.assertLogs('upgradeapp') as logs, \
+                mock.patch.object(PodmanUpgrader, '_resolve_targets', side_effect=AssertionError('upgraded')):
+            self.assertTrue(self.upgrader.upgrade('cache'))
+        self.assertEqual(logs.records[-1].getMessage(),
+                         "Skipping cache: excluded by exclude_containers rule 'label:com.example.upgrade=false'")
+        self.assertEqual(logs.records[-1].item, 'cache')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests for the persistent probe cache.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import AppUpgrader
+from upgradeapp.utils.probe_cache import ProbeCache
+
+
+class TestProbeCache(unittest.TestCase):
+    """Test cases for ProbeCache."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.bindir = os.path.join(self.tmpdir, 'bin')
+        os.mkdir(self.bindir)
+        self.tool = self._write_tool('faketool', 'faketool 1.0')
+        self.cache_file = os.path.join(self.tmpdir, 'probes.json')
+        patcher = mock.patch.dict(os.environ, {'PATH': self.bindir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+
+    def _write_tool(self, name, output):
+        path = os.path.join(self.bindir, name)
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\necho "{output}"\n')
+        os.chmod(path, 0o755)
+        return path
+
+    def _probe(self, cache):
+        with mock.patch('upgradeapp.utils.runner.subprocess.Popen', wraps=subprocess.Popen) as popen:
+            result = cache.probe('faketool')
+        return result, popen.call_count
+
+    def test_memoized_within_process(self):
+        """Test a probe forks once per process."""
+        cache = ProbeCache(self.cache_file)
+        result, forks = self._probe(cache)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.output, 'faketool 1.0')
+        self.assertEqual(forks, 1)
+        self.assertEqual(self._probe(cache)[1], 0)
+
+    def test_persisted_across_processes(self):
+        """Test a fresh cache instance reuses the stored result without forking."""
+        self._probe(ProbeCache(self.cache_file))
+        result, forks = self._probe(ProbeCache(self.cache_file))
+        self.assertEqual(forks, 0)
+        self.assertEqual(result.output, 'faketool 1.0')
+
+    def test_invalidated_when_binary_changes(self):
+        """Test a changed mtime forces a new probe."""
+        self._probe(ProbeCache(self.cache_file))
+        self._write_tool('faketool', 'faketool 2.0')
+        stat = os.stat(self.tool)
+        os.utime(self.tool, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        result, forks = self._probe(ProbeCache(self.cache_file))
+        self.assertEqual(forks, 1)
+        self.assertEqual(result.output, 'faketool 2.0')
+
+    def test_missing_binary(self):
+        """Test a missing binary yields None without forking."""
+        with mock.patch('subprocess.Popen') as popen:
+            self.assertIsNone(ProbeCache(self.cache_file).probe('nothere'))
+        popen.assert_not_called()
+
+    def test_no_persist(self):
+        """Test persist=False never writes the cache file."""
+        self._probe(ProbeCache(self.cache_file, persist=False))
+        self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_package_manager_detection_does_not_fork(self):
+        """Test AppUpgrader finds the package manager without subprocesses."""
+        self._write_tool('pacman', 'Pacman v6')
+        with mock.patch('subprocess.Popen') as popen:
+            upgrader = AppUpgrader({'probe_cache': False})
+        self.assertEqual(upgrader.package_manager, 'pacman')
+        popen.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
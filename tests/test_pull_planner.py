@@ -0,0 +1,147 @@
+"""
+Tests for the layer-aware pull planner.
+"""
+
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import PodmanUpgrader
+from upgradeapp.utils.state_store import StateStore
+from upgradeapp.upgraders.pull_planner import PullPlanner, format_bytes, plan_pulls
+
+
+MB = 1000 * 1000
+
+# Image reference -> layers of the manifest it resolves to
+MANIFESTS = {
+    'example/api:2': [('sha256:base', 50 * MB), ('sha256:runtime', 30 * MB), ('sha256:api', 5 * MB)],
+    'example/worker:2': [('sha256:base', 50 * MB), ('sha256:runtime', 30 * MB), ('sha256:worker', 4 * MB)],
+    'example/cron:2': [('sha256:base', 50 * MB), ('sha256:cron', 1 * MB)],
+    'example/db:16': [('sha256:debian', 40 * MB), ('sha256:db', 20 * MB)],
+    'example/cache:7': [('sha256:debian', 40 * MB), ('sha256:cache', 8 * MB)],
+    'example/web@sha256:local': [('sha256:alpine', 3 * MB)],
+    'example/web:2': [('sha256:alpine', 3 * MB), ('sha256:web', 2 * MB)],
+}
+
+
+class FakeRegistryClient:
+    """Registry client serving MANIFESTS and recording what was fetched."""
+
+    def __init__(self):
+        self.fetched = []
+
+    def manifest(self, image):
+        self.fetched.append(image)
+        if image not in MANIFESTS:
+            return None
+        return {'layers': [{'digest': digest, 'size': size} for digest, size in MANIFESTS[image]]}
+
+
+class TestPlanPulls(unittest.TestCase):
+    """Test cases for plan_pulls."""
+
+    def test_shared_layers_pulled_first(self):
+        """Test one image per shared layer group leads, the rest fan out after it."""
+        images = ['example/cron:2', 'example/api:2', 'example/db:16', 'example/worker:2', 'example/cache:7']
+        plan = plan_pulls(images, {image: MANIFESTS[image] for image in images}, set())
+        self.assertEqual(plan.waves, [['example/api:2', 'example/db:16'],
+                                      ['example/cron:2', 'example/worker:2', 'example/cache:7']])
+        self.assertEqual(sorted(plan.index['sha256:base']), ['example/api:2', 'example/cron:2', 'example/worker:2'])
+        self.assertEqual(plan.download_bytes, 158 * MB)
+        self.assertEqual(plan.unshared_bytes - plan.download_bytes, 170 * MB)
+        self.assertEqual(plan.disk_bytes, 395 * MB)
+
+    def test_present_layers_not_counted(self):
+        """Test layers already stored locally are neither downloaded nor ordered for."""
+        images = ['example/db:16', 'example/cache:7']
+        plan = plan_pulls(images, {image: MANIFESTS[image] for image in images}, {'sha256:debian'})
+        self.assertEqual(plan.waves, [images])
+        self.assertEqual(plan.download_bytes, 28 * MB)
+        self.assertEqual(plan.shared_layers(), {})
+
+    def test_unknown_images_pulled_last(self):
+        """Test images without a manifest are still pulled, after the planned ones."""
+        images = ['localhost/app', 'example/api:2', 'example/worker:2']
+        plan = plan_pulls(images, {'localhost/app': None, 'example/api:2': MANIFESTS['example/api:2'],
+                                   'example/worker:2': MANIFESTS['example/worker:2']}, set())
+        self.assertEqual(plan.waves, [['example/api:2'], ['localhost/app', 'example/worker:2']])
+        self.assertEqual(plan.unknown, ['localhost/app'])
+        self.assertIn('1 image(s) not sized', plan.summary())
+
+    def test_format_bytes(self):
+        """Test byte counts are rendered with decimal units."""
+        self.assertEqual(format_bytes(512), '512 B')
+        self.assertEqual(format_bytes(1400 * MB), '1.4 GB')
+
+
+class TestPullPlanner(unittest.TestCase):
+    """Test cases for PullPlanner."""
+
+    def test_local_copy_marks_layers_present(self):
+        """Test the local image's manifest is fetched by repo digest to find present layers."""
+        registry = FakeRegistryClient()
+        planner = PullPlanner(registry, lambda image: ['example/web@sha256:local'] if image == 'example/web:2' else [])
+        plan = planner.plan(['example/web:2', 'localhost/app'])
+        self.assertEqual(plan.download_bytes, 2 * MB)
+        self.assertEqual(plan.unknown, ['localhost/app'])
+        self.assertNotIn('localhost/app', registry.fetched)
+
+    def test_registry_errors_leave_image_unsized(self):
+        """Test a failing manifest request does not fail the plan."""
+        registry = FakeRegistryClient()
+        registry.manifest = mock.Mock(side_effect=OSError('unreachable'))
+        with self.assertLogs('upgradeapp', level='WARNING'):
+            plan = PullPlanner(registry, lambda image: []).plan(['example/api:2'])
+        self.assertEqual(plan.waves, [['example/api:2']])
+        self.assertEqual(plan.unknown, ['example/api:2'])
+
+
+class TestPlannedUpgrade(unittest.TestCase):
+    """Test cases for upgrades with pull planning enabled."""
+
+    def setUp(self):
+        self.upgrader = PodmanUpgrader({'podman_upgrader': {'pull_planning': True, 'pull_concurrency': 4}})
+        self.upgrader._registry = FakeRegistryClient()
+        self.pulled = []
+
+    def _pull(self, image, quiet=False):
+        self.pulled.append(image)
+        return 'ok'
+
+    def test_prepull_follows_waves(self):
+        """Test seed images are pulled before the images sharing their layers."""
+        images = ['example/cron:2', 'example/worker:2', 'example/api:2']
+        with mock.patch.object(PodmanUpgrader, '_local_repo_digests', return_value=[]), \
+                mock.patch.object(PodmanUpgrader, '_pull_image', side_effect=self._pull), \
+                self.assertLogs('upgradeapp') as logs:
+            pulled = self.upgrader._prepull_images(images)
+        self.assertEqual(list(pulled), images)
+        self.assertTrue(all(pulled.values()))
+        self.assertEqual(self.pulled[0], 'example/worker:2')
+        self.assertIn('Pull plan: 3 image(s) in 2 wave(s)', logs.records[0].getMessage())
+
+    def test_pull_mode_check_keeps_listing_order(self):
+        """Test pull-mode checks follow the plan but report in listing order."""
+        images = ['example/cron:2', 'example/worker:2', 'example/api:2']
+        store = StateStore(persist=False)
+        self.upgrader.state_store = lambda: store
+        with mock.patch.object(PodmanUpgrader, 'check_available', return_value=True), \
+                mock.patch.object(PodmanUpgrader, 'list_images', return_value=images), \
+                mock.patch.object(PodmanUpgrader, '_local_repo_digests', return_value=[]), \
+                mock.patch.object(PodmanUpgrader, '_pull_image', side_effect=self._pull), \
+                self.assertLogs('upgradeapp'):
+            updates = self.upgrader.check_updates()
+        self.assertEqual(list(updates), images)
+        self.assertEqual(self.pulled[0], 'example/worker:2')
+
+    def test_disabled_by_default(self):
+        """Test no manifests are fetched unless pull planning is enabled."""
+        upgrader = PodmanUpgrader({})
+        upgrader._registry = FakeRegistryClient()
+        self.assertEqual(upgrader._plan_pulls(['example/api:2', 'example/worker:2']),
+                         [['example/api:2', 'example/worker:2']])
+        self.assertEqual(upgrader._registry.fetched, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Tests for capturing container configuration for recreation.
+"""
+
+import unittest
+
+from upgradeapp.upgraders.recreate import container_spec
+
+
+IMAGE = {
+    'Id': 'sha256:old',
+    'Config': {
+        'Env': ['PATH=/usr/bin', 'APP_VERSION=1.0'],
+        'Cmd': ['serve'],
+        'Entrypoint': ['/entrypoint.sh'],
+        'Labels': {'org.opencontainers.image.version': '1.0'},
+        'WorkingDir': '/app',
+    },
+}
+
+CONTAINER = {
+    'Id': 'c0ffee' * 10,
+    'Name': '/web',
+    'Image': 'sha256:old',
+    'Config': {
+        'Image': 'example/web:1',
+        'Hostname': 'c0ffeec0ffee',
+        'Env': ['PATH=/usr/bin', 'APP_VERSION=1.0', 'DB_HOST=db'],
+        'Cmd': ['serve'],
+        'Entrypoint': ['/entrypoint.sh'],
+        'Labels': {'org.opencontainers.image.version': '1.0', 'com.docker.compose.service': 'web'},
+        'WorkingDir': '/app',
+    },
+    'HostConfig': {
+        'NetworkMode': 'frontend',
+        'PortBindings': {'80/tcp': [{'HostIp': '127.0.0.1', 'HostPort': '8080'}], '9090/tcp': [{'HostPort': ''}]},
+        'RestartPolicy': {'Name': 'on-failure', 'MaximumRetryCount': 3},
+        'CapAdd': ['NET_ADMIN'],
+        'ShmSize': 67108864,
+        'Binds': ['/srv/web:/usr/share/web:ro'],
+    },
+    'Mounts': [
+        {'Type': 'bind', 'Source': '/srv/web', 'Destination': '/usr/share/web', 'Mode': 'ro', 'RW': False},
+        {'Type': 'volume', 'Name': '3f2a', 'Source': '/var/lib/docker/volumes/3f2a/_data',
+         'Destination': '/cache', 'Mode': '', 'RW': True},
+    ],
+    'NetworkSettings': {'Networks': {
+        'frontend': {'Aliases': ['web', 'c0ffeec0ffee']},
+        'backend': {'Aliases': ['web-backend']},
+    }},
+    'State': {'Running': True},
+}
+
+
+class TestContainerSpec(unittest.TestCase):
+    """Test cases for container_spec."""
+
+    def setUp(self):
+        self.spec = container_spec(CONTAINER, IMAGE)
+        self.spec.image = 'example/web:2'
+
+    def test_image_defaults_left_out(self):
+        """Test settings inherited from the old image are not pinned."""
+        self.assertEqual(self.spec.env, ['DB_HOST=db'])
+        self.assertEqual(self.spec.labels, {'com.docker.compose.service': 'web'})
+        self.assertIsNone(self.spec.cmd)
+        self.assertIsNone(self.spec.entrypoint)
+        self.assertEqual((self.spec.working_dir, self.spec.hostname), ('', ''))
+        self.assertTrue(self.spec.running)
+
+    def test_create_args(self):
+        """Test the CLI arguments reproduce mounts, ports, networks and policies."""
+        args = self.spec.create_args('web-new')
+        self.assertEqual(args[:2], ['--name', 'web-new'])
+        self.assertEqual(args[-1], 'example/web:2')
+        joined = ' '.join(args)
+        for expected in ('-e DB_HOST=db', '-v /srv/web:/usr/share/web:ro', '-v 3f2a:/cache',
+                         '-p 127.0.0.1:8080:80/tcp', '-p 9090/tcp', '--network frontend',
+                         '--network-alias web', '--restart on-failure:3', '--cap-add NET_ADMIN'):
+            self.assertIn(expected, joined)
+        self.assertNotIn('c0ffeec0ffee', joined)
+        self.assertNotIn('--shm-size', joined)
+        self.assertEqual(self.spec.extra_networks(), {'backend': ['web-backend']})
+
+    def test_entrypoint_override_keeps_command(self):
+        """Test an overridden entrypoint carries the effective command along."""
+        data = dict(CONTAINER, Config=dict(CONTAINER['Config'], Entrypoint=['tini', '--'], Cmd=['serve']))
+        args = container_spec(data, IMAGE).create_args('web-new')
+        self.assertEqual(args[-5:], ['--entrypoint', 'tini', 'example/web:1', '--', 'serve'])
+
+    def test_api_body(self):
+        """Test the API body passes HostConfig through and keeps anonymous volumes."""
+        body = self.spec.api_body()
+        self.assertEqual(body['Image'], 'example/web:2')
+        self.assertEqual(body['HostConfig']['CapAdd'], ['NET_ADMIN'])
+        self.assertEqual(body['HostConfig']['Binds'], ['/srv/web:/usr/share/web:ro', '3f2a:/cache'])
+        self.assertEqual(body['NetworkingConfig'], {'EndpointsConfig': {'frontend': {'Aliases': ['web']}}})
+        self.assertNotIn('Cmd', body)
+        self.assertEqual(CONTAINER['HostConfig']['Binds'], ['/srv/web:/usr/share/web:ro'])
+
+    def test_podman_custom_network(self):
+        """Test Podman's bridge mode on a custom network keeps that network."""
+        data = dict(CONTAINER, HostConfig={'NetworkMode': 'bridge'},
+                    NetworkSettings={'Networks': {'appnet': {'Aliases': ['web']}}})
+        spec = container_spec(data, IMAGE)
+        self.assertEqual(spec.primary_network, 'appnet')
+        self.assertEqual(spec.extra_networks(), {})
+        self.assertIn('--network', spec.create_args('web-new'))
+
+    def test_pod_member(self):
+        """Test a pod member joins the pod instead of publishing ports."""
+        spec = container_spec(dict(CONTAINER, Pod='abc'), IMAGE)
+        args = spec.create_args('web-new')
+        self.assertIn('--pod', args)
+        self.assertNotIn('-p', args)
+        self.assertEqual(spec.extra_networks(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+"""
+Tests for the registry client and digest-based update checks.
+"""
+
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from upgradeapp.upgraders import PodmanUpgrader
+from upgradeapp.upgraders.inventory import ContainerInventory
+from upgradeapp.upgraders.registry import RegistryClient, RegistryError, parse_image_reference
+from upgradeapp.utils.state_store import StateStore
+
+
+TOKEN = 'secret-token'
+
+
+class FakeRegistryHandler(BaseHTTPRequestHandler):
+    """Request handler emulating a token-authenticated v2 registry."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/token'):
+            self.server.token_requests.append(self.path)
+            self._send(200, json.dumps({'token': TOKEN}).encode())
+            return
+        self.do_HEAD()
+
+    def do_HEAD(self):
+        self.server.requests.append((self.command, self.path))
+        if self.headers.get('Authorization') != f'Bearer {TOKEN}':
+            realm = f'http://127.0.0.1:{self.server.server_port}/token'
+            self._send(401, headers={
+                'WWW-Authenticate': f'Bearer realm="{realm}",service="fake-registry"'
+            })
+            return
+
+        path = self.path
+        if not path.startswith('/v2/') or '/manifests/' not in path:
+            self._send(404)
+            return
+        repository, tag = path[len('/v2/'):].split('/manifests/')
+        document = self.server.documents.get(f'{repository}:{tag}')
+        if document is not None:
+            self._send(200, json.dumps(document).encode(), {'Content-Type': document['mediaType']})
+            return
+        digest = self.server.manifests.get(f'{repository}:{tag}')
+        if digest is None:
+            self._send(404)
+        elif self.headers.get('If-None-Match') == f'"{digest}"':
+            self._send(304, headers={'ETag': f'"{digest}"'})
+        else:
+            self._send(200, b'{}', {'Docker-Content-Digest': digest, 'ETag': f'"{digest}"'})
+
+
+class FakeRegistry(ThreadingHTTPServer):
+    """Local stand-in registry recording the requests it receives."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRegistryHandler)
+        self.connections = 0
+        self.requests = []
+        self.token_requests = []
+        self.manifests = {}
+        self.documents = {}
+
+    @property
+    def host(self):
+        return f'127.0.0.1:{self.server_port}'
+
+
+class RegistryTestCase(unittest.TestCase):
+    """Base test case running a fake registry."""
+
+    def setUp(self):
+        self.registry = FakeRegistry()
+        self.thread = threading.Thread(
+            target=self.registry.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True
+        )
+        self.thread.start()
+        self.host = self.registry.host
+
+    def tearDown(self):
+        self.registry.shutdown()
+        self.registry.server_close()
+
+
+class TestParseImageReference(unittest.TestCase):
+    """Test cases for parse_image_reference."""
+
+    def test_docker_hub_short_names(self):
+        """Test Docker Hub names are expanded."""
+        self.assertEqual(parse_image_reference('nginx'), ('registry-1.docker.io', 'library/nginx', 'latest'))
+        self.assertEqual(parse_image_reference('docker.io/grafana/grafana:10'),
+                         ('registry-1.docker.io', 'grafana/grafana', '10'))
+
+    def test_private_registry(self):
+        """Test registry hosts with ports are detected."""
+        self.assertEqual(parse_image_reference('localhost:5000/app:1.0'), ('localhost:5000', 'app', '1.0'))
+        self.assertEqual(parse_image_reference('ghcr.io/org/tool'), ('ghcr.io', 'org/tool', 'latest'))
+
+
+class TestRegistryClient(RegistryTestCase):
+    """Test cases for RegistryClient."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = RegistryClient(insecure_registries=[self.host])
+
+    def test_manifest_digest_with_token(self):
+        """Test a bearer challenge is answered and the digest returned."""
+        self.registry.manifests['team/app:1.0'] = 'sha256:aaa'
+        self.assertEqual(self.client.manifest_digest(f'{self.host}/team/app:1.0'), 'sha256:aaa')
+        self.assertEqual(len(self.registry.token_requests), 1)
+        self.assertIn('scope=repository%3Ateam%2Fapp%3Apull', self.registry.token_requests[0])
+
+    def test_token_and_connection_reused(self):
+        """Test repeated checks reuse the cached token and connection."""
+        self.registry.manifests['team/app:1.0'] = 'sha256:aaa'
+        self.registry.manifests['team/app:2.0'] = 'sha256:bbb'
+        self.client.manifest_digest(f'{self.host}/team/app:1.0')
+        self.client.manifest_digest(f'{self.host}/team/app:2.0')
+        self.client.manifest_digest(f'{self.host}/team/app:1.0')
+        self.assertEqual(len(self.registry.token_requests), 1)
+        self.assertEqual(self.registry.connections, 1)
+        self.assertTrue(all(method == 'HEAD' for method, _ in self.registry.requests))
+
+    def test_conditional_request(self):
+        """Test a known ETag is revalidated and a 304 reuses the known digest."""
+        image = f'{self.host}/team/app:1.0'
+        self.registry.manifests['team/app:1.0'] = 'sha256:aaa'
+        self.client.validators[image] = ('"sha256:aaa"', 'sha256:aaa')
+        self.assertEqual(self.client.manifest_digest(image), 'sha256:aaa')
+        self.registry.manifests['team/app:1.0'] = 'sha256:bbb'
+        self.assertEqual(self.client.manifest_digest(image), 'sha256:bbb')
+        self.assertEqual(self.client.validators[image], ('"sha256:bbb"', 'sha256:bbb'))
+
+    def test_missing_tag(self):
+        """Test an unknown tag resolves to None."""
+        self.assertIsNone(self.client.manifest_digest(f'{self.host}/team/app:nope'))
+
+    def test_unreachable_registry(self):
+        """Test connection failures propagate."""
+        client = RegistryClient(insecure_registries=['127.0.0.1:1'])
+        with self.assertRaises(OSError):
+            client.manifest_digest('127.0.0.1:1/app')
+
+    def test_manifest_resolves_platform(self):
+        """Test a manifest list is resolved to the platform's image manifest, cached by digest."""
+        self.registry.documents['team/app:1.0'] = {
+            'mediaType': 'application/vnd.oci.image.index.v1+json',
+            'manifests': [
+                {'digest': 'sha256:arm', 'platform': {'os': 'linux', 'architecture': 'arm', 'variant': 'v7'}},
+                {'digest': 'sha256:amd', 'platform': {'os': 'linux', 'architecture': 'amd64'}},
+            ],
+        }
+        self.registry.documents['team/app:sha256:amd'] = {
+            'mediaType': 'application/vnd.oci.image.manifest.v1+json',
+            'layers': [{'digest': 'sha256:base', 'size': 100}],
+        }
+        image = f'{self.host}/team/app:1.0'
+        manifest = self.client.manifest(image, ('linux', 'amd64', ''))
+        self.assertEqual(manifest['layers'], [{'digest': 'sha256:base', 'size': 100}])
+        self.client.manifest(image, ('linux', 'amd64', ''))
+        paths = [path for method, path in self.registry.requests if method == 'GET']
+        self.assertEqual(paths.count('/v2/team/app/manifests/sha256:amd'), 1)
+        with self.assertRaises(RegistryError):
+            self.client.manifest(image, ('linux', 's390x', ''))
+
+    def test_rejected_token(self):
+        """Test a registry that keeps rejecting the token raises RegistryError."""
+        client = RegistryClient(insecure_registries=[self.host])
+        client._fetch_token = lambda host, challenge, scope: 'wrong'
+        with self.assertRaises(RegistryError):
+            client.manifest_digest(f'{self.host}/team/app:1.0')
+
+
+class TestDigestCheckMode(RegistryTestCase):
+    """Test cases for check_updates in digest mode."""
+
+    def setUp(self):
+        super().setUp()
+        self.upgrader = PodmanUpgrader({
+            'podman_upgrader': {'check_mode': 'digest', 'insecure_registries': [self.host]}
+        })
+        self.store = StateStore(persist=False)
+        self.upgrader.state_store = lambda: self.store
+        self.image = f'{self.host}/team/app:1.0'
+        self.registry.manifests['team/app:1.0'] = 'sha256:new'
+
+    def _check(self, local_digests):
+        with mock.patch.object(PodmanUpgrader, 'check_available', return_value=True), \
+                mock.patch.object(PodmanUpgrader, 'inventory', return_value=ContainerInventory([])), \
+                mock.patch.object(PodmanUpgrader, '_local_repo_digests', return_value=local_digests), \
+                mock.patch.object(PodmanUpgrader, '_pull_image') as pull:
+            updates = self.upgrader.check_updates(self.image)
+        pull.assert_not_called()
+        return updates
+
+    def test_update_available(self):
+        """Test a changed remote digest is reported without pulling."""
+        updates = self._check([f'{self.host}/team/app@sha256:old'])
+        self.assertEqual(updates, {self.image: 'sha256:new'})
+
+    def test_up_to_date(self):
+        """Test a matching digest reports no update."""
+        self.assertEqual(self._check([f'{self.host}/team/app@sha256:new']), {})
+
+    def test_etag_persisted_between_runs(self):
+        """Test a later run revalidates the stored ETag instead of resolving the tag again."""
+        self._check([f'{self.host}/team/app@sha256:old'])
+        self.assertEqual(self.store.get('podman_upgrader', self.image).etag, '"sha256:new"')
+
+        self.upgrader = PodmanUpgrader({
+            'podman_upgrader': {'check_mode': 'digest', 'insecure_registries': [self.host]}
+        })
+        self.upgrader.state_store = lambda: self.store
+        with mock.patch.object(RegistryClient, '_send', autospec=True,
+                               side_effect=RegistryClient._send) as send:
+            updates = self._check([f'{self.host}/team/app@sha256:old'])
+        self.assertEqual(updates, {self.image: 'sha256:new'})
+        manifest_requests = [call for call in send.call_args_list if '/manifests/' in call.args[3]]
+        self.assertEqual(manifest_requests[-1].args[4]['If-None-Match'], '"sha256:new"')
+
+    def test_localhost_image_skipped(self):
+        """Test Podman local builds named localhost/<name> never reach a registry."""
+        self.image = 'localhost/myapp:latest'
+        with mock.patch.object(RegistryClient, 'manifest_digest') as remote:
+            self.assertEqual(self._check(['localhost/myapp@sha256:abc']), {})
+        remote.assert_not_called()
+
+    def test_local_only_image(self):
+        """Test images without repo digests are skipped."""
+        self.assertEqual(self._check([]), {})
+        self.assertEqual(self.registry.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,279 @@
+"""
+Tests for the native rpm database and repository metadata readers.
+"""
+
+import glob
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import AppUpgrader
+from upgradeapp.upgraders.packages.rpm import (
+    RpmRepoIndex,
+    iter_primary,
+    iter_rpmdb,
+    parse_check_update,
+    parse_zypper_list_updates,
+)
+from upgradeapp.upgraders.packages.versions import compare_rpm_versions, rpmvercmp
+from upgradeapp.utils.runner import CommandResult, CommandRunner
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'rpm')
+
+INSTALLED = [
+    ('bash', None, '5.2.26', '1.fc39', 'x86_64'),
+    ('vim-enhanced', 2, '9.0.2120', '1.fc39', 'x86_64'),
+    ('tzdata', None, '2024a', '1.fc39', 'noarch'),
+    ('kernel', None, '6.8.5', '301.fc39', 'x86_64'),
+    ('kernel', None, '6.8.7', '200.fc39', 'x86_64'),
+    ('glibc', None, '2.38', '16.fc39', 'x86_64'),
+    ('gpg-pubkey', None, '18b8e74c', '62f2920f', None),
+]
+
+
+def make_header(name, epoch, version, release, arch):
+    """Encode a minimal rpm header blob as stored in rpmdb.sqlite."""
+    entries = []
+    data = b''
+    tags = [(1000, name), (1001, version), (1002, release), (1022, arch)]
+    for tag, value in tags:
+        if value is not None:
+            entries.append(struct.pack('>iiii', tag, 6, len(data), 1))
+            data += value.encode() + b'\0'
+    if epoch is not None:
+        data += b'\0' * (-len(data) % 4)
+        entries.append(struct.pack('>iiii', 1003, 4, len(data), 1))
+        data += struct.pack('>i', epoch)
+    return struct.pack('>II', len(entries), len(data)) + b''.join(entries) + data
+
+
+def make_rpmdb(path, packages):
+    """Create an rpmdb.sqlite with the given (name, epoch, version, release, arch) rows."""
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE Packages (hnum INTEGER PRIMARY KEY AUTOINCREMENT, blob BLOB NOT NULL)')
+    connection.executemany('INSERT INTO Packages (blob) VALUES (?)', [(make_header(*row),) for row in packages])
+    connection.commit()
+    connection.close()
+
+
+class RpmdbTestCase(unittest.TestCase):
+    """Base class providing a temporary rpmdb."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.rpmdb = os.path.join(self.tmpdir, 'rpmdb.sqlite')
+        make_rpmdb(self.rpmdb, INSTALLED)
+
+
+class TestRpmVersions(unittest.TestCase):
+    """Test cases for rpm version comparison."""
+
+    def test_rpmvercmp(self):
+        """Test segment ordering matches rpm, including '~' and '^'."""
+        ascending = ['1.0~rc1', '1.0', '1.0^git1', '1.0a', '1.0.1', '1.1', '1.10', '2']
+        for lower, higher in zip(ascending, ascending[1:]):
+            self.assertEqual(rpmvercmp(lower, higher), -1, f'{lower} < {higher}')
+            self.assertEqual(rpmvercmp(higher, lower), 1, f'{higher} > {lower}')
+        self.assertEqual(rpmvercmp('1.0.1', '1.0_1'), 0)
+        self.assertEqual(rpmvercmp('1.01', '1.1'), 0)
+
+    def test_epoch_and_release(self):
+        """Test epochs dominate and a missing release matches any release."""
+        self.assertGreater(compare_rpm_versions('1:1.0-1', '2.0-1'), 0)
+        self.assertLess(compare_rpm_versions('1.0-1.fc39', '1.0-2.fc39'), 0)
+        self.assertEqual(compare_rpm_versions('1.0', '1.0-5'), 0)
+
+
+class TestRpmdb(RpmdbTestCase):
+    """Test cases for the rpmdb reader."""
+
+    def test_iter_rpmdb(self):
+        """Test headers decode to name, version and arch, skipping pubkeys."""
+        packages = list(iter_rpmdb(self.rpmdb))
+        self.assertEqual(len(packages), 6)
+        self.assertEqual(packages[1].name, 'vim-enhanced')
+        self.assertEqual(packages[1].version, '2:9.0.2120-1.fc39')
+        self.assertEqual(packages[2].architecture, 'noarch')
+
+    def test_read_only_fallback_closes_connection(self):
+        """Test the read-only connection is closed before retrying with immutable=1."""
+        connect = sqlite3.connect
+        connections = []
+
+        def fake_connect(database, **kwargs):
+            connection = mock.MagicMock(wraps=connect(database, **kwargs))
+            if 'mode=ro' in database:
+                connection.execute.side_effect = sqlite3.OperationalError('unable to open database file')
+            connections.append(connection)
+            return connection
+
+        with mock.patch('sqlite3.connect', side_effect=fake_connect):
+            packages = list(iter_rpmdb(self.rpmdb))
+        self.assertEqual(len(packages), 6)
+        for connection in connections:
+            connection.close.assert_called_once()
+
+    def test_primary_skips_source_packages(self):
+        """Test source rpms in primary.xml are not candidates."""
+        path = os.path.join(FIXTURES, 'cache', 'fedora-3a1b2c', 'repodata', '5c2f-primary.xml')
+        packages = list(iter_primary(path))
+        self.assertIn(('bash', 'x86_64', '5.2.26-1.fc39'), packages)
+        self.assertNotIn('src', [arch for _, arch, _ in packages])
+
+    def test_primary_chunk_boundaries(self):
+        """Test packages split across read chunks are still matched."""
+        path = os.path.join(FIXTURES, 'cache', 'fedora-3a1b2c', 'repodata', '5c2f-primary.xml')
+        expected = list(iter_primary(path))
+        with mock.patch('upgradeapp.upgraders.packages.rpm._PRIMARY_CHUNK_SIZE', 64):
+            self.assertEqual(list(iter_primary(path)), expected)
+
+
+class TestRpmRepoIndex(RpmdbTestCase):
+    """Test cases for RpmRepoIndex."""
+
+    def setUp(self):
+        super().setUp()
+        self.index = RpmRepoIndex([os.path.join(FIXTURES, 'cache')], self.rpmdb)
+
+    def test_upgradable(self):
+        """Test the newest candidate per name and arch across repositories."""
+        self.assertEqual(self.index.upgradable(), {
+            'bash': '5.2.26-3.fc39',
+            'vim-enhanced': '2:9.1.083-1.fc39',
+            'kernel': '6.8.9-100.fc39',
+        })
+
+    def test_install_only_packages_compare_to_newest(self):
+        """Test the highest installed kernel is the baseline."""
+        self.assertEqual(self.index.installed()[('kernel', 'x86_64')], '6.8.7-200.fc39')
+
+    def test_candidate_source(self):
+        """Test candidates record the repository cache they came from."""
+        self.assertEqual(self.index.candidates()[('bash', 'x86_64')].source, 'updates-9f8e7d')
+
+    def test_security_updates(self):
+        """Test only updates named by a cached security advisory are flagged."""
+        self.assertEqual(self.index.security_updates(self.index.upgradable()), {'bash'})
+
+    def test_age_ignores_metadata_mtimes(self):
+        """Test freshness comes from the repodata directories, not the server-dated files."""
+        cache = os.path.join(self.tmpdir, 'cache')
+        shutil.copytree(os.path.join(FIXTURES, 'cache'), cache)
+        old = time.time() - 7200
+        for repodata in glob.glob(os.path.join(cache, '*', 'repodata')):
+            for name in os.listdir(repodata):
+                os.utime(os.path.join(repodata, name), (old, old))
+            os.utime(repodata)
+        index = RpmRepoIndex([cache], self.rpmdb)
+        self.assertFalse(index.is_stale(3600))
+        for repodata in glob.glob(os.path.join(cache, '*', 'repodata')):
+            os.utime(repodata, (old, old))
+        self.assertTrue(index.is_stale(3600))
+
+    def test_unavailable_without_sqlite_rpmdb(self):
+        """Test hosts without a sqlite rpmdb fall back to the CLI."""
+        self.assertFalse(RpmRepoIndex([os.path.join(FIXTURES, 'cache')], os.path.join(self.tmpdir, 'none')).available())
+
+
+class TestCliParsers(unittest.TestCase):
+    """Test cases for the CLI fallback parsers."""
+
+    def test_check_update(self):
+        """Test dnf check-update output, including wrapped names and obsoletes."""
+        output = (
+            "\n"
+            "bash.x86_64                      5.2.26-3.fc39            updates\n"
+            "a-very-long-package-name-for-wrapping.noarch\n"
+            "                                 1.2-1.fc39               updates\n"
+            "Obsoleting Packages\n"
+            "grub2-tools.x86_64               1:2.06-1.fc39            updates\n"
+        )
+        self.assertEqual(parse_check_update(output), {
+            'bash': '5.2.26-3.fc39',
+            'a-very-long-package-name-for-wrapping': '1.2-1.fc39',
+        })
+
+    def test_zypper_list_updates(self):
+        """Test the zypper table is parsed by column."""
+        output = (
+            "S | Repository | Name | Current Version | Available Version | Arch\n"
+            "--+------------+------+-----------------+-------------------+-------\n"
+            "v | Update     | curl | 8.0.1-1.1       | 8.6.0-1.1         | x86_64\n"
+        )
+        self.assertEqual(parse_zypper_list_updates(output), {'curl': '8.6.0-1.1'})
+
+
+class TestAppUpgraderRpm(RpmdbTestCase):
+    """Test cases for AppUpgrader on dnf and zypper hosts."""
+
+    def make_upgrader(self, manager, **settings):
+        settings.setdefault('rpmdb_path', self.rpmdb)
+        settings.setdefault('rpm_cache_dirs', [os.path.join(FIXTURES, 'cache')])
+        settings.setdefault('metadata_max_age', float('inf'))
+        upgrader = AppUpgrader({'app_upgrader': settings})
+        upgrader.package_manager = manager
+        return upgrader
+
+    def test_native_check_needs_no_subprocess(self):
+        """Test dnf hosts are checked from the rpmdb and metadata cache."""
+        upgrader = self.make_upgrader('dnf')
+        with mock.patch.object(CommandRunner, 'run') as run:
+            updates = upgrader.check_updates('bash')
+        run.assert_not_called()
+        self.assertEqual(updates, {'bash': '5.2.26-3.fc39'})
+
+    def test_list_items(self):
+        """Test installed packages are listed from the rpmdb."""
+        upgrader = self.make_upgrader('zypper')
+        with mock.patch.object(CommandRunner, 'run') as run:
+            items = upgrader.list_items()
+        run.assert_not_called()
+        self.assertEqual(items, ['bash', 'vim-enhanced', 'tzdata', 'kernel', 'glibc'])
+
+    def test_list_items_from_rpm_cli(self):
+        """Test rpm -qa lines are parsed as they stream, skipping gpg-pubkey entries."""
+        def rpm(cmd, *args, on_line, **kwargs):
+            for line in ['bash\t(none)\t5.2.26\t1.fc39\tx86_64', 'gpg-pubkey\t(none)\t1\t2\t(none)', 'kernel\t1\t6.8.7\t200']:
+                on_line(line)
+            return CommandResult(cmd, 0)
+        upgrader = self.make_upgrader('dnf', rpmdb_path='')
+        with mock.patch('upgradeapp.upgraders.app_upgrader.find_rpmdb', return_value=None), \
+                mock.patch.object(CommandRunner, 'run', side_effect=rpm):
+            self.assertEqual(upgrader.list_items(), ['bash'])
+
+    def test_classify_updates(self):
+        """Test the newest installed version is the baseline for classification."""
+        with mock.patch.object(CommandRunner, 'run') as run:
+            updates = self.make_upgrader('dnf').classify_updates()
+        run.assert_not_called()
+        self.assertEqual((updates['bash'].kind, updates['bash'].security), ('revision', True))
+        self.assertEqual(updates['vim-enhanced'].kind, 'minor')
+        self.assertEqual((updates['kernel'].installed, updates['kernel'].kind), ('6.8.7-200.fc39', 'patch'))
+
+    def test_cli_fallback(self):
+        """Test the cli backend runs check-update and accepts exit code 100."""
+        upgrader = self.make_upgrader('dnf', rpm_backend='cli')
+        result = CommandResult(['dnf', '--quiet', 'check-update'], 100, 'bash.x86_64  5.2.26-3.fc39  updates\n', '')
+        with mock.patch.object(CommandRunner, 'run', return_value=result) as run:
+            updates = upgrader.check_updates()
+        self.assertEqual(run.call_args[0][0], ['dnf', '--quiet', 'check-update'])
+        self.assertEqual(updates, {'bash': '5.2.26-3.fc39'})
+
+    def test_upgrade_command(self):
+        """Test dnf upgrades run non-interactively."""
+        upgrader = self.make_upgrader('dnf')
+        with mock.patch.object(CommandRunner, 'run', return_value=CommandResult([], 0)) as run, \
+                self.assertLogs('upgradeapp'):
+            self.assertTrue(upgrader.upgrade('bash'))
+        run.assert_called_once_with(['sudo', 'dnf', 'upgrade', '-y', 'bash'], 300, capture=False, item='bash')
+
+
+if __name__ == '__main__':
+    unittest.main()
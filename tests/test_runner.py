@@ -0,0 +1,196 @@
+"""
+Tests for the shared command runner.
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from upgradeapp.utils import tracing
+from upgradeapp.utils.runner import CommandResult, CommandRunner, OutputBuffer, is_transient
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+# Fails with a transient error until the marker file holds the given number of attempts
+FLAKY = '''
+import os, sys
+path, succeed_on = sys.argv[1], int(sys.argv[2])
+attempt = int(open(path).read()) + 1 if os.path.exists(path) else 1
+open(path, 'w').write(str(attempt))
+if attempt < succeed_on:
+    sys.exit('Error: connection reset by peer')
+print('pulled')
+'''
+
+
+class TestOutputBuffer(unittest.TestCase):
+    """Test cases for OutputBuffer."""
+
+    def test_keeps_tail(self):
+        """Test only the last bytes are kept, however the writes are split."""
+        buffer = OutputBuffer(10)
+        for chunk in (b'abc', b'defgh', b'ijklmn', b'op'):
+            buffer.write(chunk)
+        self.assertEqual(buffer.getvalue(), b'ghijklmnop')
+        self.assertEqual((buffer.total, buffer.dropped), (16, 6))
+        buffer.write(b'0123456789ABC')
+        self.assertEqual(buffer.getvalue(), b'3456789ABC')
+
+    def test_unbounded_and_empty(self):
+        """Test None keeps everything and 0 keeps nothing."""
+        unbounded, empty = OutputBuffer(None), OutputBuffer(0)
+        for buffer in (unbounded, empty):
+            buffer.write(b'x' * 100)
+            buffer.write(b'y')
+        self.assertEqual(len(unbounded.getvalue()), 101)
+        self.assertEqual((empty.getvalue(), empty.dropped), (b'', 101))
+
+
+class TestCommandRunner(unittest.TestCase):
+    """Test cases for CommandRunner.run."""
+
+    def setUp(self):
+        self.runner = CommandRunner(backoff=0.5)
+
+    def test_bounded_capture(self):
+        """Test long output keeps its tail and counts every byte."""
+        runner = CommandRunner(max_output=1000)
+        result = runner.run(python('import sys; sys.stdout.write("x" * 100000 + "end")'))
+        self.assertTrue(result.ok)
+        self.assertEqual(len(result.stdout), 1000)
+        self.assertTrue(result.stdout.endswith('end'))
+        self.assertEqual((result.output_bytes, result.dropped_bytes), (100003, 99003))
+        self.assertEqual(len(runner.run(python('print("x" * 100000)'), keep_all=True).stdout), 100001)
+
+    def test_lines_arrive_while_running(self):
+        """Test each line reaches the handler before the command finishes."""
+        arrivals = []
+        start = time.monotonic()
+        result = self.runner.run(
+            python('import time\nfor i in range(3): print(i, flush=True); time.sleep(0.3)\nprint("partial", end="")'),
+            on_line=lambda line: arrivals.append((line, time.monotonic() - start))
+        )
+        self.assertEqual([line for line, _ in arrivals], ['0', '1', '2', 'partial'])
+        self.assertLess(arrivals[0][1], result.duration - 0.5)
+        self.assertEqual(result.stdout, '0\n1\n2\npartial')
+
+    def test_handler_error_stops_command(self):
+        """Test an exception in the line handler stops the command and propagates."""
+        def fail(line):
+            raise ValueError(line)
+        with self.assertRaises(ValueError):
+            self.runner.run(python('import time; print("go", flush=True); time.sleep(30)'), 60, on_line=fail)
+
+    def test_timeout(self):
+        """Test a command outliving its timeout is stopped and reported, with what it wrote."""
+        result = self.runner.run(python('import time; print("started", flush=True); time.sleep(30)'), 0.3)
+        self.assertTrue(result.timed_out)
+        self.assertIsNone(result.returncode)
+        self.assertEqual(result.stdout, 'started\n')
+        self.assertLess(result.duration, 10)
+        self.assertIn('timed out', result.describe())
+
+    def test_configured_timeout(self):
+        """Test configured timeouts by command name override the caller's."""
+        runner = CommandRunner.from_config({'commands': {'retries': 5, 'timeouts': {'docker pull': 600}},
+                                            'docker_upgrader': {'commands': {'retries': 0}}}, 'docker_upgrader')
+        self.assertEqual(runner.retries, 0)
+        self.assertEqual(runner.timeout_for(['docker', 'pull', 'nginx'], 300), 600)
+        self.assertEqual(runner.timeout_for(['docker', 'rm', 'web'], 30), 30)
+
+    def test_spawn_error(self):
+        """Test a missing executable yields a result instead of raising."""
+        result = self.runner.run(['/nonexistent/tool', '--version'], idempotent=True)
+        self.assertFalse(result.ok)
+        self.assertIsInstance(result.error, OSError)
+        self.assertEqual(result.attempts, 1)
+        self.assertIn('could not be started', result.describe())
+
+    def test_retries_transient_failures(self):
+        """Test idempotent commands are retried with growing backoff after transient errors."""
+        with mock.patch('time.sleep') as sleep, mock.patch('random.uniform', side_effect=lambda low, high: high), \
+                self.assertLogs('upgradeapp.utils.runner', 'WARNING') as logs:
+            path = self._marker()
+            result = self.runner.run(python(FLAKY) + [path, '3'], idempotent=True, item='nginx')
+        self.assertTrue(result.ok)
+        self.assertEqual((result.attempts, result.stdout), (3, 'pulled\n'))
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 1.0])
+        self.assertEqual(logs.records[0].item, 'nginx')
+
+    def test_no_retry(self):
+        """Test non-idempotent commands and permanent failures run once."""
+        with mock.patch('time.sleep') as sleep:
+            path = self._marker()
+            self.assertEqual(self.runner.run(python(FLAKY) + [path, '2']).attempts, 1)
+            result = self.runner.run(python('import sys; sys.exit("Error: manifest unknown")'), idempotent=True)
+        self.assertEqual(result.attempts, 1)
+        self.assertTrue(result.describe().endswith('failed with exit code 1: Error: manifest unknown'))
+        sleep.assert_not_called()
+
+    def test_backoff_is_capped(self):
+        """Test the delay doubles up to max_backoff and keeps at least half of it."""
+        runner = CommandRunner(backoff=1, max_backoff=4)
+        for attempt, delay in ((1, 1), (2, 2), (3, 4), (10, 4)):
+            self.assertTrue(delay / 2 <= runner.backoff_delay(attempt) <= delay)
+
+    def test_is_transient(self):
+        """Test timeouts and network errors on stderr are transient, package names on stdout are not."""
+        self.assertTrue(is_transient(CommandResult([], None, timed_out=True)))
+        self.assertTrue(is_transient(CommandResult([], 100, '', 'E: Could not get lock /var/lib/dpkg/lock')))
+        self.assertFalse(is_transient(CommandResult([], 100, 'python3-timeout-decorator.noarch 4.1', '')))
+
+    def test_spans_per_attempt(self):
+        """Test each attempt is traced as a command span."""
+        tracer = tracing.enable()
+        try:
+            with mock.patch('time.sleep'):
+                self.runner.run(python(FLAKY) + [self._marker(), '2'], idempotent=True)
+            self.runner.run(python('import time; time.sleep(5)'), 0.2)
+        finally:
+            tracing.disable()
+        spans = [span for span in tracer.spans if span.category == 'command']
+        self.assertEqual([span.args.get('exit_code') for span in spans], [1, 0, 'timeout'])
+        self.assertEqual(spans[1].args['attempt'], 2)
+
+    def _marker(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        return os.path.join(directory, 'attempts')
+
+
+class TestCommandRunnerAsync(unittest.IsolatedAsyncioTestCase):
+    """Test cases for CommandRunner.run_async."""
+
+    async def test_output_and_lines(self):
+        """Test the async path captures, streams lines and bounds output like the blocking one."""
+        lines = []
+        result = await CommandRunner(max_output=4).run_async(python('print("a"); print("bcdef")'), on_line=lines.append)
+        self.assertEqual((result.returncode, result.stdout, lines), (0, 'def\n', ['a', 'bcdef']))
+
+    async def test_timeout_and_spawn_error(self):
+        """Test timeouts and missing executables are results, not exceptions."""
+        runner = CommandRunner()
+        result = await runner.run_async(python('import time; time.sleep(30)'), 0.2)
+        self.assertTrue(result.timed_out)
+        result = await runner.run_async(['/nonexistent/tool'])
+        self.assertIsInstance(result.error, OSError)
+
+    async def test_cancel_stops_command(self):
+        """Test cancelling the awaiting task stops the command."""
+        task = asyncio.ensure_future(CommandRunner().run_async(python('import time; time.sleep(30)')))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await asyncio.wait_for(task, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Tests for the persistent check state store.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from upgradeapp.upgraders import PodmanUpgrader
+from upgradeapp.utils.state_store import ItemState, StateStore
+
+
+class TestStateStore(unittest.TestCase):
+    """Test cases for StateStore."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.path = os.path.join(self.tmpdir, 'state.sqlite')
+
+    def test_persisted_across_instances(self):
+        """Test recorded states are read back by a new store on the same file."""
+        store = StateStore(self.path)
+        store.record([ItemState('docker_upgrader', 'nginx:latest', 'sha256:new', 'sha256:new', '"sha256:new"', 100.0)])
+        store.close()
+        state = StateStore(self.path).get('docker_upgrader', 'nginx:latest')
+        self.assertEqual(state.etag, '"sha256:new"')
+        self.assertEqual(state.checked_at, 100.0)
+        self.assertIsNone(StateStore(self.path).get('podman_upgrader', 'nginx:latest'))
+
+    def test_unwritable_cache_dir_falls_back_to_memory(self):
+        """Test a cache directory that cannot be created leaves the store in memory."""
+        blocker = os.path.join(self.tmpdir, 'file')
+        open(blocker, 'w').close()
+        store = StateStore()
+        with mock.patch.dict(os.environ, {'UPGRADEAPP_CACHE_DIR': os.path.join(blocker, 'cache')}), \
+                self.assertLogs('upgradeapp.utils.state_store', 'WARNING'):
+            store.record([ItemState('docker_upgrader', 'nginx:latest', None)])
+        self.assertIsNotNone(store.get('docker_upgrader', 'nginx:latest'))
+
+    def test_fresh(self):
+        """Test states are reused only within the TTL."""
+        state = ItemState('docker_upgrader', 'nginx:latest', None, checked_at=1000.0)
+        self.assertTrue(state.fresh(60, now=1030.0))
+        self.assertFalse(state.fresh(60, now=1090.0))
+        self.assertFalse(state.fresh(0, now=1000.0))
+
+    def test_forget(self):
+        """Test forgotten items are checked again."""
+        store = StateStore(persist=False)
+        store.record([ItemState('app_upgrader', name, '1.0') for name in ('curl', 'bash')])
+        store.forget('app_upgrader', ['curl'])
+        self.assertEqual(list(store.load('app_upgrader')), ['bash'])
+
+    def test_report_deltas(self):
+        """Test only new or changed updates are reported, and cleared ones can return."""
+        store = StateStore(persist=False)
+        self.assertEqual(store.report('app_upgrader', {'curl': '1.1', 'bash': '5.2'}),
+                         {'curl': '1.1', 'bash': '5.2'})
+        self.assertEqual(store.report('app_upgrader', {'curl': '1.2', 'bash': '5.2'}), {'curl': '1.2'})
+        self.assertEqual(store.report('app_upgrader', {'curl': '1.2'}), {})
+        self.assertEqual(store.report('app_upgrader', {'curl': '1.2', 'bash': '5.2'}), {'bash': '5.2'})
+
+    def test_scoped_report_keeps_other_items(self):
+        """Test a single-item run leaves the other reports in place."""
+        store = StateStore(persist=False)
+        store.report('app_upgrader', {'curl': '1.1', 'bash': '5.2'})
+        self.assertEqual(store.report('app_upgrader', {}, ['curl']), {})
+        self.assertEqual(store.report('app_upgrader', {'bash': '5.2', 'curl': '1.1'}), {'curl': '1.1'})
+
+
+class TestIncrementalChecks(unittest.TestCase):
+    """Test cases for container checks backed by the state store."""
+
+    def setUp(self):
+        self.store = StateStore(persist=False)
+        self.images = ['nginx:latest', 'postgres:16']
+        patches = [
+            mock.patch.object(PodmanUpgrader, 'check_available', return_value=True),
+            mock.patch.object(PodmanUpgrader, 'list_images', return_value=self.images),
+            mock.patch.object(PodmanUpgrader, 'state_store', return_value=self.store),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _check(self, ttl, results):
+        upgrader = PodmanUpgrader({'check_ttl': ttl})
+        with mock.patch.object(PodmanUpgrader, '_check_image', side_effect=results.get) as check:
+            updates = upgrader.check_updates()
+        return updates, [call.args[0] for call in check.call_args_list]
+
+    def test_fresh_items_skipped(self):
+        """Test items checked within the TTL reuse their stored result."""
+        self._check(3600, {'nginx:latest': 'latest'})
+        updates, checked = self._check(3600, {})
+        self.assertEqual(checked, [])
+        self.assertEqual(updates, {'nginx:latest': 'latest'})
+
+    def test_expired_items_rechecked(self):
+        """Test items are checked again once their state is older than the TTL."""
+        self._check(3600, {'nginx:latest': 'latest'})
+        with mock.patch('upgradeapp.utils.state_store.time.time', return_value=time.time() + 7200):
+            updates, checked = self._check(3600, {})
+        self.assertEqual(sorted(checked), self.images)
+        self.assertEqual(updates, {})
+
+    def test_failed_checks_not_recorded(self):
+        """Test a check that raised is retried on the next run."""
+        upgrader = PodmanUpgrader({'check_ttl': 3600})
+        with mock.patch.object(PodmanUpgrader, '_check_image', side_effect=OSError('offline')), \
+                self.assertLogs('upgradeapp', level='ERROR'):
+            upgrader.check_updates()
+        self.assertEqual(self.store.load('podman_upgrader'), {})
+
+    def test_check_changes(self):
+        """Test check_changes reports only updates new since the previous run."""
+        upgrader = PodmanUpgrader({})
+        with mock.patch.object(PodmanUpgrader, '_check_image', return_value='latest'):
+            self.assertEqual(len(upgrader.check_changes()), 2)
+            self.assertEqual(upgrader.check_changes(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Tests for streaming results and the structured output formats.
+"""
+
+import io
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import main
+from upgradeapp.upgraders import PodmanUpgrader
+from upgradeapp.utils.concurrency import CheckEngine
+from upgradeapp.utils.state_store import StateStore
+
+
+class TestStreamingChecks(unittest.TestCase):
+    """Test cases for iter_run and iter_updates."""
+
+    def test_results_yielded_as_completed(self):
+        """Test a fast check is yielded before a slow one finishes."""
+        release = threading.Event()
+
+        def check(item):
+            if item == 'slow':
+                release.wait(5)
+            return 'latest'
+
+        results = CheckEngine(workers=2).iter_run(['slow', 'fast'], check)
+        self.assertEqual(next(results), ('fast', 'latest'))
+        release.set()
+        self.assertEqual(list(results), [('slow', 'latest')])
+
+    def test_check_updates_keeps_listing_order(self):
+        """Test the dict wrapper keeps images in listing order."""
+        images = ['slow:1', 'fast:1']
+        upgrader = PodmanUpgrader({'check_workers': 2})
+        with mock.patch.object(PodmanUpgrader, 'check_available', return_value=True), \
+                mock.patch.object(PodmanUpgrader, 'list_images', return_value=images), \
+                mock.patch.object(PodmanUpgrader, 'state_store', return_value=StateStore(persist=False)), \
+                mock.patch.object(PodmanUpgrader, '_check_image',
+                                  side_effect=lambda image: time.sleep(0.1 if image == 'slow:1' else 0) or 'latest'):
+            self.assertEqual(list(upgrader.check_updates()), images)
+            self.assertEqual([image for image, _ in upgrader.iter_updates()], ['fast:1', 'slow:1'])
+
+
+class TestOutputFormats(unittest.TestCase):
+    """Test cases for main.py --format."""
+
+    def _run(self, *argv):
+        upgrader = mock.Mock()
+        upgrader.check_available.return_value = True
+        upgrader.iter_items.return_value = iter(['web', 'db'])
+        upgrader.iter_updates.return_value = iter([('nginx:latest', 'latest')])
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch.object(main, 'get_upgrader', return_value=upgrader), \
+                mock.patch('sys.argv', ['main.py', *argv]), \
+                mock.patch('sys.stdout', stdout), mock.patch('sys.stderr', stderr):
+            code = main.main()
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def test_ndjson(self):
+        """Test one JSON object per line on stdout, with logs on stderr."""
+        code, stdout, stderr = self._run('docker', 'list', '--format', 'ndjson')
+        self.assertEqual(code, 0)
+        self.assertEqual([json.loads(line) for line in stdout.splitlines()],
+                         [{'type': 'docker', 'item': 'web'}, {'type': 'docker', 'item': 'db'}])
+        self.assertIn('Found 2 items', stderr)
+
+    def test_json(self):
+        """Test a single JSON array is written at the end."""
+        code, stdout, _ = self._run('docker', 'check', '--format', 'json')
+        self.assertEqual(json.loads(stdout), [{'type': 'docker', 'item': 'nginx:latest', 'version': 'latest'}])
+
+    def test_text(self):
+        """Test the text format prints one line per result."""
+        _, stdout, _ = self._run('docker', 'check')
+        self.assertIn('  - nginx:latest: latest\n', stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
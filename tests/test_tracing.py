@@ -0,0 +1,157 @@
+"""
+Tests for tracing spans and the --profile export.
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+from upgradeapp.upgraders.base import BaseUpgrader
+from upgradeapp.utils import tracing
+from upgradeapp.utils.aio import run_blocking, run_process
+
+
+class TracedUpgrader(BaseUpgrader):
+    """Upgrader whose operations run a command each."""
+
+    def check_available(self):
+        return True
+
+    def list_items(self):
+        return ['curl']
+
+    def check_updates(self, item=None):
+        tracing.traced_run([sys.executable, '-c', 'print("curl 8.0")'], capture_output=True, text=True)
+        return {'curl': '8.0'}
+
+    def upgrade(self, item=None, dry_run=False):
+        return tracing.traced_run([sys.executable, '-c', 'raise SystemExit(3)']).returncode == 0
+
+
+class OverridingUpgrader(TracedUpgrader):
+    """Subclass calling the traced method it overrides."""
+
+    def check_updates(self, item=None):
+        return super().check_updates(item)
+
+
+class TestTracer(unittest.TestCase):
+    """Test cases for spans and their export."""
+
+    def setUp(self):
+        self.tracer = tracing.enable()
+        self.addCleanup(tracing.disable)
+
+    def test_disabled_spans_are_shared_no_ops(self):
+        """Test nothing is recorded, or allocated per call, while tracing is off."""
+        tracing.disable()
+        self.assertIs(tracing.span('a'), tracing.span('b'))
+        with tracing.span('a') as span:
+            span.set(exit_code=1)
+        self.assertEqual(self.tracer.spans, [])
+
+    def test_upgrader_methods_and_commands(self):
+        """Test upgrader operations become spans with their commands nested inside."""
+        upgrader = OverridingUpgrader()
+        upgrader.check_updates('curl')
+        self.assertFalse(upgrader.upgrade())
+        spans = {span.name: span for span in self.tracer.spans}
+        self.assertEqual([span.name for span in self.tracer.spans if span.category == 'phase'],
+                         ['OverridingUpgrader.check_updates', 'OverridingUpgrader.upgrade'])
+        command = self.tracer.spans[0]
+        self.assertEqual(command.category, 'command')
+        self.assertEqual(command.item, 'curl')
+        self.assertEqual(command.args['exit_code'], 0)
+        self.assertEqual(command.args['output_bytes'], len('curl 8.0\n'))
+        self.assertGreaterEqual(spans['OverridingUpgrader.check_updates'].duration_ns, command.duration_ns)
+        failed = [span for span in self.tracer.spans if span.failed]
+        self.assertEqual([span.args['exit_code'] for span in failed], [3])
+
+    def test_timeout_and_error(self):
+        """Test a timed-out command and an exception are recorded as failures."""
+        with self.assertRaises(subprocess.TimeoutExpired):
+            tracing.traced_run([sys.executable, '-c', 'import time; time.sleep(5)'], timeout=0.2)
+        with self.assertRaises(ValueError):
+            with tracing.span('parse'):
+                raise ValueError('bad')
+        self.assertEqual([span.args for span in self.tracer.spans][0]['exit_code'], 'timeout')
+        self.assertEqual(self.tracer.spans[1].args, {'error': 'ValueError'})
+
+    def test_chrome_trace_and_summary(self):
+        """Test the export has one complete event per span and the summary aggregates by name."""
+        for _ in range(3):
+            with tracing.span('docker pull', 'command', 'nginx') as span:
+                span.set(exit_code=0, output_bytes=100)
+        trace = json.loads(json.dumps(self.tracer.chrome_trace()))
+        events = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0]['args'], {'exit_code': 0, 'output_bytes': 100, 'item': 'nginx'})
+        self.assertEqual(trace['traceEvents'][0]['ph'], 'M')
+        row = self.tracer.summary()[0]
+        self.assertEqual((row['name'], row['count'], row['output_bytes'], row['failures']), ('docker pull', 3, 300, 0))
+        self.assertIn('docker pull', self.tracer.format_summary())
+
+    def test_command_name(self):
+        """Test commands are named by executable and operation, not by their items."""
+        self.assertEqual(tracing.command_name(['sudo', 'apt', '--dry-run', 'upgrade', 'curl']), 'apt upgrade')
+        self.assertEqual(tracing.command_name(['podman', 'image', 'inspect', '--format', 'x', 'nginx']),
+                         'podman image inspect')
+        self.assertEqual(tracing.command_name(['sudo', 'pacman', '--noconfirm', '-S', 'vim']), 'pacman -S')
+        self.assertEqual(tracing.command_name(['fakeroot', '--', 'pacman', '-Sy', '--dbpath', '/tmp/db']), 'pacman -Sy')
+        self.assertEqual(tracing.command_name(['docker', '--version']), 'docker --version')
+
+
+class TestAsyncTracing(unittest.IsolatedAsyncioTestCase):
+    """Test cases for spans on the event loop."""
+
+    async def asyncSetUp(self):
+        self.tracer = tracing.enable()
+        self.addCleanup(tracing.disable)
+
+    async def test_async_commands_and_executor(self):
+        """Test asyncio subprocesses are spans and executor work nests under the caller's span."""
+        def blocking():
+            with tracing.span('inner'):
+                pass
+
+        with tracing.span('outer', item='nginx'):
+            await asyncio.gather(run_process([sys.executable, '-c', 'print(1)']), run_blocking(blocking))
+        spans = {span.name: span for span in self.tracer.spans}
+        self.assertEqual(spans['inner'].item, 'nginx')
+        command = next(span for span in self.tracer.spans if span.category == 'command')
+        self.assertEqual(command.args['exit_code'], 0)
+        self.assertEqual(command.item, 'nginx')
+        lanes = {span.lane for span in self.tracer.spans}
+        self.assertEqual(len(lanes), 3)
+
+
+class TestProfileOption(unittest.TestCase):
+    """Test cases for main.py --profile."""
+
+    def test_profile_writes_trace(self):
+        """Test --profile runs locally and leaves a trace and a summary behind."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.json')
+            argv = ['main.py', 'app', 'list', '--profile', path, '--format', 'json']
+            with mock.patch.object(sys, 'argv', argv), \
+                    mock.patch.object(main, 'get_upgrader', return_value=TracedUpgrader()), \
+                    mock.patch('main.AgentClient') as client, \
+                    mock.patch('sys.stdout'), mock.patch('sys.stderr') as stderr:
+                self.assertEqual(main.main(), 0)
+            client.assert_not_called()
+            with open(path) as f:
+                names = [event['name'] for event in json.load(f)['traceEvents']]
+        self.assertIn('app list', names)
+        self.assertIn('TracedUpgrader.list_items', names)
+        self.assertIsNone(tracing.active())
+        self.assertIn('TracedUpgrader.list_items', ''.join(call.args[0] for call in stderr.write.call_args_list))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Tests for the batch version comparison API and update classification.
+"""
+
+import unittest
+
+from upgradeapp.upgraders.packages.versions import (
+    classify_update,
+    compare_pairs,
+    compare_versions,
+    deb_version_key,
+    newest_version,
+    sort_versions,
+)
+
+
+class TestBatchComparison(unittest.TestCase):
+    """Test cases for sorting and comparing many versions at once."""
+
+    def test_sort_each_scheme(self):
+        """Test sorting follows each package manager's ordering."""
+        self.assertEqual(sort_versions(['1.0', '1.0~rc1', '1:0.1', '1.0-1'], 'deb'),
+                         ['1.0~rc1', '1.0', '1.0-1', '1:0.1'])
+        self.assertEqual(sort_versions(['1.10', '1.0^git1', '1.0~rc1', '1.2'], 'rpm'),
+                         ['1.0~rc1', '1.0^git1', '1.2', '1.10'])
+        self.assertEqual(sort_versions(['1.0.1', '1.0', '1.0a'], 'pacman', reverse=True),
+                         ['1.0.1', '1.0', '1.0a'])
+
+    def test_newest_version(self):
+        """Test the newest version is picked and empty input yields None."""
+        self.assertEqual(newest_version(['2.36-9', '2.36-9+deb12u4', '2.36-9+deb12u1']), '2.36-9+deb12u4')
+        self.assertEqual(newest_version(['6.8.7-200.fc39', '6.8.9-100.fc39'], 'rpm'), '6.8.9-100.fc39')
+        self.assertIsNone(newest_version([]))
+
+    def test_compare_pairs(self):
+        """Test pair results are normalised to -1, 0 and 1."""
+        pairs = [('1.0', '1.10'), ('1.01', '1.1'), ('2:1.0', '1:9.9')]
+        self.assertEqual(compare_pairs(pairs, 'deb'), [-1, 0, 1])
+        self.assertEqual(compare_pairs(pairs, 'rpm'), [-1, 0, 1])
+
+    def test_unknown_scheme(self):
+        """Test an unknown scheme is rejected."""
+        with self.assertRaises(ValueError):
+            compare_versions('1.0', '1.1', 'ebuild')
+
+    def test_keys_are_cached(self):
+        """Test repeated versions reuse their parsed sort key."""
+        deb_version_key.cache_clear()
+        sort_versions(['1.0-1', '1.0-2'] * 50)
+        info = deb_version_key.cache_info()
+        self.assertEqual(info.misses, 2)
+        self.assertEqual(info.hits, 98)
+
+
+class TestClassifyUpdate(unittest.TestCase):
+    """Test cases for classify_update."""
+
+    def test_kinds(self):
+        """Test the first differing upstream component decides the kind."""
+        self.assertEqual(classify_update('1.2.3-1', '2.0.0-1'), 'major')
+        self.assertEqual(classify_update('1.2.3-1', '1.3.0-1'), 'minor')
+        self.assertEqual(classify_update('1.2.3-1', '1.2.4-1'), 'patch')
+        self.assertEqual(classify_update('1.2.3-1', '1.2.3-2'), 'revision')
+        self.assertEqual(classify_update('7.88.1-10', '7.88.1-10+deb12u7'), 'revision')
+
+    def test_epoch_is_major(self):
+        """Test an epoch bump is a major update."""
+        self.assertEqual(classify_update('2.0-1', '1:1.0-1'), 'major')
+        self.assertEqual(classify_update('9.0.2120-1.fc39', '2:9.1.083-1.fc39', 'rpm'), 'major')
+
+    def test_suffix_changes(self):
+        """Test added components and suffix-only changes."""
+        self.assertEqual(classify_update('1.2', '1.2.1'), 'patch')
+        self.assertEqual(classify_update('2024a-0+deb12u1', '2024b-0+deb12u1'), 'patch')
+        self.assertEqual(classify_update('1.0~rc1-1', '1.0-1'), 'patch')
+
+    def test_not_newer(self):
+        """Test downgrades and equal versions are not updates."""
+        self.assertIsNone(classify_update('1.2.4-1', '1.2.3-1'))
+        self.assertIsNone(classify_update('1.01', '1.1'))
+        self.assertIsNone(classify_update('5.2.026-2', '5.2.26-2', 'pacman'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,593 @@
+"""
+Long-running agent that keeps upgraders warm and serves requests locally.
+
+The agent answers ``POST /v1/<type>/<action>`` over a Unix socket or a
+loopback TCP port. Results are streamed back as NDJSON, one record per
+line, followed by ``{"done": true}``; a failure mid-stream ends with
+``{"error": "..."}`` instead. Upgrades start only once the response has
+begun, so an upgrade type that turns out to be unavailable is reported
+in the stream as ``{"status": "unavailable", "error": "..."}``.
+"""
+
+import hmac
+import http.client
+import ipaddress
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .upgraders.base import BaseUpgrader
+from .upgraders.docker_api import UnixHTTPConnection
+from .utils import metrics
+from .utils.config import Config
+from .utils.paths import user_cache_dir
+
+
+ACTIONS = ('list', 'check', 'upgrade')
+
+DEFAULT_INVENTORY_TTL = 60
+
+logger = logging.getLogger('upgradeapp.agent')
+
+
+class AgentError(Exception):
+    """Raised when the agent rejects or fails a request."""
+
+
+class AgentUnavailable(AgentError):
+    """Raised when no agent could be connected to, before any request was sent."""
+
+
+class UpgraderUnavailable(AgentError):
+    """Raised when the requested upgrade type is not available on this host."""
+
+
+def default_address() -> str:
+    """
+    Get the default agent address.
+
+    Returns:
+        ``unix:`` address of upgradeapp.sock in ``XDG_RUNTIME_DIR``, or of
+        agent.sock in the user cache directory
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return 'unix:' + os.path.join(runtime_dir, 'upgradeapp.sock')
+    return 'unix:' + os.path.join(user_cache_dir(), 'agent.sock')
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """
+    Parse an agent address.
+
+    Args:
+        address: ``unix:/path``, an absolute socket path, ``host:port`` or
+            ``http://host:port``
+
+    Returns:
+        ``('unix', path)`` or ``('tcp', (host, port))``
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    if address.startswith('/'):
+        return 'unix', address
+    if address.startswith('http://'):
+        address = address[len('http://'):].rstrip('/')
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid agent address: {address}")
+    return 'tcp', (host.strip('[]'), int(port))
+
+
+class Agent:
+    """
+    Runs upgrader actions against long-lived upgrader instances.
+
+    Upgraders are created once per type, so probe results, detected
+    package managers, registry connections and container inventories stay
+    in memory between requests. Container inventories are rebuilt once
+    they are older than ``inventory_ttl`` seconds, and package listings
+    are reused until the package database changes. Requests for the same
+    type are serialized.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str, Optional[Config]], BaseUpgrader],
+        config: Optional[Config] = None,
+        inventory_ttl: float = DEFAULT_INVENTORY_TTL
+    ):
+        """
+        Initialize the agent.
+
+        Args:
+            factory: Function creating an upgrader for a type name, such as
+                main.get_upgrader
+            config: Configuration passed to every upgrader
+            inventory_ttl: Maximum age in seconds of a container inventory
+        """
+        self.factory = factory
+        self.config = config
+        self.inventory_ttl = inventory_ttl
+        self._upgraders: Dict[str, BaseUpgrader] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._inventory_built: Dict[str, float] = {}
+        self._listings: Dict[str, Tuple[Any, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def upgrader(self, upgrade_type: str) -> BaseUpgrader:
+        """
+        Get the warm upgrader for a type, creating it on first use.
+
+        Args:
+            upgrade_type: Upgrade type (app, docker, podman)
+
+        Returns:
+            Upgrader instance
+
+        Raises:
+            ValueError: If the type is unknown
+        """
+        with self._lock:
+            if upgrade_type not in self._upgraders:
+                self._upgraders[upgrade_type] = self.factory(upgrade_type, self.config)
+                self._locks[upgrade_type] = threading.Lock()
+            return self._upgraders[upgrade_type]
+
+    def warm(self, types: List[str]) -> None:
+        """
+        Create upgraders and load their caches ahead of the first request.
+
+        Args:
+            types: Upgrade types to warm up; unavailable ones are skipped
+        """
+        for upgrade_type in types:
+            upgrader = self.upgrader(upgrade_type)
+            with self._locks[upgrade_type]:
+                if upgrader.check_available():
+                    self._refresh_inventory(upgrade_type, upgrader)
+                    logger.info(f"{upgrade_type} upgrader ready")
+
+    def _refresh_inventory(self, upgrade_type: str, upgrader: BaseUpgrader) -> None:
+        inventory = getattr(upgrader, 'inventory', None)
+        if inventory is None:
+            return
+        now = time.monotonic()
+        if now - self._inventory_built.get(upgrade_type, float('-inf')) >= self.inventory_ttl:
+            inventory(refresh=True)
+            self._inventory_built[upgrade_type] = now
+
+    def _list_items(self, upgrade_type: str, upgrader: BaseUpgrader) -> Iterator[str]:
+        stamp_of = getattr(upgrader, 'package_db_stamp', None)
+        stamp = stamp_of() if stamp_of is not None else None
+        if stamp is None:
+            yield from upgrader.iter_items()
+            return
+        cached = self._listings.get(upgrade_type)
+        if cached is not None and cached[0] == stamp:
+            yield from cached[1]
+            return
+        items = list(upgrader.iter_items())
+        self._listings[upgrade_type] = (stamp, items)
+        yield from items
+
+    def run(
+        self,
+        upgrade_type: str,
+        action: str,
+        item: Optional[str] = None,
+        dry_run: bool = False,
+        changes_only: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Run an action and stream its results.
+
+        Args:
+            upgrade_type: Upgrade type (app, docker, podman)
+            action: list, check or upgrade
+            item: Optional specific item to target
+            dry_run: For upgrade, only simulate it
+            changes_only: For check, only report updates new since the
+                previous changes-only check
+
+        Yields:
+            ``{'item'}`` records for list, ``{'item', 'version'}`` for
+            check and one ``{'item', 'dry_run', 'success'}`` for upgrade,
+            with the per-container ``downtime`` in seconds after a
+            container upgrade and the items the policy ``skipped``, with
+            the reason
+
+        Raises:
+            ValueError: If the type or action is unknown
+            UpgraderUnavailable: If the upgrade type is not available
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action: {action}")
+        upgrader = self.upgrader(upgrade_type)
+        with self._locks[upgrade_type]:
+            if not upgrader.check_available():
+                raise UpgraderUnavailable(f"{upgrade_type.capitalize()} is not available on this system")
+            self._refresh_inventory(upgrade_type, upgrader)
+
+            if action == 'list':
+                for name in self._list_items(upgrade_type, upgrader):
+                    yield {'item': name}
+            elif action == 'check':
+                updates = upgrader.check_changes(item).items() if changes_only else upgrader.iter_updates(item)
+                for name, version in updates:
+                    yield {'item': name, 'version': version}
+            else:
+                success = upgrader.upgrade(item, dry_run=dry_run)
+                # The upgrade changed what is installed and running
+                self._inventory_built.pop(upgrade_type, None)
+                self._listings.pop(upgrade_type, None)
+                record = {'item': item, 'dry_run': dry_run, 'success': success}
+                downtimes = getattr(upgrader, 'downtimes', None)
+                if downtimes and not dry_run:
+                    record['downtime'] = dict(downtimes)
+                skipped = getattr(upgrader, 'skipped', None)
+                if skipped:
+                    record['skipped'] = {name: decision.reason for name, decision in skipped.items()}
+                yield record
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler exposing an Agent."""
+
+    # Responses are streamed without a length, so each request gets its own connection
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+    def _authorized(self) -> bool:
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get('Authorization', '').encode(),
+                                             f'Bearer {token}'.encode()):
+            self._send_json(401, {'error': 'Missing or invalid agent token'})
+            return False
+        return True
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if not self._authorized():
+            return
+        if self.path == '/v1/health':
+            self._send_json(200, {'status': 'ok', 'pid': os.getpid()})
+        elif self.path == '/metrics' and metrics.active() is not None:
+            self._send_metrics('openmetrics' in self.headers.get('Accept', ''))
+        else:
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def _send_metrics(self, openmetrics: bool) -> None:
+        body = metrics.active().render(openmetrics).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.OPENMETRICS_CONTENT_TYPE if openmetrics
+                         else metrics.PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        if not self._authorized():
+            return
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 3 or parts[0] != 'v1':
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+        _, upgrade_type, action = parts
+        start = time.monotonic()
+
+        first = None
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            options = json.loads(self.rfile.read(length) or b'{}')
+            if action not in ACTIONS:
+                raise ValueError(f"Unknown action: {action}")
+            # Rejects unknown types before anything runs
+            self.server.agent.upgrader(upgrade_type)
+            results = self.server.agent.run(
+                upgrade_type,
+                action,
+                item=options.get('item'),
+                dry_run=bool(options.get('dry_run')),
+                changes_only=bool(options.get('changes_only')),
+            )
+            if action != 'upgrade':
+                # Run up to the first result so unavailability is reported as a status
+                first = next(results, None)
+        except UpgraderUnavailable as e:
+            self._send_json(503, {'error': str(e)})
+            return
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            logger.exception(f"{upgrade_type} {action} failed")
+            self._send_json(500, {'error': str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        success = False
+        try:
+            # An upgrade runs only now that the response is committed
+            if first is not None:
+                self._write_record(first)
+            for record in results:
+                self._write_record(record)
+            self._write_record({'done': True})
+            success = True
+        except (BrokenPipeError, ConnectionResetError):
+            results.close()
+        except UpgraderUnavailable as e:
+            self._write_record({'status': 'unavailable', 'error': str(e)})
+        except Exception as e:
+            logger.exception(f"{upgrade_type} {action} failed")
+            self._write_record({'error': str(e)})
+        finally:
+            registry = metrics.active()
+            if registry is not None:
+                registry.record_run(upgrade_type, action, success, time.monotonic() - start)
+
+    def _write_record(self, record: Dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(record).encode() + b'\n')
+        self.wfile.flush()
+
+
+class UnixAgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Agent server on a Unix domain socket readable only by its owner."""
+
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        # A socket left behind by a crashed agent would make bind fail
+        if os.path.exists(self.server_address):
+            if not stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                raise OSError(f"{self.server_address} exists and is not a socket")
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.server_address)
+            except OSError:
+                os.unlink(self.server_address)
+            else:
+                raise OSError(f"An agent is already listening on {self.server_address}")
+            finally:
+                probe.close()
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+class TCPAgentServer(ThreadingHTTPServer):
+    """Agent server on a TCP port."""
+
+    daemon_threads = True
+
+
+def is_loopback(host: str) -> bool:
+    """
+    Check whether a listen host only accepts local connections.
+
+    Args:
+        host: Host name or IP address; empty means every interface
+
+    Returns:
+        True for ``localhost`` and loopback addresses
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def make_server(agent: Agent, address: str, token: Optional[str] = None) -> socketserver.BaseServer:
+    """
+    Create a server for an agent.
+
+    Args:
+        agent: Agent answering the requests
+        address: Address to listen on, see parse_address
+        token: Bearer token every request must carry; required for TCP
+            addresses other than loopback
+
+    Returns:
+        Bound server, ready for serve_forever
+
+    Raises:
+        ValueError: If the address is invalid, or reachable from other
+            hosts without a token
+    """
+    kind, target = parse_address(address)
+    if kind == 'tcp' and not token and not is_loopback(target[0]):
+        raise ValueError(f"Refusing to listen on {address} without a token: "
+                         "any host could run upgrades; set agent.token or --token")
+    if kind == 'unix':
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        server = UnixAgentServer(target, AgentRequestHandler)
+    else:
+        server = TCPAgentServer(target, AgentRequestHandler)
+    server.agent = agent
+    server.token = token
+    return server
+
+
+def serve(agent: Agent, address: str, token: Optional[str] = None, warm: Optional[List[str]] = None) -> None:
+    """
+    Run an agent until SIGTERM or SIGINT.
+
+    Args:
+        agent: Agent answering the requests
+        address: Address to listen on, see parse_address
+        token: Optional bearer token every request must carry
+        warm: Upgrade types to warm up before accepting requests
+    """
+    server = make_server(agent, address, token)
+    # Served live on GET /metrics
+    metrics.enable()
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        if warm:
+            agent.warm(warm)
+        logger.info(f"Agent listening on {address}")
+        server.serve_forever()
+    finally:
+        server.server_close()
+        metrics.disable()
+
+
+class AgentClient:
+    """Client for a running agent."""
+
+    def __init__(self, address: Optional[str] = None, token: Optional[str] = None, timeout: float = 3600):
+        """
+        Initialize the client.
+
+        Args:
+            address: Agent address, defaults to default_address()
+            token: Optional bearer token
+            timeout: Socket timeout in seconds; upgrades can take long
+        """
+        self.address = address or default_address()
+        self.token = token
+        self.timeout = timeout
+
+    def _connect(self, timeout: float) -> http.client.HTTPConnection:
+        kind, target = parse_address(self.address)
+        if kind == 'unix':
+            return UnixHTTPConnection(target, timeout=timeout)
+        return http.client.HTTPConnection(*target, timeout=timeout)
+
+    def _request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        conn = self._connect(timeout or self.timeout)
+        try:
+            conn.connect()
+        except OSError as e:
+            # Nothing was sent, so the caller may safely run the request elsewhere
+            conn.close()
+            raise AgentUnavailable(f"No agent at {self.address}: {e}")
+
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        try:
+            conn.request(method, path, body=json.dumps(body or {}), headers=headers)
+            response = conn.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            # The agent may already be acting on the request
+            conn.close()
+            raise AgentError(f"Agent at {self.address} did not answer: {e}")
+
+        if response.status != 200:
+            try:
+                message = json.loads(response.read()).get('error', '')
+            except ValueError:
+                message = ''
+            conn.close()
+            error = UpgraderUnavailable if response.status == 503 else AgentError
+            raise error(message or f"Agent returned HTTP {response.status}")
+        return conn, response
+
+    def health(self) -> Dict[str, Any]:
+        """
+        Ask the agent whether it is running.
+
+        Returns:
+            Health payload with status and pid
+
+        Raises:
+            AgentUnavailable: If no agent could be connected to
+            AgentError: If the agent did not answer
+        """
+        conn, response = self._request('GET', '/v1/health', timeout=5)
+        try:
+            return json.loads(response.read())
+        finally:
+            conn.close()
+
+    def run(
+        self,
+        upgrade_type: str,
+        action: str,
+        item: Optional[str] = None,
+        dry_run: bool = False,
+        changes_only: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Run an action on the agent.
+
+        The request is sent before this returns, so an unreachable agent
+        raises here rather than on iteration. Only AgentUnavailable means
+        the agent never saw the request; after any other error it may have
+        run the action.
+
+        Args:
+            upgrade_type: Upgrade type (app, docker, podman)
+            action: list, check or upgrade
+            item: Optional specific item to target
+            dry_run: For upgrade, only simulate it
+            changes_only: For check, only report new updates
+
+        Returns:
+            Iterator over the agent's result records as they arrive; it
+            raises UpgraderUnavailable or AgentError for failures reported
+            in the stream, or if the connection is lost
+
+        Raises:
+            AgentUnavailable: If no agent could be connected to
+            UpgraderUnavailable: If the type is not available on the agent's host
+            AgentError: If the agent rejected the request or did not answer
+        """
+        body = {'item': item, 'dry_run': dry_run, 'changes_only': changes_only}
+        conn, response = self._request('POST', f'/v1/{upgrade_type}/{action}', body)
+        return self._records(conn, response)
+
+    @staticmethod
+    def _records(conn: http.client.HTTPConnection, response: http.client.HTTPResponse) -> Iterator[Dict[str, Any]]:
+        try:
+            for line in response:
+                record = json.loads(line)
+                if record.get('done'):
+                    return
+                if 'error' in record:
+                    error = UpgraderUnavailable if record.get('status') == 'unavailable' else AgentError
+                    raise error(record['error'])
+                yield record
+            raise AgentError("Agent closed the connection before finishing")
+        except (OSError, http.client.HTTPException) as e:
+            raise AgentError(f"Lost the connection to the agent: {e}")
+        finally:
+            conn.close()
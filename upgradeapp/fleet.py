@@ -0,0 +1,327 @@
+"""
+Fleet coordinator that drives agents on many hosts.
+"""
+
+import http.client
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from .agent import AgentClient, AgentError, AgentUnavailable, UpgraderUnavailable
+
+
+# Host outcomes; everything except ok and skipped counts as a failure
+OK = 'ok'
+FAILED = 'failed'
+UNREACHABLE = 'unreachable'
+UNAVAILABLE = 'unavailable'
+SKIPPED = 'skipped'
+
+
+@dataclass
+class Host:
+    """An agent endpoint in the fleet inventory."""
+
+    name: str
+    address: str
+    token: Optional[str] = None
+
+
+@dataclass
+class HostResult:
+    """Outcome of one action on one host."""
+
+    host: str
+    status: str
+    records: List[Dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+    duration: float = 0.0
+
+    @property
+    def failed(self) -> bool:
+        """Whether the host counts against the failure threshold."""
+        return self.status not in (OK, SKIPPED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the result to a JSON-serializable record.
+
+        Returns:
+            Dictionary with host, status, error, duration and results
+        """
+        return {
+            'host': self.host,
+            'status': self.status,
+            'error': self.error,
+            'duration': round(self.duration, 3),
+            'results': self.records,
+        }
+
+
+@dataclass
+class FleetReport:
+    """Aggregated outcome of an action across the fleet."""
+
+    action: str
+    results: Dict[str, HostResult] = field(default_factory=dict)
+    halted: bool = False
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count hosts per status.
+
+        Returns:
+            Mapping of status to number of hosts
+        """
+        counts: Dict[str, int] = {}
+        for result in self.results.values():
+            counts[result.status] = counts.get(result.status, 0) + 1
+        return counts
+
+    @property
+    def success(self) -> bool:
+        """Whether every host succeeded and the rollout was not halted."""
+        return not self.halted and not any(result.failed for result in self.results.values())
+
+    def summary(self) -> str:
+        """
+        Summarize the report in one line.
+
+        Returns:
+            Host counts per status, e.g. ``12 hosts: 11 ok, 1 unreachable``
+        """
+        counts = ', '.join(f"{count} {status}" for status, count in sorted(self.counts().items()))
+        text = f"{len(self.results)} hosts: {counts or 'none'}"
+        return text + ' (rollout halted)' if self.halted else text
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the report to a JSON-serializable dictionary.
+
+        Returns:
+            Dictionary with action, counts, halted and per-host results
+        """
+        return {
+            'action': self.action,
+            'counts': self.counts(),
+            'halted': self.halted,
+            'hosts': [result.to_dict() for result in self.results.values()],
+        }
+
+
+def load_inventory(path: str) -> List[Host]:
+    """
+    Load a fleet inventory.
+
+    A JSON inventory is a list of addresses or of objects with ``address``
+    and optional ``name`` and ``token``, either at the top level or under
+    ``hosts``. Any other file lists one host per line as ``address`` or
+    ``name address``; blank lines and ``#`` comments are ignored.
+
+    Args:
+        path: Inventory file path
+
+    Returns:
+        Hosts in inventory order
+
+    Raises:
+        ValueError: If an entry is malformed or a name is used twice
+    """
+    with open(path) as f:
+        content = f.read()
+
+    hosts: List[Host] = []
+    try:
+        entries = json.loads(content)
+    except ValueError:
+        for line in content.splitlines():
+            fields = line.split('#', 1)[0].split()
+            if len(fields) == 1:
+                hosts.append(Host(fields[0], fields[0]))
+            elif len(fields) == 2:
+                hosts.append(Host(fields[0], fields[1]))
+            elif fields:
+                raise ValueError(f"Invalid inventory line: {line.strip()}")
+    else:
+        if isinstance(entries, dict):
+            entries = entries.get('hosts', [])
+        for entry in entries:
+            if isinstance(entry, str):
+                hosts.append(Host(entry, entry))
+            elif isinstance(entry, dict) and entry.get('address'):
+                hosts.append(Host(entry.get('name') or entry['address'], entry['address'], entry.get('token')))
+            else:
+                raise ValueError(f"Invalid inventory entry: {entry!r}")
+
+    names = [host.name for host in hosts]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate hosts in inventory: {', '.join(duplicates)}")
+    return hosts
+
+
+def resolve_limit(value: Union[int, str], total: int) -> int:
+    """
+    Resolve a host count given as a number or a percentage of the fleet.
+
+    Args:
+        value: Count such as ``3`` or percentage such as ``"25%"``
+        total: Number of hosts in the fleet
+
+    Returns:
+        Host count; percentages round down
+    """
+    if isinstance(value, str) and value.endswith('%'):
+        return int(total * float(value[:-1]) / 100)
+    return int(value)
+
+
+class FleetCoordinator:
+    """
+    Runs upgrader actions on the agents of many hosts.
+
+    ``list`` and ``check`` fan out to every host at once, bounded by
+    ``concurrency``. ``upgrade`` rolls through the fleet in batches of at
+    most ``max_unavailable`` hosts and stops starting new batches once more
+    than ``max_failures`` hosts have failed.
+    """
+
+    def __init__(
+        self,
+        hosts: List[Host],
+        upgrade_type: str,
+        token: Optional[str] = None,
+        concurrency: int = 32,
+        timeout: Optional[float] = None
+    ):
+        """
+        Initialize the coordinator.
+
+        Args:
+            hosts: Hosts to drive
+            upgrade_type: Upgrade type run on every host (app, docker, podman)
+            token: Agent token for hosts that do not set their own
+            concurrency: Maximum number of hosts contacted at once
+            timeout: Optional socket timeout in seconds per host request
+        """
+        self.hosts = hosts
+        self.upgrade_type = upgrade_type
+        self.token = token
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = timeout
+
+    def _client(self, host: Host) -> AgentClient:
+        return AgentClient(host.address, host.token or self.token, timeout=self.timeout or 3600)
+
+    def run_host(self, host: Host, action: str, **options: Any) -> HostResult:
+        """
+        Run an action on one host.
+
+        Args:
+            host: Host to run on
+            action: list, check or upgrade
+            **options: item, dry_run and changes_only, as for AgentClient.run
+
+        Returns:
+            The host's result; errors are captured, never raised
+        """
+        started = time.monotonic()
+        result = HostResult(host.name, OK)
+        try:
+            result.records = list(self._client(host).run(self.upgrade_type, action, **options))
+            if action == 'upgrade' and not all(record.get('success') for record in result.records):
+                result.status = FAILED
+        except AgentUnavailable as e:
+            result.status, result.error = UNREACHABLE, str(e)
+        except UpgraderUnavailable as e:
+            result.status, result.error = UNAVAILABLE, str(e)
+        except (AgentError, OSError, ValueError, http.client.HTTPException) as e:
+            result.status, result.error = FAILED, str(e)
+        result.duration = time.monotonic() - started
+        return result
+
+    def _fan_out(self, hosts: List[Host], action: str, options: Dict[str, Any]) -> Iterator[HostResult]:
+        if not hosts:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(hosts))) as pool:
+            futures = [pool.submit(self.run_host, host, action, **options) for host in hosts]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def run(
+        self,
+        action: str,
+        item: Optional[str] = None,
+        changes_only: bool = False,
+        on_result: Optional[Callable[[HostResult], None]] = None
+    ) -> FleetReport:
+        """
+        Run list or check on every host concurrently.
+
+        Args:
+            action: list or check
+            item: Optional specific item to target
+            changes_only: For check, only report new updates
+            on_result: Optional callback invoked with each host's result as
+                soon as it arrives
+
+        Returns:
+            Report with one result per host, in inventory order
+        """
+        results = {}
+        for result in self._fan_out(self.hosts, action, {'item': item, 'changes_only': changes_only}):
+            results[result.host] = result
+            if on_result is not None:
+                on_result(result)
+        return FleetReport(action, {host.name: results[host.name] for host in self.hosts})
+
+    def upgrade(
+        self,
+        item: Optional[str] = None,
+        dry_run: bool = False,
+        max_unavailable: Union[int, str] = 1,
+        max_failures: Union[int, str] = 0,
+        on_result: Optional[Callable[[HostResult], None]] = None
+    ) -> FleetReport:
+        """
+        Upgrade the fleet in rolling batches.
+
+        Args:
+            item: Optional specific item to upgrade on every host
+            dry_run: If True, only simulate the upgrade
+            max_unavailable: Hosts upgraded at the same time, as a count or
+                a percentage of the fleet; at least one
+            max_failures: Failed hosts tolerated, as a count or percentage;
+                once exceeded no further batch starts
+            on_result: Optional callback invoked with each host's result as
+                soon as it arrives, including skipped hosts
+
+        Returns:
+            Report with one result per host, in inventory order; hosts in
+            batches that never started are ``skipped``
+        """
+        batch_size = max(1, resolve_limit(max_unavailable, len(self.hosts)))
+        tolerated = resolve_limit(max_failures, len(self.hosts))
+        report = FleetReport('upgrade')
+        results: Dict[str, HostResult] = {}
+        failures = 0
+
+        for start in range(0, len(self.hosts), batch_size):
+            batch = self.hosts[start:start + batch_size]
+            if failures > tolerated:
+                report.halted = True
+                for host in batch:
+                    results[host.name] = HostResult(host.name, SKIPPED, error='Rollout halted')
+                    if on_result is not None:
+                        on_result(results[host.name])
+                continue
+            for result in self._fan_out(batch, 'upgrade', {'item': item, 'dry_run': dry_run}):
+                results[result.host] = result
+                failures += result.failed
+                if on_result is not None:
+                    on_result(result)
+
+        report.results = {host.name: results[host.name] for host in self.hosts}
+        return report
@@ -0,0 +1,137 @@
+"""
+Registry of upgrade types and the upgrader classes that implement them.
+
+Upgraders are looked up by type name and their modules imported only when
+that type is requested, so a run pays for the one backend it uses. The
+built-in types are known without any lookup; other packages add types by
+declaring an entry point in the ``upgradeapp.upgraders`` group:
+
+    entry_points={
+        'upgradeapp.upgraders': ['flatpak = upgradeapp_flatpak:FlatpakUpgrader'],
+    }
+
+The entry point names a BaseUpgrader subclass taking the configuration
+dictionary. Installed entry points are only scanned when a type is not
+built in, or when every type is listed. A plugin cannot replace a
+built-in type.
+"""
+
+import importlib
+import logging
+import threading
+from typing import Dict, List, Optional, Type, Union
+
+from .upgraders.base import BaseUpgrader
+
+logger = logging.getLogger(__name__)
+
+
+ENTRY_POINT_GROUP = 'upgradeapp.upgraders'
+
+# Type name -> "module:class", in the order `all` runs them
+BUILTIN_UPGRADERS: Dict[str, str] = {
+    'app': 'upgradeapp.upgraders.app_upgrader:AppUpgrader',
+    'docker': 'upgradeapp.upgraders.docker_upgrader:DockerUpgrader',
+    'podman': 'upgradeapp.upgraders.podman_upgrader:PodmanUpgrader',
+}
+
+Target = Union[str, Type[BaseUpgrader]]
+
+# Types added with register()
+_registered: Dict[str, Target] = {}
+# Installed entry points by name, once scanned
+_installed: Optional[Dict[str, str]] = None
+_lock = threading.Lock()
+
+
+def register(name: str, target: Target) -> None:
+    """
+    Add an upgrade type without installing an entry point.
+
+    Args:
+        name: Type name used on the command line
+        target: The upgrader class, or its "module:class" path
+
+    Raises:
+        ValueError: If the name is a built-in type
+    """
+    if name in BUILTIN_UPGRADERS:
+        raise ValueError(f"Cannot replace the built-in upgrade type {name}")
+    _registered[name] = target
+
+
+def _entry_points() -> Dict[str, str]:
+    """Installed entry points of ENTRY_POINT_GROUP as name -> "module:class"."""
+    global _installed
+    with _lock:
+        if _installed is None:
+            # Reading package metadata costs more than importing a backend, so only do it on demand
+            from importlib import metadata
+
+            found = metadata.entry_points()
+            group = found.select(group=ENTRY_POINT_GROUP) if hasattr(found, 'select') \
+                else found.get(ENTRY_POINT_GROUP, [])
+            _installed = {}
+            for entry_point in group:
+                if entry_point.name in BUILTIN_UPGRADERS:
+                    logger.warning(f"Ignoring plugin {entry_point.value}: {entry_point.name} is a built-in type")
+                else:
+                    # Drop any "[extras]" suffix
+                    _installed.setdefault(entry_point.name, entry_point.value.split('[')[0].strip())
+        return _installed
+
+
+def _target(name: str) -> Optional[Target]:
+    target = BUILTIN_UPGRADERS.get(name) or _registered.get(name)
+    return target if target is not None else _entry_points().get(name)
+
+
+def upgrade_types() -> List[str]:
+    """
+    List every upgrade type: built-in ones first, then plugins by name.
+
+    Returns:
+        Type names
+    """
+    plugins = set(_registered) | set(_entry_points())
+    return list(BUILTIN_UPGRADERS) + sorted(plugins - set(BUILTIN_UPGRADERS))
+
+
+def is_known(name: str) -> bool:
+    """
+    Check whether an upgrade type exists, without importing it.
+
+    Args:
+        name: Type name
+
+    Returns:
+        True if the type is built in, registered or installed
+    """
+    return _target(name) is not None
+
+
+def load(name: str) -> Type[BaseUpgrader]:
+    """
+    Import the upgrader class of an upgrade type.
+
+    Args:
+        name: Type name
+
+    Returns:
+        The upgrader class
+
+    Raises:
+        ValueError: If the type is unknown or its plugin cannot be loaded
+    """
+    target = _target(name)
+    if target is None:
+        raise ValueError(f"Unknown upgrade type: {name}")
+    if isinstance(target, str):
+        module_name, _, attribute = target.partition(':')
+        try:
+            target = getattr(importlib.import_module(module_name), attribute)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"Could not load upgrade type {name} from {module_name}: {e}") from e
+    if not (isinstance(target, type) and issubclass(target, BaseUpgrader)):
+        raise ValueError(f"Upgrade type {name} is not a BaseUpgrader subclass: {target!r}")
+    return target
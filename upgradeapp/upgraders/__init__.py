@@ -1,10 +1,33 @@
 """
 Upgraders module - Contains all upgrader implementations.
+
+The classes are imported on first access, so importing this package, or
+one backend from it, does not import the others.
 """
 
-from .base import BaseUpgrader
-from .app_upgrader import AppUpgrader
-from .docker_upgrader import DockerUpgrader
-from .podman_upgrader import PodmanUpgrader
+import importlib
+from typing import Any, List
+
+# Exported class -> submodule defining it
+_MODULES = {
+    'BaseUpgrader': '.base',
+    'ContainerUpgrader': '.container',
+    'AppUpgrader': '.app_upgrader',
+    'DockerUpgrader': '.docker_upgrader',
+    'PodmanUpgrader': '.podman_upgrader',
+}
+
+__all__ = ['BaseUpgrader', 'ContainerUpgrader', 'AppUpgrader', 'DockerUpgrader', 'PodmanUpgrader']
+
+
+def __getattr__(name: str) -> Any:
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['BaseUpgrader', 'AppUpgrader', 'DockerUpgrader', 'PodmanUpgrader']
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -2,45 +2,104 @@
 Application upgrader for system applications and packages.
 """
 
-import subprocess
-from typing import Dict, List, Optional
+import logging
+import os
+import tarfile
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 
+from ..utils.aio import run_blocking
+from ..utils.paths import user_cache_dir
+from ..utils.probe_cache import get_probe_cache
+from ..utils.runner import CommandResult
+from ..utils.state_store import ItemState
 from .base import BaseUpgrader
+from .packages.apt import DEFAULT_LISTS_DIR, DEFAULT_UPDATE_STAMPS, AptIndex
+from .packages.dpkg import DEFAULT_STATUS_FILE, DpkgPackage, iter_dpkg_status
+from .packages.pacman import DEFAULT_CONFIG as PACMAN_CONFIG
+from .packages.pacman import DEFAULT_DB_PATH as PACMAN_DB_PATH
+from .packages.pacman import (
+    PacmanIndex,
+    PacmanPackage,
+    iter_pacman_local,
+    parse_query_upgrades,
+    prepare_sync_copy,
+)
+from .packages.rpm import (
+    DNF_CACHE_DIRS,
+    ZYPPER_CACHE_DIRS,
+    RpmPackage,
+    RpmRepoIndex,
+    find_rpmdb,
+    format_evr,
+    iter_rpmdb,
+    parse_check_update,
+    parse_zypper_list_updates,
+)
+from .packages.versions import classify_update, compare_versions
+from .policy import Decision, Policy
+
+
+logger = logging.getLogger(__name__)
+
+
+VERSION_SCHEMES = {'apt': 'deb', 'dnf': 'rpm', 'yum': 'rpm', 'zypper': 'rpm', 'pacman': 'pacman'}
+
+
+@dataclass
+class PackageUpdate:
+    """An available package update with its classification."""
+
+    name: str
+    installed: str
+    version: str
+    kind: Optional[str]
+    security: bool = False
 
 
 class AppUpgrader(BaseUpgrader):
     """Upgrader for system applications and packages."""
 
+    config_section = 'app_upgrader'
+
     def __init__(self, config: Optional[Dict] = None):
         """
         Initialize the application upgrader.
 
         Args:
-            config: Optional configuration dictionary
+            config: Optional configuration dictionary. The ``app_upgrader``
+                section may set ``apt_backend``, ``rpm_backend`` and
+                ``pacman_backend`` to ``native`` (default) or ``cli``, the
+                metadata freshness thresholds ``apt_lists_max_age`` and
+                ``metadata_max_age`` in seconds, database locations, and
+                ``include_packages`` / ``exclude_packages`` rules (see
+                policy).
+
+        Raises:
+            ValueError: If a policy rule is invalid
         """
         super().__init__(config)
+        self.settings = self.config.get(self.config_section, {})
+        self.policy = Policy.from_settings(self.settings, 'packages')
         self.package_manager = self._detect_package_manager()
+        # Updates the last upgrade left alone because of the policy
+        self.skipped: Dict[str, Decision] = {}
 
     def _detect_package_manager(self) -> Optional[str]:
         """
         Detect the system package manager.
 
+        Looks the managers up on PATH in-process instead of forking `which`.
+
         Returns:
             Package manager name (apt, yum, dnf, pacman, etc.) or None
         """
-        managers = ['apt', 'yum', 'dnf', 'pacman', 'zypper']
+        # dnf before yum: on current Fedora/RHEL yum is a symlink to dnf
+        managers = ['apt', 'dnf', 'yum', 'pacman', 'zypper']
+        probes = get_probe_cache(self.config.get('probe_cache', True))
         for manager in managers:
-            try:
-                result = subprocess.run(
-                    ['which', manager],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                if result.returncode == 0:
-                    return manager
-            except (subprocess.TimeoutExpired, FileNotFoundError):
-                continue
+            if probes.which(manager):
+                return manager
         return None
 
     def check_available(self) -> bool:
@@ -54,113 +113,540 @@ class AppUpgrader(BaseUpgrader):
 
     def list_items(self) -> List[str]:
         """
-        List all installed packages.
+        List all installed packages the policy allows.
 
         Returns:
             List of installed package names
         """
+        return list(self.iter_items())
+
+    def iter_items(self) -> Iterator[str]:
+        """
+        Stream installed package names as the package database is read.
+
+        Yields:
+            Installed package names the policy allows, each once
+        """
+        seen: Set[str] = set()
+        policy = self.policy
+        try:
+            for package in self.iter_packages():
+                # Multi-arch packages appear once per architecture
+                if package.name not in seen:
+                    seen.add(package.name)
+                    if not policy or policy.allows(package.name):
+                        yield package.name
+        except Exception as e:
+            logger.error(f"Error listing packages: {e}", extra={'phase': 'list'})
+
+    def iter_packages(self) -> Iterator[Union[DpkgPackage, RpmPackage, PacmanPackage]]:
+        """
+        Iterate over installed packages without materializing the full list.
+
+        The package database (dpkg status, rpmdb or pacman's local
+        database) is read directly, one entry at a time, so callers that
+        only need part of the list can stop early.
+
+        Yields:
+            Installed package entries with at least name, version and architecture
+        """
         if not self.check_available():
-            return []
+            return
+
+        if self.package_manager == 'apt':
+            yield from iter_dpkg_status(self.settings.get('dpkg_status', DEFAULT_STATUS_FILE))
+        elif self.package_manager in ('dnf', 'yum', 'zypper'):
+            rpmdb = self.settings.get('rpmdb_path') or find_rpmdb()
+            if rpmdb:
+                yield from iter_rpmdb(rpmdb)
+            else:
+                yield from self._iter_rpm_cli()
+        elif self.package_manager == 'pacman':
+            yield from iter_pacman_local(self.settings.get('pacman_db_path', PACMAN_DB_PATH))
+
+    def package_db_stamp(self) -> Optional[int]:
+        """
+        Get a stamp that changes whenever the package database changes.
 
+        Long-running callers compare stamps to reuse a package listing
+        until packages are installed or removed.
+
+        Returns:
+            Modification time in nanoseconds of the package database, or
+            None if there is no database file to watch
+        """
+        if self.package_manager == 'apt':
+            path = self.settings.get('dpkg_status', DEFAULT_STATUS_FILE)
+        elif self.package_manager in ('dnf', 'yum', 'zypper'):
+            path = self.settings.get('rpmdb_path') or find_rpmdb()
+        elif self.package_manager == 'pacman':
+            # pacman adds and removes one directory per package under local/
+            path = os.path.join(self.settings.get('pacman_db_path', PACMAN_DB_PATH), 'local')
+        else:
+            path = None
+        if not path:
+            return None
         try:
-            if self.package_manager == 'apt':
-                result = subprocess.run(
-                    ['dpkg', '--get-selections'],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _iter_rpm_cli(self) -> Iterator[RpmPackage]:
+        # Berkeley DB and ndb rpmdbs (RHEL 7/8, older SUSE) need rpm itself.
+        # Lines are parsed as they are read, so the listing is not held twice
+        packages: List[RpmPackage] = []
+
+        def parse(line: str) -> None:
+            parts = line.split('\t')
+            if len(parts) == 5 and parts[4] != '(none)':
+                name, epoch, version, release, arch = parts
+                packages.append(
+                    RpmPackage(name, format_evr(epoch if epoch != '(none)' else None, version, release), arch)
                 )
-                if result.returncode == 0:
-                    packages = [line.split()[0] for line in result.stdout.strip().split('\n')
-                               if line and 'install' in line]
-                    return packages
-            # Add other package managers as needed
-        except Exception as e:
-            print(f"Error listing packages: {e}")
 
-        return []
+        self.runner.run(
+            ['rpm', '-qa', '--queryformat', '%{NAME}\t%{EPOCH}\t%{VERSION}\t%{RELEASE}\t%{ARCH}\n'], 60,
+            on_line=parse
+        )
+        yield from packages
 
     def check_updates(self, item: Optional[str] = None) -> Dict[str, str]:
         """
         Check for available updates.
 
+        The native backends compute upgradable packages from the on-disk
+        package databases and only refresh repository metadata when it is
+        older than the configured maximum age. The package manager's CLI is
+        used when the native backend is disabled or its data is missing.
+
         Args:
             item: Optional specific package to check
 
         Returns:
-            Dictionary of packages with available updates
+            Dictionary of packages with available updates the policy allows
         """
-        updates = {}
-        if not self.check_available():
+        return self._apply_policy(self._find_updates(item))
+
+    def _apply_policy(self, updates: Dict[str, str]) -> Dict[str, str]:
+        if not self.policy:
             return updates
+        return {name: version for name, version in updates.items() if self.policy.allows(name)}
+
+    def _find_updates(self, item: Optional[str]) -> Dict[str, str]:
+        if not self.check_available():
+            return {}
 
         try:
+            index = self._native_index()
+            if index is not None:
+                if self._metadata_stale(index):
+                    self._refresh_metadata()
+                try:
+                    return index.upgradable(item)
+                except tarfile.ReadError:
+                    # e.g. zstd-compressed pacman sync databases
+                    pass
+
             if self.package_manager == 'apt':
-                # Update package list
-                subprocess.run(
-                    ['sudo', 'apt', 'update'],
-                    capture_output=True,
-                    timeout=60
-                )
-                # Check for upgradable packages
-                result = subprocess.run(
-                    ['apt', 'list', '--upgradable'],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                if result.returncode == 0:
-                    for line in result.stdout.strip().split('\n')[1:]:  # Skip header
-                        if line:
-                            parts = line.split()
-                            if len(parts) >= 2:
-                                pkg_name = parts[0].split('/')[0]
-                                version = parts[1]
-                                if item is None or pkg_name == item:
-                                    updates[pkg_name] = version
+                # apt list only reads the lists, so update them first
+                self._refresh_metadata()
+            cmd, timeout = self._list_updates_command()
+            result = self.runner.run(cmd, timeout, keep_all=True, idempotent=True, item=item)
+            return self._parse_list_updates(result, item)
+        except Exception as e:
+            logger.error(f"Error checking updates: {e}", extra={'item': item, 'phase': 'check'})
+
+        return {}
+
+    async def async_check_updates(self, item: Optional[str] = None) -> Dict[str, str]:
+        """
+        Async counterpart of check_updates.
+
+        Native index reads run on the executor; metadata refreshes and CLI
+        queries run as asyncio subprocesses that are stopped on cancellation.
+
+        Args:
+            item: Optional specific package to check
+
+        Returns:
+            Dictionary of packages with available updates the policy allows
+        """
+        return self._apply_policy(await self._async_find_updates(item))
+
+    async def _async_find_updates(self, item: Optional[str]) -> Dict[str, str]:
+        if not self.check_available():
+            return {}
+
+        try:
+            index = await run_blocking(self._native_index)
+            if index is not None:
+                if await run_blocking(self._metadata_stale, index):
+                    await self._async_refresh_metadata()
+                try:
+                    return await run_blocking(index.upgradable, item)
+                except tarfile.ReadError:
+                    pass
+
+            if self.package_manager == 'apt':
+                await self._async_refresh_metadata()
+            cmd, timeout = self._list_updates_command()
+            result = await self.runner.run_async(cmd, timeout, keep_all=True, idempotent=True, item=item)
+            return self._parse_list_updates(result, item)
+        except Exception as e:
+            logger.error(f"Error checking updates: {e}", extra={'item': item, 'phase': 'check'})
+
+        return {}
+
+    def _native_index(self) -> Optional[Union[AptIndex, RpmRepoIndex, PacmanIndex]]:
+        """
+        Get the native index for the package manager.
+
+        Returns:
+            Index over the on-disk databases, or None if the native backend
+            is disabled or its data is missing
+        """
+        if self.package_manager == 'apt':
+            backend, index = 'apt_backend', self._apt_index
+        elif self.package_manager in ('dnf', 'yum', 'zypper'):
+            backend, index = 'rpm_backend', self._rpm_index
+        else:
+            backend, index = 'pacman_backend', self._pacman_index
+        if self.settings.get(backend, 'native') != 'native':
+            return None
+        try:
+            native = index()
+        except OSError as e:
+            logger.warning(f"Cannot use the native {self.package_manager} backend: {e}", extra={'phase': 'check'})
+            return None
+        return native if native.available() else None
+
+    def _metadata_max_age(self) -> float:
+        if self.package_manager == 'apt':
+            return self.settings.get('apt_lists_max_age', 3600)
+        return self.settings.get('metadata_max_age', 3600)
+
+    def _metadata_stale(self, index: Union[AptIndex, RpmRepoIndex, PacmanIndex]) -> bool:
+        """
+        Check whether the native index should be refreshed before reading it.
+
+        Args:
+            index: Native index to check
+
+        Returns:
+            True if neither the index nor the refresh time recorded by the
+            last successful refresh is within the freshness threshold
+        """
+        max_age = self._metadata_max_age()
+        if not index.is_stale(max_age):
+            return False
+        refreshed = self.state_store().get(self.config_section, self._refresh_key())
+        return refreshed is None or not refreshed.fresh(max_age)
+
+    def _refresh_key(self) -> str:
+        # Keyed by location too, so a chroot's indexes keep their own refresh time
+        if self.package_manager == 'apt':
+            location = self.settings.get('apt_lists_dir', DEFAULT_LISTS_DIR)
+        elif self.package_manager in ('dnf', 'yum', 'zypper'):
+            location = os.pathsep.join(self._rpm_index().cache_dirs)
+        else:
+            location = self._pacman_sync_path()
+        return f'metadata:{self.package_manager}:{location}'
+
+    def _list_updates_command(self) -> Tuple[List[str], int]:
+        if self.package_manager == 'apt':
+            return ['apt', 'list', '--upgradable'], 30
+        if self.package_manager == 'zypper':
+            return ['zypper', '--non-interactive', '--quiet', 'list-updates'], 120
+        if self.package_manager == 'pacman':
+            if self.settings.get('pacman_backend', 'native') == 'native':
+                # Read the copy the native backend keeps synced, e.g. when it cannot read zstd databases
+                try:
+                    return ['pacman', '-Qu', '--dbpath', self._pacman_sync_path()], 60
+                except OSError:
+                    pass
+            return ['pacman', '-Qu'], 60
+        return [self.package_manager, '--quiet', 'check-update'], 120
+
+    def _parse_list_updates(self, result: CommandResult, item: Optional[str]) -> Dict[str, str]:
+        if result.returncode is None:
+            logger.error(result.describe(), extra={'item': item, 'phase': 'check'})
+            return {}
+        if self.package_manager == 'apt':
+            if result.returncode != 0:
+                return {}
+            updates = {}
+            for line in result.stdout.strip().split('\n')[1:]:  # Skip header
+                parts = line.split()
+                if len(parts) >= 2:
+                    updates[parts[0].split('/')[0]] = parts[1]
+        elif self.package_manager == 'pacman':
+            # pacman -Qu exits with 1 when nothing is upgradable
+            updates = parse_query_upgrades(result.stdout)
+        elif result.returncode not in (0, 100):
+            # check-update exits with 100 when updates are available
+            return {}
+        elif self.package_manager == 'zypper':
+            updates = parse_zypper_list_updates(result.stdout)
+        else:
+            updates = parse_check_update(result.stdout)
+        return {name: version for name, version in updates.items() if item is None or name == item}
+
+    def classify_updates(self, item: Optional[str] = None) -> Dict[str, PackageUpdate]:
+        """
+        Check for updates and classify each one.
+
+        Each update is labelled ``major``, ``minor``, ``patch`` or
+        ``revision`` from its installed and candidate versions, and flagged
+        as a security update when it comes from a security archive (apt)
+        or is named by a cached security advisory (dnf, yum, zypper).
+
+        Args:
+            item: Optional specific package to check
+
+        Returns:
+            Dictionary of package name to classified update
+        """
+        updates = self.check_updates(item)
+        if not updates:
+            return {}
+
+        scheme = VERSION_SCHEMES[self.package_manager]
+        installed: Dict[str, str] = {}
+        try:
+            for package in self.iter_packages():
+                if package.name not in updates:
+                    continue
+                current = installed.get(package.name)
+                if current is None or compare_versions(package.version, current, scheme) > 0:
+                    installed[package.name] = package.version
+        except Exception as e:
+            logger.error(f"Error reading installed versions: {e}", extra={'phase': 'classify'})
+
+        try:
+            security = self._security_updates(updates)
         except Exception as e:
-            print(f"Error checking updates: {e}")
+            logger.error(f"Error reading security advisories: {e}", extra={'phase': 'classify'})
+            security = set()
+
+        return {
+            name: PackageUpdate(
+                name=name,
+                installed=installed.get(name, ''),
+                version=version,
+                kind=classify_update(installed[name], version, scheme) if name in installed else None,
+                security=name in security,
+            )
+            for name, version in updates.items()
+        }
+
+    def _security_updates(self, updates: Dict[str, str]) -> Set[str]:
+        if self.package_manager == 'apt':
+            return self._apt_index().security_updates(updates)
+        if self.package_manager in ('dnf', 'yum', 'zypper'):
+            return self._rpm_index().security_updates(updates)
+        return set()
+
+    def _apt_index(self) -> AptIndex:
+        return AptIndex(
+            self.settings.get('apt_lists_dir', DEFAULT_LISTS_DIR),
+            self.settings.get('dpkg_status', DEFAULT_STATUS_FILE),
+            self.settings.get('apt_update_stamps', DEFAULT_UPDATE_STAMPS),
+        )
 
-        return updates
+    def _rpm_index(self) -> RpmRepoIndex:
+        default_dirs = ZYPPER_CACHE_DIRS if self.package_manager == 'zypper' else DNF_CACHE_DIRS
+        return RpmRepoIndex(
+            self.settings.get('rpm_cache_dirs', default_dirs),
+            self.settings.get('rpmdb_path') or find_rpmdb(),
+        )
+
+    def _pacman_index(self) -> PacmanIndex:
+        return PacmanIndex(self._pacman_sync_path(), self.settings.get('pacman_config', PACMAN_CONFIG))
+
+    def _pacman_sync_path(self) -> str:
+        """
+        Get the private pacman database root that checks sync into.
+
+        Returns:
+            Database root linking the system's local database
+
+        Raises:
+            OSError: If the copy cannot be created
+        """
+        path = self.settings.get('pacman_sync_path') or os.path.join(user_cache_dir(), 'pacman')
+        prepare_sync_copy(path, self.settings.get('pacman_db_path', PACMAN_DB_PATH))
+        return path
+
+    def _refresh_command(self) -> Tuple[List[str], int]:
+        if self.package_manager == 'pacman':
+            # Like checkupdates: sync the private copy as this user, never the system databases
+            cmd = ['pacman', '-Sy', '--dbpath', self._pacman_sync_path(), '--logfile', '/dev/null',
+                   '--config', self.settings.get('pacman_config', PACMAN_CONFIG)]
+            return (['fakeroot', '--'] + cmd if os.geteuid() != 0 else cmd), 300
+        commands = {
+            'apt': ['sudo', 'apt', 'update'],
+            'dnf': ['sudo', 'dnf', '--quiet', 'makecache'],
+            'yum': ['sudo', 'yum', '--quiet', 'makecache'],
+            'zypper': ['sudo', 'zypper', '--non-interactive', '--quiet', 'refresh'],
+        }
+        return commands[self.package_manager], 300 if self.package_manager != 'apt' else 60
+
+    def _refresh_metadata(self) -> None:
+        cmd, timeout = self._refresh_command()
+        self._record_refresh(self.runner.run(cmd, timeout, idempotent=True))
+
+    async def _async_refresh_metadata(self) -> None:
+        cmd, timeout = self._refresh_command()
+        result = await self.runner.run_async(cmd, timeout, idempotent=True)
+        await run_blocking(self._record_refresh, result)
+
+    def _record_refresh(self, result: CommandResult) -> None:
+        # A refresh that finds nothing new may leave every file it could be dated by untouched
+        if result.ok:
+            self.state_store().record([ItemState(self.config_section, self._refresh_key(), None)])
 
     def upgrade(self, item: Optional[str] = None, dry_run: bool = False) -> bool:
         """
         Perform package upgrade.
 
+        With include or exclude rules, a package the policy rejects is not
+        upgraded: naming one skips it, and a full upgrade names the allowed
+        upgradable packages instead of upgrading everything (pacman, where
+        partial upgrades are unsupported, ignores the rejected ones). The
+        skipped updates and their decisions are kept in ``skipped``.
+
         Args:
             item: Optional specific package to upgrade. If None, upgrade all.
             dry_run: If True, only simulate the upgrade.
 
         Returns:
-            True if upgrade was successful, False otherwise
+            True if upgrade was successful or everything was skipped, False otherwise
         """
         if not self.check_available():
-            print(f"Package manager not available")
+            logger.error("Package manager not available", extra={'item': item, 'phase': 'upgrade'})
             return False
 
+        self.skipped = {}
         try:
-            cmd = []
-            if self.package_manager == 'apt':
-                cmd = ['sudo', 'apt']
-                if dry_run:
-                    cmd.extend(['--dry-run'])
-                cmd.append('upgrade')
-                if item:
-                    cmd.append(item)
-                else:
-                    cmd.extend(['-y'])
-
-            if cmd:
-                print(f"Running: {' '.join(cmd)}")
-                if not dry_run:
-                    result = subprocess.run(cmd, timeout=300)
-                    return result.returncode == 0
-                else:
-                    print("Dry run - no actual upgrade performed")
-                    return True
+            if item and not self._allowed(item):
+                return True
+            plan = self._plan_upgrade(self._find_updates(None)) if self.policy and not item else None
+            if plan is not None and not plan[0]:
+                logger.info("No updates allowed by the policy", extra={'phase': 'upgrade'})
+                return True
+            cmd = self._upgrade_command(item, dry_run, plan)
+            logger.info(f"Running: {' '.join(cmd)}", extra={'item': item, 'phase': 'upgrade'})
+            if not dry_run:
+                result = self.runner.run(cmd, 300, capture=False, item=item)
+                self._log_upgrade_result(item, result)
+                return result.ok
+            else:
+                logger.info("Dry run - no actual upgrade performed", extra={'item': item, 'phase': 'upgrade'})
+                return True
+
+        except Exception as e:
+            logger.error(f"Error during upgrade: {e}", extra={'item': item, 'phase': 'upgrade'})
+            return False
+
+    async def async_upgrade(self, item: Optional[str] = None, dry_run: bool = False) -> bool:
+        """
+        Async counterpart of upgrade.
+
+        The package manager runs as an asyncio subprocess with its output
+        captured, so upgrades running side by side do not interleave on
+        the terminal; cancelling the task stops it.
+
+        Args:
+            item: Optional specific package to upgrade. If None, upgrade all.
+            dry_run: If True, only simulate the upgrade.
+
+        Returns:
+            True if upgrade was successful or everything was skipped, False otherwise
+        """
+        if not self.check_available():
+            logger.error("Package manager not available", extra={'item': item, 'phase': 'upgrade'})
+            return False
 
+        self.skipped = {}
+        try:
+            if item and not self._allowed(item):
+                return True
+            plan = self._plan_upgrade(await self._async_find_updates(None)) if self.policy and not item else None
+            if plan is not None and not plan[0]:
+                logger.info("No updates allowed by the policy", extra={'phase': 'upgrade'})
+                return True
+            cmd = self._upgrade_command(item, dry_run, plan)
+            logger.info(f"Running: {' '.join(cmd)}", extra={'item': item, 'phase': 'upgrade'})
+            if dry_run:
+                logger.info("Dry run - no actual upgrade performed", extra={'item': item, 'phase': 'upgrade'})
+                return True
+            result = await self.runner.run_async(cmd, 300, item=item)
+            self._log_upgrade_result(item, result)
+            return result.ok
         except Exception as e:
-            print(f"Error during upgrade: {e}")
+            logger.error(f"Error during upgrade: {e}", extra={'item': item, 'phase': 'upgrade'})
             return False
 
-        return False
+    @staticmethod
+    def _log_upgrade_result(item: Optional[str], result: CommandResult) -> None:
+        fields = {'item': item, 'phase': 'upgrade', 'duration': result.duration}
+        if result.ok:
+            logger.info(f"{result.command} finished in {result.duration:.1f}s", extra=fields)
+        else:
+            # Output is only captured when running async; otherwise it went to the terminal
+            logger.error(result.describe(), extra=fields)
+
+    def _allowed(self, item: str) -> bool:
+        decision = self.policy.decide(item)
+        if not decision.allowed:
+            self.skipped[item] = decision
+            self._report_skipped({item: decision})
+        return decision.allowed
+
+    def _plan_upgrade(self, updates: Dict[str, str]) -> Tuple[List[str], List[str]]:
+        """
+        Split the upgradable packages by policy, recording the skipped ones.
+
+        Returns:
+            Tuple of (packages to upgrade, packages to leave alone)
+        """
+        allowed, denied = [], []
+        for name in updates:
+            decision = self.policy.decide(name)
+            if decision.allowed:
+                allowed.append(name)
+            else:
+                denied.append(name)
+                self.skipped[name] = decision
+        self._report_skipped(self.skipped)
+        return allowed, denied
+
+    def _upgrade_command(self, item: Optional[str], dry_run: bool,
+                         plan: Optional[Tuple[List[str], List[str]]] = None) -> List[str]:
+        # A plan from _plan_upgrade replaces a full upgrade with its allowed packages
+        packages = [item] if item else plan[0] if plan else []
+        if self.package_manager == 'apt':
+            cmd = ['sudo', 'apt']
+            if dry_run:
+                cmd.extend(['--dry-run'])
+            cmd.append('upgrade')
+            cmd.extend(packages)
+            if not item:
+                cmd.extend(['-y'])
+        elif self.package_manager in ('dnf', 'yum'):
+            cmd = ['sudo', self.package_manager, 'upgrade']
+            cmd.append('--assumeno' if dry_run else '-y')
+            cmd.extend(packages)
+        elif self.package_manager == 'zypper':
+            cmd = ['sudo', 'zypper', '--non-interactive', 'update']
+            if dry_run:
+                cmd.append('--dry-run')
+            cmd.extend(packages)
+        else:
+            cmd = ['sudo', 'pacman', '--noconfirm']
+            if dry_run:
+                cmd.append('--print')
+            cmd.extend(['-S', item] if item else ['-Syu'])
+            if plan and plan[1]:
+                cmd.extend(['--ignore', ','.join(plan[1])])
+        return cmd
@@ -2,12 +2,53 @@
 Base upgrader class that defines the interface for all upgraders.
 """
 
+import logging
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..utils.aio import run_blocking
+from ..utils.runner import CommandRunner
+from ..utils.state_store import StateStore, get_state_store
+from ..utils.tracing import traced
+from .policy import Decision
+
+logger = logging.getLogger(__name__)
+
+
+# Operations recorded as spans when tracing is enabled, in every subclass that defines them
+TRACED_METHODS = (
+    'check_available', 'list_items', 'check_updates', 'upgrade',
+    'async_check_available', 'async_list_items', 'async_check_updates', 'async_upgrade',
+)
 
 
 class BaseUpgrader(ABC):
-    """Abstract base class for all upgraders."""
+    """
+    Abstract base class for all upgraders.
+
+    Subclasses set ``config_section`` to their section of the
+    configuration; it also keys their entries in the state store. They
+    run external commands through ``self.runner``, configured by the
+    ``commands`` settings.
+
+    Every operation has an ``async_`` counterpart for use on an asyncio
+    event loop. The defaults run the blocking method on the loop's
+    executor; upgraders override them to drive their commands as asyncio
+    subprocesses, which are stopped when the awaiting task is cancelled.
+
+    The operations in TRACED_METHODS are wrapped as tracing spans named
+    ``<class>.<method>`` wherever they are defined, so overrides are
+    traced without decorating them. Each span records the result size or
+    success as its ``result``, which the metrics registry counts.
+    """
+
+    config_section = ''
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in TRACED_METHODS:
+            if name in cls.__dict__:
+                setattr(cls, name, traced(f"{{cls}}.{name}", record_result=True)(cls.__dict__[name]))
 
     def __init__(self, config: Optional[Dict] = None):
         """
@@ -17,6 +58,7 @@ class BaseUpgrader(ABC):
             config: Optional configuration dictionary
         """
         self.config = config or {}
+        self.runner = CommandRunner.from_config(self.config, self.config_section)
 
     @abstractmethod
     def check_available(self) -> bool:
@@ -65,6 +107,120 @@ class BaseUpgrader(ABC):
         """
         pass
 
+    def iter_items(self) -> Iterator[str]:
+        """
+        Stream the items that can be upgraded.
+
+        The default wraps list_items. Upgraders that can produce items
+        incrementally override this and build list_items on top of it.
+
+        Yields:
+            Item names/identifiers
+        """
+        yield from self.list_items()
+
+    def iter_updates(self, item: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Stream available updates as they are found.
+
+        The default wraps check_updates. Upgraders that check items one by
+        one override this and build check_updates on top of it.
+
+        Args:
+            item: Optional specific item to check. If None, check all items.
+
+        Yields:
+            (item, available version) pairs
+        """
+        yield from self.check_updates(item).items()
+
+    def state_store(self) -> StateStore:
+        """
+        Get the store recording check results between runs.
+
+        Returns:
+            The shared state store, in memory only if ``state_store`` is
+            disabled in the configuration
+        """
+        return get_state_store(self.config.get('state_store', True))
+
+    def check_changes(self, item: Optional[str] = None) -> Dict[str, str]:
+        """
+        Check for updates and keep only those not reported by the previous run.
+
+        Args:
+            item: Optional specific item to check. If None, check all items.
+
+        Returns:
+            Dictionary of new updates and updates whose version changed
+        """
+        updates = self.check_updates(item)
+        return self.state_store().report(self.config_section, updates, [item] if item else None)
+
+    async def async_check_available(self) -> bool:
+        """
+        Async counterpart of check_available.
+
+        Returns:
+            True if available, False otherwise
+        """
+        return await run_blocking(self.check_available)
+
+    async def async_list_items(self) -> List[str]:
+        """
+        Async counterpart of list_items.
+
+        Returns:
+            List of item names/identifiers
+        """
+        return await run_blocking(self.list_items)
+
+    async def async_check_updates(self, item: Optional[str] = None) -> Dict[str, str]:
+        """
+        Async counterpart of check_updates.
+
+        Args:
+            item: Optional specific item to check. If None, check all items.
+
+        Returns:
+            Dictionary mapping item names to available versions
+        """
+        return await run_blocking(self.check_updates, item)
+
+    async def async_upgrade(self, item: Optional[str] = None, dry_run: bool = False) -> bool:
+        """
+        Async counterpart of upgrade.
+
+        Args:
+            item: Optional specific item to upgrade. If None, upgrade all items.
+            dry_run: If True, only simulate the upgrade.
+
+        Returns:
+            True if upgrade was successful, False otherwise
+        """
+        return await run_blocking(self.upgrade, item, dry_run)
+
+    @staticmethod
+    def _report_skipped(skipped: Dict[str, Decision]) -> None:
+        """
+        Log the items a policy kept from being upgraded.
+
+        Items excluded by a rule are listed with the rule; items missing
+        from the include rules are only counted, since with a short
+        include list they are most of the inventory.
+
+        Args:
+            skipped: Decision for each skipped item
+        """
+        unmatched: Dict[str, int] = {}
+        for item, decision in skipped.items():
+            if decision.rule is not None:
+                logger.info(f"Skipping {item}: {decision.reason}", extra={'item': item, 'phase': 'policy'})
+            else:
+                unmatched[decision.setting] = unmatched.get(decision.setting, 0) + 1
+        for setting, count in unmatched.items():
+            logger.info(f"Skipping {count} item(s) not matched by any {setting} rule", extra={'phase': 'policy'})
+
     def validate(self) -> bool:
         """
         Validate the upgrade configuration.
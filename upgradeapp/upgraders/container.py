@@ -0,0 +1,1006 @@
+"""
+Shared implementation for CLI-driven container upgraders (Docker, Podman).
+"""
+
+import asyncio
+import json
+import logging
+import shutil
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..utils.aio import run_blocking
+from ..utils.concurrency import AsyncKeyedLimiter, CheckEngine, KeyedLimiter, map_limited
+from ..utils.probe_cache import get_probe_cache
+from ..utils.state_store import ItemState, StateStore
+from ..utils.tracing import annotate, traced
+from .base import BaseUpgrader
+from .image_gc import DEFAULT_GC_BATCH_SIZE, GCReport, ImageRecord, ImageReferenceIndex, image_from_inspect
+from .inventory import INSPECT_BATCH_SIZE, ContainerInventory, ContainerRecord
+from .policy import ALLOWED, Decision, Policy
+from .pull_planner import DEFAULT_UNPACK_RATIO, PullPlanner, format_bytes
+from .recreate import ContainerSpec, container_spec
+from .registry import RegistryClient, parse_image_reference
+
+logger = logging.getLogger(__name__)
+
+# Anonymous Docker Hub use is rate limited, so stay gentle by default
+DEFAULT_REGISTRY_LIMITS = {
+    'registry-1.docker.io': {'concurrency': 4, 'rate': 10},
+    'default': {'concurrency': 8},
+}
+
+
+class ContainerUpgrader(BaseUpgrader):
+    """
+    Base class for upgraders that manage containers through a Docker-compatible CLI.
+
+    Subclasses set ``binary`` to the CLI executable, ``display_name`` for
+    messages and ``config_section`` to their section of the configuration.
+    """
+
+    binary = ''
+    display_name = ''
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        Initialize the container upgrader.
+
+        Args:
+            config: Optional configuration dictionary. The upgrader's section
+                may set ``check_mode`` to ``pull`` (default) or ``digest``,
+                ``insecure_registries``, ``registry_auth``, the pull
+                planner's ``pull_planning``, ``unpack_ratio`` and
+                ``storage_path``, the image GC's ``image_gc``,
+                ``gc_scope``, ``gc_retain`` and ``gc_batch_size``, and
+                ``include_containers`` / ``exclude_containers`` rules (see
+                policy).
+
+        Raises:
+            ValueError: If a policy rule is invalid
+        """
+        super().__init__(config)
+        self.settings = self.config.get(self.config_section, {})
+        self.policy = Policy.from_settings(self.settings, 'containers')
+        # Containers the last upgrade left alone because of the policy
+        self.skipped: Dict[str, Decision] = {}
+        self.check_mode = self.settings.get('check_mode', 'pull')
+        self._registry: Optional[RegistryClient] = None
+        self._inventory: Optional[ContainerInventory] = None
+        # Downtime in seconds of each container replaced by the last upgrade
+        self.downtimes: Dict[str, float] = {}
+
+    def check_available(self) -> bool:
+        """
+        Check if the container CLI is available on the system.
+
+        The ``--version`` probe goes through the shared probe cache, so it
+        forks at most once per installed binary rather than once per call.
+
+        Returns:
+            True if available, False otherwise
+        """
+        probe = get_probe_cache(self.config.get('probe_cache', True)).probe(self.binary)
+        return probe is not None and probe.ok
+
+    def list_items(self) -> List[str]:
+        """
+        List all containers the policy allows.
+
+        Returns:
+            List of container names/IDs
+        """
+        return list(self.iter_items())
+
+    def iter_items(self) -> Iterator[str]:
+        """
+        Stream container names.
+
+        Yields:
+            Container names/IDs the policy allows
+        """
+        if not self.check_available():
+            return
+
+        try:
+            names = self._list_container_names()
+            if self.policy:
+                names = [name for name in names if self._container_decision(name).allowed]
+        except Exception as e:
+            logger.error(f"Error listing {self.display_name} containers: {e}", extra={'phase': 'list'})
+            return
+        yield from names
+
+    def _container_decision(self, container: str) -> Decision:
+        """Apply the policy to a container, by its name, labels and image."""
+        if not self.policy:
+            return ALLOWED
+        record = self.inventory().get(container)
+        if record is None:
+            return self.policy.decide(container)
+        return self.policy.decide(record.name, record.labels, record.image)
+
+    def _image_decisions(self, images: List[str]) -> Dict[str, Decision]:
+        """
+        Apply the policy to images.
+
+        An image used by containers is allowed if any of them is; an
+        unused image only by the ``image:`` rules, or by being matched by
+        an include rule when there are include rules.
+
+        Returns:
+            Decision for each image
+        """
+        users: Dict[str, List[ContainerRecord]] = {}
+        for record in self.inventory():
+            users.setdefault(_tagged(record.image), []).append(record)
+        decisions = {}
+        for image in images:
+            records = users.get(_tagged(image))
+            if not records:
+                decisions[image] = self.policy.decide(None, image=image)
+                continue
+            denied = None
+            for record in records:
+                decision = self.policy.decide(record.name, record.labels, record.image)
+                if decision.allowed:
+                    break
+                denied = denied or decision
+            decisions[image] = decision if decision.allowed else denied
+        return decisions
+
+    def list_images(self) -> List[str]:
+        """
+        List all images.
+
+        Returns:
+            List of image names
+        """
+        if not self.check_available():
+            return []
+
+        try:
+            return self._list_image_tags()
+        except Exception as e:
+            logger.error(f"Error listing {self.display_name} images: {e}", extra={'phase': 'list'})
+
+        return []
+
+    def inventory(self, refresh: bool = False) -> ContainerInventory:
+        """
+        Get the container inventory, building it on first use.
+
+        The inventory is built from a single ``ps`` call plus batched
+        ``inspect`` calls and then answers every per-container lookup.
+
+        Args:
+            refresh: If True, rebuild the inventory from the runtime
+
+        Returns:
+            Container inventory
+        """
+        if self._inventory is None or refresh:
+            self._inventory = self._load_inventory()
+        return self._inventory
+
+    def _load_inventory(self) -> ContainerInventory:
+        return ContainerInventory.from_cli(self.binary, self.runner)
+
+    def _list_container_names(self) -> List[str]:
+        return self.inventory().names()
+
+    def _list_image_tags(self) -> List[str]:
+        result = self.runner.run(
+            [self.binary, 'images', '--format', '{{.Repository}}:{{.Tag}}'], 30, keep_all=True, idempotent=True
+        )
+        if result.ok:
+            return [line for line in result.stdout.strip().split('\n') if line and line != '<none>:<none>']
+        return []
+
+    def _list_image_records(self) -> List[ImageRecord]:
+        """
+        List every local image, including untagged and intermediate ones.
+
+        Returns:
+            Image records from one ``images`` call plus batched ``image
+            inspect`` calls
+        """
+        result = self.runner.run([self.binary, 'images', '-a', '-q', '--no-trunc'], 30, keep_all=True, idempotent=True)
+        if not result.ok:
+            return []
+        ids = list(dict.fromkeys(line.strip() for line in result.stdout.splitlines() if line.strip()))
+        records = []
+        for start in range(0, len(ids), INSPECT_BATCH_SIZE):
+            result = self.runner.run(
+                [self.binary, 'image', 'inspect'] + ids[start:start + INSPECT_BATCH_SIZE], 60,
+                keep_all=True, idempotent=True
+            )
+            if result.returncode is None:
+                continue
+            # Images removed since they were listed are reported on stderr; the rest are still printed
+            records += [image_from_inspect(data) for data in json.loads(result.stdout or '[]')]
+        return records
+
+    def _remove_images(self, images: List[ImageRecord]) -> List[str]:
+        """
+        Remove a batch of images with a single ``rmi`` call.
+
+        Tagged images are removed by their tags, so an image with several
+        tags goes without ``--force``.
+
+        Returns:
+            IDs of the images that were deleted
+        """
+        references = [reference for image in images for reference in image.references]
+        result = self.runner.run([self.binary, 'rmi'] + references, 300, keep_all=True)
+        if not result.ok:
+            # rmi keeps going after a failure, so report it and count what went
+            for line in result.stderr.strip().splitlines():
+                logger.warning(line, extra={'phase': 'gc'})
+        return [image.id for image in images if image.id in result.stdout]
+
+    def _container_image(self, container: str) -> Optional[str]:
+        """
+        Get the image reference a container was created from.
+
+        Returns:
+            Image reference, or None if the container could not be inspected
+        """
+        record = self.inventory().get(container)
+        if record is not None and record.image:
+            return record.image
+
+        result = self.runner.run(
+            [self.binary, 'inspect', '--format', '{{.Config.Image}}', container], 10, idempotent=True, item=container
+        )
+        if result.ok:
+            return result.stdout.strip()
+        return None
+
+    def _local_repo_digests(self, image: str) -> List[str]:
+        """
+        Get the registry digests recorded for a local image.
+
+        Returns:
+            List of "repository@sha256:..." references, empty if the image
+            is unknown or was never pulled from a registry
+        """
+        result = self.runner.run(
+            [self.binary, 'image', 'inspect', '--format', '{{json .RepoDigests}}', image], 10,
+            keep_all=True, idempotent=True, item=image
+        )
+        if not result.ok:
+            return []
+        return json.loads(result.stdout.strip() or 'null') or []
+
+    @traced('{cls}.pull')
+    def _pull_image(self, image: str, quiet: bool = False) -> Optional[str]:
+        """
+        Pull an image.
+
+        Args:
+            image: Image reference to pull
+            quiet: If True, capture the CLI output instead of streaming it
+
+        Returns:
+            Pull output, or None if the pull failed; only the tail of a
+            long output is kept
+        """
+        annotate(registry=self._registry_host(image))
+        if quiet:
+            result = self.runner.run(
+                [self.binary, 'pull', image], 300, on_line=self._pull_progress(image), idempotent=True, item=image
+            )
+            return result.stdout if result.ok else None
+
+        result = self.runner.run([self.binary, 'pull', image], 300, capture=False, idempotent=True, item=image)
+        return '' if result.ok else None
+
+    @traced('{cls}.pull')
+    async def _async_pull_image(self, image: str) -> Optional[str]:
+        """
+        Pull an image as an asyncio subprocess, capturing its output.
+
+        Returns:
+            Pull output, or None if the pull failed
+        """
+        annotate(registry=self._registry_host(image))
+        result = await self.runner.run_async(
+            [self.binary, 'pull', image], 300, on_line=self._pull_progress(image), idempotent=True, item=image
+        )
+        return result.stdout if result.ok else None
+
+    @staticmethod
+    def _pull_progress(image: str) -> Callable[[str], None]:
+        """Log the lines of a captured pull as they arrive, at debug level."""
+        def log_line(line: str) -> None:
+            if line.strip():
+                logger.debug(line.strip(), extra={'item': image, 'phase': 'pull'})
+        return log_line
+
+    def _inspect_container(self, container: str) -> Optional[Dict]:
+        result = self.runner.run([self.binary, 'inspect', container], 10, keep_all=True, idempotent=True,
+                                 item=container)
+        if not result.ok:
+            return None
+        documents = json.loads(result.stdout or '[]')
+        return documents[0] if documents else None
+
+    def _inspect_image(self, image: str) -> Optional[Dict]:
+        result = self.runner.run([self.binary, 'image', 'inspect', image], 10, keep_all=True, idempotent=True,
+                                 item=image)
+        if not result.ok:
+            return None
+        documents = json.loads(result.stdout or '[]')
+        return documents[0] if documents else None
+
+    def _create_container(self, spec: ContainerSpec, name: str) -> bool:
+        result = self.runner.run([self.binary, 'create'] + spec.create_args(name), 60, item=name)
+        if not result.ok:
+            logger.error((result.stderr or '').strip() or result.describe(), extra={'item': name, 'phase': 'recreate'})
+            return False
+        for network, aliases in spec.extra_networks().items():
+            cmd = [self.binary, 'network', 'connect']
+            for alias in aliases:
+                cmd += ['--alias', alias]
+            if not self.runner.run(cmd + [network, name], 30, item=name).ok:
+                return False
+        return True
+
+    def _rename_container(self, container: str, new_name: str) -> bool:
+        return self.runner.run([self.binary, 'rename', container, new_name], 30, item=container).ok
+
+    def _start_container(self, container: str) -> bool:
+        return self.runner.run([self.binary, 'start', container], 60, item=container).ok
+
+    def _stop_container(self, container: str) -> bool:
+        return self.runner.run([self.binary, 'stop', container], 60, item=container).ok
+
+    def _remove_container(self, container: str) -> bool:
+        return self.runner.run([self.binary, 'rm', container], 30, item=container).ok
+
+    def _get_registry(self) -> RegistryClient:
+        if self._registry is None:
+            self._registry = RegistryClient(
+                insecure_registries=self.settings.get('insecure_registries', []),
+                credentials=self.settings.get('registry_auth', {}),
+            )
+        return self._registry
+
+    def _check_image_digest(self, image: str) -> Optional[str]:
+        """
+        Compare a local image against its registry manifest without pulling.
+
+        Args:
+            image: Image reference to check
+
+        Returns:
+            Remote manifest digest if it differs from every local repo
+            digest, None if the image is current or cannot be compared
+        """
+        host, _, _ = parse_image_reference(image)
+        if host == 'localhost':
+            # Podman names local builds localhost/<name>; there is no registry behind them
+            return None
+
+        local_digests = {ref.split('@', 1)[1] for ref in self._local_repo_digests(image) if '@' in ref}
+        if not local_digests:
+            # Locally built or loaded images have nothing to compare against
+            return None
+
+        remote_digest = self._get_registry().manifest_digest(image)
+        if remote_digest and remote_digest not in local_digests:
+            return remote_digest
+        return None
+
+    @traced('{cls}.check_image')
+    def _check_image(self, image: str) -> Optional[str]:
+        """
+        Check a single image for an update.
+
+        Returns:
+            Available version (remote digest in digest mode, "latest" in
+            pull mode), or None if the image is up to date
+        """
+        logger.info(f"Checking for updates: {image}", extra={'item': image, 'phase': 'check'})
+        if self.check_mode == 'digest':
+            return self._check_image_digest(image)
+
+        # Pull latest image
+        return self._pulled_version(self._pull_image(image, quiet=True))
+
+    @traced('{cls}.check_image')
+    async def _async_check_image(self, image: str) -> Optional[str]:
+        """Async counterpart of _check_image; pull-mode checks run as asyncio subprocesses."""
+        if self.check_mode == 'digest':
+            return await run_blocking(self._check_image, image)
+        logger.info(f"Checking for updates: {image}", extra={'item': image, 'phase': 'check'})
+        return self._pulled_version(await self._async_pull_image(image))
+
+    @staticmethod
+    def _pulled_version(output: Optional[str]) -> Optional[str]:
+        if output is not None and 'Image is up to date' not in output:
+            return 'latest'
+        return None
+
+    def _registry_host(self, image: str) -> str:
+        return parse_image_reference(image)[0]
+
+    def check_updates(self, item: Optional[str] = None) -> Dict[str, str]:
+        """
+        Check for available updates for images.
+
+        Args:
+            item: Optional specific image to check. A container name is
+                accepted too and resolves to the container's image.
+
+        Returns:
+            Dictionary of images with available updates, in listing order
+        """
+        return dict(self._iter_updates(item, ordered=True))
+
+    def iter_updates(self, item: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Check images for updates, yielding each update as its check finishes.
+
+        With ``check_mode`` set to ``digest`` the local repo digest is
+        compared with the registry manifest digest and nothing is pulled.
+        Images are checked concurrently by ``check_workers`` workers, with
+        per-registry caps taken from the ``registry_limits`` setting.
+
+        Results are kept in the state store. An image checked less than
+        ``check_ttl`` seconds ago reuses its stored result, and digest
+        checks revalidate the stored manifest ETag with a conditional
+        request instead of resolving the tag from scratch.
+
+        Args:
+            item: Optional specific image to check. A container name is
+                accepted too and resolves to the container's image.
+
+        Yields:
+            (image, available version) pairs in completion order
+        """
+        return self._iter_updates(item, ordered=False)
+
+    def _iter_updates(self, item: Optional[str], ordered: bool) -> Iterator[Tuple[str, str]]:
+        if not self.check_available():
+            return
+
+        images = self._check_targets(item)
+        engine = CheckEngine(
+            workers=self.config.get('check_workers', 4),
+            limits=self.settings.get('registry_limits', DEFAULT_REGISTRY_LIMITS),
+        )
+        store, previous, ttl = self._load_check_state(images)
+        checked: List[ItemState] = []
+
+        def check(image: str) -> Optional[str]:
+            state = previous.get(image)
+            if state is not None and state.fresh(ttl):
+                return state.version
+            version = self._check_image(image)
+            checked.append(self._checked_state(image, version))
+            return version
+
+        groups = [images]
+        if self.check_mode == 'pull':
+            # Pull-mode checks pull every stale image, so order them by shared layers
+            fresh = [image for image in images if image in previous and previous[image].fresh(ttl)]
+            stale = [image for image in images if image not in fresh]
+            if len(stale) > 1:
+                groups = [fresh] + self._plan_pulls(stale)
+
+        try:
+            if len(groups) == 1:
+                yield from engine.iter_run(images, check, key=self._registry_host, ordered=ordered)
+                return
+            results = (
+                update for group in groups
+                for update in engine.iter_run(group, check, key=self._registry_host, ordered=ordered)
+            )
+            if ordered:
+                found = dict(results)
+                yield from ((image, found[image]) for image in images if image in found)
+            else:
+                yield from results
+        finally:
+            store.record(checked)
+
+    async def async_check_updates(self, item: Optional[str] = None) -> Dict[str, str]:
+        """
+        Async counterpart of check_updates.
+
+        Pull-mode checks run as asyncio subprocesses under the same
+        ``check_workers`` and ``registry_limits`` caps, and are stopped
+        when the task is cancelled.
+
+        Args:
+            item: Optional specific image or container to check
+
+        Returns:
+            Dictionary of images with available updates, in listing order
+        """
+        if not self.check_available():
+            return {}
+
+        images = await run_blocking(self._check_targets, item)
+        store, previous, ttl = self._load_check_state(images)
+        limiter = AsyncKeyedLimiter(self.settings.get('registry_limits', DEFAULT_REGISTRY_LIMITS))
+        workers = asyncio.Semaphore(max(1, int(self.config.get('check_workers', 4))))
+        checked: List[ItemState] = []
+
+        async def check(image: str) -> Optional[str]:
+            state = previous.get(image)
+            if state is not None and state.fresh(ttl):
+                return state.version
+            try:
+                async with workers:
+                    version = await limiter.run(self._registry_host(image), lambda: self._async_check_image(image))
+            except Exception as e:
+                logger.error(f"Error checking updates for {image}: {e}", extra={'item': image, 'phase': 'check'})
+                return None
+            checked.append(self._checked_state(image, version))
+            return version
+
+        groups = [images]
+        if self.check_mode == 'pull':
+            stale = [image for image in images if not (image in previous and previous[image].fresh(ttl))]
+            if len(stale) > 1:
+                groups = [[image for image in images if image not in stale]]
+                groups += await run_blocking(self._plan_pulls, stale)
+
+        versions: Dict[str, Optional[str]] = {}
+        try:
+            for group in groups:
+                versions.update(zip(group, await asyncio.gather(*(check(image) for image in group))))
+        finally:
+            store.record(checked)
+        return {image: versions[image] for image in images if versions.get(image) is not None}
+
+    def _check_targets(self, item: Optional[str]) -> List[str]:
+        if item:
+            record = self.inventory().get(item)
+            if record is not None:
+                return [record.image] if self._container_decision(item).allowed else []
+            images = [item]
+        else:
+            images = self.list_images()
+        if not self.policy:
+            return images
+        decisions = self._image_decisions(images)
+        return [image for image in images if decisions[image].allowed]
+
+    def _upgrade_targets(self, item: Optional[str]) -> List[str]:
+        """
+        Get the containers to upgrade, reporting those the policy skips.
+
+        Returns:
+            Allowed containers, in listing order
+        """
+        self.skipped = {}
+        if item:
+            decision = self._container_decision(item)
+            if not decision.allowed:
+                self.skipped[item] = decision
+            containers = [item] if decision.allowed else []
+        else:
+            containers = self.list_items()
+            if self.policy:
+                listed = set(containers)
+                for name in self._list_container_names():
+                    if name not in listed:
+                        self.skipped[name] = self._container_decision(name)
+        self._report_skipped(self.skipped)
+        return containers
+
+    def _load_check_state(self, images: List[str]) -> Tuple[StateStore, Dict[str, ItemState], float]:
+        """
+        Load stored check state, seeding the registry's ETag validators in digest mode.
+
+        Returns:
+            Tuple of (state store, stored state per image, TTL in seconds)
+        """
+        store = self.state_store()
+        previous = store.load(self.config_section)
+        if self.check_mode == 'digest':
+            registry = self._get_registry()
+            for image in images:
+                state = previous.get(image)
+                if state is not None and state.etag and state.digest and image not in registry.validators:
+                    registry.validators[image] = (state.etag, state.digest)
+        return store, previous, float(self.config.get('check_ttl', 0))
+
+    def _checked_state(self, image: str, version: Optional[str]) -> ItemState:
+        etag, digest = None, None
+        if self.check_mode == 'digest':
+            etag, digest = self._get_registry().validators.get(image, (None, None))
+        return ItemState(self.config_section, image, version, digest, etag, time.time())
+
+    @traced('{cls}.plan_pulls')
+    def _plan_pulls(self, images: List[str]) -> List[List[str]]:
+        """
+        Order pulls with the layer-aware pull planner.
+
+        The planner fetches the manifests of every image and of its local
+        copy, logs the predicted download and disk use, and warns when
+        the predicted disk use exceeds the free space under
+        ``storage_path``. Planning only runs when ``pull_planning`` is
+        enabled, since it talks to registries directly like the digest
+        check mode, and falls back to a single wave when it fails.
+
+        Args:
+            images: Distinct image references about to be pulled
+
+        Returns:
+            Waves of images; each wave is pulled after the previous one
+        """
+        if not images:
+            return []
+        if not self.settings.get('pull_planning', False):
+            return [images]
+
+        planner = PullPlanner(
+            self._get_registry(),
+            self._local_repo_digests,
+            KeyedLimiter(self.settings.get('registry_limits', DEFAULT_REGISTRY_LIMITS)),
+            workers=self.settings.get('pull_concurrency', 4),
+            unpack_ratio=float(self.settings.get('unpack_ratio', DEFAULT_UNPACK_RATIO)),
+        )
+        try:
+            plan = planner.plan(images)
+        except Exception as e:
+            logger.warning(f"Pull planning failed, pulling in listing order: {e}", extra={'phase': 'plan'})
+            return [images]
+
+        logger.info(plan.summary(), extra={'phase': 'plan'})
+        storage_path = self.settings.get('storage_path')
+        if storage_path:
+            try:
+                free = shutil.disk_usage(storage_path).free
+            except OSError as e:
+                logger.warning(f"Cannot check free space under {storage_path}: {e}", extra={'phase': 'plan'})
+            else:
+                if plan.disk_bytes > free:
+                    logger.warning(f"The pulls may need {format_bytes(plan.disk_bytes)} "
+                                   f"but only {format_bytes(free)} is free under {storage_path}",
+                                   extra={'phase': 'plan'})
+        return plan.waves
+
+    @traced('{cls}.prepull')
+    def _prepull_images(self, images: List[str]) -> Dict[str, bool]:
+        """
+        Pull images in parallel ahead of any container restart.
+
+        Pulls are bounded by the ``pull_concurrency`` setting and by the
+        per-registry ``registry_limits``. Output is captured so concurrent
+        pulls do not interleave on the terminal. Images are pulled in the
+        waves of the pull plan, so layers shared between images are
+        downloaded once before the images sharing them fan out.
+
+        Args:
+            images: Distinct image references to pull
+
+        Returns:
+            Mapping of image to whether its pull succeeded
+        """
+        limiter = KeyedLimiter(self.settings.get('registry_limits', DEFAULT_REGISTRY_LIMITS))
+
+        def pull(image: str) -> bool:
+            logger.info(f"Pulling latest image: {image}", extra={'item': image, 'phase': 'pull'})
+            start = time.monotonic()
+            try:
+                pulled = self._pull_image(image, quiet=True) is not None
+            except Exception as e:
+                logger.error(f"Error pulling {image}: {e}", extra={'item': image, 'phase': 'pull'})
+                return False
+            self._log_pull(image, pulled, time.monotonic() - start)
+            return pulled
+
+        pulled: Dict[str, bool] = {}
+        for wave in self._plan_pulls(images):
+            workers = int(self.settings.get('pull_concurrency', 4))
+            pulled.update(map_limited(pull, wave, self._registry_host, limiter, workers))
+        return {image: pulled[image] for image in images}
+
+    @traced('{cls}.prepull')
+    async def _async_prepull_images(self, images: List[str]) -> Dict[str, bool]:
+        """Async counterpart of _prepull_images."""
+        limiter = AsyncKeyedLimiter(self.settings.get('registry_limits', DEFAULT_REGISTRY_LIMITS))
+        workers = asyncio.Semaphore(max(1, int(self.settings.get('pull_concurrency', 4))))
+
+        async def pull(image: str) -> bool:
+            async with workers:
+                logger.info(f"Pulling latest image: {image}", extra={'item': image, 'phase': 'pull'})
+                start = time.monotonic()
+                try:
+                    pulled = await limiter.run(
+                        self._registry_host(image), lambda: self._async_pull_image(image)
+                    ) is not None
+                except Exception as e:
+                    logger.error(f"Error pulling {image}: {e}", extra={'item': image, 'phase': 'pull'})
+                    return False
+                self._log_pull(image, pulled, time.monotonic() - start)
+                return pulled
+
+        pulled: Dict[str, bool] = {}
+        for wave in await run_blocking(self._plan_pulls, images):
+            pulled.update(zip(wave, await asyncio.gather(*(pull(image) for image in wave))))
+        return {image: pulled[image] for image in images}
+
+    @traced('{cls}.image_gc')
+    def collect_garbage(self, dry_run: bool = False) -> GCReport:
+        """
+        Remove images nothing references any more.
+
+        A reference index records every image used by a container (running
+        or stopped), matching a ``gc_retain`` pattern, or parenting another
+        image. With ``gc_scope`` ``dangling`` (default) only untagged
+        images, such as the old versions left behind by an upgrade, are
+        removed; with ``unused`` every unreferenced image is. Removal runs
+        in batches of ``gc_batch_size`` images per ``rmi`` call.
+
+        Args:
+            dry_run: If True, only report what would be removed
+
+        Returns:
+            Report with the candidates, reclaimable bytes and removed IDs
+        """
+        index = ImageReferenceIndex(
+            self._list_image_records(), self.inventory(), self.settings.get('gc_retain', [])
+        )
+        candidates = index.unreferenced(self.settings.get('gc_scope', 'dangling'))
+        report = GCReport(
+            candidates=candidates,
+            reclaimable_bytes=index.reclaimable_bytes(candidates),
+            referenced=len([image for image in index.images if index.referenced(image)]),
+            dry_run=dry_run,
+        )
+
+        if dry_run:
+            for image in candidates:
+                logger.info(f"[DRY RUN] Would remove image {image.references[0]} ({format_bytes(image.size)})",
+                            extra={'item': image.references[0], 'phase': 'gc'})
+        elif candidates:
+            batch_size = max(1, int(self.settings.get('gc_batch_size', DEFAULT_GC_BATCH_SIZE)))
+            for start in range(0, len(candidates), batch_size):
+                report.removed += self._remove_images(candidates[start:start + batch_size])
+            removed = set(report.removed)
+            report.reclaimed_bytes = index.reclaimable_bytes([image for image in candidates if image.id in removed])
+        logger.info(report.summary(), extra={'phase': 'gc'})
+        return report
+
+    def _run_image_gc(self, dry_run: bool = False) -> None:
+        """Run image GC as part of an upgrade, if enabled; failures only warn."""
+        if not self.settings.get('image_gc', False):
+            return
+        try:
+            self.collect_garbage(dry_run)
+        except Exception as e:
+            logger.warning(f"Image GC failed: {e}", extra={'phase': 'gc'})
+
+    @traced('{cls}.recreate')
+    def _recreate_container(self, container: str, image: str) -> Optional[float]:
+        """
+        Replace a container with an identical one created from its pulled image.
+
+        The replacement is created under a temporary name before the old
+        container is touched, and the old one is renamed aside while it is
+        still running, so the container is only down between stopping the
+        old one and starting the new one. If the replacement fails to
+        start, the old container is restored and started again.
+
+        Args:
+            container: Container name or ID
+            image: Image reference to recreate it from, already pulled
+
+        Returns:
+            Downtime in seconds (0 if the container was not running or
+            already used the image), or None if it was not replaced
+        """
+        record = self.inventory().get(container)
+        data = record.details if record is not None and record.details else self._inspect_container(container)
+        if data is None:
+            logger.warning(f"Failed to inspect container {container}", extra={'item': container, 'phase': 'recreate'})
+            return None
+        new_image = self._inspect_image(image) or {}
+        if new_image.get('Id') and new_image['Id'] == data.get('Image'):
+            logger.info(f"{container} already runs the latest {image}", extra={'item': container, 'phase': 'recreate'})
+            return 0.0
+
+        spec = container_spec(data, self._inspect_image(data.get('Image', '')))
+        spec.image = image
+        name = spec.name or container
+        staged, retired = f"{name}-upgradeapp-new", f"{name}-upgradeapp-old"
+
+        fields = {'item': name, 'phase': 'recreate'}
+        logger.info(f"Creating replacement for {name} from {image}", extra=fields)
+        if not self._create_container(spec, staged):
+            logger.warning(f"Failed to create a replacement for {name}; it keeps running", extra=fields)
+            self._remove_container(staged)
+            return None
+        if not self._rename_container(name, retired):
+            logger.warning(f"Failed to rename {name}; it keeps running", extra=fields)
+            self._remove_container(staged)
+            return None
+        if not self._rename_container(staged, name):
+            logger.warning(f"Failed to rename the replacement for {name}; it keeps running", extra=fields)
+            self._rename_container(retired, name)
+            self._remove_container(staged)
+            return None
+
+        logger.info(f"Swapping container: {name}", extra=fields)
+        started = time.monotonic()
+        if spec.running and not self._stop_container(retired):
+            logger.warning(f"Failed to stop container {name}; it keeps running", extra=fields)
+            self._restore_container(name, retired, start=False)
+            return None
+        if spec.running and not self._start_container(name):
+            logger.warning(f"Replacement for {name} failed to start; restoring the old container", extra=fields)
+            self._restore_container(name, retired, start=True)
+            return None
+        downtime = time.monotonic() - started if spec.running else 0.0
+
+        if not self._remove_container(retired):
+            logger.warning(f"Failed to remove the old container, left as {retired}", extra=fields)
+        return downtime
+
+    def _restore_container(self, name: str, retired: str, start: bool) -> None:
+        """Put a retired container back in place of a failed replacement."""
+        self._remove_container(name)
+        if not self._rename_container(retired, name):
+            logger.warning(f"The old container is left as {retired}", extra={'item': name, 'phase': 'recreate'})
+            name = retired
+        if start and not self._start_container(name):
+            logger.warning(f"Failed to restart the old container {name}", extra={'item': name, 'phase': 'recreate'})
+
+    def upgrade(self, item: Optional[str] = None, dry_run: bool = False) -> bool:
+        """
+        Upgrade containers by pulling latest images and recreating containers.
+
+        The upgrade runs in phases: resolve every container's image, pull
+        all distinct images in parallel, and only then swap containers.
+        Each replacement is created before its predecessor is stopped, so
+        a container is only down between the old one stopping and the new
+        one starting. The measured downtimes are kept in ``downtimes``.
+        With ``image_gc`` enabled, a successful upgrade ends with
+        collect_garbage, and a dry run reports what it would remove.
+        Containers the policy rejects are left alone and kept in
+        ``skipped``.
+
+        Args:
+            item: Optional specific container to upgrade. If None, upgrade all.
+            dry_run: If True, only simulate the upgrade.
+
+        Returns:
+            True if every container was upgraded, False otherwise
+        """
+        if not self.check_available():
+            logger.error(f"{self.display_name} is not available", extra={'item': item, 'phase': 'upgrade'})
+            return False
+
+        try:
+            containers = self._upgrade_targets(item)
+            if item and not containers:
+                return True
+            if dry_run:
+                self._log_dry_run(containers)
+                self._run_image_gc(dry_run=True)
+                return True
+
+            # Phase 1: resolve the image used by each container
+            targets = self._resolve_targets(containers)
+
+            # Phase 2: pull every distinct image before touching any container
+            logger.info(f"Pre-pulling {len(set(targets.values()))} image(s)", extra={'phase': 'pull'})
+            pulled = self._prepull_images(list(dict.fromkeys(targets.values())))
+
+            # Phase 3: swap in containers recreated from the new images
+            success = self._restart_pulled(targets, pulled)
+
+            # Phase 4: remove the image versions no container uses any more
+            if success:
+                self._run_image_gc()
+            return success
+        except Exception as e:
+            logger.error(f"Error during {self.display_name} upgrade: {e}", extra={'item': item, 'phase': 'upgrade'})
+            return False
+
+    async def async_upgrade(self, item: Optional[str] = None, dry_run: bool = False) -> bool:
+        """
+        Async counterpart of upgrade.
+
+        Images are pulled as asyncio subprocesses, so cancelling the task
+        during the long pull phase stops the pulls before any container
+        has been touched.
+
+        Args:
+            item: Optional specific container to upgrade. If None, upgrade all.
+            dry_run: If True, only simulate the upgrade.
+
+        Returns:
+            True if upgrade was successful, False otherwise
+        """
+        if not self.check_available():
+            logger.error(f"{self.display_name} is not available", extra={'item': item, 'phase': 'upgrade'})
+            return False
+
+        try:
+            containers = await run_blocking(self._upgrade_targets, item)
+            if item and not containers:
+                return True
+            if dry_run:
+                self._log_dry_run(containers)
+                await run_blocking(self._run_image_gc, True)
+                return True
+
+            targets = await run_blocking(self._resolve_targets, containers)
+            logger.info(f"Pre-pulling {len(set(targets.values()))} image(s)", extra={'phase': 'pull'})
+            pulled = await self._async_prepull_images(list(dict.fromkeys(targets.values())))
+            success = await run_blocking(self._restart_pulled, targets, pulled)
+            if success:
+                await run_blocking(self._run_image_gc)
+            return success
+        except Exception as e:
+            logger.error(f"Error during {self.display_name} upgrade: {e}", extra={'item': item, 'phase': 'upgrade'})
+            return False
+
+    @staticmethod
+    def _log_dry_run(containers: List[str]) -> None:
+        for container in containers:
+            fields = {'item': container, 'phase': 'upgrade'}
+            logger.info(f"[DRY RUN] Upgrading container: {container}", extra=fields)
+            logger.info(f"Would pull latest image for {container}", extra=fields)
+            logger.info(f"Would recreate container {container}", extra=fields)
+
+    @staticmethod
+    def _log_pull(image: str, pulled: bool, duration: float) -> None:
+        fields = {'item': image, 'phase': 'pull', 'duration': duration}
+        if pulled:
+            logger.info(f"Pulled {image} in {duration:.1f}s", extra=fields)
+        else:
+            logger.error(f"Failed to pull {image} after {duration:.1f}s", extra=fields)
+
+    @traced('{cls}.resolve')
+    def _resolve_targets(self, containers: List[str]) -> Dict[str, str]:
+        targets = {}
+        for container in containers:
+            image = self._container_image(container)
+            if image:
+                targets[container] = image
+        return targets
+
+    @traced('{cls}.swap')
+    def _restart_pulled(self, targets: Dict[str, str], pulled: Dict[str, bool]) -> bool:
+        self.downtimes = {}
+        success = True
+        for container, image in targets.items():
+            logger.info(f"Upgrading container: {container}", extra={'item': container, 'phase': 'swap'})
+            if not pulled.get(image):
+                logger.warning(f"Failed to pull image {image}", extra={'item': container, 'phase': 'swap'})
+                success = False
+                continue
+            downtime = self._recreate_container(container, image)
+            if downtime is None:
+                success = False
+                continue
+            self.downtimes[container] = downtime
+            if downtime:
+                logger.info(f"Recreated {container} with {downtime:.2f}s downtime",
+                            extra={'item': container, 'phase': 'swap', 'duration': downtime})
+
+        if self.downtimes:
+            total = sum(self.downtimes.values())
+            logger.info(f"Total downtime: {total:.2f}s across {len(self.downtimes)} container(s)",
+                        extra={'phase': 'swap', 'duration': total})
+
+        # Upgraded images must be checked afresh, whatever their TTL
+        self.state_store().forget(self.config_section, [image for image in targets.values() if pulled.get(image)])
+        self._inventory = None
+        return success
+
+
+def _tagged(image: str) -> str:
+    """Image reference with the implicit ``latest`` tag spelled out."""
+    if '@' in image or ':' in image.rsplit('/', 1)[-1]:
+        return image
+    return image + ':latest'
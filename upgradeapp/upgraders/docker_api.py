@@ -0,0 +1,423 @@
+"""
+Minimal Docker Engine API client speaking HTTP over the local Unix socket.
+"""
+
+import base64
+import http.client
+import json
+import os
+import queue
+import socket
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from ..utils.tracing import annotate, span
+
+
+DEFAULT_SOCKET = '/var/run/docker.sock'
+
+DOCKER_HUB_AUTH_KEY = 'https://index.docker.io/v1/'
+
+# Final path segments naming an operation on a container, image or network
+_ACTIONS = ('json', 'start', 'stop', 'rename', 'connect', 'disconnect')
+
+
+class DockerAPIError(Exception):
+    """Raised when the Docker Engine API returns an error response."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+    def is_auth_error(self) -> bool:
+        """
+        Check whether the daemon refused a pull for lack of credentials.
+
+        Returns:
+            True for "unauthorized" / "pull access denied" style failures
+        """
+        message = self.message.lower()
+        return self.status in (401, 403) or 'denied' in message or 'unauthorized' in message \
+            or 'authentication required' in message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection that connects to a Unix domain socket."""
+
+    def __init__(self, socket_path: str, timeout: float = 60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def socket_from_env() -> Optional[str]:
+    """
+    Resolve the Docker socket path from the environment.
+
+    Returns:
+        Socket path from DOCKER_HOST, the default socket path if DOCKER_HOST
+        is unset, or None if DOCKER_HOST points at a non-Unix endpoint
+    """
+    docker_host = os.environ.get('DOCKER_HOST')
+    if not docker_host:
+        return DEFAULT_SOCKET
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://'):]
+    return None
+
+
+def split_image_reference(image: str) -> Tuple[str, str]:
+    """
+    Split an image reference into repository and tag/digest.
+
+    Args:
+        image: Image reference such as "nginx", "nginx:1.25" or
+            "registry:5000/team/app@sha256:..."
+
+    Returns:
+        Tuple of (repository, tag or digest), with the tag defaulting to "latest"
+    """
+    if '@' in image:
+        repository, digest = image.split('@', 1)
+        return repository, digest
+    last_slash = image.rfind('/')
+    last_colon = image.rfind(':')
+    if last_colon > last_slash:
+        return image[:last_colon], image[last_colon + 1:]
+    return image, 'latest'
+
+
+def registry_auth_header(image: str, config_dir: Optional[str] = None) -> Optional[str]:
+    """
+    Build the X-Registry-Auth header for pulling an image.
+
+    Credentials are read from the inline ``auths`` entries of the docker CLI
+    configuration (``$DOCKER_CONFIG/config.json`` or ``~/.docker/config.json``).
+    Credential helpers are not executed.
+
+    Args:
+        image: Image reference being pulled
+        config_dir: Optional docker CLI configuration directory
+
+    Returns:
+        Encoded header value, or None if no credentials are stored
+    """
+    config_dir = config_dir or os.environ.get('DOCKER_CONFIG') or os.path.expanduser('~/.docker')
+    try:
+        with open(os.path.join(config_dir, 'config.json'), 'r') as f:
+            auths = json.load(f).get('auths', {})
+    except (OSError, ValueError):
+        return None
+
+    repository, _ = split_image_reference(image)
+    first, _, rest = repository.partition('/')
+    if rest and ('.' in first or ':' in first or first == 'localhost'):
+        server = first
+    else:
+        server = DOCKER_HUB_AUTH_KEY
+
+    for key, entry in auths.items():
+        host = key.split('://', 1)[-1].split('/', 1)[0]
+        if key != server and host != server and not (server == DOCKER_HUB_AUTH_KEY and host == 'docker.io'):
+            continue
+        if not entry.get('auth'):
+            return None
+        username, _, password = base64.b64decode(entry['auth']).decode().partition(':')
+        payload = json.dumps({'username': username, 'password': password, 'serveraddress': key})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+    return None
+
+
+class DockerEngineClient:
+    """Client for the Docker Engine API with a pool of keep-alive connections."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, timeout: float = 60, pool_size: int = 4):
+        """
+        Initialize the client.
+
+        Args:
+            socket_path: Path to the Docker daemon Unix socket
+            timeout: Default socket timeout in seconds
+            pool_size: Maximum number of idle connections kept open
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[UnixHTTPConnection]" = queue.LifoQueue(maxsize=pool_size)
+
+    def _acquire(self) -> UnixHTTPConnection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+
+    def _release(self, conn: UnixHTTPConnection) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        headers: Optional[Dict[str, str]] = None,
+        body: Optional[Any] = None
+    ) -> Tuple[int, bytes]:
+        """
+        Send a request and read the full response body.
+
+        A ``body`` is sent as JSON.
+
+        A connection taken from the pool may have been closed by the daemon
+        while idle, so a failed send on a reused connection is retried once
+        on a fresh one.
+
+        Returns:
+            Tuple of (HTTP status, response body)
+        """
+        url = path
+        if params:
+            url = f"{path}?{urlencode(params)}"
+
+        with span(f"docker-api {method} {_route(path)}", 'http', path=url) as request_span:
+            status, response_body = self._send(method, url, timeout, headers, body)
+            request_span.set(status=status, output_bytes=len(response_body))
+        return status, response_body
+
+    def _send(self, method: str, url: str, timeout: Optional[float], headers: Optional[Dict[str, str]],
+              body: Optional[Any]) -> Tuple[int, bytes]:
+        for attempt in range(2):
+            conn = self._acquire() if attempt == 0 else UnixHTTPConnection(self.socket_path, self.timeout)
+            reused = conn.sock is not None
+            try:
+                if timeout is not None:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                if body is not None:
+                    headers = {'Content-Type': 'application/json', **(headers or {})}
+                conn.request(method, url, body=json.dumps(body) if body is not None else None,
+                             headers={'Host': 'docker', **(headers or {})})
+                response = conn.getresponse()
+                response_body = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            if timeout is not None:
+                conn.timeout = self.timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(self.timeout)
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, response_body
+
+        raise ConnectionError(f"Could not reach Docker daemon at {self.socket_path}")
+
+    def _json(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+              timeout: Optional[float] = None, payload: Optional[Any] = None) -> Any:
+        status, body = self._request(method, path, params, timeout, body=payload)
+        if status >= 400:
+            raise DockerAPIError(status, _error_message(body))
+        return json.loads(body) if body else None
+
+    def ping(self) -> bool:
+        """
+        Check that the daemon answers on the socket.
+
+        Returns:
+            True if the daemon responded with OK, False otherwise
+        """
+        try:
+            status, body = self._request('GET', '/_ping', timeout=5)
+        except (OSError, http.client.HTTPException):
+            # Nothing listening, or something that does not speak HTTP
+            return False
+        return status == 200 and body.strip() == b'OK'
+
+    def list_containers(self, all: bool = True) -> List[Dict[str, Any]]:
+        """
+        List containers, equivalent to `docker ps [-a]`.
+
+        Returns:
+            List of container summaries
+        """
+        return self._json('GET', '/containers/json', {'all': '1' if all else '0'}) or []
+
+    def list_images(self, all: bool = False, shared_size: bool = False) -> List[Dict[str, Any]]:
+        """
+        List images, equivalent to `docker images [-a]`.
+
+        Args:
+            all: Include intermediate images
+            shared_size: Ask the daemon to compute each image's SharedSize
+
+        Returns:
+            List of image summaries
+        """
+        params = {}
+        if all:
+            params['all'] = '1'
+        if shared_size:
+            params['shared-size'] = '1'
+        return self._json('GET', '/images/json', params or None) or []
+
+    def inspect_container(self, container: str) -> Dict[str, Any]:
+        """
+        Inspect a container, equivalent to `docker inspect`.
+
+        Returns:
+            Container details
+        """
+        return self._json('GET', f"/containers/{quote(container, safe='')}/json", timeout=10)
+
+    def inspect_image(self, image: str) -> Dict[str, Any]:
+        """
+        Inspect an image, equivalent to `docker image inspect`.
+
+        Returns:
+            Image details
+        """
+        return self._json('GET', f"/images/{quote(image, safe='/:@')}/json", timeout=10)
+
+    def pull_image(self, image: str, timeout: float = 300) -> str:
+        """
+        Pull an image, equivalent to `docker pull`.
+
+        Args:
+            image: Image reference to pull
+            timeout: Socket timeout for the pull in seconds
+
+        Returns:
+            The final status line reported by the daemon, e.g.
+            "Status: Image is up to date for nginx:latest"; the bytes of
+            the layers downloaded are attached to the open tracing span as
+            ``pull_bytes``
+        """
+        repository, tag = split_image_reference(image)
+        headers = {}
+        auth = registry_auth_header(image)
+        if auth:
+            headers['X-Registry-Auth'] = auth
+        status, body = self._request(
+            'POST', '/images/create', {'fromImage': repository, 'tag': tag}, timeout=timeout, headers=headers
+        )
+        if status >= 400:
+            raise DockerAPIError(status, _error_message(body))
+
+        last_status = ''
+        # Compressed size of each layer the daemon downloaded
+        downloaded: Dict[str, int] = {}
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if 'error' in message:
+                raise DockerAPIError(status, message['error'])
+            if 'status' in message:
+                last_status = message['status']
+            total = (message.get('progressDetail') or {}).get('total')
+            if message.get('status') == 'Downloading' and message.get('id') and total:
+                downloaded[message['id']] = total
+        annotate(pull_bytes=sum(downloaded.values()))
+        return last_status
+
+    def stop_container(self, container: str, timeout: float = 60) -> None:
+        """Stop a container, equivalent to `docker stop`."""
+        status, body = self._request(
+            'POST', f"/containers/{quote(container, safe='')}/stop", timeout=timeout
+        )
+        # 304 means the container was already stopped
+        if status >= 400:
+            raise DockerAPIError(status, _error_message(body))
+
+    def create_container(self, name: str, config: Dict[str, Any]) -> str:
+        """
+        Create a container, equivalent to `docker create`.
+
+        Args:
+            name: Name of the new container
+            config: Create body with Image, Env, HostConfig, NetworkingConfig, ...
+
+        Returns:
+            ID of the new container
+        """
+        return self._json('POST', '/containers/create', {'name': name}, timeout=60, payload=config)['Id']
+
+    def start_container(self, container: str) -> None:
+        """Start a container, equivalent to `docker start`."""
+        status, body = self._request('POST', f"/containers/{quote(container, safe='')}/start", timeout=60)
+        # 304 means the container was already running
+        if status >= 400:
+            raise DockerAPIError(status, _error_message(body))
+
+    def rename_container(self, container: str, name: str) -> None:
+        """Rename a container, equivalent to `docker rename`."""
+        status, body = self._request(
+            'POST', f"/containers/{quote(container, safe='')}/rename", {'name': name}, timeout=30
+        )
+        if status >= 400:
+            raise DockerAPIError(status, _error_message(body))
+
+    def connect_network(self, network: str, container: str, aliases: Optional[List[str]] = None) -> None:
+        """Connect a container to a network, equivalent to `docker network connect`."""
+        payload = {'Container': container, 'EndpointConfig': {'Aliases': aliases or []}}
+        status, body = self._request(
+            'POST', f"/networks/{quote(network, safe='')}/connect", timeout=30, body=payload
+        )
+        if status >= 400:
+            raise DockerAPIError(status, _error_message(body))
+
+    def remove_image(self, image: str) -> List[Dict[str, str]]:
+        """
+        Remove an image or one of its tags, equivalent to `docker rmi`.
+
+        Returns:
+            The daemon's ``Untagged`` and ``Deleted`` entries
+        """
+        return self._json('DELETE', f"/images/{quote(image, safe='/:@')}", timeout=60) or []
+
+    def remove_container(self, container: str) -> None:
+        """Remove a container, equivalent to `docker rm`."""
+        status, body = self._request('DELETE', f"/containers/{quote(container, safe='')}", timeout=30)
+        if status >= 400:
+            raise DockerAPIError(status, _error_message(body))
+
+
+def _route(path: str) -> str:
+    """Path with the container, image or network name replaced, e.g. ``/containers/{id}/start``."""
+    resource, *rest = path.strip('/').split('/')
+    if not rest or (len(rest) == 1 and rest[0] in ('json', 'create')):
+        return '/' + '/'.join([resource] + rest)
+    action = rest[-1] if len(rest) > 1 and rest[-1] in _ACTIONS else None
+    return f"/{resource}/{{id}}" + (f"/{action}" if action else '')
+
+
+def _error_message(body: bytes) -> str:
+    try:
+        return json.loads(body).get('message', '')
+    except (ValueError, AttributeError):
+        return body.decode('utf-8', errors='replace').strip()
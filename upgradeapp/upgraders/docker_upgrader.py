@@ -2,177 +2,249 @@
 Docker upgrader for Docker containers and images.
 """
 
-import subprocess
+import http.client
+import logging
+import os
 from typing import Dict, List, Optional
 
-from .base import BaseUpgrader
+from ..utils.aio import run_blocking
+from ..utils.tracing import annotate, traced
+from .container import ContainerUpgrader
+from .docker_api import DockerAPIError, DockerEngineClient, socket_from_env
+from .image_gc import ImageRecord, image_from_summary, normalize_image_id
+from .inventory import ContainerInventory, record_from_summary
+from .recreate import ContainerSpec
 
+logger = logging.getLogger(__name__)
 
-class DockerUpgrader(BaseUpgrader):
-    """Upgrader for Docker containers and images."""
 
-    def check_available(self) -> bool:
-        """
-        Check if Docker is available on the system.
+class DockerUpgrader(ContainerUpgrader):
+    """
+    Upgrader for Docker containers and images.
 
-        Returns:
-            True if Docker is available, False otherwise
-        """
-        try:
-            result = subprocess.run(
-                ['docker', '--version'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            return False
+    Operations go through the Docker Engine API on the daemon socket when it
+    is reachable and fall back to the docker CLI otherwise. With ``backend``
+    set to ``api`` there is no fallback: an unreachable socket makes
+    Docker unavailable.
+    """
 
-    def list_items(self) -> List[str]:
-        """
-        List all Docker containers.
+    binary = 'docker'
+    display_name = 'Docker'
+    config_section = 'docker_upgrader'
 
-        Returns:
-            List of container names/IDs
+    def __init__(self, config: Optional[Dict] = None):
         """
-        if not self.check_available():
-            return []
+        Initialize the Docker upgrader.
 
-        try:
-            result = subprocess.run(
-                ['docker', 'ps', '-a', '--format', '{{.Names}}'],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            if result.returncode == 0:
-                return [line for line in result.stdout.strip().split('\n') if line]
-        except Exception as e:
-            print(f"Error listing Docker containers: {e}")
-
-        return []
-
-    def list_images(self) -> List[str]:
+        Args:
+            config: Optional configuration dictionary. The ``docker_upgrader``
+                section may set ``backend`` to ``auto`` (default), ``api`` or
+                ``cli``, and ``socket`` to the Docker daemon socket path.
         """
-        List all Docker images.
+        super().__init__(config)
+        self.backend = self.settings.get('backend', 'auto')
+        self.socket_path = self.settings.get('socket') or socket_from_env()
+        self._api: Optional[DockerEngineClient] = None
+        self._api_checked = False
+        self._api_error: Optional[str] = None
+
+    def _get_api(self) -> Optional[DockerEngineClient]:
+        """
+        Get the Engine API client if the API backend is enabled and reachable.
 
         Returns:
-            List of image names
+            Connected client, or None to use the docker CLI
         """
-        if not self.check_available():
-            return []
+        if self._api_checked:
+            return self._api
+        self._api_checked = True
+
+        if self.backend == 'cli':
+            return None
+        if not self.socket_path:
+            self._api_error = "DOCKER_HOST does not point at a Unix socket"
+        elif not os.path.exists(self.socket_path):
+            self._api_error = f"socket {self.socket_path} does not exist"
+        else:
+            client = DockerEngineClient(self.socket_path)
+            if client.ping():
+                self._api = client
+            else:
+                self._api_error = f"no Docker daemon answered on {self.socket_path}"
+        return self._api
 
-        try:
-            result = subprocess.run(
-                ['docker', 'images', '--format', '{{.Repository}}:{{.Tag}}'],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            if result.returncode == 0:
-                return [line for line in result.stdout.strip().split('\n') if line and line != '<none>:<none>']
-        except Exception as e:
-            print(f"Error listing Docker images: {e}")
-
-        return []
-
-    def check_updates(self, item: Optional[str] = None) -> Dict[str, str]:
+    def check_available(self) -> bool:
         """
-        Check for available updates for Docker images.
-
-        Args:
-            item: Optional specific image to check
+        Check if Docker is available on the system.
 
         Returns:
-            Dictionary of images with available updates
-        """
-        updates = {}
-        if not self.check_available():
-            return updates
-
-        images = [item] if item else self.list_images()
-
-        for image in images:
-            try:
-                # Pull latest image
-                print(f"Checking for updates: {image}")
-                result = subprocess.run(
-                    ['docker', 'pull', image],
-                    capture_output=True,
-                    text=True,
-                    timeout=300
-                )
-                if result.returncode == 0:
-                    if 'Image is up to date' not in result.stdout:
-                        updates[image] = 'latest'
-            except Exception as e:
-                print(f"Error checking updates for {image}: {e}")
-
-        return updates
-
-    def upgrade(self, item: Optional[str] = None, dry_run: bool = False) -> bool:
+            True if Docker is available, False otherwise
         """
-        Upgrade Docker containers by pulling latest images and recreating containers.
+        if self._get_api() is not None:
+            return True
+        if self.backend == 'api':
+            logger.error(f"Docker Engine API backend unavailable: {self._api_error}")
+            return False
+        return super().check_available()
+
+    def _load_inventory(self) -> ContainerInventory:
+        api = self._get_api()
+        if api is None:
+            return super()._load_inventory()
+        # The API's container list already carries image, labels, mounts and state
+        return ContainerInventory([record_from_summary(c) for c in api.list_containers(all=True)])
+
+    def _list_image_tags(self) -> List[str]:
+        api = self._get_api()
+        if api is None:
+            return super()._list_image_tags()
+        return [
+            tag
+            for image in api.list_images()
+            for tag in (image.get('RepoTags') or [])
+            if tag != '<none>:<none>'
+        ]
+
+    def _container_image(self, container: str) -> Optional[str]:
+        api = self._get_api()
+        if api is None or self.inventory().get(container) is not None:
+            return super()._container_image(container)
+        try:
+            return api.inspect_container(container)['Config']['Image']
+        except (DockerAPIError, OSError, http.client.HTTPException) as e:
+            logger.error(str(e), extra={'item': container, 'phase': 'resolve'})
+            return None
+
+    def _local_repo_digests(self, image: str) -> List[str]:
+        api = self._get_api()
+        if api is None:
+            return super()._local_repo_digests(image)
+        try:
+            return api.inspect_image(image).get('RepoDigests') or []
+        except DockerAPIError:
+            return []
 
-        Args:
-            item: Optional specific container to upgrade. If None, upgrade all.
-            dry_run: If True, only simulate the upgrade.
+    @traced('{cls}.pull')
+    def _pull_image(self, image: str, quiet: bool = False) -> Optional[str]:
+        annotate(registry=self._registry_host(image))
+        api = self._get_api()
+        if api is None:
+            return super()._pull_image(image, quiet)
+        try:
+            return api.pull_image(image, timeout=300)
+        except DockerAPIError as e:
+            if e.is_auth_error() and self.backend != 'api':
+                # The CLI can use credential helpers the API client cannot
+                logger.warning(f"{e}; retrying with the docker CLI", extra={'item': image, 'phase': 'pull'})
+                return super()._pull_image(image, quiet)
+            logger.error(str(e), extra={'item': image, 'phase': 'pull'})
+            return None
+        except (OSError, http.client.HTTPException) as e:
+            logger.error(f"Error pulling {image} through the Docker API: {e}", extra={'item': image, 'phase': 'pull'})
+            return None
+
+    @traced('{cls}.pull')
+    async def _async_pull_image(self, image: str) -> Optional[str]:
+        if self._get_api() is None:
+            return await super()._async_pull_image(image)
+        return await run_blocking(self._pull_image, image, True)
+
+    def _inspect_container(self, container: str) -> Optional[Dict]:
+        api = self._get_api()
+        if api is None:
+            return super()._inspect_container(container)
+        try:
+            return api.inspect_container(container)
+        except (DockerAPIError, OSError, http.client.HTTPException) as e:
+            logger.error(str(e), extra={'item': container, 'phase': 'recreate'})
+            return None
+
+    def _inspect_image(self, image: str) -> Optional[Dict]:
+        api = self._get_api()
+        if api is None:
+            return super()._inspect_image(image)
+        try:
+            return api.inspect_image(image)
+        except (DockerAPIError, OSError, http.client.HTTPException):
+            return None
+
+    def _create_container(self, spec: ContainerSpec, name: str) -> bool:
+        api = self._get_api()
+        if api is None:
+            return super()._create_container(spec, name)
+        try:
+            # The API takes the inspected HostConfig as is, so nothing is lost in translation
+            api.create_container(name, spec.api_body())
+            for network, aliases in spec.extra_networks().items():
+                api.connect_network(network, name, aliases)
+            return True
+        except (DockerAPIError, OSError, http.client.HTTPException) as e:
+            logger.error(str(e), extra={'item': name, 'phase': 'recreate'})
+            return False
 
-        Returns:
-            True if upgrade was successful, False otherwise
-        """
-        if not self.check_available():
-            print("Docker is not available")
+    def _rename_container(self, container: str, new_name: str) -> bool:
+        api = self._get_api()
+        if api is None:
+            return super()._rename_container(container, new_name)
+        try:
+            api.rename_container(container, new_name)
+            return True
+        except (DockerAPIError, OSError, http.client.HTTPException) as e:
+            logger.error(str(e), extra={'item': container, 'phase': 'recreate'})
             return False
 
-        containers = [item] if item else self.list_items()
+    def _start_container(self, container: str) -> bool:
+        api = self._get_api()
+        if api is None:
+            return super()._start_container(container)
+        try:
+            api.start_container(container)
+            return True
+        except (DockerAPIError, OSError, http.client.HTTPException) as e:
+            logger.error(str(e), extra={'item': container, 'phase': 'recreate'})
+            return False
 
+    def _stop_container(self, container: str) -> bool:
+        api = self._get_api()
+        if api is None:
+            return super()._stop_container(container)
         try:
-            for container in containers:
-                print(f"{'[DRY RUN] ' if dry_run else ''}Upgrading container: {container}")
-
-                if dry_run:
-                    print(f"  Would pull latest image for {container}")
-                    print(f"  Would recreate container {container}")
-                else:
-                    # Get the image used by the container
-                    result = subprocess.run(
-                        ['docker', 'inspect', '--format', '{{.Config.Image}}', container],
-                        capture_output=True,
-                        text=True,
-                        timeout=10
-                    )
-                    if result.returncode == 0:
-                        image = result.stdout.strip()
-                        print(f"  Pulling latest image: {image}")
-                        pull_result = subprocess.run(['docker', 'pull', image], timeout=300)
-                        if pull_result.returncode != 0:
-                            print(f"  Warning: Failed to pull image {image}")
-                            continue
-
-                        print(f"  Stopping container: {container}")
-                        stop_result = subprocess.run(['docker', 'stop', container], timeout=60)
-                        if stop_result.returncode != 0:
-                            print(f"  Warning: Failed to stop container {container}")
-                            continue
-
-                        print(f"  Removing container: {container}")
-                        rm_result = subprocess.run(['docker', 'rm', container], timeout=30)
-                        if rm_result.returncode != 0:
-                            print(f"  Warning: Failed to remove container {container}")
-                            continue
-
-                        # NOTE: Container recreation is not implemented in this basic template.
-                        # In a production environment, you would need to:
-                        # 1. Save the container configuration before stopping
-                        # 2. Recreate the container with the same configuration
-                        # 3. Preserve volumes, networks, environment variables, etc.
-                        # 4. Or use docker-compose/orchestration tools for automated recreation
-                        print(f"  WARNING: Container {container} has been removed but not recreated.")
-                        print(f"  You will need to manually recreate the container with its original configuration.")
+            api.stop_container(container, timeout=60)
+            return True
+        except (DockerAPIError, OSError, http.client.HTTPException) as e:
+            logger.error(str(e), extra={'item': container, 'phase': 'recreate'})
+            return False
 
+    def _remove_container(self, container: str) -> bool:
+        api = self._get_api()
+        if api is None:
+            return super()._remove_container(container)
+        try:
+            api.remove_container(container)
             return True
-        except Exception as e:
-            print(f"Error during Docker upgrade: {e}")
+        except (DockerAPIError, OSError, http.client.HTTPException) as e:
+            logger.error(str(e), extra={'item': container, 'phase': 'recreate'})
             return False
+
+    def _list_image_records(self) -> List[ImageRecord]:
+        api = self._get_api()
+        if api is None:
+            return super()._list_image_records()
+        return [image_from_summary(image) for image in api.list_images(all=True, shared_size=True)]
+
+    def _remove_images(self, images: List[ImageRecord]) -> List[str]:
+        api = self._get_api()
+        if api is None:
+            return super()._remove_images(images)
+        # The API removes one reference per request; the pooled connection keeps them cheap
+        removed = []
+        for image in images:
+            try:
+                for reference in image.references:
+                    deleted = [normalize_image_id(entry.get('Deleted', '')) for entry in api.remove_image(reference)]
+                    if image.id in deleted:
+                        removed.append(image.id)
+            except (DockerAPIError, OSError, http.client.HTTPException) as e:
+                logger.warning(f"Failed to remove image {image.references[0]}: {e}",
+                               extra={'item': image.references[0], 'phase': 'gc'})
+        return removed
@@ -0,0 +1,248 @@
+"""
+Image garbage collection: a reference index of local images and the set of
+unreferenced images an upgrade left behind.
+"""
+
+import fnmatch
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from .inventory import ContainerRecord
+from .pull_planner import format_bytes
+
+
+# Images removed per rmi call
+DEFAULT_GC_BATCH_SIZE = 100
+
+# gc_scope values: dangling removes untagged images only, unused any unreferenced image
+GC_SCOPES = ('dangling', 'unused')
+
+
+def normalize_image_id(image_id: str) -> str:
+    """
+    Normalize an image ID to its bare hex digest.
+
+    Docker reports IDs as ``sha256:<hex>`` and Podman as ``<hex>``.
+
+    Args:
+        image_id: Image ID in either form
+
+    Returns:
+        Hex digest
+    """
+    return image_id.split(':', 1)[1] if image_id.startswith('sha256:') else image_id
+
+
+def _normalize_tag(reference: str) -> str:
+    last_slash = reference.rfind('/')
+    if '@' in reference or reference.rfind(':') > last_slash:
+        return reference
+    return f"{reference}:latest"
+
+
+@dataclass
+class ImageRecord:
+    """Structured view of one local image."""
+
+    id: str
+    tags: List[str] = field(default_factory=list)
+    digests: List[str] = field(default_factory=list)
+    size: int = 0
+    # Bytes shared with other images, if the runtime reported it
+    shared_size: Optional[int] = None
+    parent: str = ''
+    # Diff IDs of the image's layers, if known
+    layers: List[str] = field(default_factory=list)
+
+    @property
+    def dangling(self) -> bool:
+        """Whether the image has no tag left, like an old version after a pull."""
+        return not self.tags
+
+    @property
+    def references(self) -> List[str]:
+        """Names to remove the image by: its tags, or its ID if it has none."""
+        return self.tags or [self.id]
+
+
+def image_from_inspect(data: Dict[str, Any]) -> ImageRecord:
+    """
+    Build a record from one element of `image inspect` output.
+
+    Args:
+        data: Parsed inspect document for an image
+
+    Returns:
+        Image record
+    """
+    return ImageRecord(
+        id=normalize_image_id(data.get('Id', '')),
+        tags=[tag for tag in data.get('RepoTags') or [] if tag != '<none>:<none>'],
+        digests=[digest for digest in data.get('RepoDigests') or [] if digest != '<none>@<none>'],
+        size=int(data.get('Size') or 0),
+        parent=normalize_image_id(data.get('Parent') or ''),
+        layers=list((data.get('RootFS') or {}).get('Layers') or []),
+    )
+
+
+def image_from_summary(data: Dict[str, Any]) -> ImageRecord:
+    """
+    Build a record from an image summary (Engine API image list entry).
+
+    Args:
+        data: Parsed image summary
+
+    Returns:
+        Image record
+    """
+    shared = data.get('SharedSize')
+    return ImageRecord(
+        id=normalize_image_id(data.get('Id', '')),
+        tags=[tag for tag in data.get('RepoTags') or [] if tag != '<none>:<none>'],
+        digests=[digest for digest in data.get('RepoDigests') or [] if digest != '<none>@<none>'],
+        size=int(data.get('Size') or 0),
+        # The API reports -1 unless asked to compute shared sizes
+        shared_size=shared if isinstance(shared, int) and shared >= 0 else None,
+        parent=normalize_image_id(data.get('ParentId') or ''),
+    )
+
+
+class ImageReferenceIndex:
+    """
+    Index of why each local image must be kept.
+
+    An image is referenced when a container (running or not) uses it, when
+    one of its tags or repo digests matches a ``retain`` pattern, or when it
+    is the parent of another image.
+    """
+
+    def __init__(self, images: Iterable[ImageRecord], containers: Iterable[ContainerRecord],
+                 retain: Iterable[str] = ()):
+        """
+        Build the index.
+
+        Args:
+            images: Local images
+            containers: Containers of the runtime, including stopped ones
+            retain: fnmatch patterns of tags or digests to keep, such as
+                ``postgres:*``
+        """
+        self.images: Dict[str, ImageRecord] = {image.id: image for image in images}
+        self.references: Dict[str, List[str]] = {}
+        by_tag = {_normalize_tag(tag): image.id for image in self.images.values() for tag in image.tags}
+
+        for container in containers:
+            image_id = normalize_image_id(container.image_id) if container.image_id else None
+            if image_id not in self.images:
+                image_id = by_tag.get(_normalize_tag(container.image)) if container.image else None
+            if image_id:
+                self._add(image_id, f"container {container.name}")
+
+        patterns = list(retain)
+        for image in self.images.values():
+            matched = next((pattern for pattern in patterns for name in image.tags + image.digests
+                            if fnmatch.fnmatchcase(name, pattern)), None)
+            if matched:
+                self._add(image.id, f"retained by {matched}")
+            if image.parent:
+                self._add(image.parent, f"parent of {image.id[:12]}")
+
+    def _add(self, image_id: str, reason: str) -> None:
+        self.references.setdefault(image_id, []).append(reason)
+
+    def referenced(self, image_id: str) -> bool:
+        """
+        Check whether an image must be kept.
+
+        Args:
+            image_id: Image ID, in either form
+
+        Returns:
+            True if anything references the image
+        """
+        return normalize_image_id(image_id) in self.references
+
+    def unreferenced(self, scope: str = 'dangling') -> List[ImageRecord]:
+        """
+        Get the images garbage collection may remove.
+
+        Args:
+            scope: ``dangling`` for untagged images only, ``unused`` for
+                every unreferenced image
+
+        Returns:
+            Removable images, in listing order
+        """
+        if scope not in GC_SCOPES:
+            raise ValueError(f"Unknown gc_scope: {scope}")
+        return [
+            image for image in self.images.values()
+            if image.id not in self.references and (scope == 'unused' or image.dangling)
+        ]
+
+    def reclaimable_bytes(self, candidates: List[ImageRecord]) -> int:
+        """
+        Estimate the disk space removing images frees.
+
+        Bytes shared with kept images stay on disk. When the runtime reports
+        an image's shared size it is subtracted; otherwise the image's size
+        is scaled by the share of its layers no kept image uses.
+
+        Args:
+            candidates: Images to be removed
+
+        Returns:
+            Estimated reclaimable bytes
+        """
+        removed = {image.id for image in candidates}
+        kept_layers = {
+            layer for image in self.images.values() if image.id not in removed for layer in image.layers
+        }
+        total = 0
+        for image in candidates:
+            if image.shared_size is not None:
+                total += max(0, image.size - image.shared_size)
+            elif image.layers:
+                unique = [layer for layer in image.layers if layer not in kept_layers]
+                total += image.size * len(unique) // len(image.layers)
+            else:
+                total += image.size
+        return total
+
+
+@dataclass
+class GCReport:
+    """Outcome of one garbage collection run."""
+
+    candidates: List[ImageRecord] = field(default_factory=list)
+    reclaimable_bytes: int = 0
+    # Number of local images kept because something references them
+    referenced: int = 0
+    removed: List[str] = field(default_factory=list)
+    reclaimed_bytes: int = 0
+    dry_run: bool = False
+
+    @property
+    def failed(self) -> List[ImageRecord]:
+        """Candidates that could not be removed."""
+        if self.dry_run:
+            return []
+        removed = set(self.removed)
+        return [image for image in self.candidates if image.id not in removed]
+
+    def summary(self) -> str:
+        """
+        Summarize the run in one line.
+
+        Returns:
+            Counts and bytes, e.g. ``Image GC: removed 3 of 3 unreferenced
+            image(s), reclaiming about 412.0 MB; 12 referenced image(s) kept``
+        """
+        count = len(self.candidates)
+        if self.dry_run:
+            text = (f"Image GC: would remove {count} unreferenced image(s), "
+                    f"reclaiming about {format_bytes(self.reclaimable_bytes)}")
+        else:
+            text = (f"Image GC: removed {len(self.removed)} of {count} unreferenced image(s), "
+                    f"reclaiming about {format_bytes(self.reclaimed_bytes)}")
+        return text + f"; {self.referenced} referenced image(s) kept"
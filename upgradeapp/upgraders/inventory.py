@@ -0,0 +1,176 @@
+"""
+In-memory container inventory built from batched ps/inspect calls.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from ..utils.runner import CommandRunner
+
+
+# Keep each inspect command line well under ARG_MAX on hosts with many containers
+INSPECT_BATCH_SIZE = 500
+
+
+@dataclass
+class ContainerRecord:
+    """Structured view of one container."""
+
+    name: str
+    id: str
+    image: str
+    image_id: str = ''
+    labels: Dict[str, str] = field(default_factory=dict)
+    mounts: List[Dict[str, Any]] = field(default_factory=list)
+    state: str = ''
+    # Full inspect document, when the record was built from one
+    details: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+
+def _first_name(names: Any) -> str:
+    if isinstance(names, list):
+        names = names[0] if names else ''
+    return (names or '').split(',')[0].lstrip('/')
+
+
+def record_from_inspect(data: Dict[str, Any]) -> ContainerRecord:
+    """
+    Build a record from one element of `inspect` output.
+
+    Args:
+        data: Parsed inspect document for a container
+
+    Returns:
+        Container record
+    """
+    config = data.get('Config') or {}
+    state = data.get('State') or {}
+    return ContainerRecord(
+        name=_first_name(data.get('Name', '')),
+        id=data.get('Id', ''),
+        image=config.get('Image', ''),
+        image_id=data.get('Image', ''),
+        labels=config.get('Labels') or {},
+        mounts=data.get('Mounts') or [],
+        state=state.get('Status', '') if isinstance(state, dict) else str(state),
+        details=data,
+    )
+
+
+def record_from_summary(data: Dict[str, Any]) -> ContainerRecord:
+    """
+    Build a record from a container summary (`ps` JSON line or API list entry).
+
+    Args:
+        data: Parsed container summary
+
+    Returns:
+        Container record
+    """
+    labels = data.get('Labels') or {}
+    if isinstance(labels, str):
+        # docker ps renders labels as "k=v,k2=v2"
+        labels = dict(pair.split('=', 1) for pair in labels.split(',') if '=' in pair)
+    mounts = data.get('Mounts') or []
+    if isinstance(mounts, str):
+        mounts = [{'Name': mount} for mount in mounts.split(',') if mount]
+    return ContainerRecord(
+        name=_first_name(data.get('Names', '')),
+        id=data.get('Id') or data.get('ID', ''),
+        image=data.get('Image', ''),
+        image_id=data.get('ImageID', ''),
+        labels=labels,
+        mounts=mounts,
+        state=data.get('State', ''),
+    )
+
+
+class ContainerInventory:
+    """Index of containers by name and ID."""
+
+    def __init__(self, records: List[ContainerRecord]):
+        """
+        Initialize the inventory.
+
+        Args:
+            records: Container records, in listing order
+        """
+        self._by_name: Dict[str, ContainerRecord] = {record.name: record for record in records}
+        self._by_id: Dict[str, ContainerRecord] = {record.id: record for record in records}
+
+    @classmethod
+    def from_cli(cls, binary: str, runner: Optional[CommandRunner] = None) -> 'ContainerInventory':
+        """
+        Build the inventory with one `ps` call and batched `inspect` calls.
+
+        Args:
+            binary: Docker-compatible CLI executable (docker, podman)
+            runner: Runner for the CLI calls, a default one if not given
+
+        Returns:
+            Container inventory
+        """
+        runner = runner or CommandRunner()
+        result = runner.run(
+            [binary, 'ps', '-a', '--no-trunc', '--format', '{{json .}}'], 30, keep_all=True, idempotent=True
+        )
+        if not result.ok:
+            return cls([])
+        summaries = [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+        records = [record_from_summary(summary) for summary in summaries]
+
+        ids = [record.id for record in records if record.id]
+        inspected: Dict[str, ContainerRecord] = {}
+        for start in range(0, len(ids), INSPECT_BATCH_SIZE):
+            batch = ids[start:start + INSPECT_BATCH_SIZE]
+            result = runner.run([binary, 'inspect'] + batch, 60, keep_all=True, idempotent=True)
+            if result.returncode is None:
+                continue
+            # inspect prints the containers it found even if one vanished meanwhile
+            for data in json.loads(result.stdout or '[]'):
+                record = record_from_inspect(data)
+                inspected[record.id] = record
+
+        return cls([inspected.get(record.id, record) for record in records])
+
+    def __iter__(self) -> Iterator[ContainerRecord]:
+        return iter(self._by_name.values())
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def names(self) -> List[str]:
+        """
+        Get container names in listing order.
+
+        Returns:
+            List of container names
+        """
+        return list(self._by_name)
+
+    def get(self, container: str) -> Optional[ContainerRecord]:
+        """
+        Look up a container by name, full ID or ID prefix.
+
+        Args:
+            container: Container name or ID
+
+        Returns:
+            Matching record, or None
+        """
+        record = self._by_name.get(container) or self._by_id.get(container)
+        if record is None and len(container) >= 12:
+            matches = [r for cid, r in self._by_id.items() if cid.startswith(container)]
+            if len(matches) == 1:
+                record = matches[0]
+        return record
+
+    def images(self) -> List[str]:
+        """
+        Get the distinct image references used by containers.
+
+        Returns:
+            List of image references in listing order
+        """
+        return list(dict.fromkeys(record.image for record in self if record.image))
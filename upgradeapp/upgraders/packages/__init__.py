@@ -0,0 +1,36 @@
+"""
+Native readers for system package databases.
+"""
+
+from .apt import AptIndex
+from .dpkg import DpkgPackage, iter_dpkg_status
+from .pacman import PacmanIndex, PacmanPackage, iter_pacman_local
+from .rpm import RpmPackage, RpmRepoIndex, iter_rpmdb
+from .versions import (
+    classify_update,
+    compare_deb_versions,
+    compare_pacman_versions,
+    compare_rpm_versions,
+    compare_versions,
+    newest_version,
+    sort_versions,
+)
+
+__all__ = [
+    'AptIndex',
+    'DpkgPackage',
+    'PacmanIndex',
+    'PacmanPackage',
+    'RpmPackage',
+    'RpmRepoIndex',
+    'classify_update',
+    'compare_deb_versions',
+    'compare_pacman_versions',
+    'compare_rpm_versions',
+    'compare_versions',
+    'iter_dpkg_status',
+    'iter_pacman_local',
+    'iter_rpmdb',
+    'newest_version',
+    'sort_versions',
+]
@@ -0,0 +1,231 @@
+"""
+In-process computation of upgradable packages from apt's on-disk indexes.
+"""
+
+import glob
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .deb822 import iter_stanzas
+from .dpkg import DEFAULT_STATUS_FILE, iter_dpkg_status
+from .versions import compare_deb_versions
+
+
+DEFAULT_LISTS_DIR = '/var/lib/apt/lists'
+
+# Files apt writes when `apt update` runs: the stamp of the APT::Update::Post-Invoke-Success
+# hook shipped by Debian and Ubuntu, and the package cache apt rebuilds from the new lists
+DEFAULT_UPDATE_STAMPS = ('/var/lib/apt/periodic/update-success-stamp', '/var/cache/apt/pkgcache.bin')
+
+
+@dataclass
+class AptCandidate:
+    """Newest available version of an installed package."""
+
+    name: str
+    architecture: str
+    installed: str
+    version: str
+    source: str
+
+
+class AptIndex:
+    """
+    Reads ``/var/lib/apt/lists/*_Packages`` and ``/var/lib/dpkg/status``.
+
+    This reproduces what `apt list --upgradable` reports for the common
+    case without forking apt: for every installed package, the highest
+    version found in any Packages list for a compatible architecture.
+    Archives whose Release file sets ``NotAutomatic``, such as
+    experimental and backports, only provide upgrades for packages
+    installed from them, and only if they also set
+    ``ButAutomaticUpgrades``. Pin priorities and phased updates are not
+    evaluated.
+    """
+
+    def __init__(self, lists_dir: str = DEFAULT_LISTS_DIR, status_file: str = DEFAULT_STATUS_FILE,
+                 update_stamps: Iterable[str] = DEFAULT_UPDATE_STAMPS):
+        """
+        Initialize the index.
+
+        Args:
+            lists_dir: Directory holding apt's downloaded Packages lists
+            status_file: Path to the dpkg status database
+            update_stamps: Files whose mtime records the last `apt update`
+        """
+        self.lists_dir = lists_dir
+        self.status_file = status_file
+        self.update_stamps = list(update_stamps)
+
+    def package_lists(self) -> List[str]:
+        """
+        Get the Packages list files currently on disk.
+
+        Returns:
+            Sorted list of file paths
+        """
+        paths = []
+        for pattern in ('*_Packages', '*_Packages.gz', '*_Packages.xz'):
+            paths.extend(glob.glob(os.path.join(self.lists_dir, pattern)))
+        return sorted(paths)
+
+    def available(self) -> bool:
+        """
+        Check whether the on-disk indexes can be used.
+
+        Returns:
+            True if the status file and at least one Packages list exist
+        """
+        return os.path.exists(self.status_file) and bool(self.package_lists())
+
+    def age(self) -> float:
+        """
+        Get the time since apt last updated the lists.
+
+        apt sets the mtime of each downloaded list to the archive's
+        Last-Modified date, which says when the mirror changed rather than
+        when apt checked it. The update stamps and the lists directory,
+        which changes whenever apt replaces a list, are used instead.
+
+        Returns:
+            Seconds since the lists were last refreshed, infinity if unknown
+        """
+        mtimes = []
+        for path in self.update_stamps + [self.lists_dir]:
+            try:
+                mtimes.append(os.stat(path).st_mtime)
+            except OSError:
+                continue
+        if not mtimes:
+            return float('inf')
+        return time.time() - max(mtimes)
+
+    def is_stale(self, max_age: float) -> bool:
+        """
+        Check whether the lists are older than a freshness threshold.
+
+        Args:
+            max_age: Maximum acceptable age in seconds
+
+        Returns:
+            True if the lists should be refreshed
+        """
+        return self.age() > max_age
+
+    def not_automatic_archives(self) -> Dict[str, bool]:
+        """
+        Find the archives apt never upgrades to on its own.
+
+        Returns:
+            Mapping of the list file prefix of every ``NotAutomatic``
+            archive to whether it also sets ``ButAutomaticUpgrades``
+        """
+        archives = {}
+        for pattern in ('*_InRelease', '*_Release'):
+            for path in glob.glob(os.path.join(self.lists_dir, pattern)):
+                prefix = os.path.basename(path).rsplit('_', 1)[0]
+                # InRelease files start with the PGP armor header; the fields follow as the next paragraph
+                for stanza in iter_stanzas(path, ('NotAutomatic', 'ButAutomaticUpgrades')):
+                    if stanza.get('NotAutomatic') == 'yes':
+                        archives[prefix] = stanza.get('ButAutomaticUpgrades') == 'yes'
+                    break
+        return archives
+
+    def installed(self) -> Dict[Tuple[str, str], str]:
+        """
+        Read installed package versions from the dpkg status database.
+
+        Returns:
+            Mapping of (name, architecture) to installed version
+        """
+        return {
+            (package.name, package.architecture): package.version
+            for package in iter_dpkg_status(self.status_file)
+            if package.version
+        }
+
+    def candidates(self) -> Dict[Tuple[str, str], AptCandidate]:
+        """
+        Find the newest available version of every installed package.
+
+        Returns:
+            Mapping of (name, architecture) to candidate, only for packages
+            with a version newer than the installed one
+        """
+        installed = self.installed()
+        names = {name for name, _ in installed}
+        not_automatic = self.not_automatic_archives()
+        best: Dict[Tuple[str, str], AptCandidate] = {}
+        # Versions offered by ButAutomaticUpgrades archives, per archive, kept until
+        # it is known which installed versions came from that archive
+        held: Dict[str, List[Tuple[Tuple[str, str], str, str]]] = {}
+
+        def offer(key: Tuple[str, str], version: str, source: str) -> None:
+            current = installed[key]
+            if compare_deb_versions(version, current) <= 0:
+                return
+            previous = best.get(key)
+            if previous is None or compare_deb_versions(version, previous.version) > 0:
+                best[key] = AptCandidate(key[0], key[1], current, version, source)
+
+        for path in self.package_lists():
+            source = os.path.basename(path)
+            archive = next((prefix for prefix in not_automatic if source.startswith(prefix + '_')), None)
+            if archive is not None and not not_automatic[archive]:
+                continue
+            for stanza in iter_stanzas(path, ('Package', 'Version', 'Architecture'), packages=names):
+                if 'Version' not in stanza:
+                    continue
+                key = (stanza['Package'], stanza.get('Architecture', 'all'))
+                if key not in installed:
+                    continue
+                if archive is None:
+                    offer(key, stanza['Version'], source)
+                else:
+                    held.setdefault(archive, []).append((key, stanza['Version'], source))
+
+        for versions in held.values():
+            from_archive = {key for key, version, _ in versions if version == installed[key]}
+            for key, version, source in versions:
+                if key in from_archive:
+                    offer(key, version, source)
+
+        return best
+
+    def upgradable(self, item: Optional[str] = None) -> Dict[str, str]:
+        """
+        Get upgradable packages in the shape AppUpgrader.check_updates returns.
+
+        Args:
+            item: Optional package name to restrict the result to
+
+        Returns:
+            Mapping of package name to the newer available version
+        """
+        return {
+            candidate.name: candidate.version
+            for candidate in self.candidates().values()
+            if item is None or candidate.name == item
+        }
+
+    def security_updates(self, updates: Dict[str, str]) -> Set[str]:
+        """
+        Find which updates are published in a security archive.
+
+        Args:
+            updates: Mapping of package name to candidate version
+
+        Returns:
+            Names whose candidate version appears in a ``*security*`` list
+        """
+        security = set()
+        names = set(updates)
+        for path in self.package_lists():
+            if 'security' not in os.path.basename(path):
+                continue
+            for stanza in iter_stanzas(path, ('Package', 'Version'), packages=names):
+                if stanza.get('Version') == updates[stanza['Package']]:
+                    security.add(stanza['Package'])
+        return security
@@ -0,0 +1,99 @@
+"""
+Streaming reader for deb822 control files (dpkg status, apt Packages lists).
+"""
+
+import gzip
+import lzma
+import mmap
+import os
+from typing import AbstractSet, Dict, Iterable, Iterator, Optional
+
+
+def _parse_stanza(block: bytes, wanted: Optional[frozenset]) -> Dict[str, str]:
+    record = {}
+    for line in block.split(b'\n'):
+        if not line or line[:1] in (b' ', b'\t'):
+            # Continuation lines only belong to multi-line fields we skip
+            continue
+        key, sep, value = line.partition(b':')
+        if sep and (wanted is None or key in wanted):
+            record[key.decode('ascii', 'replace')] = value.strip().decode('utf-8', 'replace')
+    return record
+
+
+def _iter_mapped(path: str, wanted: Optional[frozenset],
+                 packages: Optional[AbstractSet[str]]) -> Iterator[Dict[str, str]]:
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < size:
+                end = mm.find(b'\n\n', start)
+                if end == -1:
+                    end = size
+                if packages is not None and mm[start:start + 9] == b'Package: ':
+                    # Package always leads the paragraph; skip unwanted ones unparsed
+                    name_end = mm.find(b'\n', start, end)
+                    name = mm[start + 9:name_end if name_end != -1 else end].strip()
+                    if name.decode('utf-8', 'replace') not in packages:
+                        start = end + 1
+                        while start < size and mm[start] == 0x0a:
+                            start += 1
+                        continue
+                record = _parse_stanza(mm[start:end], wanted)
+                if record and (packages is None or record.get('Package') in packages):
+                    yield record
+                start = end + 1
+                while start < size and mm[start] == 0x0a:
+                    start += 1
+
+
+def _iter_stream(f, wanted: Optional[frozenset],
+                 packages: Optional[AbstractSet[str]]) -> Iterator[Dict[str, str]]:
+    lines = []
+    for line in f:
+        if line.strip():
+            lines.append(line.rstrip(b'\n'))
+            continue
+        if lines:
+            record = _parse_stanza(b'\n'.join(lines), wanted)
+            lines = []
+            if record and (packages is None or record.get('Package') in packages):
+                yield record
+    if lines:
+        record = _parse_stanza(b'\n'.join(lines), wanted)
+        if record and (packages is None or record.get('Package') in packages):
+            yield record
+
+
+def iter_stanzas(
+    path: str,
+    fields: Optional[Iterable[str]] = None,
+    packages: Optional[AbstractSet[str]] = None
+) -> Iterator[Dict[str, str]]:
+    """
+    Iterate over the paragraphs of a deb822 file without loading it whole.
+
+    Plain files are memory-mapped and scanned paragraph by paragraph;
+    ``.gz`` and ``.xz`` files are decompressed as a stream.
+
+    Args:
+        path: File to read
+        fields: Optional field names to keep; other fields are skipped
+        packages: Optional set of package names; paragraphs for other
+            packages are skipped without being parsed
+
+    Yields:
+        Dictionary of field name to value for each paragraph
+    """
+    wanted = frozenset(field.encode() for field in fields) if fields is not None else None
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            yield from _iter_stream(f, wanted, packages)
+    elif path.endswith('.xz'):
+        with lzma.open(path, 'rb') as f:
+            yield from _iter_stream(f, wanted, packages)
+    else:
+        yield from _iter_mapped(path, wanted, packages)
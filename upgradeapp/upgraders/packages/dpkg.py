@@ -0,0 +1,91 @@
+"""
+Streaming reader for the dpkg status database.
+"""
+
+import mmap
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterator
+
+from .deb822 import iter_stanzas
+
+
+DEFAULT_STATUS_FILE = '/var/lib/dpkg/status'
+
+_STATUS_FIELDS = ('Package', 'Status', 'Architecture', 'Version')
+
+# dpkg always writes status fields in canonical order, and every installed
+# entry carries all four. Lines matched between them must be non-empty, so a
+# match never runs past the end of its paragraph.
+_INSTALLED_ENTRY = re.compile(
+    rb'^Package: ([^\n]*)\n'
+    rb'(?:[^\n]+\n)*?Status: ([^\n]*installed)\n'
+    rb'(?:[^\n]+\n)*?Architecture: ([^\n]*)\n'
+    rb'(?:[^\n]+\n)*?Version: ([^\n]*)',
+    re.M
+)
+
+
+@dataclass
+class DpkgPackage:
+    """One package entry from the dpkg status database."""
+
+    name: str
+    version: str
+    architecture: str
+    status: str
+
+    @property
+    def installed(self) -> bool:
+        """Whether dpkg considers the package fully installed."""
+        return self.status.endswith(' installed')
+
+
+def iter_dpkg_status(path: str = DEFAULT_STATUS_FILE, installed_only: bool = True) -> Iterator[DpkgPackage]:
+    """
+    Iterate over the packages recorded in a dpkg status file.
+
+    The file is memory-mapped and scanned one paragraph at a time, so
+    callers that stop early never read the rest of it. Installed entries
+    are matched with a single pattern relying on dpkg's field order; the
+    generic deb822 reader is used when every entry is requested.
+
+    Args:
+        path: Path to the dpkg status file
+        installed_only: Skip packages that are removed, half-installed or
+            only have configuration files left
+
+    Yields:
+        Package entries in file order
+    """
+    if installed_only:
+        yield from _iter_installed(path)
+        return
+
+    for stanza in iter_stanzas(path, _STATUS_FIELDS):
+        if 'Package' not in stanza:
+            continue
+        yield DpkgPackage(
+            name=stanza['Package'],
+            version=stanza.get('Version', ''),
+            architecture=stanza.get('Architecture', 'all'),
+            status=stanza.get('Status', ''),
+        )
+
+
+def _iter_installed(path: str) -> Iterator[DpkgPackage]:
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for match in _INSTALLED_ENTRY.finditer(mm):
+                name, status, architecture, version = match.groups()
+                status = status.decode('utf-8', 'replace').strip()
+                if status.endswith(' installed'):
+                    yield DpkgPackage(
+                        name.decode('utf-8', 'replace').strip(),
+                        version.decode('utf-8', 'replace').strip(),
+                        architecture.decode('utf-8', 'replace').strip(),
+                        status,
+                    )
@@ -0,0 +1,331 @@
+"""
+In-process readers for pacman's local and sync databases.
+"""
+
+import bz2
+import glob
+import gzip
+import lzma
+import os
+import re
+import shutil
+import tarfile
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from .versions import compare_pacman_versions
+
+
+DEFAULT_DB_PATH = '/var/lib/pacman'
+DEFAULT_CONFIG = '/etc/pacman.conf'
+
+_SECTION = re.compile(r'^\s*\[([^\]]+)\]\s*$')
+
+
+@dataclass
+class PacmanPackage:
+    """One installed pacman package."""
+
+    name: str
+    version: str
+    architecture: str
+
+
+def split_entry_name(entry: str) -> Tuple[str, str]:
+    """
+    Split a database entry name into package name and version.
+
+    Entries are named ``<name>-<pkgver>-<pkgrel>`` and neither pkgver nor
+    pkgrel may contain a hyphen, so the name is everything before the
+    second-to-last one.
+
+    Args:
+        entry: Directory name such as "linux-firmware-20240115.9b6d0b08-1"
+
+    Returns:
+        Tuple of (name, version)
+    """
+    name, pkgver, pkgrel = entry.rsplit('-', 2)
+    return name, f"{pkgver}-{pkgrel}"
+
+
+def _read_desc_field(path: str, field: str) -> str:
+    marker = f'%{field}%'
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if line.strip() == marker:
+                return next(f, '').strip()
+    return ''
+
+
+def iter_pacman_local(db_path: str = DEFAULT_DB_PATH) -> Iterator[PacmanPackage]:
+    """
+    Iterate over installed packages in pacman's local database.
+
+    Args:
+        db_path: pacman database root containing ``local/``
+
+    Yields:
+        Installed packages in name order
+    """
+    local = os.path.join(db_path, 'local')
+    for entry in sorted(os.scandir(local), key=lambda entry: entry.name):
+        if not entry.is_dir() or entry.name.count('-') < 2:
+            continue
+        name, version = split_entry_name(entry.name)
+        architecture = _read_desc_field(os.path.join(entry.path, 'desc'), 'ARCH')
+        yield PacmanPackage(name, version, architecture)
+
+
+def _open_archive(path: str) -> BinaryIO:
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith(b'\x1f\x8b'):
+        return gzip.open(path, 'rb')
+    if magic.startswith(b'\xfd7zXZ'):
+        return lzma.open(path, 'rb')
+    if magic.startswith(b'BZh'):
+        return bz2.open(path, 'rb')
+    f = open(path, 'rb')
+    f.seek(257)
+    if f.read(5) == b'ustar':
+        f.seek(0)
+        return f
+    f.close()
+    raise tarfile.ReadError(f"unsupported sync database compression: {path}")
+
+
+def _iter_member_names(f: BinaryIO) -> Iterator[str]:
+    """
+    Yield member names of a tar stream by reading headers only.
+
+    Contents are skipped without building TarInfo objects, which makes a
+    large sync database an order of magnitude faster to scan than with
+    tarfile. GNU long names and pax ``path`` records are honoured.
+    """
+    long_name = None
+    while True:
+        header = f.read(512)
+        if len(header) < 512 or not header.strip(b'\0'):
+            return
+        size = int(header[124:136].strip(b' \0') or b'0', 8)
+        padded = (size + 511) // 512 * 512
+        kind = header[156:157]
+        if kind in (b'L', b'x'):
+            data = f.read(padded)[:size]
+            if kind == b'L':
+                long_name = data.rstrip(b'\0')
+            else:
+                for record in data.split(b'\n'):
+                    key, _, value = record.partition(b' ')[2].partition(b'=')
+                    if key == b'path':
+                        long_name = value
+            continue
+        name = long_name or header[:100].split(b'\0', 1)[0]
+        if long_name is None and header[257:263] == b'ustar\0':
+            prefix = header[345:500].split(b'\0', 1)[0]
+            if prefix:
+                name = prefix + b'/' + name
+        long_name = None
+        yield name.decode('utf-8', 'replace')
+        if padded:
+            f.read(padded)
+
+
+def prepare_sync_copy(path: str, db_path: str = DEFAULT_DB_PATH) -> None:
+    """
+    Set up a private database root to sync into, as checkupdates does.
+
+    Syncing the system databases without upgrading leaves them newer than
+    the installed packages, so the next `pacman -S` performs an unsupported
+    partial upgrade. The copy links ``local`` to the system database and
+    seeds ``sync/`` with the system databases, keeping their mtimes so the
+    first sync only downloads what changed.
+
+    Args:
+        path: Private database root
+        db_path: System database root
+
+    Raises:
+        OSError: If the copy cannot be created
+    """
+    sync_dir = os.path.join(path, 'sync')
+    os.makedirs(sync_dir, exist_ok=True)
+    local = os.path.join(path, 'local')
+    if not os.path.lexists(local):
+        os.symlink(os.path.join(os.path.abspath(db_path), 'local'), local)
+    system_sync_dir = os.path.join(db_path, 'sync')
+    if glob.glob(os.path.join(sync_dir, '*.db')) or not os.path.isdir(system_sync_dir):
+        return
+    for source in glob.glob(os.path.join(system_sync_dir, '*.db')):
+        shutil.copy2(source, sync_dir)
+    # Until its first sync, the copy is as fresh as the system databases
+    shutil.copystat(system_sync_dir, sync_dir)
+
+
+def parse_query_upgrades(output: str) -> Dict[str, str]:
+    """
+    Parse `pacman -Qu` output ("name oldver -> newver").
+
+    Args:
+        output: Command output
+
+    Returns:
+        Mapping of package name to available version
+    """
+    updates = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 4 and parts[2] == '->':
+            updates[parts[0]] = parts[3]
+    return updates
+
+
+class PacmanIndex:
+    """
+    Computes upgradable packages from pacman's local and sync databases.
+
+    Like `pacman -Qu`, each installed package is compared with the first
+    configured repository that carries it. Only entry names are read: the
+    local database is listed with scandir and sync databases are scanned as
+    tar member names, so no ``desc`` file is opened. Ignored packages and
+    replacements are not evaluated.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, config_path: str = DEFAULT_CONFIG):
+        """
+        Initialize the index.
+
+        Args:
+            db_path: pacman database root containing ``local/`` and ``sync/``
+            config_path: pacman.conf, read for the repository order
+        """
+        self.db_path = db_path
+        self.config_path = config_path
+
+    def sync_dbs(self) -> List[str]:
+        """
+        Get the sync databases in repository priority order.
+
+        The order follows the repository sections of pacman.conf; without
+        a readable pacman.conf every database is used in name order.
+
+        Returns:
+            List of ``.db`` file paths
+        """
+        paths = {
+            os.path.basename(path)[:-3]: path
+            for path in glob.glob(os.path.join(self.db_path, 'sync', '*.db'))
+        }
+        configured = self._configured_repos()
+        if configured:
+            # Leftover databases of repositories no longer configured are ignored
+            return [paths[repo] for repo in configured if repo in paths]
+        return [paths[repo] for repo in sorted(paths)]
+
+    def _configured_repos(self) -> List[str]:
+        if not os.path.exists(self.config_path):
+            return []
+        repos = []
+        with open(self.config_path) as f:
+            for line in f:
+                match = _SECTION.match(line)
+                if match and match.group(1) != 'options':
+                    repos.append(match.group(1))
+        return repos
+
+    def available(self) -> bool:
+        """
+        Check whether the databases can be used.
+
+        Returns:
+            True if the local database and at least one sync database exist
+        """
+        return os.path.isdir(os.path.join(self.db_path, 'local')) and bool(self.sync_dbs())
+
+    def age(self) -> float:
+        """
+        Get the time since a sync database was last replaced.
+
+        pacman dates each database by the mirror's Last-Modified time, so
+        the ``sync`` directory, which changes whenever a database is
+        replaced, is used instead.
+
+        Returns:
+            Seconds since the databases were last synced, infinity if none exist
+        """
+        if not self.sync_dbs():
+            return float('inf')
+        return time.time() - os.stat(os.path.join(self.db_path, 'sync')).st_mtime
+
+    def is_stale(self, max_age: float) -> bool:
+        """
+        Check whether the sync databases are older than a freshness threshold.
+
+        Args:
+            max_age: Maximum acceptable age in seconds
+
+        Returns:
+            True if the databases should be synced
+        """
+        return self.age() > max_age
+
+    def installed(self) -> Dict[str, str]:
+        """
+        Read installed package versions from the local database.
+
+        Returns:
+            Mapping of package name to installed version
+        """
+        installed = {}
+        for entry in os.scandir(os.path.join(self.db_path, 'local')):
+            if entry.is_dir() and entry.name.count('-') >= 2:
+                name, version = split_entry_name(entry.name)
+                installed[name] = version
+        return installed
+
+    def repo_versions(self, path: str) -> Dict[str, str]:
+        """
+        Read package versions from one sync database.
+
+        Args:
+            path: Sync database (a compressed tar archive)
+
+        Returns:
+            Mapping of package name to repository version
+
+        Raises:
+            tarfile.ReadError: If the compression is not supported (zstd)
+        """
+        versions = {}
+        with _open_archive(path) as f:
+            for member in _iter_member_names(f):
+                entry = member.rstrip('/').split('/', 1)[0]
+                if entry.count('-') >= 2:
+                    name, version = split_entry_name(entry)
+                    versions.setdefault(name, version)
+        return versions
+
+    def upgradable(self, item: Optional[str] = None) -> Dict[str, str]:
+        """
+        Get upgradable packages in the shape AppUpgrader.check_updates returns.
+
+        Args:
+            item: Optional package name to restrict the result to
+
+        Returns:
+            Mapping of package name to the newer available version
+        """
+        remaining = self.installed()
+        if item is not None:
+            remaining = {item: remaining[item]} if item in remaining else {}
+        updates = {}
+        for path in self.sync_dbs():
+            if not remaining:
+                break
+            for name, version in self.repo_versions(path).items():
+                current = remaining.pop(name, None)
+                if current is not None and compare_pacman_versions(version, current) > 0:
+                    updates[name] = version
+        return {name: updates[name] for name in sorted(updates)}
@@ -0,0 +1,426 @@
+"""
+In-process readers for the rpm database and cached repository metadata.
+
+Used by the dnf, yum and zypper backends of AppUpgrader.
+"""
+
+import glob
+import gzip
+import lzma
+import os
+import re
+import sqlite3
+import struct
+import time
+from dataclasses import dataclass
+import xml.etree.ElementTree as ElementTree
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .versions import compare_rpm_versions
+
+
+RPMDB_PATHS = ('/var/lib/rpm/rpmdb.sqlite', '/usr/lib/sysimage/rpm/rpmdb.sqlite')
+DNF_CACHE_DIRS = ('/var/cache/dnf', '/var/cache/libdnf5', '/var/cache/yum')
+ZYPPER_CACHE_DIRS = ('/var/cache/zypp/raw',)
+
+RPMTAG_NAME = 1000
+RPMTAG_VERSION = 1001
+RPMTAG_RELEASE = 1002
+RPMTAG_EPOCH = 1003
+RPMTAG_ARCH = 1022
+
+_RPM_INT32_TYPE = 4
+_RPM_STRING_TYPE = 6
+_HEADER_TAGS = frozenset((RPMTAG_NAME, RPMTAG_VERSION, RPMTAG_RELEASE, RPMTAG_EPOCH, RPMTAG_ARCH))
+_ENTRY = struct.Struct('>iiii')
+
+_PRIMARY_PACKAGE = re.compile(
+    rb'<package type="rpm">\s*<name>([^<]*)</name>\s*<arch>([^<]*)</arch>\s*'
+    rb'<version epoch="([^"]*)" ver="([^"]*)" rel="([^"]*)"'
+)
+_PRIMARY_CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class RpmPackage:
+    """One installed rpm package."""
+
+    name: str
+    version: str
+    architecture: str
+
+
+@dataclass
+class RpmCandidate:
+    """Newest available version of an installed rpm package."""
+
+    name: str
+    architecture: str
+    installed: str
+    version: str
+    source: str
+
+
+def format_evr(epoch: Optional[str], version: str, release: str) -> str:
+    """
+    Format an rpm version the way dnf displays it.
+
+    Args:
+        epoch: Epoch, omitted when empty or zero
+        version: Upstream version
+        release: Release
+
+    Returns:
+        Version string such as "2:9.0-1.fc39"
+    """
+    evr = f"{version}-{release}" if release else version
+    if epoch and epoch != '0':
+        evr = f"{epoch}:{evr}"
+    return evr
+
+
+def parse_header(blob: bytes) -> Dict[int, object]:
+    """
+    Decode the name, version, release, epoch and arch tags of an rpm header.
+
+    The rpmdb stores headers without the leading magic: two big-endian
+    int32 counts (index entries, data bytes), the index, then the data.
+
+    Args:
+        blob: Header blob as stored in the rpmdb
+
+    Returns:
+        Mapping of tag number to value for the tags found
+    """
+    index_count, _data_length = struct.unpack_from('>II', blob)
+    data_start = 8 + index_count * _ENTRY.size
+    values: Dict[int, object] = {}
+    for tag, kind, offset, _count in _ENTRY.iter_unpack(blob[8:data_start]):
+        if tag not in _HEADER_TAGS:
+            continue
+        position = data_start + offset
+        if kind == _RPM_STRING_TYPE:
+            end = blob.index(b'\0', position)
+            values[tag] = blob[position:end].decode('utf-8', 'replace')
+        elif kind == _RPM_INT32_TYPE:
+            values[tag] = struct.unpack_from('>i', blob, position)[0]
+    return values
+
+
+def find_rpmdb(paths: Sequence[str] = RPMDB_PATHS) -> Optional[str]:
+    """
+    Find the sqlite rpm database.
+
+    Args:
+        paths: Candidate locations, in order of preference
+
+    Returns:
+        Path to the database, or None if the host uses another rpmdb format
+    """
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def iter_rpmdb(path: str) -> Iterator[RpmPackage]:
+    """
+    Iterate over the packages in a sqlite rpm database.
+
+    Args:
+        path: Path to rpmdb.sqlite
+
+    Yields:
+        Installed packages; gpg-pubkey pseudo-packages are skipped
+    """
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        cursor = connection.execute('SELECT blob FROM Packages')
+    except sqlite3.OperationalError:
+        # Unprivileged users cannot create the WAL index next to the database
+        connection.close()
+        connection = sqlite3.connect(f'file:{path}?immutable=1', uri=True)
+        try:
+            cursor = connection.execute('SELECT blob FROM Packages')
+        except sqlite3.Error:
+            connection.close()
+            raise
+    try:
+        for (blob,) in cursor:
+            tags = parse_header(blob)
+            if RPMTAG_NAME not in tags or RPMTAG_ARCH not in tags:
+                continue
+            epoch = tags.get(RPMTAG_EPOCH)
+            yield RpmPackage(
+                name=tags[RPMTAG_NAME],
+                version=format_evr(
+                    str(epoch) if epoch is not None else None,
+                    tags.get(RPMTAG_VERSION, ''),
+                    tags.get(RPMTAG_RELEASE, ''),
+                ),
+                architecture=tags[RPMTAG_ARCH],
+            )
+    finally:
+        connection.close()
+
+
+def _open_metadata(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_primary(path: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    Stream the binary packages listed in a repository's primary.xml.
+
+    createrepo writes every package's name, arch and version elements
+    first and in that order, so they are matched with one pattern instead
+    of building an XML tree for the large dependency sections that follow.
+    The file is processed in chunks, split at package boundaries.
+
+    Args:
+        path: primary.xml file, optionally gzip or xz compressed
+
+    Yields:
+        Tuples of (name, architecture, version)
+    """
+    with _open_metadata(path) as f:
+        pending = b''
+        while True:
+            chunk = f.read(_PRIMARY_CHUNK_SIZE)
+            data = pending + chunk
+            # Only packages before the last opening tag are known to be complete
+            end = len(data) if not chunk else max(data.rfind(b'<package '), 0)
+            for match in _PRIMARY_PACKAGE.finditer(data, 0, end):
+                name, arch, epoch, ver, rel = (group.decode('utf-8', 'replace') for group in match.groups())
+                if arch not in ('src', 'nosrc'):
+                    yield name, arch, format_evr(epoch, ver, rel)
+            if not chunk:
+                return
+            pending = data[end:]
+
+
+def iter_security_advisories(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Stream the packages fixed by security advisories in an updateinfo.xml.
+
+    Args:
+        path: updateinfo.xml file, optionally gzip or xz compressed
+
+    Yields:
+        Tuples of (name, version)
+    """
+    with _open_metadata(path) as f:
+        for _event, element in ElementTree.iterparse(f):
+            if element.tag != 'update':
+                continue
+            if element.get('type') == 'security':
+                for package in element.iter('package'):
+                    yield package.get('name', ''), format_evr(
+                        package.get('epoch'), package.get('version', ''), package.get('release', '')
+                    )
+            element.clear()
+
+
+def parse_check_update(output: str) -> Dict[str, str]:
+    """
+    Parse `dnf check-update` / `yum check-update` output.
+
+    Args:
+        output: Command output
+
+    Returns:
+        Mapping of package name to available version
+    """
+    updates = {}
+    pending = ''
+    for line in output.splitlines():
+        if line.startswith(('Obsoleting', 'Security:')):
+            break
+        parts = (pending + ' ' + line).split() if pending else line.split()
+        pending = ''
+        if len(parts) == 1 and '.' in parts[0]:
+            # Long package names wrap onto a line of their own
+            pending = parts[0]
+            continue
+        if len(parts) == 3 and '.' in parts[0]:
+            updates[parts[0].rsplit('.', 1)[0]] = parts[1]
+    return updates
+
+
+def parse_zypper_list_updates(output: str) -> Dict[str, str]:
+    """
+    Parse the table printed by `zypper list-updates`.
+
+    Args:
+        output: Command output
+
+    Returns:
+        Mapping of package name to available version
+    """
+    updates = {}
+    for line in output.splitlines():
+        columns = [column.strip() for column in line.split('|')]
+        if len(columns) >= 5 and columns[0] == 'v':
+            updates[columns[2]] = columns[4]
+    return updates
+
+
+class RpmRepoIndex:
+    """
+    Computes upgradable rpm packages from the rpmdb and cached repo metadata.
+
+    Installed packages come from the sqlite rpmdb; candidates from the
+    ``primary.xml`` files dnf, yum and zypper keep in their caches. The
+    newest version for the same name and architecture wins. Repository
+    priorities, excludes and obsoletes are not evaluated.
+    """
+
+    def __init__(self, cache_dirs: Sequence[str] = DNF_CACHE_DIRS, rpmdb_path: Optional[str] = None):
+        """
+        Initialize the index.
+
+        Args:
+            cache_dirs: Directories searched for ``repodata/*primary.xml*``
+            rpmdb_path: Path to rpmdb.sqlite, detected if not given
+        """
+        self.cache_dirs = list(cache_dirs)
+        self.rpmdb_path = rpmdb_path or find_rpmdb()
+
+    def primary_files(self) -> List[str]:
+        """
+        Get the readable primary metadata files currently cached.
+
+        Returns:
+            Sorted list of file paths
+        """
+        return self._metadata_files('primary')
+
+    def updateinfo_files(self) -> List[str]:
+        """
+        Get the readable updateinfo (advisory) files currently cached.
+
+        Returns:
+            Sorted list of file paths
+        """
+        return self._metadata_files('updateinfo')
+
+    def _metadata_files(self, kind: str) -> List[str]:
+        paths = []
+        for cache_dir in self.cache_dirs:
+            for suffix in ('', '.gz', '.xz'):
+                pattern = os.path.join(cache_dir, '**', 'repodata', f'*{kind}.xml{suffix}')
+                paths.extend(glob.glob(pattern, recursive=True))
+        return sorted(paths)
+
+    def available(self) -> bool:
+        """
+        Check whether the rpmdb and cached metadata can be used.
+
+        Returns:
+            True if a sqlite rpmdb and at least one primary file exist
+        """
+        return self.rpmdb_path is not None and os.path.exists(self.rpmdb_path) and bool(self.primary_files())
+
+    def age(self) -> float:
+        """
+        Get the time since cached metadata was last replaced.
+
+        Downloaded metadata files may keep the server's modification time,
+        so the ``repodata`` directories, which change whenever a file in
+        them is replaced, are used instead.
+
+        Returns:
+            Seconds since the metadata was last refreshed, infinity if none exists
+        """
+        mtimes = [os.stat(os.path.dirname(path)).st_mtime for path in self.primary_files()]
+        if not mtimes:
+            return float('inf')
+        return time.time() - max(mtimes)
+
+    def is_stale(self, max_age: float) -> bool:
+        """
+        Check whether the metadata is older than a freshness threshold.
+
+        Args:
+            max_age: Maximum acceptable age in seconds
+
+        Returns:
+            True if the metadata should be refreshed
+        """
+        return self.age() > max_age
+
+    def installed(self) -> Dict[Tuple[str, str], str]:
+        """
+        Read installed package versions from the rpmdb.
+
+        Returns:
+            Mapping of (name, architecture) to the highest installed version
+        """
+        installed: Dict[Tuple[str, str], str] = {}
+        for package in iter_rpmdb(self.rpmdb_path):
+            key = (package.name, package.architecture)
+            # Install-only packages such as kernels have several versions
+            if key not in installed or compare_rpm_versions(package.version, installed[key]) > 0:
+                installed[key] = package.version
+        return installed
+
+    def candidates(self) -> Dict[Tuple[str, str], RpmCandidate]:
+        """
+        Find the newest available version of every installed package.
+
+        Returns:
+            Mapping of (name, architecture) to candidate, only for packages
+            with a version newer than the installed one
+        """
+        installed = self.installed()
+        best: Dict[Tuple[str, str], RpmCandidate] = {}
+
+        for path in self.primary_files():
+            source = os.path.basename(os.path.dirname(os.path.dirname(path)))
+            for name, arch, version in iter_primary(path):
+                key = (name, arch)
+                current = installed.get(key)
+                if current is None or compare_rpm_versions(version, current) <= 0:
+                    continue
+                previous = best.get(key)
+                if previous is None or compare_rpm_versions(version, previous.version) > 0:
+                    best[key] = RpmCandidate(name, arch, current, version, source)
+
+        return best
+
+    def upgradable(self, item: Optional[str] = None) -> Dict[str, str]:
+        """
+        Get upgradable packages in the shape AppUpgrader.check_updates returns.
+
+        Args:
+            item: Optional package name to restrict the result to
+
+        Returns:
+            Mapping of package name to the newer available version
+        """
+        return {
+            candidate.name: candidate.version
+            for candidate in self.candidates().values()
+            if item is None or candidate.name == item
+        }
+
+    def security_updates(self, updates: Dict[str, str]) -> Set[str]:
+        """
+        Find which updates are named by a cached security advisory.
+
+        Args:
+            updates: Mapping of package name to candidate version
+
+        Returns:
+            Names whose candidate version is listed in a security advisory
+        """
+        security = set()
+        for path in self.updateinfo_files():
+            for name, version in iter_security_advisories(path):
+                if updates.get(name) == version:
+                    security.add(name)
+        return security
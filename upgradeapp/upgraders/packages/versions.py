@@ -0,0 +1,437 @@
+"""
+Package version comparison.
+
+dpkg and rpm versions are turned into sort keys once and cached, so
+comparing or sorting large candidate lists is plain tuple comparison.
+pacman's vercmp is not a total order (separator lengths can outweigh
+segment types), so its comparisons are memoized pairwise instead.
+"""
+
+import re
+from functools import cmp_to_key, lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Enough for every installed and candidate version on a large host
+VERSION_CACHE_SIZE = 1 << 16
+
+UPDATE_KINDS = ('major', 'minor', 'patch', 'revision')
+
+_DEB_RUN = re.compile(r'(\D*)(\d*)')
+_DEB_END = ((0,), 0)
+_RPM_SEGMENT = re.compile(r'[^a-zA-Z0-9~^]*(?:(~)|(\^)|(\d+)|([a-zA-Z]+))')
+_NUMBERS = re.compile(r'\d+')
+
+# rpmvercmp ranks what follows a common prefix: '~' < end of string < '^'
+# < letters < digits
+_RPM_TILDE = (0,)
+_RPM_END = (1,)
+_RPM_CARET = (2,)
+_RPM_ALPHA = 3
+_RPM_DIGIT = 4
+
+
+def _order(char: str) -> int:
+    # dpkg ordering: '~' sorts before everything, even the end of the string,
+    # letters sort before non-letters
+    if char == '~':
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _deb_fragment_key(fragment: str) -> tuple:
+    # Alternating non-digit and digit runs, as dpkg's verrevcmp walks them.
+    # Non-digit runs end in 0 (the end of string), which only '~' undercuts.
+    key: list = []
+    position = 0
+    while True:
+        match = _DEB_RUN.match(fragment, position)
+        letters, digits = match.groups()
+        key.append(tuple(_order(char) for char in letters) + (0,))
+        key.append(int(digits) if digits else 0)
+        position = match.end()
+        if position >= len(fragment):
+            break
+    key.extend(_DEB_END)
+    return tuple(key)
+
+
+def _rpm_segments_key(value: str) -> tuple:
+    key = []
+    for tilde, caret, digits, letters in _RPM_SEGMENT.findall(value):
+        if tilde:
+            key.append(_RPM_TILDE)
+        elif caret:
+            key.append(_RPM_CARET)
+        elif digits:
+            key.append((_RPM_DIGIT, int(digits)))
+        else:
+            key.append((_RPM_ALPHA, letters))
+    key.append(_RPM_END)
+    return tuple(key)
+
+
+def _sign(a, b) -> int:
+    return (a > b) - (a < b)
+
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def parse_deb_version(version: str) -> Tuple[int, str, str]:
+    """
+    Split a Debian version into epoch, upstream version and revision.
+
+    Args:
+        version: Version string such as "1:2.30-1ubuntu1"
+
+    Returns:
+        Tuple of (epoch, upstream version, revision)
+    """
+    epoch = 0
+    if ':' in version:
+        epoch_str, version = version.split(':', 1)
+        epoch = int(epoch_str or 0)
+    upstream, _, revision = version.rpartition('-')
+    if not upstream:
+        upstream, revision = revision, ''
+    return epoch, upstream, revision
+
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def deb_version_key(version: str) -> tuple:
+    """
+    Get a sort key ordering Debian versions the way dpkg does.
+
+    Args:
+        version: Version string
+
+    Returns:
+        Tuple that compares like the version
+    """
+    epoch, upstream, revision = parse_deb_version(version)
+    return epoch, _deb_fragment_key(upstream), _deb_fragment_key(revision)
+
+
+def compare_deb_versions(a: str, b: str) -> int:
+    """
+    Compare two Debian package versions with dpkg semantics.
+
+    Args:
+        a: First version
+        b: Second version
+
+    Returns:
+        Negative if a < b, zero if equal, positive if a > b
+    """
+    return _sign(deb_version_key(a), deb_version_key(b))
+
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def rpm_segments_key(value: str) -> tuple:
+    """
+    Get a sort key ordering version or release strings like rpmvercmp.
+
+    Args:
+        value: Version or release string
+
+    Returns:
+        Tuple that compares like the string
+    """
+    return _rpm_segments_key(value)
+
+
+def rpmvercmp(a: str, b: str) -> int:
+    """
+    Compare version or release strings with rpm's rpmvercmp.
+
+    Args:
+        a: First version string
+        b: Second version string
+
+    Returns:
+        -1, 0 or 1
+    """
+    if a == b:
+        return 0
+    return _sign(rpm_segments_key(a), rpm_segments_key(b))
+
+
+def _compare_segment(one: str, two: str, isnum: bool) -> int:
+    if isnum:
+        one = one.lstrip('0')
+        two = two.lstrip('0')
+        if len(one) != len(two):
+            return 1 if len(one) > len(two) else -1
+    if one != two:
+        return 1 if one > two else -1
+    return 0
+
+
+def alpm_vercmp(a: str, b: str) -> int:
+    """
+    Compare version or release strings the way pacman's libalpm does.
+
+    This is the older rpmvercmp variant: no '~' or '^' handling, a
+    differing number of separators decides, and a trailing alphabetic
+    segment sorts before the end of the string (1.0a < 1.0).
+
+    Args:
+        a: First version string
+        b: Second version string
+
+    Returns:
+        -1, 0 or 1
+    """
+    if a == b:
+        return 0
+    i = j = 0
+    prev_a = prev_b = 0
+    while i < len(a) and j < len(b):
+        while i < len(a) and not a[i].isalnum():
+            i += 1
+        while j < len(b) and not b[j].isalnum():
+            j += 1
+        if i >= len(a) or j >= len(b):
+            break
+        if i - prev_a != j - prev_b:
+            return -1 if i - prev_a < j - prev_b else 1
+
+        start_a, start_b = i, j
+        isnum = a[i].isdigit()
+        kind = str.isdigit if isnum else str.isalpha
+        while i < len(a) and kind(a[i]):
+            i += 1
+        while j < len(b) and kind(b[j]):
+            j += 1
+        if j == start_b:
+            return 1 if isnum else -1
+
+        result = _compare_segment(a[start_a:i], b[start_b:j], isnum)
+        if result:
+            return result
+        prev_a, prev_b = i, j
+
+    if i >= len(a) and j >= len(b):
+        return 0
+    if (i >= len(a) and not b[j].isalpha()) or (i < len(a) and a[i].isalpha()):
+        return -1
+    return 1
+
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def parse_evr(version: str) -> Tuple[str, str, str]:
+    """
+    Split an rpm or pacman version into epoch, version and release.
+
+    Args:
+        version: Version string such as "1:2.30-4.fc39"
+
+    Returns:
+        Tuple of (epoch, version, release); epoch defaults to "0" and
+        release is empty when absent
+    """
+    epoch = '0'
+    head, sep, tail = version.partition(':')
+    if sep and head.isdigit():
+        epoch, version = head, tail
+    version, sep, release = version.rpartition('-')
+    if not sep:
+        version, release = release, ''
+    return epoch, version, release
+
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def rpm_version_key(version: str) -> tuple:
+    """
+    Get a sort key ordering rpm ``[epoch:]version[-release]`` strings.
+
+    Unlike compare_rpm_versions, a missing release sorts before any
+    release instead of matching it, which keeps the order total.
+
+    Args:
+        version: Version string
+
+    Returns:
+        Tuple that compares like the version
+    """
+    epoch, upstream, release = parse_evr(version)
+    return int(epoch), rpm_segments_key(upstream), rpm_segments_key(release)
+
+
+def compare_rpm_versions(a: str, b: str) -> int:
+    """
+    Compare two rpm ``[epoch:]version[-release]`` strings.
+
+    Args:
+        a: First version
+        b: Second version
+
+    Returns:
+        Negative if a < b, zero if equal, positive if a > b
+    """
+    a_key = rpm_version_key(a)
+    b_key = rpm_version_key(b)
+    if parse_evr(a)[2] and parse_evr(b)[2]:
+        return _sign(a_key, b_key)
+    # A missing release matches any release, as in rpm
+    return _sign(a_key[:2], b_key[:2])
+
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def compare_pacman_versions(a: str, b: str) -> int:
+    """
+    Compare two pacman ``[epoch:]pkgver-pkgrel`` strings like `vercmp`.
+
+    Args:
+        a: First version
+        b: Second version
+
+    Returns:
+        Negative if a < b, zero if equal, positive if a > b
+    """
+    a_epoch, a_version, a_release = parse_evr(a)
+    b_epoch, b_version, b_release = parse_evr(b)
+    if int(a_epoch) != int(b_epoch):
+        return 1 if int(a_epoch) > int(b_epoch) else -1
+    result = alpm_vercmp(a_version, b_version)
+    if result or not a_release or not b_release:
+        # A missing pkgrel matches any pkgrel, as in pacman
+        return result
+    return alpm_vercmp(a_release, b_release)
+
+
+_COMPARATORS: Dict[str, Callable[[str, str], int]] = {
+    'deb': compare_deb_versions,
+    'rpm': compare_rpm_versions,
+    'pacman': compare_pacman_versions,
+}
+
+_KEYS: Dict[str, Callable[[str], tuple]] = {
+    'deb': deb_version_key,
+    'rpm': rpm_version_key,
+    'pacman': cmp_to_key(compare_pacman_versions),
+}
+
+
+def _comparator(scheme: str) -> Callable[[str, str], int]:
+    try:
+        return _COMPARATORS[scheme]
+    except KeyError:
+        raise ValueError(f"Unknown version scheme: {scheme}") from None
+
+
+def version_key(scheme: str) -> Callable[[str], object]:
+    """
+    Get the sort key function for a version scheme.
+
+    Args:
+        scheme: ``deb``, ``rpm`` or ``pacman``
+
+    Returns:
+        Function usable as ``key=`` for sorted(), min() and max()
+    """
+    _comparator(scheme)
+    return _KEYS[scheme]
+
+
+def compare_versions(a: str, b: str, scheme: str = 'deb') -> int:
+    """
+    Compare two versions under a scheme.
+
+    Args:
+        a: First version
+        b: Second version
+        scheme: ``deb``, ``rpm`` or ``pacman``
+
+    Returns:
+        Negative if a < b, zero if equal, positive if a > b
+    """
+    return _comparator(scheme)(a, b)
+
+
+def sort_versions(versions: Iterable[str], scheme: str = 'deb', reverse: bool = False) -> List[str]:
+    """
+    Sort a list of versions in one call.
+
+    Args:
+        versions: Versions to sort
+        scheme: ``deb``, ``rpm`` or ``pacman``
+        reverse: Newest first if True
+
+    Returns:
+        Sorted list
+    """
+    return sorted(versions, key=version_key(scheme), reverse=reverse)
+
+
+def newest_version(versions: Iterable[str], scheme: str = 'deb') -> Optional[str]:
+    """
+    Pick the newest of several versions.
+
+    Args:
+        versions: Candidate versions
+        scheme: ``deb``, ``rpm`` or ``pacman``
+
+    Returns:
+        The newest version, or None if there are none
+    """
+    return max(versions, key=version_key(scheme), default=None)
+
+
+def compare_pairs(pairs: Sequence[Tuple[str, str]], scheme: str = 'deb') -> List[int]:
+    """
+    Compare many (installed, candidate) pairs in one call.
+
+    Args:
+        pairs: Version pairs
+        scheme: ``deb``, ``rpm`` or ``pacman``
+
+    Returns:
+        -1, 0 or 1 for each pair, in input order
+    """
+    compare = _comparator(scheme)
+    return [max(-1, min(1, compare(a, b))) for a, b in pairs]
+
+
+def _upstream(version: str, scheme: str) -> Tuple[str, str, str]:
+    if scheme == 'deb':
+        epoch, upstream, revision = parse_deb_version(version)
+        return str(epoch), upstream, revision
+    return parse_evr(version)
+
+
+def classify_update(installed: str, candidate: str, scheme: str = 'deb') -> Optional[str]:
+    """
+    Classify the step from an installed version to a candidate.
+
+    The first differing numeric component of the upstream version decides:
+    the first one is ``major``, the second ``minor`` and any later one
+    ``patch``. Epoch changes count as ``major``; a change only in the
+    packaging revision or release is ``revision``.
+
+    Args:
+        installed: Installed version
+        candidate: Candidate version
+        scheme: ``deb``, ``rpm`` or ``pacman``
+
+    Returns:
+        One of UPDATE_KINDS, or None if the candidate is not newer
+    """
+    if compare_versions(candidate, installed, scheme) <= 0:
+        return None
+    old_epoch, old_upstream, _ = _upstream(installed, scheme)
+    new_epoch, new_upstream, _ = _upstream(candidate, scheme)
+    if int(old_epoch or 0) != int(new_epoch or 0):
+        return 'major'
+    if old_upstream == new_upstream:
+        return 'revision'
+    old_numbers = [int(number) for number in _NUMBERS.findall(old_upstream)]
+    new_numbers = [int(number) for number in _NUMBERS.findall(new_upstream)]
+    for position, (old, new) in enumerate(zip(old_numbers, new_numbers)):
+        if old != new:
+            return UPDATE_KINDS[min(position, 2)]
+    if len(old_numbers) != len(new_numbers):
+        # An added component, e.g. 1.2 -> 1.2.1
+        return UPDATE_KINDS[min(len(old_numbers), len(new_numbers), 2)]
+    # Same numbers with a different suffix, e.g. 9.0p1 -> 9.0p2
+    return 'patch'
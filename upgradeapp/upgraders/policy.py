@@ -0,0 +1,242 @@
+"""
+Include/exclude policy deciding which packages and containers upgraders touch.
+
+Each upgrader section may list ``include_<items>`` and ``exclude_<items>``
+rules, where ``<items>`` is ``packages`` or ``containers``. A rule is one
+of:
+
+- a glob such as ``linux-image-*`` or ``web-?``, matched against the whole
+  name (a name without wildcards matches only itself);
+- ``re:<regex>``, searched for anywhere in the name;
+- ``label:<key>`` or ``label:<key>=<glob>``, matched against container
+  labels;
+- ``image:<glob>`` or ``image:re:<regex>``, matched against the container's
+  image reference.
+
+An item matched by an exclude rule is skipped. If there are include rules,
+an item must also match one of them. The rules are compiled once: names
+without wildcards go into a dictionary and every other pattern of a kind
+into one combined regex, so deciding an item costs one lookup and one
+regex match however many rules there are.
+"""
+
+import fnmatch
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Pattern, Sequence, Tuple
+
+
+# Backreferences and inline global flags cannot be embedded in the combined regex
+_UNCOMBINABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)')
+
+
+@dataclass(frozen=True)
+class Decision:
+    """Whether an item may be handled, and the rule that decided it."""
+
+    allowed: bool
+    # Setting and rule that decided, None when no rules apply
+    setting: Optional[str] = None
+    rule: Optional[str] = None
+
+    @property
+    def reason(self) -> str:
+        """Human-readable explanation of the decision."""
+        if self.setting is None:
+            return 'allowed' if self.allowed else 'not allowed'
+        if self.rule is None:
+            return f"not matched by any {self.setting} rule"
+        return f"{'included' if self.allowed else 'excluded'} by {self.setting} rule {self.rule!r}"
+
+
+ALLOWED = Decision(True)
+
+
+class _PatternSet:
+    """Glob and regex patterns matched against one string with a dict lookup plus one regex."""
+
+    def __init__(self, patterns: Sequence[Tuple[int, str]]):
+        """
+        Compile patterns.
+
+        Args:
+            patterns: (rule index, pattern) pairs; a pattern starting with
+                ``re:`` is a regex, anything else a glob
+        """
+        self._exact: Dict[str, int] = {}
+        regexes: List[Tuple[int, str]] = []
+        for index, pattern in patterns:
+            if pattern.startswith('re:'):
+                try:
+                    re.compile(pattern[3:])
+                except re.error as e:
+                    raise ValueError(f"Invalid regex in rule {pattern!r}: {e}") from e
+                # Searched anywhere in the value, like re.search
+                regexes.append((index, f"(?s:.*?)(?:{pattern[3:]})"))
+            elif not any(char in pattern for char in '*?['):
+                self._exact.setdefault(pattern, index)
+            else:
+                regexes.append((index, fnmatch.translate(pattern)))
+
+        self._indexes = [index for index, _ in regexes]
+        self._combined: Optional[Pattern[str]] = None
+        self._each: List[Tuple[int, Pattern[str]]] = []
+        if regexes and not any(_UNCOMBINABLE.search(regex) for _, regex in regexes):
+            self._combined = re.compile('|'.join(f"(?P<r{i}>{regex})" for i, (_, regex) in enumerate(regexes)))
+        else:
+            self._each = [(index, re.compile(regex)) for index, regex in regexes]
+
+    def match(self, value: str) -> Optional[int]:
+        """
+        Find the first rule matching a value.
+
+        Returns:
+            Index of the earliest matching rule, or None
+        """
+        found = self._exact.get(value)
+        if self._combined is not None:
+            # Alternatives are tried in order, so the first match is the earliest regex rule
+            match = self._combined.match(value)
+            if match is not None:
+                index = self._indexes[int(match.lastgroup[1:])]
+                found = index if found is None else min(found, index)
+        else:
+            for index, regex in self._each:
+                if regex.match(value):
+                    found = index if found is None else min(found, index)
+                    break
+        return found
+
+
+class _RuleSet:
+    """One include or exclude list, compiled."""
+
+    def __init__(self, rules: Sequence[str], setting: str):
+        self.rules = [str(rule) for rule in rules]
+        self.setting = setting
+        names: List[Tuple[int, str]] = []
+        images: List[Tuple[int, str]] = []
+        self._labels: List[Tuple[int, str, Optional[Pattern[str]]]] = []
+        for index, rule in enumerate(self.rules):
+            if rule.startswith('label:'):
+                key, has_value, value = rule[len('label:'):].partition('=')
+                self._labels.append((index, key, re.compile(fnmatch.translate(value)) if has_value else None))
+            elif rule.startswith('image:'):
+                images.append((index, rule[len('image:'):]))
+            else:
+                names.append((index, rule))
+        self._names = _PatternSet(names)
+        self._images = _PatternSet(images)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def match(self, name: Optional[str], labels: Optional[Mapping[str, str]],
+              image: Optional[str]) -> Optional[str]:
+        """
+        Find the first rule matching an item.
+
+        Returns:
+            The rule as written, or None
+        """
+        found = self._names.match(name) if name is not None else None
+        if image is not None:
+            index = self._images.match(image)
+            if index is not None and (found is None or index < found):
+                found = index
+        if labels:
+            for index, key, value in self._labels:
+                if found is not None and index > found:
+                    break
+                if key in labels and (value is None or value.match(labels[key])):
+                    found = index
+                    break
+        return self.rules[found] if found is not None else None
+
+
+class Policy:
+    """Compiled include and exclude rules for one kind of item."""
+
+    def __init__(self, include: Iterable[str] = (), exclude: Iterable[str] = (), items: str = 'packages'):
+        """
+        Compile the rules.
+
+        Args:
+            include: Rules an item must match one of, if any are given
+            exclude: Rules skipping the items they match
+            items: ``packages`` or ``containers``, naming the settings in
+                decisions
+
+        Raises:
+            ValueError: If a regex does not compile
+        """
+        self._include = _RuleSet(list(include), f"include_{items}")
+        self._exclude = _RuleSet(list(exclude), f"exclude_{items}")
+
+    @classmethod
+    def from_settings(cls, settings: Mapping, items: str) -> 'Policy':
+        """
+        Compile the ``include_<items>`` and ``exclude_<items>`` rules of an upgrader section.
+
+        Args:
+            settings: The upgrader's configuration section
+            items: ``packages`` or ``containers``
+
+        Returns:
+            Compiled policy
+        """
+        return cls(settings.get(f"include_{items}") or (), settings.get(f"exclude_{items}") or (), items)
+
+    def __bool__(self) -> bool:
+        """Whether there are any rules at all."""
+        return bool(self._include) or bool(self._exclude)
+
+    def decide(self, name: Optional[str], labels: Optional[Mapping[str, str]] = None,
+               image: Optional[str] = None) -> Decision:
+        """
+        Decide whether an item may be handled.
+
+        Args:
+            name: Package or container name; None to decide on labels and
+                image alone
+            labels: Container labels
+            image: Container image reference
+
+        Returns:
+            The decision, naming the rule that made it
+        """
+        if not self:
+            return ALLOWED
+        rule = self._exclude.match(name, labels, image)
+        if rule is not None:
+            return Decision(False, self._exclude.setting, rule)
+        if not self._include:
+            return ALLOWED
+        rule = self._include.match(name, labels, image)
+        return Decision(rule is not None, self._include.setting, rule)
+
+    def allows(self, name: str) -> bool:
+        """
+        Check a name against the rules.
+
+        Args:
+            name: Package or container name
+
+        Returns:
+            True if the item may be handled
+        """
+        return self.decide(name).allowed
+
+    def filter(self, names: Iterable[str]) -> List[str]:
+        """
+        Keep the names the rules allow.
+
+        Args:
+            names: Package or container names
+
+        Returns:
+            Allowed names, in order
+        """
+        if not self:
+            return list(names)
+        return [name for name in names if self.decide(name).allowed]
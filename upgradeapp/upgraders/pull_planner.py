@@ -0,0 +1,238 @@
+"""
+Layer-aware pull planning: fetch the manifests of the images about to be
+pulled, index their layers and order the pulls so layers shared between
+images are downloaded once before the rest fan out.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from ..utils.concurrency import KeyedLimiter, map_limited
+from .registry import RegistryClient, parse_image_reference
+
+logger = logging.getLogger(__name__)
+
+
+# Typical expansion of gzip-compressed layers once unpacked on disk
+DEFAULT_UNPACK_RATIO = 2.5
+
+# (digest, compressed size) of one layer
+Layer = Tuple[str, int]
+
+
+def format_bytes(size: float) -> str:
+    """
+    Format a byte count for humans.
+
+    Args:
+        size: Number of bytes
+
+    Returns:
+        Size such as ``512 B`` or ``1.4 GB``
+    """
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if abs(size) < 1000 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1000
+    return f"{size:.1f} GB"
+
+
+@dataclass
+class PullPlan:
+    """Order in which to pull a set of images, with the bytes it will take."""
+
+    # Images to pull, wave by wave; images within a wave are pulled in parallel
+    waves: List[List[str]] = field(default_factory=list)
+    # Layer digest -> images needing it, for layers not present locally
+    index: Dict[str, List[str]] = field(default_factory=dict)
+    # Layer digest -> compressed size, for layers not present locally
+    sizes: Dict[str, int] = field(default_factory=dict)
+    # Images whose manifest could not be fetched; their bytes are not predicted
+    unknown: List[str] = field(default_factory=list)
+    unpack_ratio: float = DEFAULT_UNPACK_RATIO
+
+    @property
+    def download_bytes(self) -> int:
+        """Compressed bytes to download, counting every missing layer once."""
+        return sum(self.sizes.values())
+
+    @property
+    def unshared_bytes(self) -> int:
+        """Compressed bytes the images would download if no layer were shared."""
+        return sum(self.sizes[layer] * len(images) for layer, images in self.index.items())
+
+    @property
+    def disk_bytes(self) -> int:
+        """Estimated disk space the unpacked layers will take."""
+        return int(self.download_bytes * self.unpack_ratio)
+
+    def shared_layers(self) -> Dict[str, List[str]]:
+        """
+        Get the missing layers needed by more than one image.
+
+        Returns:
+            Mapping of layer digest to the images that share it
+        """
+        return {layer: images for layer, images in self.index.items() if len(images) > 1}
+
+    def summary(self) -> str:
+        """
+        Summarize the plan in one line.
+
+        Returns:
+            Predicted download and disk use, e.g. ``Pull plan: 3 image(s)
+            in 2 wave(s), 120.0 MB to download (2 shared layer(s) save
+            80.0 MB), about 300.0 MB on disk``
+        """
+        images = sum(len(wave) for wave in self.waves)
+        text = (f"Pull plan: {images} image(s) in {len(self.waves)} wave(s), "
+                f"{format_bytes(self.download_bytes)} to download")
+        saved = self.unshared_bytes - self.download_bytes
+        if saved:
+            text += f" ({len(self.shared_layers())} shared layer(s) save {format_bytes(saved)})"
+        text += f", about {format_bytes(self.disk_bytes)} on disk"
+        if self.unknown:
+            text += f"; {len(self.unknown)} image(s) not sized"
+        return text
+
+
+def plan_pulls(
+    images: List[str],
+    layers: Dict[str, Optional[List[Layer]]],
+    present: Set[str],
+    unpack_ratio: float = DEFAULT_UNPACK_RATIO
+) -> PullPlan:
+    """
+    Order pulls so every shared layer is downloaded by a single image first.
+
+    Seed images are chosen greedily, each covering the most bytes of shared
+    layers not covered yet, and are pulled in waves whose images share no
+    missing layer. All other images follow in a final wave, by which time
+    the layers they share are already local.
+
+    Args:
+        images: Image references in their original order
+        layers: Image reference -> its layers, or None if unknown
+        present: Digests of layers already stored locally
+        unpack_ratio: Expansion of compressed layers once unpacked
+
+    Returns:
+        Pull plan covering every image exactly once
+    """
+    plan = PullPlan(unpack_ratio=unpack_ratio)
+    missing: Dict[str, Set[str]] = {}
+    for image in images:
+        if layers.get(image) is None:
+            plan.unknown.append(image)
+            continue
+        missing[image] = set()
+        for digest, size in layers[image]:
+            if digest in present or digest in missing[image]:
+                continue
+            missing[image].add(digest)
+            plan.sizes[digest] = size
+            plan.index.setdefault(digest, []).append(image)
+
+    uncovered = set(plan.shared_layers())
+    seeds: List[str] = []
+    while uncovered:
+        seed = max(
+            (image for image in missing if image not in seeds),
+            key=lambda image: (sum(plan.sizes[layer] for layer in missing[image] & uncovered),
+                               len(missing[image] & uncovered)),
+        )
+        seeds.append(seed)
+        uncovered -= missing[seed]
+
+    for seed in seeds:
+        for wave in plan.waves:
+            if not any(missing[seed] & missing[other] for other in wave):
+                wave.append(seed)
+                break
+        else:
+            plan.waves.append([seed])
+
+    rest = [image for image in images if image not in seeds]
+    if rest:
+        plan.waves.append(rest)
+    return plan
+
+
+class PullPlanner:
+    """
+    Builds pull plans from registry manifests.
+
+    The layers already present locally are taken from the manifests of
+    the local images' repo digests, since neither Docker nor Podman expose
+    the compressed digests of the layers they store.
+    """
+
+    def __init__(
+        self,
+        registry: RegistryClient,
+        local_digests: Callable[[str], List[str]],
+        limiter: Optional[KeyedLimiter] = None,
+        workers: int = 4,
+        unpack_ratio: float = DEFAULT_UNPACK_RATIO
+    ):
+        """
+        Initialize the planner.
+
+        Args:
+            registry: Client used to fetch manifests
+            local_digests: Function returning the ``repository@sha256:...``
+                references recorded for a local image
+            limiter: Optional per-registry limiter for manifest requests
+            workers: Number of images whose manifests are fetched at once
+            unpack_ratio: Expansion of compressed layers once unpacked
+        """
+        self.registry = registry
+        self.local_digests = local_digests
+        self.limiter = limiter
+        self.workers = max(1, int(workers))
+        self.unpack_ratio = unpack_ratio
+
+    def _layers(self, image: str) -> Optional[List[Layer]]:
+        manifest = self.registry.manifest(image)
+        if manifest is None:
+            return None
+        return [(layer['digest'], int(layer.get('size', 0))) for layer in manifest.get('layers', [])]
+
+    def _fetch(self, image: str) -> Tuple[Optional[List[Layer]], List[Layer]]:
+        """Fetch the layers of an image's pull target and of its local copy."""
+        if parse_image_reference(image)[0] == 'localhost':
+            return None, []
+        try:
+            remote = self._layers(image)
+            local: List[Layer] = []
+            for ref in self.local_digests(image):
+                if '@' in ref:
+                    local = self._layers(ref) or []
+                    break
+        except Exception as e:
+            logger.warning(f"Could not size {image}: {e}", extra={'item': image, 'phase': 'plan'})
+            return None, []
+        return remote, local
+
+    def plan(self, images: List[str]) -> PullPlan:
+        """
+        Fetch manifests for the images and plan their pulls.
+
+        Images whose manifests cannot be fetched are still pulled, in the
+        final wave, and left out of the size prediction.
+
+        Args:
+            images: Distinct image references to pull
+
+        Returns:
+            Pull plan for the images
+        """
+        if not images:
+            return PullPlan(unpack_ratio=self.unpack_ratio)
+        fetched = dict(map_limited(self._fetch, images, lambda image: parse_image_reference(image)[0],
+                                   self.limiter or KeyedLimiter(), self.workers))
+
+        present = {digest for _, local in fetched.values() for digest, _ in local}
+        return plan_pulls(images, {image: remote for image, (remote, _) in fetched.items()},
+                          present, self.unpack_ratio)
@@ -0,0 +1,302 @@
+"""
+Container configuration captured from inspect, for recreating a container
+from a new image.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+# Network modes that are not user-defined networks
+SPECIAL_NETWORK_MODES = ('default', 'bridge', 'host', 'none')
+
+# Default networks of Docker and Podman
+DEFAULT_NETWORKS = ('bridge', 'podman')
+
+# HostConfig keys with a direct CLI flag: key -> (flag, kind)
+HOST_CONFIG_FLAGS = {
+    'Privileged': ('--privileged', 'bool'),
+    'ReadonlyRootfs': ('--read-only', 'bool'),
+    'Init': ('--init', 'bool'),
+    'CapAdd': ('--cap-add', 'list'),
+    'CapDrop': ('--cap-drop', 'list'),
+    'Dns': ('--dns', 'list'),
+    'ExtraHosts': ('--add-host', 'list'),
+    'SecurityOpt': ('--security-opt', 'list'),
+    'GroupAdd': ('--group-add', 'list'),
+    'Memory': ('--memory', 'int'),
+    'NanoCpus': ('--cpus', 'cpus'),
+    'ShmSize': ('--shm-size', 'int'),
+}
+
+# Default /dev/shm size, which Docker reports even when not configured
+DEFAULT_SHM_SIZE = 64 * 1024 * 1024
+
+
+@dataclass
+class ContainerSpec:
+    """Everything needed to create an equivalent container from another image."""
+
+    name: str
+    image: str
+    env: List[str] = field(default_factory=list)
+    cmd: Optional[List[str]] = None
+    entrypoint: Optional[List[str]] = None
+    labels: Dict[str, str] = field(default_factory=dict)
+    user: str = ''
+    working_dir: str = ''
+    hostname: str = ''
+    tty: bool = False
+    interactive: bool = False
+    mounts: List[Dict[str, Any]] = field(default_factory=list)
+    port_bindings: Dict[str, List[Dict[str, str]]] = field(default_factory=dict)
+    publish_all: bool = False
+    network_mode: str = ''
+    networks: Dict[str, List[str]] = field(default_factory=dict)
+    restart_policy: Dict[str, Any] = field(default_factory=dict)
+    pod: str = ''
+    running: bool = False
+    host_config: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def primary_network(self) -> Optional[str]:
+        """The user-defined network the container is created on, if any."""
+        mode = self.network_mode
+        if mode in ('', 'default', 'bridge'):
+            # Podman reports bridge mode for every netavark/CNI network
+            custom = [name for name in self.networks if name not in DEFAULT_NETWORKS]
+            if custom and len(custom) == len(self.networks):
+                return custom[0]
+            return None
+        if mode in SPECIAL_NETWORK_MODES or ':' in mode:
+            return None
+        return mode
+
+    def extra_networks(self) -> Dict[str, List[str]]:
+        """
+        Get the networks to connect after creation.
+
+        Returns:
+            Mapping of network name to aliases, without the network the
+            container is created on
+        """
+        if self.pod or self.network_mode in ('host', 'none') or ':' in self.network_mode:
+            return {}
+        primary = self.primary_network
+        return {
+            name: aliases for name, aliases in self.networks.items()
+            if name != primary and not (primary is None and name in DEFAULT_NETWORKS)
+        }
+
+    def _volume_args(self) -> List[str]:
+        args = []
+        for mount in self.mounts:
+            mount_type = mount.get('Type')
+            destination = mount.get('Destination', '')
+            if mount_type == 'tmpfs':
+                args += ['--tmpfs', destination]
+                continue
+            source = mount.get('Name') if mount_type == 'volume' else mount.get('Source')
+            if mount_type not in ('bind', 'volume') or not source or not destination:
+                continue
+            options = [] if mount.get('RW', True) else ['ro']
+            options += [o for o in (mount.get('Mode') or '').split(',') if o and o not in ('rw', 'ro')]
+            args += ['-v', ':'.join([source, destination] + ([','.join(options)] if options else []))]
+        return args
+
+    def _port_args(self) -> List[str]:
+        args = ['-P'] if self.publish_all else []
+        for port, bindings in self.port_bindings.items():
+            for binding in bindings or [{}]:
+                host = binding.get('HostPort', '')
+                host_ip = binding.get('HostIp', '')
+                if ':' in host_ip:
+                    host_ip = f"[{host_ip}]"
+                published = ':'.join(part for part in (host_ip, host) if part) if host else ''
+                args += ['-p', f"{published}:{port}" if published else port]
+        return args
+
+    def _host_config_args(self) -> List[str]:
+        args = []
+        for key, (flag, kind) in HOST_CONFIG_FLAGS.items():
+            value = self.host_config.get(key)
+            if not value or (key == 'ShmSize' and value == DEFAULT_SHM_SIZE):
+                continue
+            if kind == 'bool':
+                args.append(flag)
+            elif kind == 'list':
+                for entry in value:
+                    args += [flag, str(entry)]
+            elif kind == 'cpus':
+                args += [flag, f"{value / 1e9:g}"]
+            else:
+                args += [flag, str(value)]
+        for device in self.host_config.get('Devices') or []:
+            args += ['--device', ':'.join(
+                part for part in (device.get('PathOnHost'), device.get('PathInContainer'),
+                                  device.get('CgroupPermissions')) if part
+            )]
+        log_config = self.host_config.get('LogConfig') or {}
+        if log_config.get('Type'):
+            args += ['--log-driver', log_config['Type']]
+            for key, value in (log_config.get('Config') or {}).items():
+                args += ['--log-opt', f"{key}={value}"]
+        return args
+
+    def create_args(self, name: str) -> List[str]:
+        """
+        Build `create` arguments for the replacement container.
+
+        Args:
+            name: Name to create the replacement under
+
+        Returns:
+            Arguments following the CLI's ``create`` subcommand, ending
+            with the image and any command
+        """
+        args = ['--name', name]
+        for entry in self.env:
+            args += ['-e', entry]
+        for key, value in self.labels.items():
+            args += ['--label', f"{key}={value}"]
+        if self.user:
+            args += ['--user', self.user]
+        if self.working_dir:
+            args += ['--workdir', self.working_dir]
+        if self.hostname:
+            args += ['--hostname', self.hostname]
+        if self.tty:
+            args.append('-t')
+        if self.interactive:
+            args.append('-i')
+        args += self._volume_args()
+
+        if self.pod:
+            # The pod owns the network namespace and published ports
+            args += ['--pod', self.pod]
+        else:
+            args += self._port_args()
+            primary = self.primary_network
+            if primary:
+                args += ['--network', primary]
+                for alias in self.networks.get(primary, []):
+                    args += ['--network-alias', alias]
+            elif self.network_mode and self.network_mode not in ('default', 'bridge'):
+                args += ['--network', self.network_mode]
+
+        policy = self.restart_policy.get('Name')
+        if policy and policy != 'no':
+            retries = self.restart_policy.get('MaximumRetryCount')
+            args += ['--restart', f"{policy}:{retries}" if policy == 'on-failure' and retries else policy]
+        args += self._host_config_args()
+
+        command = self.cmd or []
+        if self.entrypoint:
+            args += ['--entrypoint', self.entrypoint[0]]
+            command = self.entrypoint[1:] + command
+        return args + [self.image] + command
+
+    def api_body(self) -> Dict[str, Any]:
+        """
+        Build the Docker Engine API create body for the replacement.
+
+        The full HostConfig is passed through unchanged, so settings without
+        a CLI flag in create_args are kept as well.
+
+        Returns:
+            JSON body for ``POST /containers/create``
+        """
+        body: Dict[str, Any] = {
+            'Image': self.image,
+            'Env': self.env,
+            'Labels': self.labels,
+            'Tty': self.tty,
+            'OpenStdin': self.interactive,
+            'ExposedPorts': {port: {} for port in self.port_bindings},
+            'HostConfig': dict(self.host_config),
+        }
+        for key, value in (('Cmd', self.cmd), ('Entrypoint', self.entrypoint), ('User', self.user),
+                           ('WorkingDir', self.working_dir), ('Hostname', self.hostname)):
+            if value:
+                body[key] = value
+
+        # Keep anonymous volumes, which HostConfig does not mention
+        binds = list(body['HostConfig'].get('Binds') or [])
+        declared = {bind.split(':')[1] for bind in binds if ':' in bind}
+        declared.update(mount.get('Target') for mount in body['HostConfig'].get('Mounts') or [])
+        for mount in self.mounts:
+            if mount.get('Type') == 'volume' and mount.get('Name') and mount.get('Destination') not in declared:
+                binds.append(f"{mount['Name']}:{mount['Destination']}")
+        body['HostConfig']['Binds'] = binds or None
+
+        primary = self.primary_network
+        if primary:
+            body['NetworkingConfig'] = {'EndpointsConfig': {primary: {'Aliases': self.networks.get(primary, [])}}}
+        return body
+
+
+def _overrides(values: Optional[List[str]], defaults: Optional[List[str]]) -> Optional[List[str]]:
+    return values if values and values != defaults else None
+
+
+def container_spec(data: Dict[str, Any], image_data: Optional[Dict[str, Any]] = None) -> ContainerSpec:
+    """
+    Capture a container's configuration from `inspect` output.
+
+    Settings equal to the defaults of the image the container was created
+    from (environment, labels, command, user, working directory) are left
+    out, so the replacement picks up the new image's defaults for them.
+
+    Args:
+        data: Parsed inspect document for the container
+        image_data: Parsed inspect document for the container's current
+            image, if available
+
+    Returns:
+        Container spec; its ``image`` is the container's current reference
+    """
+    config = data.get('Config') or {}
+    host_config = data.get('HostConfig') or {}
+    image_config = (image_data or {}).get('Config') or {}
+    container_id = data.get('Id', '')
+    state = data.get('State') or {}
+
+    image_env = set(image_config.get('Env') or [])
+    image_labels = image_config.get('Labels') or {}
+    entrypoint = _overrides(config.get('Entrypoint'), image_config.get('Entrypoint'))
+    # Overriding the entrypoint resets the image's command, so keep the effective one
+    cmd = config.get('Cmd') if entrypoint else _overrides(config.get('Cmd'), image_config.get('Cmd'))
+
+    networks = {}
+    for network, endpoint in ((data.get('NetworkSettings') or {}).get('Networks') or {}).items():
+        aliases = (endpoint or {}).get('Aliases') or []
+        networks[network] = [alias for alias in aliases if alias not in (container_id[:12], container_id)]
+
+    hostname = config.get('Hostname', '')
+    if host_config.get('NetworkMode') == 'host' or container_id.startswith(hostname):
+        hostname = ''
+
+    return ContainerSpec(
+        name=(data.get('Name') or '').lstrip('/'),
+        image=config.get('Image', ''),
+        env=[entry for entry in config.get('Env') or [] if entry not in image_env],
+        cmd=cmd,
+        entrypoint=entrypoint,
+        labels={key: value for key, value in (config.get('Labels') or {}).items()
+                if image_labels.get(key) != value},
+        user=config.get('User', '') if config.get('User') != image_config.get('User') else '',
+        working_dir=(config.get('WorkingDir', '')
+                     if config.get('WorkingDir') != image_config.get('WorkingDir') else ''),
+        hostname=hostname,
+        tty=bool(config.get('Tty')),
+        interactive=bool(config.get('OpenStdin')),
+        mounts=data.get('Mounts') or [],
+        port_bindings=host_config.get('PortBindings') or {},
+        publish_all=bool(host_config.get('PublishAllPorts')),
+        network_mode=host_config.get('NetworkMode') or '',
+        networks=networks,
+        restart_policy=host_config.get('RestartPolicy') or {},
+        pod=data.get('Pod') or '',
+        running=bool(state.get('Running')) if isinstance(state, dict) else False,
+        host_config=host_config,
+    )
@@ -0,0 +1,346 @@
+"""
+Container registry (Distribution v2 API) client for digest-based update checks.
+"""
+
+import base64
+import hashlib
+import http.client
+import json
+import platform
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from ..utils.tracing import span
+from .docker_api import split_image_reference
+
+
+DOCKER_HUB = 'registry-1.docker.io'
+
+MANIFEST_MEDIA_TYPES = ', '.join([
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+])
+
+
+# platform.machine() values mapped to OCI (architecture, variant)
+OCI_ARCHITECTURES = {
+    'x86_64': ('amd64', ''),
+    'amd64': ('amd64', ''),
+    'aarch64': ('arm64', ''),
+    'arm64': ('arm64', ''),
+    'armv7l': ('arm', 'v7'),
+    'armv6l': ('arm', 'v6'),
+    'i686': ('386', ''),
+    'i386': ('386', ''),
+    'ppc64le': ('ppc64le', ''),
+    's390x': ('s390x', ''),
+    'riscv64': ('riscv64', ''),
+}
+
+
+class RegistryError(Exception):
+    """Raised when a registry request fails."""
+
+
+def parse_image_reference(image: str) -> Tuple[str, str, str]:
+    """
+    Split an image reference into registry host, repository and tag.
+
+    Docker Hub short names are expanded the same way the docker CLI does,
+    so "nginx" becomes ("registry-1.docker.io", "library/nginx", "latest").
+
+    Args:
+        image: Image reference
+
+    Returns:
+        Tuple of (registry host, repository path, tag or digest)
+    """
+    name, tag = split_image_reference(image)
+    first, _, rest = name.partition('/')
+    if rest and ('.' in first or ':' in first or first == 'localhost'):
+        host, repository = first, rest
+    else:
+        host, repository = DOCKER_HUB, name
+    if host in ('docker.io', 'index.docker.io'):
+        host = DOCKER_HUB
+    if host == DOCKER_HUB and '/' not in repository:
+        repository = f"library/{repository}"
+    return host, repository, tag
+
+
+def host_platform() -> Tuple[str, str, str]:
+    """
+    Get the OCI platform images are pulled for on this host.
+
+    Returns:
+        Tuple of (os, architecture, variant), e.g. ("linux", "amd64", "")
+    """
+    machine = platform.machine().lower()
+    architecture, variant = OCI_ARCHITECTURES.get(machine, (machine, ''))
+    return 'linux', architecture, variant
+
+
+def _select_platform(manifests: List[Dict[str, Any]], target: Tuple[str, str, str]) -> Optional[Dict[str, Any]]:
+    os_name, architecture, variant = target
+    candidates = [
+        entry for entry in manifests
+        if (entry.get('platform') or {}).get('os') == os_name
+        and (entry.get('platform') or {}).get('architecture') == architecture
+    ]
+    for entry in candidates:
+        if not variant or entry['platform'].get('variant', variant) == variant:
+            return entry
+    return candidates[0] if candidates else None
+
+
+def _parse_challenge(header: str) -> Tuple[str, Dict[str, str]]:
+    scheme, _, params = header.partition(' ')
+    return scheme.lower(), dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+
+class RegistryClient:
+    """
+    Registry v2 client that resolves manifest digests with HEAD requests
+    and fetches image manifests for pull planning.
+
+    Idle keep-alive connections are pooled per registry host and bearer
+    tokens are cached per repository scope, so checking many images on the
+    same registry costs a handful of TCP/TLS handshakes and one token fetch
+    per repository. The client is safe to share between threads.
+
+    ``validators`` maps an image reference to the ``(etag, digest)`` of its
+    last resolved manifest. When an image has a validator the request
+    carries ``If-None-Match`` and a 304 answer reuses the known digest;
+    callers may seed it from an earlier run.
+    """
+
+    def __init__(
+        self,
+        insecure_registries: Iterable[str] = (),
+        credentials: Optional[Dict[str, Dict[str, str]]] = None,
+        timeout: float = 30
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            insecure_registries: Registry hosts to reach over plain HTTP
+            credentials: Mapping of registry host to a dict with
+                ``username`` and ``password``
+            timeout: Socket timeout in seconds
+        """
+        self.insecure_registries = set(insecure_registries)
+        self.credentials = credentials or {}
+        self.timeout = timeout
+        self._idle: Dict[str, List[http.client.HTTPConnection]] = {}
+        self._idle_lock = threading.Lock()
+        self._tokens: Dict[Tuple[str, str], str] = {}
+        self._token_lock = threading.Lock()
+        self.validators: Dict[str, Tuple[str, str]] = {}
+        self._manifests: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+
+    def _connect(self, host: str) -> http.client.HTTPConnection:
+        if host in self.insecure_registries:
+            return http.client.HTTPConnection(host, timeout=self.timeout)
+        return http.client.HTTPSConnection(host, timeout=self.timeout)
+
+    def _acquire(self, host: str) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._idle_lock:
+            idle = self._idle.get(host)
+            if idle:
+                return idle.pop(), True
+        return self._connect(host), False
+
+    def _release(self, host: str, conn: http.client.HTTPConnection) -> None:
+        with self._idle_lock:
+            self._idle.setdefault(host, []).append(conn)
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        with self._idle_lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
+
+    def _send(self, host: str, method: str, path: str,
+              headers: Dict[str, str]) -> Tuple[http.client.HTTPResponse, bytes]:
+        """Send a request on a pooled connection, reconnecting once if it went stale."""
+        with span(f"registry {method} {host}", 'http', path=path, registry=host) as request_span:
+            response, body = self._send_pooled(host, method, path, headers)
+            request_span.set(status=response.status, output_bytes=len(body))
+        return response, body
+
+    def _send_pooled(self, host: str, method: str, path: str,
+                     headers: Dict[str, str]) -> Tuple[http.client.HTTPResponse, bytes]:
+        for attempt in range(2):
+            conn, reused = self._acquire(host) if attempt == 0 else (self._connect(host), False)
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(host, conn)
+            return response, body
+        raise RegistryError(f"Could not reach registry {host}")
+
+    def _basic_auth(self, host: str) -> Optional[str]:
+        creds = self.credentials.get(host)
+        if not creds:
+            return None
+        raw = f"{creds.get('username', '')}:{creds.get('password', '')}".encode()
+        return 'Basic ' + base64.b64encode(raw).decode()
+
+    def _fetch_token(self, host: str, challenge: Dict[str, str], scope: str) -> str:
+        realm = urlsplit(challenge['realm'])
+        params = {'scope': challenge.get('scope', scope)}
+        if 'service' in challenge:
+            params['service'] = challenge['service']
+        path = f"{realm.path or '/'}?{urlencode(params)}"
+
+        headers = {}
+        basic = self._basic_auth(host)
+        if basic:
+            headers['Authorization'] = basic
+
+        # The token realm usually lives on a different host (auth.docker.io),
+        # so it gets its own pooled connection keyed by netloc.
+        realm_host = realm.netloc
+        if realm.scheme == 'http':
+            self.insecure_registries.add(realm_host)
+        response, body = self._send(realm_host, 'GET', path, headers)
+        if response.status != 200:
+            raise RegistryError(f"Token request to {challenge['realm']} failed with HTTP {response.status}")
+
+        payload = json.loads(body)
+        token = payload.get('token') or payload.get('access_token')
+        if not token:
+            raise RegistryError(f"No token in response from {challenge['realm']}")
+        return token
+
+    def _authorized_send(self, host: str, repository: str, method: str, path: str,
+                         headers: Dict[str, str]) -> Tuple[http.client.HTTPResponse, bytes]:
+        """Send a request for a repository, answering a bearer challenge once."""
+        scope = f"repository:{repository}:pull"
+        for attempt in range(2):
+            token = self._tokens.get((host, scope))
+            if token:
+                headers['Authorization'] = f"Bearer {token}"
+            elif self._basic_auth(host):
+                headers['Authorization'] = self._basic_auth(host)
+
+            response, body = self._send(host, method, path, headers)
+            if response.status != 401:
+                return response, body
+            # A cached token may have expired, so refetch it once
+            scheme, challenge = _parse_challenge(response.getheader('WWW-Authenticate', ''))
+            if scheme != 'bearer' or attempt == 1:
+                raise RegistryError(f"Registry {host} rejected credentials for {repository}")
+            with self._token_lock:
+                # Another thread may have refreshed the token while we waited
+                if self._tokens.get((host, scope)) == token:
+                    self._tokens[(host, scope)] = self._fetch_token(host, challenge, scope)
+        raise RegistryError(f"Registry {host} rejected credentials for {repository}")
+
+    def manifest_digest(self, image: str) -> Optional[str]:
+        """
+        Resolve the current manifest digest of an image tag without pulling it.
+
+        Args:
+            image: Image reference
+
+        Returns:
+            The "sha256:..." digest of the manifest (or manifest list) the
+            tag currently points at, or None if the tag does not exist
+        """
+        host, repository, tag = parse_image_reference(image)
+        if tag.startswith('sha256:'):
+            return tag
+
+        path = f"/v2/{repository}/manifests/{tag}"
+        headers = {'Accept': MANIFEST_MEDIA_TYPES}
+        validator = self.validators.get(image)
+        if validator:
+            headers['If-None-Match'] = validator[0]
+
+        response, _ = self._authorized_send(host, repository, 'HEAD', path, headers)
+
+        if response.status == 304 and validator:
+            return validator[1]
+        if response.status == 404:
+            self.validators.pop(image, None)
+            return None
+        if response.status != 200:
+            raise RegistryError(f"Manifest request for {image} failed with HTTP {response.status}")
+
+        digest = response.getheader('Docker-Content-Digest')
+        if not digest:
+            # Some registries only send the digest header on GET
+            headers.pop('If-None-Match', None)
+            response, body = self._send(host, 'GET', path, headers)
+            if response.status != 200:
+                raise RegistryError(f"Manifest request for {image} failed with HTTP {response.status}")
+            digest = response.getheader('Docker-Content-Digest') or 'sha256:' + hashlib.sha256(body).hexdigest()
+
+        etag = response.getheader('ETag')
+        if etag:
+            self.validators[image] = (etag, digest)
+        return digest
+
+    def manifest(self, image: str, target: Optional[Tuple[str, str, str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the image manifest an image reference resolves to.
+
+        Manifest lists and OCI indexes are resolved to the entry for the
+        target platform. Manifests addressed by digest never change, so
+        they are cached for the lifetime of the client.
+
+        Args:
+            image: Image reference, by tag or digest
+            target: (os, architecture, variant) to resolve indexes for;
+                defaults to host_platform()
+
+        Returns:
+            Parsed image manifest with ``config`` and ``layers``, or None if
+            the reference does not exist
+
+        Raises:
+            RegistryError: If the registry fails the request or an index has
+                no entry for the platform
+        """
+        host, repository, reference = parse_image_reference(image)
+        key = (host, repository, reference)
+        if key in self._manifests:
+            return self._manifests[key]
+
+        path = f"/v2/{repository}/manifests/{reference}"
+        response, body = self._authorized_send(host, repository, 'GET', path, {'Accept': MANIFEST_MEDIA_TYPES})
+        if response.status == 404:
+            return None
+        if response.status != 200:
+            raise RegistryError(f"Manifest request for {image} failed with HTTP {response.status}")
+
+        document = json.loads(body)
+        if 'manifests' in document:
+            target = target or host_platform()
+            entry = _select_platform(document['manifests'], target)
+            if entry is None:
+                raise RegistryError(f"No {'/'.join(part for part in target if part)} manifest for {image}")
+            document = self.manifest(f"{host}/{repository}@{entry['digest']}", target)
+        if reference.startswith('sha256:') and document is not None:
+            self._manifests[key] = document
+        return document
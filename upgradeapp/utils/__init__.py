@@ -2,7 +2,8 @@
 Utility modules for the upgrade application.
 """
 
+from .concurrency import CheckEngine, check_many
 from .config import Config
-from .logger import setup_logger
+from .logger import setup_logger, shutdown_logger
 
-__all__ = ['Config', 'setup_logger']
+__all__ = ['CheckEngine', 'Config', 'check_many', 'setup_logger', 'shutdown_logger']
@@ -0,0 +1,104 @@
+"""
+asyncio helpers: cancellable subprocesses and concurrent tasks with timeouts.
+"""
+
+import asyncio
+import contextvars
+import functools
+import subprocess
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, TypeVar, Union
+
+from .runner import CommandRunner
+
+
+T = TypeVar('T')
+
+
+async def run_process(
+    cmd: Sequence[str],
+    timeout: Optional[float] = None,
+    capture_output: bool = True
+) -> subprocess.CompletedProcess:
+    """
+    Run a command as an asyncio subprocess.
+
+    The process is terminated (then killed after a grace period) when it
+    exceeds its timeout or the awaiting task is cancelled, so cancelling
+    a run never leaves children behind. Upgraders use CommandRunner
+    directly; this keeps the subprocess.run-like interface.
+
+    Args:
+        cmd: Command and arguments
+        timeout: Optional timeout in seconds
+        capture_output: If True, capture stdout and stderr as text;
+            otherwise they are inherited from this process
+
+    Returns:
+        Completed process, like subprocess.run
+
+    Raises:
+        subprocess.TimeoutExpired: If the command exceeded its timeout
+        OSError: If the command could not be started
+    """
+    result = await CommandRunner(retries=0).run_async(cmd, timeout, capture=capture_output, keep_all=True)
+    if result.error is not None:
+        raise result.error
+    if result.timed_out:
+        raise subprocess.TimeoutExpired(list(cmd), timeout)
+    return subprocess.CompletedProcess(result.args, result.returncode, result.stdout, result.stderr)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any) -> T:
+    """
+    Run a blocking function on the loop's default executor.
+
+    Cancelling the awaiting task stops waiting for the result, but the
+    function itself runs to completion on its worker thread. The function
+    runs in a copy of the caller's context, so tracing spans it opens nest
+    under the caller's.
+
+    Args:
+        func: Function to call
+        *args: Positional arguments for the function
+
+    Returns:
+        The function's return value
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, func, *args))
+
+
+async def gather_with_timeouts(
+    tasks: Dict[str, Awaitable[T]],
+    timeout: Optional[float] = None,
+    on_result: Optional[Callable[[str, Union[T, BaseException]], None]] = None
+) -> Dict[str, Union[T, BaseException]]:
+    """
+    Run named awaitables concurrently, each under its own timeout.
+
+    A task that fails or times out does not affect the others; its
+    exception is returned in place of a result. Cancelling the caller
+    cancels every task still running.
+
+    Args:
+        tasks: Mapping of name to awaitable
+        timeout: Optional timeout in seconds applied to each task
+        on_result: Optional callback invoked with each name and result (or
+            exception) as soon as that task finishes
+
+    Returns:
+        Mapping of name to result or exception, in input order
+    """
+    async def guarded(name: str, awaitable: Awaitable[T]) -> Union[T, BaseException]:
+        try:
+            result: Union[T, BaseException] = await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            result = asyncio.TimeoutError(f"{name} did not finish within {timeout} seconds")
+        except Exception as e:
+            result = e
+        if on_result is not None:
+            on_result(name, result)
+        return result
+
+    results = await asyncio.gather(*(guarded(name, awaitable) for name, awaitable in tasks.items()))
+    return dict(zip(tasks, results))
@@ -0,0 +1,404 @@
+"""
+Concurrent execution helpers for update checks.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# How long the dispatcher waits for a key saturated by operations it did not start
+_SATURATED_POLL = 0.05
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting how often an operation may start."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            rate: Permitted operations per second
+            burst: Maximum number of operations allowed back to back,
+                defaults to one second's worth
+        """
+        self.rate = rate
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Start an operation if a token is available right now.
+
+        Returns:
+            0 if the operation may start, otherwise the seconds until a
+            token becomes available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Block until an operation may start."""
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            time.sleep(delay)
+
+
+class KeyedLimiter:
+    """
+    Per-key concurrency and rate caps, e.g. one set of limits per registry host.
+
+    Limits are given as ``{key: {'concurrency': int, 'rate': float}}``; the
+    ``default`` entry applies to keys without their own entry. Missing
+    values mean unlimited.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None):
+        self.limits = limits or {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._rates: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _limits_for(self, key: str) -> Tuple[Optional[threading.BoundedSemaphore], Optional[RateLimiter]]:
+        with self._lock:
+            if key not in self._semaphores and key not in self._rates:
+                settings = self.limits.get(key, self.limits.get('default', {}))
+                if settings.get('concurrency'):
+                    self._semaphores[key] = threading.BoundedSemaphore(int(settings['concurrency']))
+                if settings.get('rate'):
+                    self._rates[key] = RateLimiter(float(settings['rate']), settings.get('burst'))
+            return self._semaphores.get(key), self._rates.get(key)
+
+    def try_acquire(self, key: str) -> float:
+        """
+        Start an operation for a key if its limits allow it right now.
+
+        Args:
+            key: Limit key, e.g. a registry host
+
+        Returns:
+            0 if the operation may start, in which case release() must be
+            called when it ends; otherwise the seconds to wait before
+            trying again, or infinity if the key is at its concurrency cap
+            until a running operation ends
+        """
+        semaphore, rate = self._limits_for(key)
+        if semaphore is not None and not semaphore.acquire(blocking=False):
+            return math.inf
+        delay = rate.try_acquire() if rate is not None else 0.0
+        if delay and semaphore is not None:
+            semaphore.release()
+        return delay
+
+    def release(self, key: str) -> None:
+        """
+        End an operation started with try_acquire.
+
+        Args:
+            key: Limit key the operation was started for
+        """
+        semaphore = self._limits_for(key)[0]
+        if semaphore is not None:
+            semaphore.release()
+
+    def run(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        Run a function within the limits for a key, blocking until they allow it.
+
+        Args:
+            key: Limit key, e.g. a registry host
+            func: Function to run
+
+        Returns:
+            The function's return value
+        """
+        semaphore, rate = self._limits_for(key)
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            if rate is not None:
+                rate.acquire()
+            return func()
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+
+def map_limited(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    key: Callable[[T], str],
+    limiter: KeyedLimiter,
+    workers: int,
+    ordered: bool = False
+) -> Iterator[Tuple[T, R]]:
+    """
+    Run a function over items on a worker pool, within per-key limits.
+
+    An item is only handed to the pool once its key's limits admit it, so
+    no worker sits waiting on a saturated or rate-limited key while items
+    for other keys are ready to run.
+
+    Args:
+        func: Function to run for each item
+        items: Items to process
+        key: Function mapping an item to its limit key
+        limiter: Limits to run the items within
+        workers: Size of the worker pool
+        ordered: If True, yield in input order; otherwise yield each
+            result as soon as it is ready
+
+    Yields:
+        (item, result) for every item
+
+    Raises:
+        Exception: Whatever func raised, once that item's result is due
+    """
+    items = list(items)
+    if not items:
+        return
+    workers = max(1, min(int(workers), len(items)))
+    # Indexes of the items still to start, per key and in input order
+    queues: Dict[str, Deque[int]] = {}
+    for index, item in enumerate(items):
+        queues.setdefault(key(item), deque()).append(index)
+    running: Dict[Future, int] = {}
+    done: Dict[int, Future] = {}
+    next_index = 0
+
+    def call(item: T, item_key: str) -> R:
+        try:
+            return func(item)
+        finally:
+            limiter.release(item_key)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while queues or running:
+            retry = math.inf
+            for item_key in list(queues):
+                queue = queues[item_key]
+                while queue and len(running) < workers:
+                    delay = limiter.try_acquire(item_key)
+                    if delay:
+                        retry = min(retry, delay)
+                        break
+                    index = queue.popleft()
+                    running[pool.submit(call, items[index], item_key)] = index
+                if not queue:
+                    del queues[item_key]
+            if not running:
+                # Every key waits on its rate, or on operations started outside this call
+                time.sleep(retry if retry != math.inf else _SATURATED_POLL)
+                continue
+
+            finished, _ = wait(list(running), timeout=None if retry == math.inf else retry,
+                               return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = running.pop(future)
+                if not ordered:
+                    yield items[index], future.result()
+                else:
+                    done[index] = future
+            while next_index in done:
+                yield items[next_index], done.pop(next_index).result()
+                next_index += 1
+
+
+class AsyncRateLimiter:
+    """Token bucket like RateLimiter, for tasks on a single event loop."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            rate: Permitted operations per second
+            burst: Maximum number of operations allowed back to back,
+                defaults to one second's worth
+        """
+        self.rate = rate
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        """Wait until an operation may start."""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncKeyedLimiter:
+    """
+    asyncio counterpart of KeyedLimiter.
+
+    Takes the same ``{key: {'concurrency': int, 'rate': float}}`` limits.
+    Instances must only be used from the event loop that created them.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None):
+        self.limits = limits or {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._rates: Dict[str, AsyncRateLimiter] = {}
+        self._configured = set()
+
+    def _limits_for(self, key: str) -> Tuple[Optional[asyncio.Semaphore], Optional[AsyncRateLimiter]]:
+        if key not in self._configured:
+            self._configured.add(key)
+            settings = self.limits.get(key, self.limits.get('default', {}))
+            if settings.get('concurrency'):
+                self._semaphores[key] = asyncio.Semaphore(int(settings['concurrency']))
+            if settings.get('rate'):
+                self._rates[key] = AsyncRateLimiter(float(settings['rate']), settings.get('burst'))
+        return self._semaphores.get(key), self._rates.get(key)
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await a coroutine function within the limits for a key.
+
+        Args:
+            key: Limit key, e.g. a registry host
+            func: Function returning the awaitable to run
+
+        Returns:
+            The awaitable's result
+        """
+        semaphore, rate = self._limits_for(key)
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            if rate is not None:
+                await rate.acquire()
+            return await func()
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+
+class CheckEngine:
+    """
+    Worker pool that runs per-item update checks concurrently.
+
+    Each check runs under the limits of the key it maps to, so a large
+    image set spread over several registries is bounded per registry while
+    the total wall time approaches that of the slowest checks rather than
+    the sum of all of them.
+    """
+
+    def __init__(self, workers: int = 4, limits: Optional[Dict[str, Dict[str, float]]] = None):
+        """
+        Initialize the check engine.
+
+        Args:
+            workers: Size of the worker pool
+            limits: Per-key limits, see KeyedLimiter
+        """
+        self.workers = max(1, int(workers))
+        self.limiter = KeyedLimiter(limits)
+
+    def iter_run(
+        self,
+        items: Iterable[str],
+        check: Callable[[str], Optional[str]],
+        key: Optional[Callable[[str], str]] = None,
+        ordered: bool = False
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Check items concurrently and yield updates as they are found.
+
+        Args:
+            items: Items to check
+            check: Function returning the available version for an item,
+                or None if the item is up to date
+            key: Optional function mapping an item to its limit key
+            ordered: If True, yield in input order; otherwise yield each
+                result as soon as its check finishes
+
+        Yields:
+            (item, version) for every item with an available update
+        """
+        items = list(items)
+        key = key or (lambda item: 'default')
+
+        def guarded(item: str) -> Optional[str]:
+            try:
+                return check(item)
+            except Exception as e:
+                logger.error(f"Error checking updates for {item}: {e}", extra={'item': item, 'phase': 'check'})
+                return None
+
+        if self.workers == 1 or len(items) <= 1:
+            for item in items:
+                version = self.limiter.run(key(item), lambda: guarded(item))
+                if version is not None:
+                    yield item, version
+            return
+
+        for item, version in map_limited(guarded, items, key, self.limiter, self.workers, ordered):
+            if version is not None:
+                yield item, version
+
+    def run(
+        self,
+        items: Iterable[str],
+        check: Callable[[str], Optional[str]],
+        key: Optional[Callable[[str], str]] = None
+    ) -> Dict[str, str]:
+        """
+        Check items concurrently and merge the results.
+
+        Args:
+            items: Items to check
+            check: Function returning the available version for an item,
+                or None if the item is up to date
+            key: Optional function mapping an item to its limit key
+
+        Returns:
+            Dictionary of items with available updates, in input order
+        """
+        return dict(self.iter_run(items, check, key, ordered=True))
+
+
+def check_many(upgraders: Dict[str, Any], item: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+    """
+    Run check_updates on several upgraders at once.
+
+    Useful to overlap a slow package index refresh with container checks.
+
+    Args:
+        upgraders: Mapping of upgrader type to upgrader instance
+        item: Optional specific item passed to every upgrader
+
+    Returns:
+        Mapping of upgrader type to that upgrader's update dictionary
+    """
+    if not upgraders:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(upgraders)) as pool:
+        futures = {name: pool.submit(upgrader.check_updates, item) for name, upgrader in upgraders.items()}
+        return {name: future.result() for name, future in futures.items()}
@@ -3,9 +3,12 @@ Configuration management for the upgrade application.
 """
 
 import json
+import logging
 import os
 from typing import Any, Dict, Optional
 
+logger = logging.getLogger(__name__)
+
 
 class Config:
     """Configuration manager for the upgrade application."""
@@ -16,6 +19,9 @@ class Config:
         'auto_confirm': False,
         'log_level': 'INFO',
         'backup_before_upgrade': True,
+        'probe_cache': True,
+        'state_store': True,
+        'check_ttl': 0,
     }
 
     def __init__(self, config_file: Optional[str] = None):
@@ -43,7 +49,7 @@ class Config:
                 loaded_config = json.load(f)
                 self.config.update(loaded_config)
         except Exception as e:
-            print(f"Error loading configuration: {e}")
+            logger.error(f"Error loading configuration: {e}")
 
     def save(self, config_file: Optional[str] = None) -> None:
         """
@@ -60,7 +66,7 @@ class Config:
             with open(target_file, 'w') as f:
                 json.dump(self.config, f, indent=2)
         except Exception as e:
-            print(f"Error saving configuration: {e}")
+            logger.error(f"Error saving configuration: {e}")
 
     def get(self, key: str, default: Any = None) -> Any:
         """
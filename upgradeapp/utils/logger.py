@@ -1,16 +1,91 @@
 """
 Logger setup for the upgrade application.
+
+Upgraders log through module loggers under ``upgradeapp``. Records may
+carry ``item``, ``phase`` and ``duration`` fields passed as ``extra``:
+
+    logger.info(f"Pulled {image}", extra={'item': image, 'phase': 'pull', 'duration': 3.2})
+
+With ``background=True`` the calling threads only put records on a queue
+and one writer thread formats and writes them, so a slow terminal or disk
+does not hold up upgrade workers. ``json`` format writes one JSON object
+per line with those fields.
 """
 
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
 import sys
-from typing import Optional
+import time
+from typing import Dict, List, Optional, TextIO
+
+
+# Record attributes copied into JSON lines when they are set
+FIELDS = ('item', 'phase', 'duration')
+
+LOG_FORMATS = ('text', 'json')
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Writer threads of the loggers set up with background=True, by logger name
+_listeners: Dict[str, logging.handlers.QueueListener] = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = round(value, 6) if field == 'duration' else value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting to the writer thread's handlers."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The arguments and traceback may refer to objects that change or
+        # disappear before the writer thread gets to them, so render them here
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _make_formatter(log_format: str) -> logging.Formatter:
+    if log_format == 'json':
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
 
 
 def setup_logger(
     name: str = 'upgradeapp',
     level: str = 'INFO',
-    log_file: Optional[str] = None
+    log_file: Optional[str] = None,
+    stream: Optional[TextIO] = None,
+    log_format: str = 'text',
+    max_bytes: int = 0,
+    backup_count: int = 5,
+    background: bool = False
 ) -> logging.Logger:
     """
     Setup and configure logger.
@@ -19,36 +94,88 @@ def setup_logger(
         name: Logger name
         level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         log_file: Optional log file path
+        stream: Console stream, defaults to stdout
+        log_format: ``text`` or ``json`` (one JSON object per line)
+        max_bytes: Size at which the log file is rotated; 0 never rotates
+        backup_count: Rotated log files kept
+        background: Write records from a background thread instead of
+            the logging thread; call shutdown_logger() to flush them
 
     Returns:
         Configured logger instance
     """
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format: {log_format}")
+    shutdown_logger(name)
+
     logger = logging.getLogger(name)
     logger.setLevel(getattr(logging, level.upper()))
 
     # Clear any existing handlers
+    for handler in logger.handlers:
+        handler.close()
     logger.handlers.clear()
 
+    formatter = _make_formatter(log_format)
+    handlers: List[logging.Handler] = []
+
     # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = logging.StreamHandler(stream or sys.stdout)
     console_handler.setLevel(getattr(logging, level.upper()))
-
-    # Format
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
-    # File handler if specified
+    # File handler if specified, rotated by size
+    file_error = None
     if log_file:
         try:
-            file_handler = logging.FileHandler(log_file)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count
+            )
             file_handler.setLevel(getattr(logging, level.upper()))
             file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            handlers.append(file_handler)
         except Exception as e:
-            logger.warning(f"Could not setup file logging: {e}")
+            file_error = e
+
+    if background:
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        logger.addHandler(_QueueHandler(records))
+        listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners[name] = listener
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    if file_error is not None:
+        logger.warning(f"Could not setup file logging: {file_error}")
 
     return logger
+
+
+def shutdown_logger(name: str = 'upgradeapp') -> None:
+    """
+    Stop a logger's background writer after it has written every queued record.
+
+    Does nothing if the logger was not set up with ``background=True``.
+
+    Args:
+        name: Logger name
+    """
+    listener = _listeners.pop(name, None)
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    logger = logging.getLogger(name)
+    for handler in list(logger.handlers):
+        if isinstance(handler, _QueueHandler):
+            logger.removeHandler(handler)
+
+
+@atexit.register
+def _shutdown_all() -> None:
+    for name in list(_listeners):
+        shutdown_logger(name)
@@ -0,0 +1,435 @@
+"""
+Metrics: counters and latency histograms of upgrader work in the
+Prometheus text and OpenMetrics exposition formats.
+
+The registry is fed by tracing spans, so everything traced is measured
+without separate instrumentation: upgrader operations and phases,
+external commands (including the timeouts they hit), registry requests
+and pulls. ``main.py`` writes the registry to a node-exporter textfile
+after each local run, and the agent serves it live on ``GET /metrics``.
+"""
+
+import fcntl
+import math
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from . import tracing
+
+
+# Histogram bucket bounds in seconds, from quick probes to slow pulls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Content types of the two exposition formats
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Upgrader operations counted in upgradeapp_operations_total
+OPERATIONS = ('list_items', 'check_updates', 'upgrade')
+
+# name -> (type, help, label names); counter samples get a _total suffix
+FAMILIES: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    'upgradeapp_operations': (
+        'counter', 'Upgrader list, check and upgrade operations by outcome', ('type', 'operation', 'outcome')),
+    'upgradeapp_updates_found': ('counter', 'Updates reported by checks', ('type',)),
+    'upgradeapp_commands': ('counter', 'External commands run, by outcome', ('command', 'outcome')),
+    'upgradeapp_command_timeouts': (
+        'counter', 'External commands stopped by their timeout, by timeout in seconds', ('command', 'timeout')),
+    'upgradeapp_command_duration_seconds': ('histogram', 'Duration of external commands', ('command',)),
+    'upgradeapp_phase_duration_seconds': ('histogram', 'Duration of upgrader operations and phases', ('type', 'phase')),
+    'upgradeapp_registry_request_duration_seconds': (
+        'histogram', 'Duration of registry API requests', ('registry',)),
+    'upgradeapp_pull_duration_seconds': ('histogram', 'Duration of image pulls', ('type', 'registry')),
+    'upgradeapp_pull_bytes': ('counter', 'Bytes downloaded by image pulls, where the runtime reports them',
+                              ('type', 'registry')),
+    'upgradeapp_last_run_timestamp_seconds': ('gauge', 'Time the last run finished', ('type', 'action')),
+    'upgradeapp_last_run_duration_seconds': ('gauge', 'Duration of the last run', ('type', 'action')),
+    'upgradeapp_last_run_success': ('gauge', 'Whether the last run succeeded', ('type', 'action')),
+}
+
+Labels = Tuple[str, ...]
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)')
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _upgrade_type(class_name: str) -> str:
+    """Type label of an upgrader class, e.g. ``docker`` for DockerUpgrader."""
+    return (class_name[:-len('Upgrader')] if class_name.endswith('Upgrader') else class_name).lower()
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # Observations per bucket, not cumulative; the last entry is above every bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float) -> None:
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+
+    def add(self, other: '_Histogram') -> None:
+        if other.buckets != self.buckets:
+            return
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+
+class MetricsRegistry:
+    """Thread-safe store of the FAMILIES samples."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Initialize an empty registry.
+
+        Args:
+            buckets: Upper bounds of the histogram buckets, in seconds
+        """
+        self.buckets = tuple(buckets)
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels.get(label, '')) for label in FAMILIES[name][2])
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increase a counter.
+
+        Args:
+            name: Family name from FAMILIES, without ``_total``
+            value: Amount to add
+            **labels: Label values
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            samples = self._values.setdefault(name, {})
+            samples[key] = samples.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """
+        Set a gauge.
+
+        Args:
+            name: Family name from FAMILIES
+            value: New value
+            **labels: Label values
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._values.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Record an observation in a histogram.
+
+        Args:
+            name: Family name from FAMILIES
+            value: Observed value, in seconds
+            **labels: Label values
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            if key not in histograms:
+                histograms[key] = _Histogram(self.buckets)
+            histograms[key].observe(value)
+
+    def value(self, name: str, **labels: str) -> float:
+        """
+        Get a counter or gauge value.
+
+        Returns:
+            The value, 0 if it was never set
+        """
+        with self._lock:
+            return self._values.get(name, {}).get(self._key(name, labels), 0)
+
+    def histogram(self, name: str, **labels: str) -> Tuple[int, float]:
+        """
+        Get a histogram's totals.
+
+        Returns:
+            Tuple of (observation count, sum of observations)
+        """
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(self._key(name, labels))
+            return (histogram.count, histogram.sum) if histogram is not None else (0, 0.0)
+
+    def add(self, other: 'MetricsRegistry') -> None:
+        """
+        Fold another registry's samples into this one.
+
+        Counters and histograms are added up; the other registry's gauges
+        replace these.
+
+        Args:
+            other: Registry to fold in
+        """
+        with other._lock:
+            values = {name: dict(samples) for name, samples in other._values.items()}
+            histograms = {name: dict(samples) for name, samples in other._histograms.items()}
+        with self._lock:
+            for name, samples in values.items():
+                mine = self._values.setdefault(name, {})
+                for key, value in samples.items():
+                    mine[key] = value if FAMILIES[name][0] == 'gauge' else mine.get(key, 0) + value
+            for name, samples in histograms.items():
+                mine_histograms = self._histograms.setdefault(name, {})
+                for key, histogram in samples.items():
+                    if key not in mine_histograms:
+                        mine_histograms[key] = _Histogram(histogram.buckets)
+                    mine_histograms[key].add(histogram)
+
+    def observe_span(self, span: tracing.Span) -> None:
+        """
+        Update the metrics from a finished tracing span.
+
+        Subscribed as a tracing listener by enable().
+
+        Args:
+            span: Finished span
+        """
+        seconds = span.duration_ns / 1e9
+        if span.category == 'command':
+            exit_code = span.args.get('exit_code')
+            outcome = 'timeout' if exit_code == 'timeout' else 'failure' if span.failed else 'success'
+            self.inc('upgradeapp_commands', command=span.name, outcome=outcome)
+            self.observe('upgradeapp_command_duration_seconds', seconds, command=span.name)
+            if outcome == 'timeout':
+                timeout = span.args.get('timeout')
+                self.inc('upgradeapp_command_timeouts', command=span.name,
+                         timeout=_format_value(timeout) if timeout is not None else '')
+        elif span.category == 'http':
+            if span.args.get('registry'):
+                self.observe('upgradeapp_registry_request_duration_seconds', seconds,
+                             registry=span.args['registry'])
+        elif '.' in span.name:
+            class_name, _, phase = span.name.partition('.')
+            upgrade_type = _upgrade_type(class_name)
+            self.observe('upgradeapp_phase_duration_seconds', seconds, type=upgrade_type, phase=phase)
+            operation = phase[len('async_'):] if phase.startswith('async_') else phase
+            # The default async_ operations run the blocking one, which is the same operation
+            if operation in OPERATIONS and span.parent != f"{class_name}.async_{operation}":
+                result = span.args.get('result')
+                outcome = 'failure' if span.failed or result is False else 'success'
+                self.inc('upgradeapp_operations', type=upgrade_type, operation=operation, outcome=outcome)
+                if operation == 'check_updates' and isinstance(result, int) and not isinstance(result, bool):
+                    self.inc('upgradeapp_updates_found', result, type=upgrade_type)
+            elif phase == 'pull':
+                registry = span.args.get('registry', '')
+                self.observe('upgradeapp_pull_duration_seconds', seconds, type=upgrade_type, registry=registry)
+                if span.args.get('pull_bytes'):
+                    self.inc('upgradeapp_pull_bytes', span.args['pull_bytes'], type=upgrade_type, registry=registry)
+
+    def render(self, openmetrics: bool = False) -> str:
+        """
+        Render every sample in the text exposition format.
+
+        Args:
+            openmetrics: Render OpenMetrics 1.0 instead of the Prometheus
+                0.0.4 text format node exporter reads
+
+        Returns:
+            Exposition text
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text, label_names) in FAMILIES.items():
+                values = self._values.get(name, {})
+                histograms = self._histograms.get(name, {})
+                if not values and not histograms:
+                    continue
+                family = name if openmetrics or kind != 'counter' else f"{name}_total"
+                lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} {kind}")
+                for key in sorted(values):
+                    suffix = '_total' if kind == 'counter' else ''
+                    lines.append(f"{name}{suffix}{_labels(label_names, key)} {_format_value(values[key])}")
+                for key in sorted(histograms):
+                    histogram = histograms[key]
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if math.isinf(bound) else repr(float(bound))
+                        lines.append(f"{name}_bucket{_labels(label_names + ('le',), key + (le,))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(label_names, key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels(label_names, key)} {histogram.count}")
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def parse(cls, text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> 'MetricsRegistry':
+        """
+        Load samples rendered by render().
+
+        Samples of unknown families, or of histograms with other bucket
+        bounds, are skipped.
+
+        Args:
+            text: Exposition text
+            buckets: Histogram bucket bounds of the new registry
+
+        Returns:
+            Registry holding the samples
+        """
+        registry = cls(buckets)
+        cumulative: Dict[Tuple[str, Labels], Dict[str, float]] = {}
+        for line in text.splitlines():
+            match = _SAMPLE.match(line)
+            if line.startswith('#') or not match:
+                continue
+            sample, label_text, value_text = match.groups()
+            labels = {key: _unescape(value) for key, value in _LABEL.findall(label_text or '')}
+            try:
+                value = float(value_text)
+            except ValueError:
+                continue
+            name, suffix = _family_of(sample)
+            if name is None:
+                continue
+            key = registry._key(name, labels)
+            if suffix in ('', '_total'):
+                registry._values.setdefault(name, {})[key] = value
+            else:
+                entry = cumulative.setdefault((name, key), {})
+                entry[labels.get('le', '') if suffix == '_bucket' else suffix] = value
+
+        bounds = [repr(float(bound)) for bound in registry.buckets] + ['+Inf']
+        for (name, key), entry in cumulative.items():
+            if not all(bound in entry for bound in bounds):
+                continue
+            histogram = _Histogram(registry.buckets)
+            previous = 0.0
+            for index, bound in enumerate(bounds):
+                histogram.counts[index] = int(entry[bound] - previous)
+                previous = entry[bound]
+            histogram.sum = entry.get('_sum', 0.0)
+            registry._histograms.setdefault(name, {})[key] = histogram
+        return registry
+
+    def write_textfile(self, path: str) -> None:
+        """
+        Add this registry's samples to a node-exporter textfile.
+
+        Counters and histograms already in the file are added to, so the
+        file accumulates across runs the way a scrape target would. The
+        file is replaced atomically under an exclusive lock, so
+        overlapping runs do not lose each other's counts.
+
+        Args:
+            path: The ``.prom`` file in node exporter's textfile directory
+        """
+        with open(f"{path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    merged = MetricsRegistry.parse(f.read(), self.buckets)
+            except FileNotFoundError:
+                merged = MetricsRegistry(self.buckets)
+            merged.add(self)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, 'w') as f:
+                f.write(merged.render())
+            os.replace(temporary, path)
+
+    def record_run(self, upgrade_type: str, action: str, success: bool, duration: float) -> None:
+        """
+        Set the last-run gauges of a run.
+
+        Args:
+            upgrade_type: Upgrade type of the run
+            action: Action of the run
+            success: Whether the run succeeded
+            duration: Duration of the run in seconds
+        """
+        self.set('upgradeapp_last_run_timestamp_seconds', time.time(), type=upgrade_type, action=action)
+        self.set('upgradeapp_last_run_duration_seconds', duration, type=upgrade_type, action=action)
+        self.set('upgradeapp_last_run_success', 1 if success else 0, type=upgrade_type, action=action)
+
+
+def _family_of(sample: str) -> Tuple[Optional[str], str]:
+    """Split a sample name into its family and suffix, e.g. ``_bucket``."""
+    if FAMILIES.get(sample, ('',))[0] == 'gauge':
+        return sample, ''
+    for suffix, kind in (('_total', 'counter'), ('_bucket', 'histogram'), ('_sum', 'histogram'),
+                         ('_count', 'histogram')):
+        name = sample[:-len(suffix)]
+        if sample.endswith(suffix) and FAMILIES.get(name, ('',))[0] == kind:
+            return name, suffix
+    return None, ''
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def enable() -> MetricsRegistry:
+    """
+    Start collecting metrics from tracing spans.
+
+    Returns:
+        The active registry; calling enable() again keeps it
+    """
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+        tracing.subscribe(_registry.observe_span)
+    return _registry
+
+
+def disable() -> Optional[MetricsRegistry]:
+    """
+    Stop collecting metrics.
+
+    Returns:
+        The registry that was active, or None
+    """
+    global _registry
+    registry, _registry = _registry, None
+    if registry is not None:
+        tracing.unsubscribe(registry.observe_span)
+    return registry
+
+
+def active() -> Optional[MetricsRegistry]:
+    """
+    Get the active registry.
+
+    Returns:
+        The registry, or None while metrics are not collected
+    """
+    return _registry
@@ -0,0 +1,23 @@
+"""
+Filesystem locations used by the upgrade application.
+"""
+
+import os
+
+
+def user_cache_dir() -> str:
+    """
+    Get the per-user cache directory, creating it if needed.
+
+    Honors ``UPGRADEAPP_CACHE_DIR``, then ``XDG_CACHE_HOME``, and falls back
+    to ``~/.cache/upgradeapp``.
+
+    Returns:
+        Absolute path of the cache directory
+    """
+    path = os.environ.get('UPGRADEAPP_CACHE_DIR')
+    if not path:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        path = os.path.join(base, 'upgradeapp')
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,169 @@
+"""
+Cache of capability probes (tool lookups and `--version` runs).
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence
+
+from .paths import user_cache_dir
+from .runner import CommandRunner
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of running a probe command against a binary."""
+
+    path: str
+    mtime_ns: int
+    args: List[str]
+    returncode: int
+    output: str
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+class ProbeCache:
+    """
+    Memoizes probe results per process and persists them on disk.
+
+    A persisted result is reused as long as the probed binary still
+    resolves to the same path with the same modification time, so
+    repeated invocations (e.g. from cron) start without forking any probe
+    command. Upgrading or moving the binary invalidates its entry.
+    """
+
+    def __init__(self, path: Optional[str] = None, persist: bool = True):
+        """
+        Initialize the probe cache.
+
+        Args:
+            path: Optional cache file path, defaults to probes.json in the
+                user cache directory
+            persist: If False, only memoize within this process
+        """
+        self.persist = persist
+        self.path = path
+        self._memo: Dict[str, Optional[ProbeResult]] = {}
+        self._which: Dict[str, Optional[str]] = {}
+        self._stored: Optional[Dict[str, dict]] = None
+        self._lock = threading.Lock()
+
+    def _file(self) -> str:
+        if self.path is None:
+            self.path = os.path.join(user_cache_dir(), 'probes.json')
+        return self.path
+
+    def _load(self) -> Dict[str, dict]:
+        if self._stored is None:
+            self._stored = {}
+            if self.persist:
+                try:
+                    with open(self._file(), 'r') as f:
+                        self._stored = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return self._stored
+
+    def _save(self) -> None:
+        if not self.persist:
+            return
+        try:
+            directory = os.path.dirname(self._file())
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.probes-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._stored, f, indent=2)
+            os.replace(tmp, self._file())
+        except OSError as e:
+            logger.warning(f"Could not save probe cache: {e}")
+
+    def which(self, binary: str) -> Optional[str]:
+        """
+        Resolve a binary on PATH without forking `which`.
+
+        Args:
+            binary: Executable name
+
+        Returns:
+            Absolute path, or None if not found
+        """
+        with self._lock:
+            if binary not in self._which:
+                self._which[binary] = shutil.which(binary)
+            return self._which[binary]
+
+    def probe(self, binary: str, args: Sequence[str] = ('--version',), timeout: float = 5) -> Optional[ProbeResult]:
+        """
+        Run (or recall) a probe command for a binary.
+
+        Args:
+            binary: Executable name
+            args: Arguments for the probe command
+            timeout: Timeout for the probe command in seconds
+
+        Returns:
+            Probe result, or None if the binary is not installed or the
+            probe timed out
+        """
+        key = ' '.join([binary, *args])
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+
+        path = self.which(binary)
+        result = None
+        if path is not None:
+            result = self._probe_path(key, path, list(args), timeout)
+
+        with self._lock:
+            self._memo[key] = result
+        return result
+
+    def _probe_path(self, key: str, path: str, args: List[str], timeout: float) -> Optional[ProbeResult]:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        with self._lock:
+            entry = self._load().get(key)
+        if entry and entry.get('path') == path and entry.get('mtime_ns') == mtime_ns:
+            return ProbeResult(**entry)
+
+        completed = CommandRunner().run([path, *args], timeout)
+        if completed.returncode is None:
+            # Timed out or could not be started
+            return None
+
+        result = ProbeResult(path, mtime_ns, args, completed.returncode, completed.stdout.strip())
+        with self._lock:
+            self._load()[key] = asdict(result)
+            self._save()
+        return result
+
+
+_default_caches: Dict[bool, ProbeCache] = {}
+
+
+def get_probe_cache(persist: bool = True) -> ProbeCache:
+    """
+    Get the process-wide probe cache.
+
+    Args:
+        persist: Whether results are persisted under the user cache dir
+
+    Returns:
+        Shared ProbeCache instance
+    """
+    if persist not in _default_caches:
+        _default_caches[persist] = ProbeCache(persist=persist)
+    return _default_caches[persist]
@@ -0,0 +1,552 @@
+"""
+Shared runner for the external commands upgraders start.
+
+Output is read while the command runs. Each stdout line can be handed to
+a parser as soon as it arrives, and each stream keeps only its last
+``max_output`` bytes in a ring buffer, so a long ``docker pull`` costs a
+bounded amount of memory; commands whose output is parsed as a whole ask
+to keep all of it. Commands that are safe to repeat are retried after
+transient failures (timeouts, network errors, held package manager
+locks) with jittered exponential backoff. Every run returns a
+CommandResult, whether the command succeeded, failed, timed out or could
+not be started.
+
+The ``commands`` configuration section, optionally overridden by a
+``commands`` entry in an upgrader's section, sets ``retries``,
+``backoff``, ``max_backoff``, ``max_output`` and per-command
+``timeouts`` keyed by command name (``docker pull``, ``apt update``).
+"""
+
+import asyncio
+import logging
+import os
+import random
+import re
+import selectors
+import subprocess
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Deque, Dict, List, Mapping, Optional, Sequence
+
+from .tracing import command_name, span
+
+logger = logging.getLogger(__name__)
+
+
+# Bytes of each output stream kept by default
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+
+# Extra attempts for commands that are safe to repeat, and the backoff between them in seconds
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 30.0
+
+# Grace period between SIGTERM and SIGKILL when a command is stopped
+TERMINATE_GRACE = 5.0
+
+_READ_SIZE = 65536
+
+# Failure output worth retrying: network trouble, registry rate limits, busy package manager locks
+TRANSIENT_ERRORS = re.compile(
+    r'timed? ?out|temporary failure|temporarily unavailable|connection (?:reset|refused|closed)|'
+    r'could not resolve|no route to host|network is unreachable|tls handshake|unexpected eof|'
+    r'toomanyrequests|too many requests|service unavailable|bad gateway|'
+    r'could not get lock|waiting for (?:cache )?lock|database is locked',
+    re.IGNORECASE
+)
+
+LineHandler = Callable[[str], None]
+
+
+class OutputBuffer:
+    """Ring buffer keeping the last ``limit`` bytes written to it."""
+
+    def __init__(self, limit: Optional[int] = DEFAULT_MAX_OUTPUT):
+        """
+        Initialize the buffer.
+
+        Args:
+            limit: Bytes to keep, or None to keep everything
+        """
+        self.limit = limit
+        # Bytes written, including those dropped since
+        self.total = 0
+        self._chunks: Deque[bytes] = deque()
+        self._size = 0
+
+    @property
+    def dropped(self) -> int:
+        """Bytes pushed out of the buffer by newer output."""
+        return self.total - self._size
+
+    def write(self, data: bytes) -> None:
+        """
+        Append output, dropping the oldest bytes beyond the limit.
+
+        Args:
+            data: Bytes read from the command
+        """
+        self.total += len(data)
+        if self.limit is not None and len(data) >= self.limit:
+            self._chunks.clear()
+            self._size = 0
+            data = data[len(data) - self.limit:]
+        if not data:
+            return
+        self._chunks.append(data)
+        self._size += len(data)
+        while self.limit is not None and self._size > self.limit:
+            excess = self._size - self.limit
+            head = self._chunks[0]
+            if len(head) <= excess:
+                self._chunks.popleft()
+                self._size -= len(head)
+            else:
+                self._chunks[0] = head[excess:]
+                self._size -= excess
+
+    def getvalue(self) -> bytes:
+        """The bytes kept, oldest first."""
+        return b''.join(self._chunks)
+
+
+class _StreamReader:
+    """Feeds one output stream into its buffer and, line by line, into a handler."""
+
+    def __init__(self, buffer: OutputBuffer, on_line: Optional[LineHandler] = None):
+        self.buffer = buffer
+        self.on_line = on_line
+        self._partial = b''
+        # Whether the partial line was already handed over because it grew too long
+        self._flushed = False
+
+    def feed(self, data: bytes) -> None:
+        self.buffer.write(data)
+        if self.on_line is None:
+            return
+        *lines, self._partial = (self._partial + data).split(b'\n')
+        for line in lines:
+            if not (self._flushed and not line):
+                self._emit(line)
+            self._flushed = False
+        # A line without an end must not grow past what the buffer would keep
+        if self.buffer.limit is not None and len(self._partial) > self.buffer.limit:
+            self._emit(self._partial)
+            self._partial = b''
+            self._flushed = True
+
+    def close(self) -> None:
+        if self.on_line is not None and self._partial:
+            self._emit(self._partial)
+        self._partial = b''
+
+    def _emit(self, line: bytes) -> None:
+        self.on_line(line.rstrip(b'\r').decode(errors='replace'))
+
+
+@dataclass
+class CommandResult:
+    """Outcome of a command run through CommandRunner."""
+
+    args: List[str]
+    # Exit status; None if the command timed out or could not be started
+    returncode: Optional[int]
+    # Kept output, decoded; None when the output was not captured
+    stdout: Optional[str] = None
+    stderr: Optional[str] = None
+    # Seconds across every attempt, including the backoff between them
+    duration: float = 0.0
+    attempts: int = 1
+    timed_out: bool = False
+    # Why the command could not be started
+    error: Optional[OSError] = None
+    # Bytes the command wrote to both streams, and how many were not kept
+    output_bytes: int = 0
+    dropped_bytes: int = 0
+
+    @property
+    def ok(self) -> bool:
+        """Whether the command exited with status 0."""
+        return self.returncode == 0
+
+    @property
+    def command(self) -> str:
+        """The command line, for messages."""
+        return ' '.join(self.args)
+
+    def describe(self) -> str:
+        """
+        Describe the outcome in one line.
+
+        Returns:
+            The command, what happened and, for a failure, the last line
+            it wrote
+        """
+        if self.error is not None:
+            return f"{self.command} could not be started: {self.error}"
+        if self.timed_out:
+            outcome = 'timed out'
+        elif self.ok:
+            outcome = 'succeeded'
+        else:
+            outcome = f"failed with exit code {self.returncode}"
+        if self.attempts > 1:
+            outcome += f" after {self.attempts} attempts"
+        lines = [] if self.ok else (self.stderr or self.stdout or '').strip().splitlines()
+        return f"{self.command} {outcome}" + (f": {lines[-1].strip()}" if lines else '')
+
+
+def is_transient(result: CommandResult) -> bool:
+    """
+    Decide whether a failed command is worth running again.
+
+    Args:
+        result: Result of the failed attempt
+
+    Returns:
+        True if the command timed out or its error output names a
+        transient error; stdout is not searched, as it may list packages
+        or images whose names look like errors
+    """
+    if result.timed_out:
+        return True
+    if result.error is not None or result.ok:
+        return False
+    return TRANSIENT_ERRORS.search(result.stderr or '') is not None
+
+
+class CommandRunner:
+    """Runs external commands with bounded output capture, timeouts and retries."""
+
+    def __init__(
+        self,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        timeouts: Optional[Mapping[str, float]] = None,
+        max_output: Optional[int] = DEFAULT_MAX_OUTPUT,
+        retry_on: Callable[[CommandResult], bool] = is_transient
+    ):
+        """
+        Initialize the runner.
+
+        Args:
+            retries: Extra attempts for commands run with ``idempotent=True``
+            backoff: Delay in seconds before the first retry; each retry
+                doubles it
+            max_backoff: Upper bound of the delay in seconds
+            timeouts: Timeout in seconds by command name, overriding the
+                caller's
+            max_output: Bytes of each stream kept, or None to keep all
+            retry_on: Decides whether a failed attempt is retried
+        """
+        self.retries = max(0, int(retries))
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.timeouts = dict(timeouts or {})
+        self.max_output = max_output
+        self.retry_on = retry_on
+
+    @classmethod
+    def from_config(cls, config: Mapping, section: str = '') -> 'CommandRunner':
+        """
+        Create a runner from the ``commands`` settings.
+
+        Args:
+            config: Configuration dictionary
+            section: Upgrader section whose ``commands`` entry overrides
+                the top-level ``commands`` section
+
+        Returns:
+            Configured runner
+        """
+        settings = dict(config.get('commands') or {})
+        if section:
+            settings.update((config.get(section) or {}).get('commands') or {})
+        return cls(
+            retries=settings.get('retries', DEFAULT_RETRIES),
+            backoff=settings.get('backoff', DEFAULT_BACKOFF),
+            max_backoff=settings.get('max_backoff', DEFAULT_MAX_BACKOFF),
+            timeouts=settings.get('timeouts'),
+            max_output=settings.get('max_output', DEFAULT_MAX_OUTPUT),
+        )
+
+    def timeout_for(self, cmd: Sequence[str], default: Optional[float]) -> Optional[float]:
+        """
+        Get the timeout of a command.
+
+        Args:
+            cmd: Command and arguments
+            default: The caller's timeout
+
+        Returns:
+            The configured timeout for the command's name, else the default
+        """
+        return self.timeouts.get(command_name(cmd), default)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Get the delay before the next attempt.
+
+        The delay doubles with each failed attempt up to ``max_backoff``,
+        and a random half of it is jittered away so commands that failed
+        together do not retry together.
+
+        Args:
+            attempt: Number of the attempt that just failed, from 1
+
+        Returns:
+            Delay in seconds
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def run(
+        self,
+        cmd: Sequence[str],
+        timeout: Optional[float] = None,
+        *,
+        capture: bool = True,
+        on_line: Optional[LineHandler] = None,
+        keep_all: bool = False,
+        idempotent: bool = False,
+        item: Optional[str] = None
+    ) -> CommandResult:
+        """
+        Run a command to completion.
+
+        Each attempt is traced as a command span. A command that outlives
+        its timeout is terminated, then killed after a grace period.
+
+        Args:
+            cmd: Command and arguments
+            timeout: Timeout in seconds per attempt, unless one is
+                configured for the command
+            capture: If True, read stdout and stderr; otherwise they are
+                inherited from this process
+            on_line: Called with each stdout line as it is read, without
+                its line ending; with retries it sees every attempt's lines
+            keep_all: Keep the whole output instead of its tail
+            idempotent: Whether the command may be retried after a
+                transient failure
+            item: Package, image or container the command works on
+
+        Returns:
+            Result of the last attempt
+        """
+        timeout = self.timeout_for(cmd, timeout)
+        limit = None if keep_all else self.max_output
+        start = time.monotonic()
+        attempt = 1
+        while True:
+            with span(command_name(cmd), 'command', item, command=' '.join(cmd), timeout=timeout) as command_span:
+                result = _execute(list(cmd), timeout, capture, on_line, limit)
+                _record(command_span, result, attempt)
+            if not self._should_retry(result, attempt, idempotent):
+                break
+            delay = self.backoff_delay(attempt)
+            logger.warning(f"{result.describe()}; retrying in {delay:.1f}s", extra={'item': item, 'phase': 'retry'})
+            time.sleep(delay)
+            attempt += 1
+        result.attempts = attempt
+        result.duration = time.monotonic() - start
+        return result
+
+    async def run_async(
+        self,
+        cmd: Sequence[str],
+        timeout: Optional[float] = None,
+        *,
+        capture: bool = True,
+        on_line: Optional[LineHandler] = None,
+        keep_all: bool = False,
+        idempotent: bool = False,
+        item: Optional[str] = None
+    ) -> CommandResult:
+        """
+        Async counterpart of run: the command runs as an asyncio subprocess.
+
+        Cancelling the awaiting task stops the command, so cancelling a
+        run never leaves children behind.
+
+        Args:
+            cmd: Command and arguments
+            timeout: Timeout in seconds per attempt, unless one is
+                configured for the command
+            capture: If True, read stdout and stderr; otherwise they are
+                inherited from this process
+            on_line: Called with each stdout line as it is read
+            keep_all: Keep the whole output instead of its tail
+            idempotent: Whether the command may be retried after a
+                transient failure
+            item: Package, image or container the command works on
+
+        Returns:
+            Result of the last attempt
+        """
+        timeout = self.timeout_for(cmd, timeout)
+        limit = None if keep_all else self.max_output
+        start = time.monotonic()
+        attempt = 1
+        while True:
+            with span(command_name(cmd), 'command', item, command=' '.join(cmd), timeout=timeout) as command_span:
+                result = await _execute_async(list(cmd), timeout, capture, on_line, limit)
+                _record(command_span, result, attempt)
+            if not self._should_retry(result, attempt, idempotent):
+                break
+            delay = self.backoff_delay(attempt)
+            logger.warning(f"{result.describe()}; retrying in {delay:.1f}s", extra={'item': item, 'phase': 'retry'})
+            await asyncio.sleep(delay)
+            attempt += 1
+        result.attempts = attempt
+        result.duration = time.monotonic() - start
+        return result
+
+    def _should_retry(self, result: CommandResult, attempt: int, idempotent: bool) -> bool:
+        return idempotent and not result.ok and attempt <= self.retries and self.retry_on(result)
+
+
+def _record(command_span: Any, result: CommandResult, attempt: int) -> None:
+    if result.error is not None:
+        command_span.set(error=str(result.error))
+    else:
+        command_span.set(exit_code='timeout' if result.timed_out else result.returncode)
+        if result.stdout is not None:
+            command_span.set(output_bytes=result.output_bytes)
+    if attempt > 1:
+        command_span.set(attempt=attempt)
+
+
+def _result(cmd: List[str], returncode: Optional[int], readers: Optional[List[_StreamReader]],
+            timed_out: bool = False) -> CommandResult:
+    if readers is None:
+        return CommandResult(cmd, returncode, timed_out=timed_out)
+    stdout, stderr = (reader.buffer for reader in readers)
+    return CommandResult(
+        cmd,
+        returncode,
+        stdout.getvalue().decode(errors='replace'),
+        stderr.getvalue().decode(errors='replace'),
+        timed_out=timed_out,
+        output_bytes=stdout.total + stderr.total,
+        dropped_bytes=stdout.dropped + stderr.dropped,
+    )
+
+
+def _execute(cmd: List[str], timeout: Optional[float], capture: bool, on_line: Optional[LineHandler],
+             limit: Optional[int]) -> CommandResult:
+    pipe = subprocess.PIPE if capture else None
+    try:
+        process = subprocess.Popen(cmd, stdout=pipe, stderr=pipe)
+    except OSError as e:
+        return CommandResult(cmd, None, '' if capture else None, '' if capture else None, error=e)
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    readers = [_StreamReader(OutputBuffer(limit), on_line), _StreamReader(OutputBuffer(limit))] if capture else None
+    timed_out = False
+    try:
+        if readers is not None:
+            timed_out = not _pump({process.stdout: readers[0], process.stderr: readers[1]}, deadline)
+        if not timed_out:
+            try:
+                process.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+        if timed_out:
+            _stop(process)
+    except BaseException:
+        # Interrupted, or the line handler raised
+        _stop(process)
+        raise
+    finally:
+        for stream in (process.stdout, process.stderr):
+            if stream is not None:
+                stream.close()
+    return _result(cmd, None if timed_out else process.returncode, readers, timed_out)
+
+
+def _pump(readers: Dict[IO[bytes], _StreamReader], deadline: Optional[float]) -> bool:
+    """Read the pipes until both are closed; False if the deadline passed first."""
+    with selectors.DefaultSelector() as selector:
+        for pipe, reader in readers.items():
+            selector.register(pipe, selectors.EVENT_READ, reader)
+        while selector.get_map():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, _READ_SIZE)
+                if data:
+                    key.data.feed(data)
+                else:
+                    selector.unregister(key.fileobj)
+                    key.data.close()
+    return True
+
+
+def _stop(process: subprocess.Popen) -> None:
+    if process.poll() is not None:
+        return
+    try:
+        process.terminate()
+        try:
+            process.wait(TERMINATE_GRACE)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    except ProcessLookupError:
+        pass
+
+
+async def _execute_async(cmd: List[str], timeout: Optional[float], capture: bool,
+                         on_line: Optional[LineHandler], limit: Optional[int]) -> CommandResult:
+    pipe = asyncio.subprocess.PIPE if capture else None
+    try:
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=pipe, stderr=pipe)
+    except OSError as e:
+        return CommandResult(cmd, None, '' if capture else None, '' if capture else None, error=e)
+
+    readers = [_StreamReader(OutputBuffer(limit), on_line), _StreamReader(OutputBuffer(limit))] if capture else None
+
+    async def pump(stream: asyncio.StreamReader, reader: _StreamReader) -> None:
+        while True:
+            data = await stream.read(_READ_SIZE)
+            if not data:
+                break
+            reader.feed(data)
+        reader.close()
+
+    async def communicate() -> None:
+        if readers is not None:
+            await asyncio.gather(pump(process.stdout, readers[0]), pump(process.stderr, readers[1]))
+        await process.wait()
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(communicate(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        await _stop_async(process)
+    except BaseException:
+        # Cancelled, or the line handler raised
+        await _stop_async(process)
+        raise
+    return _result(cmd, None if timed_out else process.returncode, readers, timed_out)
+
+
+async def _stop_async(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), TERMINATE_GRACE)
+    except asyncio.TimeoutError:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            return
+        await process.wait()
@@ -0,0 +1,232 @@
+"""
+Persistent per-item check state, so repeated checks only re-query what changed.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from .paths import user_cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    upgrader TEXT NOT NULL,
+    item TEXT NOT NULL,
+    version TEXT,
+    digest TEXT,
+    etag TEXT,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (upgrader, item)
+);
+CREATE TABLE IF NOT EXISTS reports (
+    upgrader TEXT NOT NULL,
+    item TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (upgrader, item)
+);
+"""
+
+
+@dataclass
+class ItemState:
+    """Outcome of the last check of one item."""
+
+    upgrader: str
+    item: str
+    version: Optional[str]
+    digest: Optional[str] = None
+    etag: Optional[str] = None
+    checked_at: float = 0.0
+
+    def fresh(self, ttl: float, now: Optional[float] = None) -> bool:
+        """
+        Check whether this state is recent enough to reuse.
+
+        Args:
+            ttl: Maximum age in seconds; 0 or less never reuses
+            now: Optional current time, defaults to time.time()
+
+        Returns:
+            True if the item was checked less than ``ttl`` seconds ago
+        """
+        return ttl > 0 and (now if now is not None else time.time()) - self.checked_at < ttl
+
+
+class StateStore:
+    """
+    sqlite-backed record of the last check of every item, per upgrader.
+
+    ``checks`` holds what each item's last check found: the available
+    version (None when up to date), the remote digest and the ETag to
+    revalidate it with. ``reports`` holds the updates last reported to the
+    user, so a run can report only what changed since the previous one.
+    The store is safe to share between threads.
+    """
+
+    def __init__(self, path: Optional[str] = None, persist: bool = True):
+        """
+        Initialize the state store.
+
+        Args:
+            path: Optional database path, defaults to state.sqlite in the
+                user cache directory
+            persist: If False, keep state in memory for this process only
+        """
+        self.persist = persist
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.persist:
+                connection = None
+                try:
+                    # Resolving the default path creates the cache directory, which may not be writable
+                    if self.path is None:
+                        self.path = os.path.join(user_cache_dir(), 'state.sqlite')
+                    connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+                    connection.executescript(SCHEMA)
+                    self._connection = connection
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"Could not open state store {self.path or 'in the user cache directory'}: {e}")
+                    if connection is not None:
+                        connection.close()
+            if self._connection is None:
+                self._connection = sqlite3.connect(':memory:', check_same_thread=False)
+                self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def load(self, upgrader: str) -> Dict[str, ItemState]:
+        """
+        Load the last check state of every item of an upgrader.
+
+        Args:
+            upgrader: Upgrader key, e.g. its configuration section
+
+        Returns:
+            Mapping of item to its state
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT item, version, digest, etag, checked_at FROM checks WHERE upgrader = ?',
+                (upgrader,)
+            ).fetchall()
+        return {row[0]: ItemState(upgrader, *row) for row in rows}
+
+    def get(self, upgrader: str, item: str) -> Optional[ItemState]:
+        """
+        Get the last check state of one item.
+
+        Args:
+            upgrader: Upgrader key
+            item: Item name
+
+        Returns:
+            Stored state, or None if the item was never checked
+        """
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT version, digest, etag, checked_at FROM checks WHERE upgrader = ? AND item = ?',
+                (upgrader, item)
+            ).fetchone()
+        return ItemState(upgrader, item, *row) if row else None
+
+    def record(self, states: Iterable[ItemState]) -> None:
+        """
+        Store check results, replacing earlier ones for the same items.
+
+        Args:
+            states: Item states to store
+        """
+        rows = [(s.upgrader, s.item, s.version, s.digest, s.etag, s.checked_at or time.time()) for s in states]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def forget(self, upgrader: str, items: Optional[Iterable[str]] = None) -> None:
+        """
+        Drop stored check results so the items are checked again.
+
+        Args:
+            upgrader: Upgrader key
+            items: Items to forget, or None for all of the upgrader's items
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                if items is None:
+                    connection.execute('DELETE FROM checks WHERE upgrader = ?', (upgrader,))
+                else:
+                    connection.executemany('DELETE FROM checks WHERE upgrader = ? AND item = ?',
+                                           [(upgrader, item) for item in items])
+
+    def report(self, upgrader: str, updates: Dict[str, str],
+               scope: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        Record the updates reported by a run and return what changed.
+
+        Args:
+            upgrader: Upgrader key
+            updates: Every update found by this run
+            scope: Items the run covered, or None if it covered all of
+                them. Reports for items outside the scope are kept.
+
+        Returns:
+            Updates that are new or carry a different version than in the
+            previous report
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                if scope is None:
+                    previous = dict(connection.execute(
+                        'SELECT item, version FROM reports WHERE upgrader = ?', (upgrader,)
+                    ).fetchall())
+                    connection.execute('DELETE FROM reports WHERE upgrader = ?', (upgrader,))
+                else:
+                    previous = {}
+                    for item in scope:
+                        row = connection.execute(
+                            'SELECT version FROM reports WHERE upgrader = ? AND item = ?', (upgrader, item)
+                        ).fetchone()
+                        if row:
+                            previous[item] = row[0]
+                    connection.executemany('DELETE FROM reports WHERE upgrader = ? AND item = ?',
+                                           [(upgrader, item) for item in scope])
+                connection.executemany('INSERT OR REPLACE INTO reports VALUES (?, ?, ?)',
+                                       [(upgrader, item, version) for item, version in updates.items()])
+        return {item: version for item, version in updates.items() if previous.get(item) != version}
+
+
+_default_stores: Dict[bool, StateStore] = {}
+
+
+def get_state_store(persist: bool = True) -> StateStore:
+    """
+    Get the process-wide state store.
+
+    Args:
+        persist: Whether state is persisted under the user cache dir
+
+    Returns:
+        Shared StateStore instance
+    """
+    if persist not in _default_stores:
+        _default_stores[persist] = StateStore(persist=persist)
+    return _default_stores[persist]
@@ -0,0 +1,503 @@
+"""
+Tracing: timed spans around upgrader operations and external commands.
+
+Spans are only recorded while a tracer is enabled, e.g. by ``main.py
+--profile``, or a listener is subscribed, such as the metrics registry.
+Otherwise span() returns a shared no-op context manager and the wrappers
+call straight through, so instrumented code pays one global lookup per
+call. A recorded span carries its name, item, duration and details such
+as the command line, exit code and output size. A tracer's spans export
+as Chrome trace event JSON (viewable in Perfetto or chrome://tracing)
+and as a summary table; listeners receive each span as it finishes.
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar
+
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+# Span categories: upgrader methods and phases, external commands, HTTP requests
+CATEGORIES = ('phase', 'command', 'http')
+
+# Container CLI commands whose subcommand names the operation, e.g. image inspect
+_MANAGEMENT_COMMANDS = ('container', 'image', 'network', 'volume', 'system')
+
+# Commands that take their operation as a short option, e.g. pacman -Syu
+_OPERATION_OPTION_COMMANDS = ('pacman', 'rpm')
+
+# Commands that run the named command, e.g. sudo apt upgrade
+_WRAPPERS = ('sudo', 'fakeroot')
+
+_SUBCOMMAND = re.compile(r'[a-z][a-z0-9-]*$')
+
+_tracer: Optional['Tracer'] = None
+
+_listeners: List[Callable[['Span'], None]] = []
+
+# Whether spans are recorded at all: a tracer is enabled or a listener subscribed
+_enabled = False
+
+_current: contextvars.ContextVar = contextvars.ContextVar('upgradeapp_span', default=None)
+
+
+@dataclass
+class Span:
+    """One timed operation."""
+
+    name: str
+    category: str = 'phase'
+    item: Optional[str] = None
+    # perf_counter_ns() at the start, and the duration in nanoseconds once finished
+    start_ns: int = 0
+    duration_ns: int = 0
+    # Thread or asyncio task the span ran on, as a trace lane
+    lane: str = ''
+    args: Dict[str, Any] = field(default_factory=dict)
+    # Name of the span this one was opened in
+    parent: Optional[str] = None
+
+    @property
+    def failed(self) -> bool:
+        """Whether the operation raised or its command exited non-zero."""
+        return 'error' in self.args or self.args.get('exit_code') not in (None, 0)
+
+    def set(self, **args: Any) -> None:
+        """
+        Attach details to the span.
+
+        Args:
+            **args: Details such as ``exit_code`` or ``output_bytes``
+        """
+        self.args.update(args)
+
+
+class _NullSpan:
+    """Stand-in yielded while tracing is off."""
+
+    failed = False
+
+    def set(self, **args: Any) -> None:
+        pass
+
+
+class _NullContext:
+    def __enter__(self) -> _NullSpan:
+        return _NULL_SPAN
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+_NULL_CONTEXT = _NullContext()
+
+
+class _SpanContext:
+    def __init__(self, span: Span):
+        self.span = span
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        self.span.lane = _lane()
+        self.span.start_ns = time.perf_counter_ns()
+        return self.span
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.span.duration_ns = time.perf_counter_ns() - self.span.start_ns
+        if exc_type is not None:
+            self.span.args.setdefault('error', exc_type.__name__)
+        _current.reset(self._token)
+        tracer = _tracer
+        if tracer is not None:
+            tracer.add(self.span)
+        for listener in _listeners:
+            listener(self.span)
+
+
+def _lane() -> str:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    thread = threading.current_thread().name
+    return f"{thread} / {task.get_name()}" if task is not None else thread
+
+
+class Tracer:
+    """Collects finished spans; safe to use from threads and asyncio tasks."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.origin_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        """
+        Record a finished span.
+
+        Args:
+            span: The span
+        """
+        with self._lock:
+            self.spans.append(span)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """
+        Export the spans as Chrome trace events.
+
+        Each span becomes a complete (``X``) event on the lane of the
+        thread or asyncio task it ran on, so concurrent pulls show up side
+        by side.
+
+        Returns:
+            Trace document with ``traceEvents``, ready for json.dump
+        """
+        pid = os.getpid()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_ns)
+        lanes: Dict[str, int] = {}
+        events: List[Dict[str, Any]] = []
+        for span in spans:
+            if span.lane not in lanes:
+                lanes[span.lane] = len(lanes) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': lanes[span.lane],
+                               'args': {'name': span.lane}})
+            args = dict(span.args)
+            if span.item is not None:
+                args['item'] = span.item
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': (span.start_ns - self.origin_ns) / 1000,
+                'dur': span.duration_ns / 1000,
+                'pid': pid,
+                'tid': lanes[span.lane],
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: str) -> None:
+        """
+        Write the Chrome trace to a file.
+
+        Args:
+            path: Destination file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Aggregate the spans by name.
+
+        Returns:
+            One row per span name with ``name``, ``category``, ``count``,
+            ``total``, ``mean`` and ``max`` (seconds), ``failures`` and
+            ``output_bytes``, slowest total first
+        """
+        rows: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = rows.setdefault(span.name, {
+                'name': span.name, 'category': span.category, 'count': 0,
+                'total': 0.0, 'max': 0.0, 'failures': 0, 'output_bytes': 0,
+            })
+            seconds = span.duration_ns / 1e9
+            row['count'] += 1
+            row['total'] += seconds
+            row['max'] = max(row['max'], seconds)
+            row['failures'] += span.failed
+            row['output_bytes'] += span.args.get('output_bytes') or 0
+        for row in rows.values():
+            row['mean'] = row['total'] / row['count']
+        return sorted(rows.values(), key=lambda row: row['total'], reverse=True)
+
+    def format_summary(self, limit: int = 25) -> str:
+        """
+        Render the summary as a table.
+
+        Nested spans are included in their parents' totals, so totals of
+        phases and of the commands they ran overlap.
+
+        Args:
+            limit: Maximum number of rows
+
+        Returns:
+            Table text
+        """
+        rows = self.summary()
+        lines = [f"{'span':<40} {'category':<8} {'count':>6} {'total s':>9} {'mean ms':>9} "
+                 f"{'max ms':>9} {'failed':>6} {'output':>10}"]
+        for row in rows[:limit]:
+            lines.append(
+                f"{row['name'][:40]:<40} {row['category']:<8} {row['count']:>6} {row['total']:>9.3f} "
+                f"{row['mean'] * 1000:>9.1f} {row['max'] * 1000:>9.1f} {row['failures']:>6} "
+                f"{row['output_bytes']:>10}"
+            )
+        if len(rows) > limit:
+            lines.append(f"... {len(rows) - limit} more span name(s) in the trace")
+        return '\n'.join(lines)
+
+
+def _update_enabled() -> None:
+    global _enabled
+    _enabled = _tracer is not None or bool(_listeners)
+
+
+def enable() -> Tracer:
+    """
+    Start tracing, replacing any tracer already active.
+
+    Returns:
+        The new tracer
+    """
+    global _tracer
+    _tracer = Tracer()
+    _update_enabled()
+    return _tracer
+
+
+def disable() -> Optional[Tracer]:
+    """
+    Stop tracing.
+
+    Returns:
+        The tracer that was active, with its spans, or None
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    _update_enabled()
+    return tracer
+
+
+def subscribe(listener: Callable[[Span], None]) -> None:
+    """
+    Call a function with every span as it finishes.
+
+    Subscribing turns span recording on, with or without a tracer.
+    Listeners run on the thread that finished the span and must be
+    thread-safe.
+
+    Args:
+        listener: Function taking the finished span
+    """
+    global _listeners
+    _listeners = _listeners + [listener]
+    _update_enabled()
+
+
+def unsubscribe(listener: Callable[[Span], None]) -> None:
+    """
+    Stop calling a listener subscribed with subscribe().
+
+    Args:
+        listener: The listener
+    """
+    global _listeners
+    _listeners = [other for other in _listeners if other != listener]
+    _update_enabled()
+
+
+def active() -> Optional[Tracer]:
+    """
+    Get the active tracer.
+
+    Returns:
+        The tracer, or None while tracing is off
+    """
+    return _tracer
+
+
+def span(name: str, category: str = 'phase', item: Optional[str] = None, **args: Any):
+    """
+    Time a block of code.
+
+    The span inherits its item from the enclosing span when none is given.
+    While spans are not recorded this returns a shared no-op context
+    manager.
+
+    Args:
+        name: Span name; spans with the same name are aggregated together
+        category: One of CATEGORIES
+        item: Package, image or container the work is for
+        **args: Details to attach to the span
+
+    Returns:
+        Context manager yielding the span, on which more details can be set
+    """
+    if not _enabled:
+        return _NULL_CONTEXT
+    parent = _current.get()
+    if item is None and parent is not None:
+        item = parent.item
+    return _SpanContext(Span(name, category, item, args=args, parent=parent.name if parent is not None else None))
+
+
+def annotate(**args: Any) -> None:
+    """
+    Attach details to the innermost open span, if spans are recorded.
+
+    Args:
+        **args: Details such as ``pull_bytes``
+    """
+    if _enabled:
+        current = _current.get()
+        if current is not None:
+            current.set(**args)
+
+
+def _item_of(args: tuple) -> Optional[str]:
+    return args[0] if args and isinstance(args[0], str) else None
+
+
+def _result_size(result: Any) -> Any:
+    if isinstance(result, bool) or not hasattr(result, '__len__'):
+        return result if isinstance(result, bool) else None
+    return len(result)
+
+
+def traced(name: str, record_result: bool = False) -> Callable[[F], F]:
+    """
+    Decorate a method so each call is a span.
+
+    The first positional argument after ``self``, if it is a string, is
+    taken as the span's item. A call made while a span of the same name
+    is open, such as an override calling ``super()``, is not recorded
+    again. Coroutine functions get an async wrapper.
+
+    Args:
+        name: Span name; ``{cls}`` is replaced by the class name of ``self``
+        record_result: Record the return value as the ``result`` detail:
+            booleans as they are, collections by their length
+
+    Returns:
+        Decorator
+    """
+    def decorate(func: F) -> F:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+                if not _enabled:
+                    return await func(self, *args, **kwargs)
+                span_name = name.format(cls=type(self).__name__)
+                parent = _current.get()
+                if parent is not None and parent.name == span_name:
+                    return await func(self, *args, **kwargs)
+                with span(span_name, item=_item_of(args)) as method_span:
+                    result = await func(self, *args, **kwargs)
+                    if record_result:
+                        method_span.set(result=_result_size(result))
+                    return result
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return func(self, *args, **kwargs)
+            span_name = name.format(cls=type(self).__name__)
+            parent = _current.get()
+            if parent is not None and parent.name == span_name:
+                return func(self, *args, **kwargs)
+            with span(span_name, item=_item_of(args)) as method_span:
+                result = func(self, *args, **kwargs)
+                if record_result:
+                    method_span.set(result=_result_size(result))
+                return result
+        return wrapper  # type: ignore[return-value]
+    return decorate
+
+
+def command_name(cmd: Sequence[str]) -> str:
+    """
+    Name a command for aggregation: the executable and its subcommand.
+
+    ``sudo`` and ``fakeroot`` are skipped, and so are options before the
+    subcommand, so ``['sudo', 'apt', '--dry-run', 'upgrade', 'curl']`` is
+    ``apt upgrade``.
+    Container CLI management commands keep their second word (``docker
+    image inspect``), and a command without a subcommand is named by its
+    first option (``docker --version``); pacman and rpm are named by their
+    operation (``pacman -Syu``).
+
+    Args:
+        cmd: Command and arguments
+
+    Returns:
+        Command name
+    """
+    words = list(cmd)
+    while words and os.path.basename(words[0]) in _WRAPPERS:
+        words = words[1:]
+        if words and words[0] == '--':
+            words = words[1:]
+    if not words:
+        return ''
+    name = os.path.basename(words[0])
+    if name in _OPERATION_OPTION_COMMANDS:
+        operation = next((word for word in words[1:] if word.startswith('-') and not word.startswith('--')), None)
+        return f"{name} {operation}" if operation else name
+    positional = [word for word in words[1:] if not word.startswith('-')]
+    if not positional or not _SUBCOMMAND.match(positional[0]):
+        # No subcommand, or the first word is an option's value rather than a subcommand
+        return f"{name} {words[1]}" if len(words) > 1 else name
+    if positional[0] in _MANAGEMENT_COMMANDS and len(positional) > 1:
+        return f"{name} {positional[0]} {positional[1]}"
+    return f"{name} {positional[0]}"
+
+
+def _output_bytes(result: subprocess.CompletedProcess) -> Optional[int]:
+    if result.stdout is None and result.stderr is None:
+        return None
+    return sum(len(output) for output in (result.stdout, result.stderr) if output is not None)
+
+
+def record_command(command_span: Any, result: subprocess.CompletedProcess) -> None:
+    """
+    Attach a finished command's exit code and output size to its span.
+
+    Args:
+        command_span: Span of the command, or the no-op span
+        result: Completed process
+    """
+    command_span.set(exit_code=result.returncode, output_bytes=_output_bytes(result))
+
+
+def traced_run(cmd: Sequence[str], item: Optional[str] = None, **kwargs: Any) -> subprocess.CompletedProcess:
+    """
+    Run a command with subprocess.run, as a span while spans are recorded.
+
+    The span carries the command's ``timeout``, so timeouts can be told
+    apart by their limit.
+
+    Args:
+        cmd: Command and arguments
+        item: Item the command works on; defaults to the enclosing span's
+        **kwargs: Passed to subprocess.run
+
+    Returns:
+        Completed process
+    """
+    if not _enabled:
+        return subprocess.run(cmd, **kwargs)
+    with span(command_name(cmd), 'command', item, command=' '.join(cmd),
+              timeout=kwargs.get('timeout')) as command_span:
+        try:
+            result = subprocess.run(cmd, **kwargs)
+        except subprocess.TimeoutExpired:
+            command_span.set(exit_code='timeout')
+            raise
+        record_command(command_span, result)
+        return result